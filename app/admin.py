@@ -1,6 +1,9 @@
 from django.contrib import admin
 
-from .models import Asignatura, Pregunta, Opcion, Unidad, ProgramaAnalitico, Partida, Carrera
+from .models import (
+    Asignatura, Pregunta, Opcion, Unidad, ProgramaAnalitico, Partida, Carrera, Tarea, PartidaSnapshot, FirmaPregunta,
+    ValidacionPregunta, SelloVersion,
+)
 
 admin.site.register(Asignatura)
 admin.site.register(Pregunta)
@@ -8,4 +11,9 @@ admin.site.register(Opcion)
 admin.site.register(Unidad)
 admin.site.register(ProgramaAnalitico)
 admin.site.register(Partida)
-admin.site.register(Carrera)
\ No newline at end of file
+admin.site.register(Carrera)
+admin.site.register(Tarea)
+admin.site.register(PartidaSnapshot)
+admin.site.register(FirmaPregunta)
+admin.site.register(ValidacionPregunta)
+admin.site.register(SelloVersion)
@@ -4,3 +4,11 @@ from django.apps import AppConfig
 class AppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'app'
+
+    def ready(self):
+        # Registrar las tareas en segundo plano (ver jobs.py)
+        from . import tasks  # noqa: F401
+
+        # Cliente de Supabase: reinicio tras fork y calentamiento (ver supabase_client.py)
+        from .supabase_client import preparar_ciclo_de_vida
+        preparar_ciclo_de_vida()
@@ -0,0 +1,115 @@
+import contextvars
+import os
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from .deadline import PlazoAgotado
+
+_pool: Optional[ThreadPoolExecutor] = None
+_lock = threading.Lock()
+_local = threading.local()
+
+
+def _reiniciar_en_hijo() -> None:
+    # Los hilos del pool no sobreviven a un fork: el hijo arma el suyo al primer gather
+    global _pool, _lock
+    _pool = None
+    _lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reiniciar_en_hijo)
+
+
+class ErroresConcurrentes(Exception):
+    """Fallaron varias llamadas de ``gather``; ``errores`` tiene pares (posición, excepción)."""
+
+    def __init__(self, errores: List[Tuple[int, BaseException]]):
+        self.errores = errores
+        super().__init__("; ".join(f"[{indice}] {error}" for indice, error in errores))
+
+
+def _obtener_pool() -> ThreadPoolExecutor:
+    global _pool
+    if _pool is None:
+        with _lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(max_workers=settings.CONCURRENCIA_HILOS, thread_name_prefix='gather')
+    return _pool
+
+
+def _ejecutar(contexto: contextvars.Context, llamada: Callable[[], Any]) -> Any:
+    _local.en_pool = True
+    try:
+        # Cada llamada ve el plazo y las marcas de la petición que la originó
+        return contexto.run(llamada)
+    finally:
+        close_old_connections()
+
+
+def _resolver(resultados: List[Any], errores: List[Tuple[int, BaseException]], devolver_errores: bool) -> List[Any]:
+    if devolver_errores or not errores:
+        return resultados
+    for _, error in errores:
+        if isinstance(error, PlazoAgotado):
+            raise error
+    if len(errores) == 1:
+        raise errores[0][1]
+    raise ErroresConcurrentes(errores)
+
+
+def gather(*llamadas: Callable[[], Any], limite: Optional[int] = None, devolver_errores: bool = False) -> List[Any]:
+    """Ejecuta llamadas independientes (funciones sin argumentos) en el pool compartido.
+
+    Devuelve los resultados en el mismo orden que las llamadas. Como mucho ``limite``
+    (``CONCURRENCIA_POR_PETICION``) corren a la vez, así una vista con mucho fan-out no
+    acapara el pool. El límite es de cada llamada a ``gather``, no de la petición: vale
+    para toda la petición porque ``gather`` bloquea hasta terminar y las llamadas
+    anidadas corren en serie, pero dos hilos propios de una vista que llamen a
+    ``gather`` a la vez ocuparían ``limite`` cada uno. Siempre se esperan todas:
+
+    - ``devolver_errores=True``: la excepción de cada llamada fallida ocupa su lugar.
+    - Si no, se relanza el error (``PlazoAgotado`` tiene prioridad) o
+      ``ErroresConcurrentes`` si fallaron varias.
+
+    Desde un hilo del pool las llamadas corren en serie, para no esperar a hilos
+    que nunca se liberan.
+    """
+    limite = limite or settings.CONCURRENCIA_POR_PETICION
+    resultados: List[Any] = [None] * len(llamadas)
+    errores: List[Tuple[int, BaseException]] = []
+
+    if len(llamadas) <= 1 or limite <= 1 or getattr(_local, 'en_pool', False):
+        for indice, llamada in enumerate(llamadas):
+            try:
+                resultados[indice] = llamada()
+            except Exception as e:
+                resultados[indice] = e
+                errores.append((indice, e))
+        return _resolver(resultados, errores, devolver_errores)
+
+    pool = _obtener_pool()
+    en_curso = {}
+
+    def recoger(terminados):
+        for futuro in terminados:
+            indice = en_curso.pop(futuro)
+            error = futuro.exception()
+            if error is not None:
+                resultados[indice] = error
+                errores.append((indice, error))
+            else:
+                resultados[indice] = futuro.result()
+
+    for indice, llamada in enumerate(llamadas):
+        if len(en_curso) >= limite:
+            recoger(wait(en_curso, return_when=FIRST_COMPLETED).done)
+        en_curso[pool.submit(_ejecutar, contextvars.copy_context(), llamada)] = indice
+    recoger(wait(en_curso).done)
+
+    errores.sort(key=lambda e: e[0])
+    return _resolver(resultados, errores, devolver_errores)
@@ -0,0 +1,104 @@
+import time
+from datetime import timedelta
+from functools import wraps
+from typing import Optional
+
+from django.conf import settings
+from django.db.models import Count, Max, Min, Sum
+from django.utils import timezone
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition
+
+from .models import PartidaSnapshot
+from .swr import generacion
+
+# GET condicional con sellos de versión baratos: el ETag sale de la base local y de la
+# caché de respaldo, nunca de Supabase ni del cuerpo ya renderizado. Si no hay un sello
+# confiable (snapshot faltante o vencido) se devuelve None y la vista corre normalmente.
+
+
+def sello_global() -> str:
+    """Listas que vienen de la caché de respaldo (partidas, unidades, programas, ...).
+
+    Cambia con cada escritura y al pasar cada ventana de ``SWR_FRESCO`` segundos, que es
+    cuando las copias se recargan desde Supabase.
+    """
+    return f"g{generacion()}.{int(time.time() // max(settings.SWR_FRESCO, 1))}"
+
+
+def _vigente(actualizado) -> bool:
+    return actualizado is not None and timezone.now() - actualizado < timedelta(seconds=settings.PARTIDA_SNAPSHOT_MAX_EDAD)
+
+
+def _partida_id(request) -> Optional[int]:
+    try:
+        return int(request.GET['partida'])
+    except (KeyError, ValueError):
+        return None
+
+
+def sello_partida(partida_id: int) -> Optional[str]:
+    fila = PartidaSnapshot.objects.filter(pk=partida_id).values_list('version', 'actualizado').first()
+    if not fila or not _vigente(fila[1]):
+        return None
+    return f"p{partida_id}.{fila[0]}"
+
+
+def sello_snapshots() -> Optional[str]:
+    """Todos los snapshots a la vez (la lista de partidas muestra sus conteos)."""
+    resumen = PartidaSnapshot.objects.aggregate(
+        cantidad=Count('pk'), versiones=Sum('version'), ultimo=Max('actualizado'), primero=Min('actualizado')
+    )
+    if resumen['cantidad'] and not _vigente(resumen['primero']):
+        return None
+    return f"s{resumen['cantidad']}.{resumen['versiones'] or 0}.{resumen['ultimo'].timestamp() if resumen['ultimo'] else 0}"
+
+
+def etag_global(request, *args, **kwargs) -> str:
+    return sello_global()
+
+
+def etag_lista_partidas(request, *args, **kwargs) -> Optional[str]:
+    snapshots = sello_snapshots()
+    return f"{sello_global()}-{snapshots}" if snapshots else None
+
+
+def etag_partida(request, *args, **kwargs) -> Optional[str]:
+    """Vistas de una partida (``?partida=``) que además muestran listas globales."""
+    partida_id = _partida_id(request)
+    if partida_id is None:
+        return sello_global()
+    sello = sello_partida(partida_id)
+    return f"{sello_global()}-{sello}" if sello else None
+
+
+def etag_snapshot(request, *args, **kwargs) -> Optional[str]:
+    """Vistas que solo leen el snapshot de la partida."""
+    partida_id = _partida_id(request)
+    return sello_partida(partida_id) if partida_id is not None else None
+
+
+def modificado_snapshot(request, *args, **kwargs):
+    partida_id = _partida_id(request)
+    if partida_id is None:
+        return None
+    actualizado = PartidaSnapshot.objects.filter(pk=partida_id).values_list('actualizado', flat=True).first()
+    return actualizado if _vigente(actualizado) else None
+
+
+def condicional(etag_func, last_modified_func=None):
+    """Como ``condition`` de Django; además pide al navegador revalidar siempre (Cache-Control: no-cache).
+
+    Con el sello sin cambios la respuesta es un 304 y la vista no se ejecuta.
+    """
+    def decorador(vista):
+        vista_condicional = condition(etag_func=etag_func, last_modified_func=last_modified_func)(vista)
+
+        @wraps(vista)
+        def envoltura(request, *args, **kwargs):
+            response = vista_condicional(request, *args, **kwargs)
+            if response.has_header('ETag') or response.has_header('Last-Modified'):
+                patch_cache_control(response, private=True, no_cache=True)
+            return response
+        return envoltura
+    return decorador
@@ -0,0 +1,169 @@
+import bisect
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+SECCION_UNIDADES = "Unidades, temas y subtemas"
+TITULO_SECCION = "Unidades, temas y subtemas (tal como en el programa)"
+
+# Encabezados reconocidos, en el mismo orden de prioridad que la búsqueda original
+_PALABRAS_DIRECTAS = ("unidad", "tema", "capítulo")
+_SEPARADORES = (":", " ")
+
+_ENCABEZADO_SECCION = re.compile(r"unidad (\d+)([: ])")
+_ENCABEZADO_DIRECTO = re.compile(r"(unidad|tema|capítulo) (\d+)([: ])")
+
+_MAX_INDICES = 256
+
+
+@lru_cache(maxsize=128)
+def _patron_numero(numero_unidad: int):
+    return re.compile(rf'\b{numero_unidad}\.?\s*[:\-]?\s*', re.IGNORECASE)
+
+
+def _indexar(texto_lower: str, patron) -> Dict[Tuple[str, ...], List[int]]:
+    """Posiciones (ordenadas) de cada encabezado, agrupadas por (palabra, número, separador)."""
+    posiciones: Dict[Tuple[str, ...], List[int]] = {}
+    for match in patron.finditer(texto_lower):
+        posiciones.setdefault(match.groups(), []).append(match.start())
+    return posiciones
+
+
+def _primera_desde(posiciones: Dict[Tuple[str, ...], List[int]], clave: Tuple[str, ...], desde: int = 0) -> int:
+    lista = posiciones.get(clave)
+    if not lista:
+        return -1
+    i = bisect.bisect_left(lista, desde)
+    return lista[i] if i < len(lista) else -1
+
+
+class IndiceContexto:
+    """Contexto de un programa analítico analizado una sola vez.
+
+    Guarda el contexto general y las posiciones de cada encabezado de unidad, de modo
+    que extraer el contexto de una unidad es una búsqueda en diccionario en lugar de
+    recorrer el texto con varios patrones por llamada. Los resultados son idénticos a
+    los de la búsqueda lineal que reemplaza.
+    """
+
+    def __init__(self, contexto: str, directo: bool = False):
+        self.contexto = contexto
+        contexto_lower = contexto.lower()
+        # En modo directo se ignora la sección de unidades y se buscan los encabezados en todo el texto
+        self.pos_seccion = -1 if directo else contexto_lower.find(SECCION_UNIDADES.lower())
+
+        if self.pos_seccion == -1:
+            self.contexto_general = contexto
+            self.seccion = None
+            self.posiciones = _indexar(contexto_lower, _ENCABEZADO_DIRECTO)
+            self.titulo_seccion = None
+        else:
+            self.contexto_general = contexto[:self.pos_seccion].strip()
+            self.seccion = contexto[self.pos_seccion:].strip()
+            self.posiciones = _indexar(self.seccion.lower(), _ENCABEZADO_SECCION)
+            if TITULO_SECCION.lower() in contexto_lower:
+                self.titulo_seccion = TITULO_SECCION
+            else:
+                self.titulo_seccion = SECCION_UNIDADES
+
+        self._spans: Dict[int, Optional[Tuple[int, int]]] = {}
+
+    def span_unidad(self, numero_unidad: int) -> Optional[Tuple[int, int]]:
+        """(inicio, fin) de la unidad dentro de la sección (o del contexto si no hay sección)."""
+        if numero_unidad not in self._spans:
+            if self.seccion is None:
+                self._spans[numero_unidad] = self._span_directo(numero_unidad)
+            else:
+                self._spans[numero_unidad] = self._span_seccion(numero_unidad)
+        return self._spans[numero_unidad]
+
+    def _span_seccion(self, numero_unidad: int) -> Optional[Tuple[int, int]]:
+        numero = str(numero_unidad)
+        inicio = -1
+        for separador in _SEPARADORES:
+            inicio = _primera_desde(self.posiciones, (numero, separador))
+            if inicio != -1:
+                break
+        if inicio == -1:
+            return None
+
+        siguiente = str(numero_unidad + 1)
+        fin = len(self.seccion)
+        for separador in _SEPARADORES:
+            pos = _primera_desde(self.posiciones, (siguiente, separador), inicio + 1)
+            if pos != -1:
+                fin = pos
+                break
+        return inicio, fin
+
+    def _span_directo(self, numero_unidad: int) -> Optional[Tuple[int, int]]:
+        inicio = -1
+        for palabra in _PALABRAS_DIRECTAS:
+            for separador in _SEPARADORES:
+                inicio = _primera_desde(self.posiciones, (palabra, str(numero_unidad), separador))
+                if inicio != -1:
+                    break
+            if inicio != -1:
+                break
+
+        if inicio == -1:
+            # Si no encuentra patrones específicos, buscar por número
+            match = _patron_numero(numero_unidad).search(self.contexto)
+            if match:
+                inicio = match.start()
+        if inicio == -1:
+            return None
+
+        fin = len(self.contexto)
+        for siguiente in range(numero_unidad + 1, numero_unidad + 4):  # Hasta 3 unidades adelante
+            for palabra in _PALABRAS_DIRECTAS:
+                for separador in _SEPARADORES:
+                    pos = _primera_desde(self.posiciones, (palabra, str(siguiente), separador), inicio + 1)
+                    if pos != -1:
+                        fin = pos
+                        break
+                if fin < len(self.contexto):
+                    break
+            if fin < len(self.contexto):
+                break
+        return inicio, fin
+
+    def extraer(self, numero_unidad: int) -> str:
+        """Contexto general más el de la unidad, o el contexto completo si no se encuentra."""
+        span = self.span_unidad(numero_unidad)
+        if span is None:
+            return self.contexto
+
+        if self.seccion is None:
+            contexto_unidad = self.contexto[span[0]:span[1]].strip()
+            return self.contexto if len(contexto_unidad) < 50 else contexto_unidad
+
+        contexto_unidad = self.seccion[span[0]:span[1]].strip()
+        if len(contexto_unidad) < 50:
+            return self.contexto
+        return f"{self.contexto_general}\n\n{self.titulo_seccion}\n\n{contexto_unidad}"
+
+
+_indices: "OrderedDict[str, IndiceContexto]" = OrderedDict()
+_indices_lock = threading.Lock()
+
+
+def obtener_indice_contexto(contexto: str, directo: bool = False) -> IndiceContexto:
+    """Índice memoizado por hash del contenido; se reutiliza entre peticiones."""
+    contexto = str(contexto).strip()
+    clave = hashlib.sha1(contexto.encode('utf-8')).hexdigest() + (':directo' if directo else '')
+    with _indices_lock:
+        indice = _indices.get(clave)
+        if indice is not None:
+            _indices.move_to_end(clave)
+            return indice
+
+    indice = IndiceContexto(contexto, directo=directo)
+    with _indices_lock:
+        _indices[clave] = indice
+        while len(_indices) > _MAX_INDICES:
+            _indices.popitem(last=False)
+    return indice
@@ -0,0 +1,12 @@
+from .deadline import resultados_parciales
+from .swr import hay_datos_obsoletos
+
+
+def datos_obsoletos(request):
+    """Permite a las plantillas avisar cuando la página usa datos de respaldo."""
+    return {'datos_obsoletos': hay_datos_obsoletos()}
+
+
+def plazo_peticion(request):
+    """Permite a las plantillas avisar cuando la página quedó incompleta por el plazo."""
+    return {'resultados_parciales': bool(resultados_parciales())}
@@ -0,0 +1,65 @@
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+# Estado de la petición en curso: {'limite': instante time.monotonic o None, 'parciales': int}.
+# Es un dict compartido (no un valor) para que los hilos de concurrency.gather, que
+# corren en una copia del contexto, marquen resultados parciales en la misma petición.
+_estado: ContextVar[Optional[dict]] = ContextVar('plazo_peticion', default=None)
+
+
+class PlazoAgotado(TimeoutError):
+    """La petición superó su plazo; no se deben hacer más llamadas a Supabase."""
+
+
+def iniciar_plazo(segundos: Optional[float]):
+    """Fija el plazo de la petición en curso; devuelve el token para ``terminar_plazo``."""
+    limite = time.monotonic() + segundos if segundos else None
+    return _estado.set({'limite': limite, 'parciales': 0})
+
+
+def terminar_plazo(token) -> None:
+    _estado.reset(token)
+
+
+def plazo_restante() -> Optional[float]:
+    estado = _estado.get()
+    if estado is None or estado['limite'] is None:
+        return None
+    return max(0.0, estado['limite'] - time.monotonic())
+
+
+def plazo_agotado() -> bool:
+    restante = plazo_restante()
+    return restante is not None and restante <= 0
+
+
+def verificar_plazo() -> None:
+    if plazo_agotado():
+        raise PlazoAgotado('Se agotó el tiempo de la petición')
+
+
+def marcar_parcial() -> None:
+    estado = _estado.get()
+    if estado is not None:
+        estado['parciales'] += 1
+
+
+def resultados_parciales() -> int:
+    """Distinto de cero si la respuesta en curso quedó incompleta por el plazo."""
+    estado = _estado.get()
+    return estado['parciales'] if estado is not None else 0
+
+
+def limitar_timeout(request) -> None:
+    """Event hook de httpx: recorta los timeouts de la petición HTTP al tiempo que le queda a la vista."""
+    restante = plazo_restante()
+    if restante is None:
+        return
+    if restante <= 0:
+        raise PlazoAgotado('Se agotó el tiempo de la petición')
+    timeouts = request.extensions.get('timeout') or {}
+    request.extensions['timeout'] = {
+        clave: restante if timeouts.get(clave) is None else min(timeouts[clave], restante)
+        for clave in ('connect', 'read', 'write', 'pool')
+    }
@@ -0,0 +1,70 @@
+import hashlib
+import json
+import logging
+from typing import Any, Dict, List, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+CACHE_PREFIX = "docx_unidad"
+
+# Subir al cambiar cómo _agregar_unidad_word dibuja una unidad (estilos, textos, límites):
+# los fragmentos guardados con la versión anterior dejan de usarse
+VERSION_RENDER = 1
+
+
+def clave_fragmento_unidad(unidad: Dict[str, Any], contador_inicio: int) -> str:
+    """Clave de caché derivada del contenido de la unidad.
+
+    El contador global solo influye en el fragmento cuando alguna pregunta no trae
+    su propio número, así que solo entonces forma parte del hash. ``VERSION_RENDER``
+    también entra en el hash para descartar fragmentos dibujados con código anterior.
+    """
+    preguntas = unidad.get('preguntas', [])
+    usa_contador = any('numero' not in pregunta for pregunta in preguntas)
+    contenido = {
+        'version_render': VERSION_RENDER,
+        'numero': unidad.get('numero'),
+        'descripcion': unidad.get('descripcion'),
+        'preguntas': preguntas,
+        'contador_inicio': contador_inicio if usa_contador else None,
+    }
+    serializado = json.dumps(contenido, sort_keys=True, ensure_ascii=False, default=str)
+    digest = hashlib.sha256(serializado.encode('utf-8')).hexdigest()
+    return f"{CACHE_PREFIX}:{digest}"
+
+
+def obtener_fragmento(clave: str) -> Optional[List[bytes]]:
+    try:
+        return cache.get(clave)
+    except Exception as e:
+        logger.warning(f"No se pudo leer el fragmento {clave} de la caché: {e}")
+        return None
+
+
+def guardar_fragmento(clave: str, elementos) -> None:
+    """Serializa los elementos XML del cuerpo que componen una unidad y los guarda."""
+    from lxml import etree
+
+    fragmento = [etree.tostring(elemento) for elemento in elementos]
+    timeout = getattr(settings, 'DOCX_FRAGMENT_CACHE_TIMEOUT', 60 * 60 * 24)
+    try:
+        cache.set(clave, fragmento, timeout)
+    except Exception as e:
+        logger.warning(f"No se pudo guardar el fragmento {clave} en la caché: {e}")
+
+
+def insertar_fragmento(doc, fragmento: List[bytes]) -> None:
+    """Inserta un fragmento cacheado al final del cuerpo, antes de las propiedades de sección."""
+    from docx.oxml import parse_xml
+
+    body = doc.element.body
+    sect_pr = body.sectPr
+    for xml in fragmento:
+        elemento = parse_xml(xml)
+        if sect_pr is not None:
+            sect_pr.addprevious(elemento)
+        else:
+            body.append(elemento)
@@ -0,0 +1,282 @@
+import hashlib
+import logging
+import re
+import unicodedata
+import zlib
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from django.conf import settings
+from django.db import connection, transaction
+
+from .models import BandaPregunta, FirmaPregunta
+from .snapshots import obtener_snapshot
+
+logger = logging.getLogger(__name__)
+
+# Largo de los shingles de caracteres sobre el texto normalizado
+LARGO_SHINGLE = 5
+# Primo de Mersenne 2^61 - 1 para el hashing universal (a·x + b) mod p
+_PRIMO = np.uint64((1 << 61) - 1)
+# Cantidad de valores (shingles × permutaciones) que se calculan a la vez
+_VALORES_POR_LOTE = 8_000_000
+
+
+def normalizar(texto: str) -> str:
+    """Minúsculas, sin tildes ni puntuación y con espacios simples."""
+    texto = unicodedata.normalize('NFKD', (texto or '').lower())
+    texto = ''.join(c for c in texto if not unicodedata.combining(c))
+    return ' '.join(re.findall(r'\w+', texto))
+
+
+def texto_pregunta(pregunta: Dict[str, Any]) -> str:
+    """Enunciado más opciones; las opciones se ordenan para que el orden no cuente."""
+    opciones = sorted(normalizar(o.get('opcion', '')) for o in pregunta.get('opciones') or [])
+    return ' '.join([normalizar(pregunta.get('enunciado', '')), *opciones]).strip()
+
+
+def shingles(texto: str) -> np.ndarray:
+    """Hashes (crc32) de los shingles de caracteres del texto, sin repetir."""
+    if len(texto) <= LARGO_SHINGLE:
+        partes = {texto}
+    else:
+        partes = {texto[i:i + LARGO_SHINGLE] for i in range(len(texto) - LARGO_SHINGLE + 1)}
+    return np.fromiter((zlib.crc32(p.encode()) for p in partes), dtype=np.uint64, count=len(partes))
+
+
+@lru_cache(maxsize=None)
+def _coeficientes(permutaciones: int, bandas: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    # Semilla fija: las firmas guardadas tienen que poder compararse entre procesos
+    rng = np.random.default_rng(20261019)
+    a = rng.integers(1, 1 << 32, size=permutaciones, dtype=np.uint64)
+    b = rng.integers(0, 1 << 32, size=permutaciones, dtype=np.uint64)
+    mezcla = rng.integers(1, 1 << 63, size=permutaciones // bandas, dtype=np.uint64) | np.uint64(1)
+    return a, b, mezcla
+
+
+def _parametros() -> Tuple[int, int]:
+    permutaciones, bandas = settings.DUPLICADOS_PERMUTACIONES, settings.DUPLICADOS_BANDAS
+    if permutaciones % bandas:
+        raise ValueError('DUPLICADOS_PERMUTACIONES debe ser múltiplo de DUPLICADOS_BANDAS')
+    return permutaciones, bandas
+
+
+def calcular_firmas(textos: List[str]) -> np.ndarray:
+    """Firmas MinHash de los textos, una fila uint32 por texto.
+
+    Todos los shingles de un lote se pasan por las permutaciones en una sola operación
+    (a·x + b con x < 2^32 y a, b < 2^32 no desborda uint64) y el mínimo por texto sale
+    de ``np.minimum.reduceat``.
+    """
+    permutaciones, bandas = _parametros()
+    a, b, _ = _coeficientes(permutaciones, bandas)
+    firmas = np.empty((len(textos), permutaciones), dtype=np.uint32)
+
+    hashes = [shingles(t) for t in textos]
+    inicio = 0
+    while inicio < len(hashes):
+        fin, valores = inicio, 0
+        while fin < len(hashes) and (fin == inicio or valores + len(hashes[fin]) * permutaciones <= _VALORES_POR_LOTE):
+            valores += len(hashes[fin]) * permutaciones
+            fin += 1
+        lote = hashes[inicio:fin]
+        todos = np.concatenate(lote)
+        offsets = np.cumsum([0] + [len(h) for h in lote[:-1]])
+        permutados = (a[:, None] * todos[None, :] + b[:, None]) % _PRIMO
+        firmas[inicio:fin] = np.minimum.reduceat(permutados, offsets, axis=1).T.astype(np.uint32)
+        inicio = fin
+    return firmas
+
+
+def claves_bandas(firmas: np.ndarray) -> np.ndarray:
+    """Una clave int64 por banda (LSH): combinación lineal de las filas de la banda módulo 2^64."""
+    permutaciones, bandas = _parametros()
+    _, _, mezcla = _coeficientes(permutaciones, bandas)
+    filas = firmas.astype(np.uint64).reshape(len(firmas), bandas, permutaciones // bandas)
+    return (filas * mezcla).sum(axis=2, dtype=np.uint64).view(np.int64)
+
+
+def _huella(texto: str) -> str:
+    permutaciones, bandas = _parametros()
+    return hashlib.blake2b(f"{permutaciones}:{bandas}:{LARGO_SHINGLE}:{texto}".encode(), digest_size=16).hexdigest()
+
+
+# ============================================================================
+# ÍNDICE
+# ============================================================================
+
+def indexar(asignatura_id: int, preguntas: Iterable[Dict[str, Any]], completo: bool = False) -> List[int]:
+    """Guarda las firmas de las preguntas nuevas o modificadas y devuelve sus ids.
+
+    Con ``completo`` las preguntas recibidas son todas las de la asignatura y se quitan
+    del índice las que ya no existen.
+    """
+    preguntas = [p for p in preguntas if p.get('pregunta_id') and not p.get('virtual')]
+    actuales = {
+        pregunta_id: (huella, unidad_id, numero)
+        for pregunta_id, huella, unidad_id, numero in FirmaPregunta.objects.filter(
+            pk__in=[p['pregunta_id'] for p in preguntas]
+        ).values_list('pregunta_id', 'huella', 'unidad_id', 'numero')
+    }
+
+    pendientes = []
+    for pregunta in preguntas:
+        texto = texto_pregunta(pregunta)
+        if not texto:
+            continue
+        huella = _huella(texto)
+        if actuales.get(pregunta['pregunta_id']) != (huella, pregunta['unidad_id'], pregunta['numero']):
+            pendientes.append((pregunta, texto, huella))
+
+    with transaction.atomic():
+        if completo:
+            FirmaPregunta.objects.filter(asignatura_id=asignatura_id).exclude(
+                pk__in=[p['pregunta_id'] for p in preguntas]
+            ).delete()
+        if not pendientes:
+            return []
+
+        firmas = calcular_firmas([texto for _, texto, _ in pendientes])
+        claves = claves_bandas(firmas)
+        ids = [p['pregunta_id'] for p, _, _ in pendientes]
+        FirmaPregunta.objects.filter(pk__in=ids).delete()
+        FirmaPregunta.objects.bulk_create([
+            FirmaPregunta(
+                pregunta_id=pregunta['pregunta_id'],
+                asignatura_id=asignatura_id,
+                unidad_id=pregunta['unidad_id'],
+                numero=pregunta['numero'],
+                resumen=(pregunta.get('enunciado') or '')[:200],
+                huella=huella,
+                firma=firma.tobytes(),
+            )
+            for (pregunta, _, huella), firma in zip(pendientes, firmas)
+        ], batch_size=500)
+        BandaPregunta.objects.bulk_create([
+            BandaPregunta(firma_id=pregunta_id, banda=banda, clave=int(clave))
+            for pregunta_id, fila in zip(ids, claves)
+            for banda, clave in enumerate(fila)
+        ], batch_size=2000)
+
+    logger.info(f"Firmas de duplicados actualizadas en la asignatura {asignatura_id}: {len(ids)}")
+    return ids
+
+
+def indexar_partida(partida_id: int) -> Tuple[Optional[int], List[int]]:
+    """Indexa las preguntas de la asignatura de la partida desde su snapshot; devuelve (asignatura, ids nuevos)."""
+    documento = obtener_snapshot(partida_id)
+    if not documento:
+        return None, []
+    asignatura_id = documento['asignatura']['asignatura_id']
+    preguntas = [p for u in documento['unidades'] for p in u['preguntas']]
+    return asignatura_id, indexar(asignatura_id, preguntas, completo=True)
+
+
+# ============================================================================
+# BÚSQUEDA
+# ============================================================================
+
+def _pares_candidatos(asignatura_id: Optional[int], pregunta_ids: Optional[List[int]]) -> List[Tuple[int, int]]:
+    """Pares de preguntas que comparten al menos una banda, con el índice (banda, clave)."""
+    banda = BandaPregunta._meta.db_table
+    firma = FirmaPregunta._meta.db_table
+    if pregunta_ids is None:
+        consultas = [(f"SELECT pregunta_id FROM {firma} WHERE asignatura_id = %s", [asignatura_id])]
+    else:
+        # Por lotes, para no superar el límite de parámetros de la base
+        consultas = [
+            (', '.join(['%s'] * len(lote)), lote)
+            for lote in (pregunta_ids[i:i + 500] for i in range(0, len(pregunta_ids), 500))
+        ]
+
+    pares = []
+    with connection.cursor() as cursor:
+        for origen, parametros in consultas:
+            cursor.execute(
+                f"""
+                SELECT DISTINCT a.firma_id, b.firma_id
+                FROM {banda} a
+                JOIN {banda} b ON b.banda = a.banda AND b.clave = a.clave AND b.firma_id <> a.firma_id
+                WHERE a.firma_id IN ({origen})
+                """,
+                parametros,
+            )
+            pares.extend((min(x, y), max(x, y)) for x, y in cursor.fetchall())
+    return pares
+
+
+def buscar_duplicados(
+    asignatura_id: Optional[int] = None,
+    pregunta_ids: Optional[List[int]] = None,
+    umbral: Optional[float] = None,
+) -> List[Dict[str, Any]]:
+    """Grupos de casi duplicados que incluyen preguntas de la asignatura (o las indicadas).
+
+    Los candidatos salen de las bandas LSH en todo el índice, así que un grupo puede
+    reunir preguntas de otras asignaturas. Cada par se confirma con la similitud de
+    Jaccard estimada por las firmas (fracción de posiciones iguales) ``>= umbral``.
+    """
+    umbral = settings.DUPLICADOS_UMBRAL if umbral is None else umbral
+    pares = sorted(set(_pares_candidatos(asignatura_id, pregunta_ids)))
+    if not pares:
+        return []
+
+    ids = sorted({i for par in pares for i in par})
+    filas = {f.pregunta_id: f for f in FirmaPregunta.objects.filter(pk__in=ids)}
+    posicion = {pregunta_id: i for i, pregunta_id in enumerate(filas)}
+    firmas = np.stack([np.frombuffer(bytes(f.firma), dtype=np.uint32) for f in filas.values()])
+
+    izquierda = np.array([posicion[x] for x, y in pares if x in posicion and y in posicion])
+    derecha = np.array([posicion[y] for x, y in pares if x in posicion and y in posicion])
+    if not len(izquierda):
+        return []
+    similitudes = (firmas[izquierda] == firmas[derecha]).mean(axis=1)
+
+    # Unión de pares confirmados en grupos
+    padre = {}
+
+    def raiz(x):
+        while padre.get(x, x) != x:
+            padre[x] = padre.get(padre[x], padre[x])
+            x = padre[x]
+        return x
+
+    orden = list(filas)
+    maxima: Dict[int, float] = {}
+    for i, j, similitud in zip(izquierda, derecha, similitudes):
+        if similitud < umbral:
+            continue
+        x, y = orden[i], orden[j]
+        padre[raiz(x)] = raiz(y)
+        for pregunta_id in (x, y):
+            maxima[pregunta_id] = max(maxima.get(pregunta_id, 0.0), float(similitud))
+
+    grupos: Dict[int, List[int]] = {}
+    for pregunta_id in maxima:
+        grupos.setdefault(raiz(pregunta_id), []).append(pregunta_id)
+
+    resultado = []
+    for miembros in grupos.values():
+        resultado.append({
+            'similitud_maxima': round(max(maxima[m] for m in miembros), 3),
+            'preguntas': [
+                {
+                    'pregunta_id': m,
+                    'asignatura_id': filas[m].asignatura_id,
+                    'unidad_id': filas[m].unidad_id,
+                    'numero': filas[m].numero,
+                    'enunciado': filas[m].resumen,
+                    'similitud': round(maxima[m], 3),
+                }
+                for m in sorted(miembros, key=lambda m: (filas[m].asignatura_id, filas[m].numero))
+            ],
+        })
+    resultado.sort(key=lambda g: (-len(g['preguntas']), -g['similitud_maxima']))
+    return resultado
+
+
+def revisar_importacion(partida_id: int) -> List[Dict[str, Any]]:
+    """Tras una importación: indexa solo lo nuevo o modificado y lo compara contra el índice."""
+    _, nuevas = indexar_partida(partida_id)
+    return buscar_duplicados(pregunta_ids=nuevas) if nuevas else []
@@ -0,0 +1,146 @@
+import csv
+import io
+import json
+from typing import Any, Dict, Iterable, Iterator
+from xml.sax.saxutils import escape
+
+
+def _letra(indice: int) -> str:
+    return chr(97 + indice)  # a, b, c, d...
+
+
+def _filas_con_unidad(unidades: Iterable[Dict[str, Any]], preguntas: Iterable[Dict[str, Any]]) -> Iterator[tuple]:
+    """Empareja cada pregunta con su unidad sin materializar la lista de preguntas."""
+    por_id = {u['unidad_id']: u for u in unidades}
+    for pregunta in preguntas:
+        yield por_id.get(pregunta['unidad_id'], {}), pregunta
+
+
+def exportar_jsonl(unidades, preguntas) -> Iterator[str]:
+    """Una pregunta por línea con sus opciones y explicación."""
+    for unidad, pregunta in _filas_con_unidad(unidades, preguntas):
+        fila = {
+            'pregunta_id': pregunta['pregunta_id'],
+            'numero': pregunta['numero'],
+            'numero_unidad': unidad.get('numero_unidad'),
+            'unidad': unidad.get('descripcion'),
+            'enunciado': pregunta['enunciado'],
+            'explicacion': pregunta.get('explicacion') or '',
+            'opciones': [
+                {
+                    'opcion_id': opcion['opcion_id'],
+                    'letra': _letra(i),
+                    'texto': opcion['opcion'],
+                    'es_correcta': bool(opcion['es_correcta']),
+                    'media_url': opcion.get('media_url'),
+                }
+                for i, opcion in enumerate(pregunta.get('opciones', []))
+            ],
+        }
+        yield json.dumps(fila, ensure_ascii=False) + '\n'
+
+
+CSV_COLUMNAS = [
+    'numero_unidad', 'unidad', 'pregunta_id', 'numero', 'enunciado', 'explicacion',
+    'opcion_id', 'letra', 'opcion', 'es_correcta',
+]
+
+
+def exportar_csv(unidades, preguntas) -> Iterator[str]:
+    """Formato largo: una fila por opción, repitiendo los datos de la pregunta."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def vaciar() -> str:
+        contenido = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate(0)
+        return contenido
+
+    writer.writerow(CSV_COLUMNAS)
+    yield '\ufeff' + vaciar()  # BOM para que Excel detecte UTF-8
+
+    for unidad, pregunta in _filas_con_unidad(unidades, preguntas):
+        base = [
+            unidad.get('numero_unidad'), unidad.get('descripcion'),
+            pregunta['pregunta_id'], pregunta['numero'],
+            pregunta['enunciado'], pregunta.get('explicacion') or '',
+        ]
+        opciones = pregunta.get('opciones', [])
+        if not opciones:
+            writer.writerow(base + ['', '', '', ''])
+        for i, opcion in enumerate(opciones):
+            writer.writerow(base + [
+                opcion['opcion_id'], _letra(i), opcion['opcion'], 'true' if opcion['es_correcta'] else 'false'
+            ])
+        yield vaciar()
+
+
+def _escapar_gift(texto: Any) -> str:
+    texto = str(texto or '')
+    for caracter in ('\\', '~', '=', '#', '{', '}', ':'):
+        texto = texto.replace(caracter, '\\' + caracter)
+    return texto.replace('\n', '\\n')
+
+
+def exportar_gift(unidades, preguntas) -> Iterator[str]:
+    """Formato Moodle GIFT, con una categoría por unidad."""
+    unidad_actual = None
+    for unidad, pregunta in _filas_con_unidad(unidades, preguntas):
+        if unidad.get('unidad_id') != unidad_actual:
+            unidad_actual = unidad.get('unidad_id')
+            yield f"$CATEGORY: $course$/Unidad {unidad.get('numero_unidad', '')}\n\n"
+
+        lineas = [f"::Pregunta {pregunta['numero']}::{_escapar_gift(pregunta['enunciado'])} {{"]
+        for opcion in pregunta.get('opciones', []):
+            prefijo = '=' if opcion['es_correcta'] else '~'
+            lineas.append(f"\t{prefijo}{_escapar_gift(opcion['opcion'])}")
+        if pregunta.get('explicacion'):
+            lineas.append(f"\t####{_escapar_gift(pregunta['explicacion'])}")
+        lineas.append('}')
+        yield '\n'.join(lineas) + '\n\n'
+
+
+def _texto_xml(texto: Any) -> str:
+    return f"<text>{escape(str(texto or ''))}</text>"
+
+
+def exportar_moodle_xml(unidades, preguntas) -> Iterator[str]:
+    """Formato Moodle XML de opción múltiple, con una categoría por unidad."""
+    yield '<?xml version="1.0" encoding="UTF-8"?>\n<quiz>\n'
+    unidad_actual = None
+    for unidad, pregunta in _filas_con_unidad(unidades, preguntas):
+        if unidad.get('unidad_id') != unidad_actual:
+            unidad_actual = unidad.get('unidad_id')
+            categoria = f"$course$/Unidad {unidad.get('numero_unidad', '')}"
+            yield (
+                '  <question type="category">\n'
+                f'    <category>{_texto_xml(categoria)}</category>\n'
+                '  </question>\n'
+            )
+
+        opciones = pregunta.get('opciones', [])
+        partes = [
+            '  <question type="multichoice">\n',
+            f"    <name>{_texto_xml('Pregunta ' + str(pregunta['numero']))}</name>\n",
+            f'    <questiontext format="plain_text">{_texto_xml(pregunta["enunciado"])}</questiontext>\n',
+            f'    <generalfeedback format="plain_text">{_texto_xml(pregunta.get("explicacion"))}</generalfeedback>\n',
+            f"    <single>{'true' if sum(1 for o in opciones if o['es_correcta']) <= 1 else 'false'}</single>\n",
+            '    <shuffleanswers>true</shuffleanswers>\n',
+            '    <answernumbering>abc</answernumbering>\n',
+        ]
+        for opcion in opciones:
+            fraccion = 100 if opcion['es_correcta'] else 0
+            partes.append(f'    <answer fraction="{fraccion}" format="plain_text">{_texto_xml(opcion["opcion"])}</answer>\n')
+        partes.append('  </question>\n')
+        yield ''.join(partes)
+    yield '</quiz>\n'
+
+
+# formato -> (generador, content_type, extensión)
+FORMATOS = {
+    'jsonl': (exportar_jsonl, 'application/x-ndjson; charset=utf-8', 'jsonl'),
+    'csv': (exportar_csv, 'text/csv; charset=utf-8', 'csv'),
+    'gift': (exportar_gift, 'text/plain; charset=utf-8', 'gift.txt'),
+    'moodle_xml': (exportar_moodle_xml, 'application/xml; charset=utf-8', 'xml'),
+}
@@ -0,0 +1,65 @@
+import logging
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from django.db import transaction
+from django.db.models import F
+
+from .models import SelloVersion
+
+logger = logging.getLogger(__name__)
+
+# Caché de fragmentos de las listas: cada fila se guarda con {% cache %} bajo su id y su
+# ``sello``. Las APIs de edición suben la versión de la fila (``subir_version``), así el
+# fragmento viejo deja de usarse y solo esa fila se vuelve a dibujar.
+
+
+def _clave(tipo: str, fila_id: Any) -> str:
+    return f"{tipo}:{fila_id}"
+
+
+def subir_version(tipo: str, *ids: int) -> None:
+    """Marca las filas como modificadas; sin propagar errores, la escritura ya se confirmó.
+
+    Las claves que faltan se crean en 0 (ignorando las que otro proceso ya creó) y luego
+    todas suben con un UPDATE atómico: dos primeras ediciones simultáneas suman dos.
+    """
+    claves = [_clave(tipo, fila_id) for fila_id in ids]
+    try:
+        with transaction.atomic():
+            SelloVersion.objects.bulk_create(
+                [SelloVersion(clave=clave, version=0) for clave in claves], ignore_conflicts=True
+            )
+            SelloVersion.objects.filter(pk__in=claves).update(version=F('version') + 1)
+    except Exception as e:
+        logger.warning(f"No se pudo subir la versión de {', '.join(claves)}: {e}")
+
+
+def versiones(claves: Iterable[str]) -> Dict[str, int]:
+    """Versión de cada clave con una sola consulta; las que nunca se editaron valen 0."""
+    claves = list(set(claves))
+    encontradas = dict(SelloVersion.objects.filter(pk__in=claves).values_list('clave', 'version'))
+    return {clave: encontradas.get(clave, 0) for clave in claves}
+
+
+def sellar(
+    filas: List[Dict[str, Any]],
+    tipo: str,
+    campo_id: str,
+    relacionadas: Sequence[Tuple[str, Callable[[Dict[str, Any]], Optional[int]]]] = (),
+) -> None:
+    """Agrega a cada fila ``sello``: su versión y la de las filas relacionadas que muestra.
+
+    ``relacionadas`` son pares (tipo, función que devuelve el id relacionado o None); por
+    ejemplo una unidad muestra el nombre de su partida.
+    """
+    claves_por_fila = []
+    for fila in filas:
+        claves = [_clave(tipo, fila[campo_id])]
+        for tipo_relacionado, obtener_id in relacionadas:
+            relacionado_id = obtener_id(fila)
+            claves.append(_clave(tipo_relacionado, relacionado_id) if relacionado_id is not None else None)
+        claves_por_fila.append(claves)
+
+    version = versiones(c for claves in claves_por_fila for c in claves if c)
+    for fila, claves in zip(filas, claves_por_fila):
+        fila['sello'] = '.'.join(str(version[c]) if c else '-' for c in claves)
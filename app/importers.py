@@ -0,0 +1,416 @@
+import codecs
+import io
+import logging
+from itertools import islice
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from . import supabase_client
+from .numbering import renumerar_programa_supabase
+from .placeholders import rangos_numeracion, unidad_de_numero
+from .question_parser import parsear_preguntas
+from .repositories import OpcionRepository, PreguntaRepository, UnidadRepository
+from .services_supabase import SupabaseBusinessService
+from .snapshots import despues_de_escribir, reconstruir_partida
+
+logger = logging.getLogger(__name__)
+
+
+def leer_texto(archivo, tamano_bloque: int = 64 * 1024) -> Iterator[str]:
+    """Decodifica un archivo binario (subida, cuerpo de la petición) en bloques de texto UTF-8."""
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    for bloque in iter(lambda: archivo.read(tamano_bloque), b''):
+        yield decoder.decode(bloque)
+    final = decoder.decode(b'', final=True)
+    if final:
+        yield final
+
+
+def _duplicados_importados(partida_id: int) -> List[Dict[str, Any]]:
+    """Grupos de casi duplicados de las preguntas importadas; la importación ya se confirmó, así que no falla."""
+    from .duplicates import revisar_importacion
+
+    try:
+        return revisar_importacion(partida_id)
+    except Exception as e:
+        logger.warning(f"No se pudieron revisar duplicados de la partida {partida_id}: {e}")
+        return []
+
+
+def _lotes(items: Iterable[Any], tamano: int) -> Iterator[List[Any]]:
+    items = iter(items)
+    while True:
+        lote = list(islice(items, tamano))
+        if not lote:
+            return
+        yield lote
+
+
+def importar_salida_llm(
+    partida_id: int,
+    chunks: Iterable[str],
+    unidad_id: Optional[int] = None,
+    programa_id: Optional[int] = None,
+    tamano_lote: int = 200,
+    dry_run: bool = False,
+) -> Dict[str, Any]:
+    """Carga en el banco las preguntas generadas por un modelo a partir del prompt.
+
+    La numeración empieza en 1 en cada programa analítico, así que las preguntas se
+    emparejan por (programa, número) con las existentes del programa (o de la unidad
+    indicada). El programa sale de ``unidad_id`` o de ``programa_id``; si la asignatura
+    tiene un solo programa no hace falta indicarlo. Se escribe por lotes: un upsert de
+    preguntas, una inserción de las nuevas y un reemplazo de opciones por lote. Si se
+    indica ``unidad_id``, los números que no existen se crean en esa unidad; si no, en
+    la unidad cuya numeración los contiene (las posiciones todavía virtuales).
+    """
+    arbol = SupabaseBusinessService.obtener_arbol_partida(partida_id)
+    if not arbol:
+        raise ValueError('Partida no encontrada')
+
+    if unidad_id is not None:
+        unidad = next((u for u in arbol['unidades'] if u['unidad_id'] == unidad_id), None)
+        if not unidad:
+            raise ValueError('La unidad no pertenece a la partida')
+        if programa_id is not None and programa_id != unidad['programa_analitico_id']:
+            raise ValueError('La unidad no pertenece al programa analítico indicado')
+        programa_id = unidad['programa_analitico_id']
+    elif programa_id is None:
+        if len(arbol['programas']) != 1:
+            raise ValueError('La asignatura tiene varios programas analíticos: indique el programa o la unidad')
+        programa_id = arbol['programas'][0]['linea_educativa_id']
+    elif not any(p['linea_educativa_id'] == programa_id for p in arbol['programas']):
+        raise ValueError('El programa analítico no pertenece a la partida')
+
+    unidades_programa = [u for u in arbol['unidades'] if u['programa_analitico_id'] == programa_id]
+    unidades = [u for u in unidades_programa if unidad_id is None or u['unidad_id'] == unidad_id]
+    clave = lambda p: (programa_id, p['numero'])
+    existentes = {clave(p): p for u in unidades for p in u['preguntas']}
+    rangos = rangos_numeracion(unidades_programa, {u['unidad_id']: len(u['preguntas']) for u in unidades_programa})
+    resumen: Dict[str, Any] = {'procesadas': 0, 'actualizadas': 0, 'creadas': 0, 'errores': []}
+    vistos = set()
+
+    for lote in _lotes(parsear_preguntas(chunks), tamano_lote):
+        validos = []
+        for item in lote:
+            resumen['procesadas'] += 1
+            if 'error' in item:
+                resumen['errores'].append(item)
+            elif item['numero'] in vistos:
+                resumen['errores'].append(_error_item(item, 'Número repetido en la importación'))
+            else:
+                vistos.add(item['numero'])
+                if unidad_id is not None:
+                    item['unidad_id'] = unidad_id
+                elif clave(item) not in existentes:
+                    item['unidad_id'] = unidad_de_numero(rangos, item['numero'])
+                validos.append(item)
+        _aplicar_lote(validos, existentes, clave, resumen, dry_run)
+
+    if not dry_run:
+        despues_de_escribir(reconstruir_partida, partida_id)
+        resumen['duplicados'] = _duplicados_importados(partida_id)
+
+    logger.info(
+        f"Importación en partida {partida_id}: {resumen['actualizadas']} actualizadas, "
+        f"{resumen['creadas']} creadas, {len(resumen['errores'])} errores"
+    )
+    return resumen
+
+
+def _error_item(item: Dict[str, Any], mensaje: str) -> Dict[str, Any]:
+    return {'error': mensaje, 'numero': item.get('numero'), 'posicion': item.get('posicion')}
+
+
+def _aplicar_lote(validos, existentes, clave, resumen, dry_run) -> None:
+    """Escribe un lote de preguntas: actualiza las que ya existen según ``clave`` y crea el resto.
+
+    Las preguntas nuevas se crean en ``item['unidad_id']``; sin unidad se reportan como error.
+    """
+    actualizar: List[Dict[str, Any]] = []
+    crear: List[Dict[str, Any]] = []
+    for item in validos:
+        pregunta = existentes.get(clave(item))
+        fila = {'numero': item['numero'], 'enunciado': item['enunciado'], 'explicacion': item['explicacion']}
+        if pregunta:
+            actualizar.append({**fila, 'pregunta_id': pregunta['pregunta_id'], 'unidad_id': pregunta['unidad_id']})
+        elif item.get('unidad_id') is not None:
+            crear.append({**fila, 'unidad_id': item['unidad_id']})
+        else:
+            resumen['errores'].append(_error_item(item, 'No existe una pregunta con ese número en el programa'))
+
+    if dry_run:
+        resumen['actualizadas'] += len(actualizar)
+        resumen['creadas'] += len(crear)
+        return
+
+    PreguntaRepository.upsert_many(actualizar)
+    creadas = PreguntaRepository.create_many(crear)
+    for pregunta in creadas:
+        existentes[clave(pregunta)] = pregunta
+
+    ids_por_clave = {clave(p): p['pregunta_id'] for p in actualizar + creadas}
+    anteriores = OpcionRepository.list_by_preguntas_chunked([p['pregunta_id'] for p in actualizar])
+    _reemplazar_opciones(
+        [
+            {'opcion': opcion['texto'], 'es_correcta': opcion['es_correcta'], 'pregunta_id': ids_por_clave[clave(item)]}
+            for item in validos if clave(item) in ids_por_clave
+            for opcion in item['opciones']
+        ],
+        [opcion['opcion_id'] for opcion in anteriores],
+    )
+
+    resumen['actualizadas'] += len(actualizar)
+    resumen['creadas'] += len(creadas)
+
+
+def _reemplazar_opciones(crear: List[Dict[str, Any]], eliminar: List[int]) -> None:
+    """Inserta las opciones nuevas y borra las anteriores en una transacción (``aplicar_edicion_masiva``).
+
+    Sin la función se inserta antes de borrar: si el borrado falla, las preguntas quedan
+    con opciones de más y el error llega al llamador, nunca sin opciones.
+    """
+    if not crear and not eliminar:
+        return
+    try:
+        PreguntaRepository.aplicar_edicion_masiva({
+            'preguntas': [], 'actualizar_opciones': [], 'crear_opciones': crear, 'eliminar_opciones': eliminar,
+        })
+        return
+    except supabase_client.APIError as e:
+        if e.code != 'PGRST202':
+            raise
+        logger.warning('La función aplicar_edicion_masiva no existe; las opciones se reemplazan en dos pasos')
+    OpcionRepository.create_many(crear)
+    OpcionRepository.delete_many(eliminar)
+
+
+def iter_docx(archivo) -> Iterator[Dict[str, Any]]:
+    """Preguntas de un .docx con el formato de generar_documento_word, párrafo a párrafo."""
+    from docx import Document
+
+    # Solo los párrafos del cuerpo: la tabla de carrera/asignatura no aporta preguntas
+    doc = Document(archivo)
+    yield from parsear_preguntas(parrafo.text + '\n' for parrafo in doc.paragraphs)
+
+
+_COLUMNAS_ANCHAS = ('opcion_a', 'opcion_b', 'opcion_c', 'opcion_d', 'opcion_e', 'opcion_f')
+
+
+def iter_csv(archivo_texto) -> Iterator[Dict[str, Any]]:
+    """Preguntas de un CSV, en formato ancho (opcion_a..opcion_d + correcta) o largo (una fila por opción).
+
+    El formato largo es el que produce la exportación CSV; las filas de una misma
+    pregunta deben ser consecutivas. En el formato ancho el número es opcional: las
+    filas sin número se numeran al importarlas (ver ``importar_banco``).
+    """
+    import csv
+
+    lector = csv.DictReader(archivo_texto)
+    actual: Optional[Dict[str, Any]] = None
+
+    def cerrar(item, numero_opcional=False):
+        correctas = sum(1 for o in item['opciones'] if o['es_correcta'])
+        if not (item['numero'] or numero_opcional) or not item['enunciado'] or len(item['opciones']) < 2 or correctas != 1:
+            return _error_item(item, f"Pregunta incompleta: {len(item['opciones'])} opciones, {correctas} correctas")
+        return item
+
+    for fila_numero, fila in enumerate(lector, 2):
+        try:
+            numero = int(fila.get('numero') or 0)
+            numero_unidad = int(fila.get('numero_unidad') or 1)
+        except ValueError:
+            yield {'error': 'Número de pregunta o de unidad inválido', 'numero': None, 'posicion': fila_numero}
+            continue
+
+        if actual and (actual['numero'], actual['unidad']['numero']) != (numero, numero_unidad):
+            yield cerrar(actual)
+            actual = None
+
+        if actual is None:
+            actual = {
+                'numero': numero,
+                'enunciado': (fila.get('enunciado') or '').strip(),
+                'explicacion': (fila.get('explicacion') or '').strip(),
+                'opciones': [],
+                'unidad': {'numero': numero_unidad, 'descripcion': (fila.get('unidad') or '').strip()},
+                'posicion': fila_numero,
+            }
+
+        if 'opcion' in fila:
+            if (fila.get('opcion') or '').strip():
+                actual['opciones'].append({
+                    'texto': fila['opcion'].strip(),
+                    'es_correcta': (fila.get('es_correcta') or '').strip().lower() in ('true', '1', 'si', 'sí', 'x'),
+                })
+        else:
+            letra = (fila.get('correcta') or '').strip().lower()[:1]
+            for columna in _COLUMNAS_ANCHAS:
+                texto = (fila.get(columna) or '').strip()
+                if texto:
+                    actual['opciones'].append({'texto': texto, 'es_correcta': columna[-1] == letra})
+            yield cerrar(actual, numero_opcional=True)
+            actual = None
+
+    if actual:
+        yield cerrar(actual)
+
+
+def items_banco(archivo, formato: str) -> Iterator[Dict[str, Any]]:
+    """Preguntas de un archivo binario según su formato ('docx' o 'csv')."""
+    if formato == 'docx':
+        return iter_docx(archivo)
+    if formato == 'csv':
+        # Los archivos subidos a Django envuelven el archivo real en ``.file``
+        return iter_csv(io.TextIOWrapper(getattr(archivo, 'file', archivo), encoding='utf-8-sig', newline=''))
+    raise ValueError(f'Formato no soportado: {formato}')
+
+
+def importar_banco(
+    partida_id: int,
+    items: Iterable[Dict[str, Any]],
+    programa_id: Optional[int] = None,
+    tamano_lote: int = 500,
+    dry_run: bool = False,
+) -> Dict[str, Any]:
+    """Carga un banco existente (DOCX o CSV) en las unidades del programa de la partida.
+
+    Las unidades se emparejan por número y se crean si no existen; las preguntas se
+    emparejan por (unidad, número) y se escriben con inserciones por lotes de
+    ``tamano_lote``. Las preguntas sin número toman las posiciones libres del rango de
+    su unidad (``rangos_numeracion``), después de leer todo el banco. Si una unidad
+    recibe preguntas fuera de su rango, crece y el programa se renumera
+    (``renumerar_programa_supabase``) para correr las unidades siguientes. Con
+    ``dry_run`` solo se valida y se cuenta lo que se escribiría.
+    """
+    arbol = SupabaseBusinessService.obtener_arbol_partida(partida_id)
+    if not arbol:
+        raise ValueError('Partida no encontrada')
+    if not arbol['programas']:
+        raise ValueError('La asignatura de la partida no tiene programa analítico')
+
+    programa = arbol['programas'][0]
+    if programa_id is not None:
+        programa = next((p for p in arbol['programas'] if p['linea_educativa_id'] == programa_id), None)
+        if not programa:
+            raise ValueError('El programa analítico no pertenece a la partida')
+
+    unidades = {
+        u['numero_unidad']: u for u in arbol['unidades']
+        if u['programa_analitico_id'] == programa['linea_educativa_id']
+    }
+    clave = lambda p: (p['unidad_id'], p['numero'])
+    existentes = {clave(p): p for u in unidades.values() for p in u['preguntas']}
+    rangos = rangos_numeracion(unidades.values(), {u['unidad_id']: len(u['preguntas']) for u in unidades.values()})
+    resumen: Dict[str, Any] = {
+        'procesadas': 0, 'actualizadas': 0, 'creadas': 0, 'unidades_creadas': 0, 'errores': []
+    }
+    unidades_fallidas: Dict[int, str] = {}
+    vistos = set()
+    sin_numero: List[Dict[str, Any]] = []
+    fuera_de_rango = False
+
+    for lote in _lotes(items, tamano_lote):
+        validos = []
+        for item in lote:
+            resumen['procesadas'] += 1
+            if 'error' in item:
+                resumen['errores'].append(item)
+                continue
+
+            datos_unidad = item.get('unidad') or {'numero': 1, 'descripcion': ''}
+            numero_unidad = datos_unidad['numero']
+            if numero_unidad not in unidades and numero_unidad not in unidades_fallidas:
+                try:
+                    unidades[numero_unidad] = _crear_unidad(datos_unidad, programa['linea_educativa_id'], dry_run)
+                    resumen['unidades_creadas'] += 1
+                except ValueError as e:
+                    unidades_fallidas[numero_unidad] = str(e)
+            if numero_unidad in unidades_fallidas:
+                # Sin unidad no se escribe ninguna pregunta suya; el resto del banco sigue
+                resumen['errores'].append(_error_item(item, unidades_fallidas[numero_unidad]))
+                continue
+
+            unidad = unidades[numero_unidad]
+            item['unidad_id'] = unidad['unidad_id']
+            if not item['numero']:
+                # Se numeran al final, cuando ya se conocen todos los números del banco
+                sin_numero.append(item)
+                continue
+            if clave(item) in vistos:
+                resumen['errores'].append(_error_item(item, 'Número repetido en la unidad'))
+                continue
+            vistos.add(clave(item))
+            if clave(item) not in existentes and item['numero'] not in rangos.get(item['unidad_id'], range(0)):
+                fuera_de_rango = True
+            validos.append(item)
+
+        _aplicar_lote(validos, existentes, clave, resumen, dry_run)
+
+    if sin_numero:
+        fuera_de_rango |= _numerar_en_unidad(sin_numero, rangos, set(existentes) | vistos)
+        for lote in _lotes(sin_numero, tamano_lote):
+            _aplicar_lote(lote, existentes, clave, resumen, dry_run)
+
+    if fuera_de_rango and not dry_run:
+        # Las unidades que crecieron pasan a ocupar tantas posiciones como preguntas tienen
+        reales: Dict[int, int] = {}
+        for unidad_id, _ in existentes:
+            reales[unidad_id] = reales.get(unidad_id, 0) + 1
+        for unidad in unidades.values():
+            if reales.get(unidad['unidad_id'], 0) > (unidad.get('num_preguntas') or 0):
+                UnidadRepository.update(unidad['unidad_id'], num_preguntas=reales[unidad['unidad_id']])
+        resumen['renumeradas'] = renumerar_programa_supabase(programa['linea_educativa_id'])['cambiadas']
+
+    if not dry_run:
+        despues_de_escribir(reconstruir_partida, partida_id)
+        resumen['duplicados'] = _duplicados_importados(partida_id)
+
+    logger.info(
+        f"Importación de banco en partida {partida_id}: {resumen['creadas']} creadas, "
+        f"{resumen['actualizadas']} actualizadas, {resumen['unidades_creadas']} unidades nuevas"
+    )
+    return resumen
+
+
+def _numerar_en_unidad(items: List[Dict[str, Any]], rangos: Dict[int, range], usados: Iterable[tuple]) -> bool:
+    """Asigna a cada pregunta sin número la primera posición libre del rango de su unidad.
+
+    Si la unidad no tiene posiciones libres, la pregunta se numera a continuación de las
+    de su unidad y se devuelve True: hay que renumerar el programa.
+    """
+    ocupados: Dict[int, set] = {}
+    for unidad_id, numero in usados:
+        ocupados.setdefault(unidad_id, set()).add(numero)
+
+    libres: Dict[int, Iterator[int]] = {}
+    siguiente: Dict[int, int] = {}
+    for item in items:
+        unidad_id = item['unidad_id']
+        de_la_unidad = ocupados.setdefault(unidad_id, set())
+        if unidad_id not in libres:
+            libres[unidad_id] = (n for n in rangos.get(unidad_id, range(0)) if n not in de_la_unidad)
+        numero = next(libres[unidad_id], None)
+        if numero is None:
+            if unidad_id not in siguiente:
+                siguiente[unidad_id] = max(de_la_unidad | {rangos.get(unidad_id, range(0)).stop - 1, 0}) + 1
+            numero = siguiente[unidad_id]
+            siguiente[unidad_id] += 1
+        de_la_unidad.add(numero)
+        item['numero'] = numero
+    return bool(siguiente)
+
+
+def _crear_unidad(datos_unidad: Dict[str, Any], programa_id: int, dry_run: bool) -> Dict[str, Any]:
+    descripcion = datos_unidad.get('descripcion') or f"Unidad {datos_unidad['numero']}"
+    if dry_run:
+        # Identificador ficticio: en dry-run no se escribe nada
+        return {'unidad_id': -datos_unidad['numero'], 'numero_unidad': datos_unidad['numero'], 'num_preguntas': 0}
+    unidad = UnidadRepository.create(
+        numero_unidad=datos_unidad['numero'],
+        descripcion=descripcion,
+        num_preguntas=0,
+        programa_analitico_id=programa_id,
+    )
+    if not unidad:
+        raise ValueError(f"No se pudo crear la unidad {datos_unidad['numero']}")
+    return unidad
@@ -0,0 +1,177 @@
+import logging
+import os
+import socket
+import threading
+from datetime import timedelta
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Set
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Tarea
+
+logger = logging.getLogger(__name__)
+
+# tipo -> función(progreso, **parametros)
+_REGISTRO: Dict[str, Callable[..., Optional[Dict[str, Any]]]] = {}
+# Tipos que se pueden volver a ejecutar sin efectos duplicados
+_IDEMPOTENTES: Set[str] = set()
+
+
+def tarea(tipo: str, idempotente: bool = False):
+    """Registra una función como tarea en segundo plano.
+
+    La función recibe un ``Progreso`` y los parámetros de la tarea, y devuelve un dict
+    con el resultado. Si el dict trae ``contenido`` (bytes), se guarda como archivo de
+    resultado junto con ``nombre_archivo`` y ``content_type``. Solo las tareas
+    ``idempotente`` se vuelven a encolar si su worker se cae a mitad de camino.
+    """
+    def decorator(func):
+        _REGISTRO[tipo] = func
+        if idempotente:
+            _IDEMPOTENTES.add(tipo)
+        return func
+    return decorator
+
+
+def tareas_en_segundo_plano() -> bool:
+    return getattr(settings, 'TAREAS_EN_SEGUNDO_PLANO', False)
+
+
+def encolar(tipo: str, **parametros) -> Tarea:
+    if tipo not in _REGISTRO:
+        raise ValueError(f'Tipo de tarea desconocido: {tipo}')
+    return Tarea.objects.create(tipo=tipo, parametros=parametros)
+
+
+class Progreso:
+    """Reporta el avance de una tarea; solo escribe en la base cuando el porcentaje cambia."""
+
+    def __init__(self, tarea_id: Optional[int] = None):
+        self.tarea_id = tarea_id
+        self.porcentaje = -1
+
+    def __call__(self, porcentaje: int, mensaje: str = '') -> None:
+        porcentaje = max(0, min(100, int(porcentaje)))
+        if self.tarea_id is None or porcentaje == self.porcentaje:
+            return
+        self.porcentaje = porcentaje
+        Tarea.objects.filter(pk=self.tarea_id).update(progreso=porcentaje, mensaje=mensaje[:255])
+
+
+def reclamar_siguiente(worker: str) -> Optional[Tarea]:
+    """Toma la tarea pendiente más antigua con una actualización condicional.
+
+    Varios workers pueden competir por la misma fila: solo el que logra cambiar el
+    estado de ``pendiente`` a ``en_proceso`` se queda con ella.
+    """
+    for _ in range(5):
+        candidata = (
+            Tarea.objects.filter(estado=Tarea.PENDIENTE, tipo__in=list(_REGISTRO))
+            .order_by('creada', 'pk')
+            .values_list('pk', flat=True)
+            .first()
+        )
+        if candidata is None:
+            return None
+        ahora = timezone.now()
+        tomadas = Tarea.objects.filter(pk=candidata, estado=Tarea.PENDIENTE).update(
+            estado=Tarea.EN_PROCESO, worker=worker, iniciada=ahora, latido=ahora
+        )
+        if tomadas:
+            return Tarea.objects.get(pk=candidata)
+    return None
+
+
+def _guardar_archivo(tarea_obj: Tarea, contenido: bytes, nombre: str) -> str:
+    directorio = Path(settings.TAREAS_RESULTADOS_DIR)
+    directorio.mkdir(parents=True, exist_ok=True)
+    ruta = directorio / f"tarea_{tarea_obj.pk}_{os.path.basename(nombre)}"
+    ruta.write_bytes(contenido)
+    return str(ruta)
+
+
+def ejecutar(tarea_obj: Tarea) -> None:
+    """Ejecuta una tarea ya reclamada y guarda su resultado o su error."""
+    try:
+        func = _REGISTRO[tarea_obj.tipo]
+        resultado = func(Progreso(tarea_obj.pk), **tarea_obj.parametros) or {}
+
+        campos: Dict[str, Any] = {}
+        contenido = resultado.pop('contenido', None)
+        if contenido is not None:
+            nombre = resultado.pop('nombre_archivo', f'resultado_{tarea_obj.pk}')
+            campos.update(
+                archivo=_guardar_archivo(tarea_obj, contenido, nombre),
+                nombre_archivo=nombre,
+                content_type=resultado.pop('content_type', 'application/octet-stream'),
+            )
+        Tarea.objects.filter(pk=tarea_obj.pk).update(
+            estado=Tarea.COMPLETADA,
+            progreso=100,
+            resultado=resultado,
+            terminada=timezone.now(),
+            intentos=tarea_obj.intentos + 1,
+            **campos
+        )
+        logger.info(f"Tarea {tarea_obj.pk} ({tarea_obj.tipo}) completada")
+    except Exception as e:
+        logger.error(f"Tarea {tarea_obj.pk} ({tarea_obj.tipo}) falló: {e}", exc_info=True)
+        Tarea.objects.filter(pk=tarea_obj.pk).update(
+            estado=Tarea.FALLIDA,
+            error=str(e),
+            terminada=timezone.now(),
+            intentos=tarea_obj.intentos + 1,
+        )
+    finally:
+        # Cada hilo del pool usa su propia conexión; liberarla al terminar la tarea
+        close_old_connections()
+
+
+def latir(worker: str) -> int:
+    """Renueva el latido de las tareas en proceso del worker; lo llama un hilo de ``procesar_tareas``."""
+    return Tarea.objects.filter(estado=Tarea.EN_PROCESO, worker=worker).update(latido=timezone.now())
+
+
+def recuperar_abandonadas() -> Dict[str, int]:
+    """Resuelve las tareas en proceso cuyo worker dejó de latir (se cayó).
+
+    Una tarea lenta con un worker vivo sigue latiendo y no se toca. De las abandonadas,
+    las idempotentes vuelven a la cola y las demás (crear una partida, importar) se
+    marcan fallidas: pudieron quedar aplicadas a medias y repetirlas duplicaría datos.
+    Las filas sin latido (anteriores a este campo) usan ``TAREAS_TIEMPO_MAXIMO``.
+    """
+    ahora = timezone.now()
+    abandonadas = Tarea.objects.filter(estado=Tarea.EN_PROCESO).filter(
+        Q(latido__lt=ahora - timedelta(seconds=settings.TAREAS_LATIDO_VENCIDO))
+        | Q(latido__isnull=True, iniciada__lt=ahora - timedelta(seconds=settings.TAREAS_TIEMPO_MAXIMO))
+    )
+    reencoladas = abandonadas.filter(tipo__in=list(_IDEMPOTENTES)).update(
+        estado=Tarea.PENDIENTE, worker='', iniciada=None, latido=None
+    )
+    fallidas = abandonadas.exclude(tipo__in=list(_IDEMPOTENTES)).update(
+        estado=Tarea.FALLIDA,
+        error='El worker se detuvo durante la ejecución; revise el resultado antes de repetirla',
+        terminada=ahora,
+    )
+    return {'reencoladas': reencoladas, 'fallidas': fallidas}
+
+
+def purgar_antiguas() -> int:
+    """Elimina las tareas terminadas (y sus archivos) más antiguas que la retención configurada."""
+    limite = timezone.now() - timedelta(days=settings.TAREAS_RETENCION_DIAS)
+    antiguas = Tarea.objects.filter(estado__in=[Tarea.COMPLETADA, Tarea.FALLIDA], terminada__lt=limite)
+    for ruta in antiguas.exclude(archivo='').values_list('archivo', flat=True):
+        try:
+            os.remove(ruta)
+        except OSError:
+            pass
+    eliminadas, _ = antiguas.delete()
+    return eliminadas
+
+
+def nombre_worker() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
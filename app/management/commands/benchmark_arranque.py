@@ -0,0 +1,78 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Corre en un proceso nuevo para medir un arranque en frío real (sin módulos ya importados)
+SCRIPT = r"""
+import json, os, time
+t0 = time.perf_counter()
+import django
+django.setup()
+t1 = time.perf_counter()
+from app.repositories import CarreraRepository
+from app.supabase_client import estado_calentamiento, get_supabase_client, iniciar_worker
+# Como gunicorn (post_worker_init) y el balanceador con /salud/listo/: sin tráfico
+# mientras el worker se calienta
+if os.environ['SUPABASE_PRECALENTAR'] == '1':
+    iniciar_worker()
+    while estado_calentamiento()['estado'] in ('frio', 'calentando'):
+        time.sleep(0.005)
+t2 = time.perf_counter()
+get_supabase_client()
+t3 = time.perf_counter()
+CarreraRepository.list_all(limit=1)
+t4 = time.perf_counter()
+CarreraRepository.list_all(limit=1)
+t5 = time.perf_counter()
+print(json.dumps({
+    'setup': t1 - t0,
+    'listo': t2 - t1,
+    'cliente': t3 - t2,
+    'primera_consulta': t4 - t3,
+    'segunda_consulta': t5 - t4,
+    'primera_peticion': t4 - t2,
+}))
+"""
+
+ETAPAS = [
+    ('setup', 'django.setup()'),
+    ('listo', 'calentamiento en segundo plano'),
+    ('cliente', 'get_supabase_client()'),
+    ('primera_consulta', 'primera consulta'),
+    ('segunda_consulta', 'segunda consulta'),
+    ('primera_peticion', 'listo -> primera respuesta'),
+]
+
+
+class Command(BaseCommand):
+    help = 'Mide el arranque en frío de un worker: setup, creación del cliente y primeras consultas a Supabase'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeticiones', type=int, default=5)
+
+    def _medir(self, precalentar):
+        entorno = {
+            **os.environ,
+            'DJANGO_SETTINGS_MODULE': os.environ.get('DJANGO_SETTINGS_MODULE', 'project.settings'),
+            'SUPABASE_PRECALENTAR': '1' if precalentar else '0',
+        }
+        proceso = subprocess.run(
+            [sys.executable, '-c', SCRIPT], cwd=settings.BASE_DIR, env=entorno, capture_output=True, text=True
+        )
+        if proceso.returncode != 0:
+            raise CommandError(proceso.stderr.strip().splitlines()[-1] if proceso.stderr else 'El proceso falló')
+        return json.loads(proceso.stdout.strip().splitlines()[-1])
+
+    def handle(self, *args, **options):
+        for precalentar in (False, True):
+            corridas = [self._medir(precalentar) for _ in range(options['repeticiones'])]
+            titulo = 'Con precalentamiento' if precalentar else 'Sin precalentamiento'
+            self.stdout.write(f'\n{titulo} (mediana de {len(corridas)} procesos)')
+            for clave, nombre in ETAPAS:
+                mediana = statistics.median(c[clave] for c in corridas)
+                self.stdout.write(f'  {nombre:<45} {mediana * 1000:8.1f} ms')
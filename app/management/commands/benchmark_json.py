@@ -0,0 +1,92 @@
+import statistics
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand, CommandError
+from django.http import JsonResponse
+
+from app import responses
+from app.repositories import ProgramaAnaliticoRepository, UnidadRepository
+from app.snapshots import obtener_snapshot
+
+
+def _sinteticas(cantidad):
+    parrafo = (
+        'La unidad aborda los fundamentos teóricos y prácticos de la asignatura, con énfasis en '
+        'la resolución de problemas, el análisis de casos y la evaluación crítica de resultados. '
+    )
+    return [
+        {
+            'unidad_id': i,
+            'programa_analitico_id': 1 + i // 12,
+            'numero_unidad': 1 + i % 12,
+            'descripcion': f'Unidad {1 + i % 12}: contenidos y resultados de aprendizaje',
+            'contexto': parrafo * 40,
+            'fecha_creacion': '2025-01-01T00:00:00+00:00',
+        }
+        for i in range(cantidad)
+    ]
+
+
+def _stdlib(datos):
+    return JsonResponse(datos, safe=False).content
+
+
+def _rapido(datos):
+    return responses.dumps(datos)
+
+
+def _streaming(datos):
+    # Se consume como lo haría el servidor: un trozo a la vez, sin juntarlos
+    total = 0
+    for trozo in responses.StreamingJsonResponse(datos).streaming_content:
+        total += len(trozo)
+    return total
+
+
+class Command(BaseCommand):
+    help = 'Mide tiempo de serialización y memoria pico de las respuestas JSON más grandes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--partida', type=int, help='Incluye las preguntas de esta partida (como /api/preguntas/)')
+        parser.add_argument('--sinteticas', type=int, help='Usa N unidades generadas en lugar de leer Supabase')
+        parser.add_argument('--repeticiones', type=int, default=10)
+
+    def handle(self, *args, **options):
+        if options['sinteticas']:
+            conjuntos = {'unidades (sintéticas)': _sinteticas(options['sinteticas'])}
+        else:
+            conjuntos = {
+                'unidades': UnidadRepository.list_all(limit=1000),
+                'programas': ProgramaAnaliticoRepository.list_all(limit=1000),
+            }
+        if options['partida']:
+            snapshot = obtener_snapshot(options['partida'])
+            if not snapshot:
+                raise CommandError(f"Partida {options['partida']} no encontrada")
+            conjuntos['preguntas'] = [p for u in snapshot['unidades'] for p in u['preguntas']]
+
+        metodos = {'JsonResponse': _stdlib, 'FastJsonResponse': _rapido, 'StreamingJsonResponse': _streaming}
+        motor = 'orjson' if responses.orjson is not None else 'json (orjson no instalado)'
+        self.stdout.write(f'Serializador rápido: {motor}')
+
+        for nombre, datos in conjuntos.items():
+            tamano = len(_stdlib(datos))
+            self.stdout.write(f'\n{nombre}: {len(datos)} filas, {tamano / 1024:.0f} KB')
+            for metodo, funcion in metodos.items():
+                tiempos = []
+                for _ in range(options['repeticiones']):
+                    inicio = time.perf_counter()
+                    funcion(datos)
+                    tiempos.append(time.perf_counter() - inicio)
+
+                # Memoria en una corrida aparte: tracemalloc altera los tiempos
+                tracemalloc.start()
+                funcion(datos)
+                _, pico = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+
+                self.stdout.write(
+                    f'  {metodo:<22} {statistics.median(tiempos) * 1000:8.2f} ms  '
+                    f'pico {pico / 1024:8.0f} KB'
+                )
@@ -45,16 +45,13 @@ class Command(BaseCommand):
             # Crear programas analíticos
             programas = self.crear_programas(asignaturas, programas_count)
             
-            # Crear unidades
+            # Crear unidades; sus preguntas son virtuales hasta la primera edición (ver placeholders.py)
             unidades = self.crear_unidades(programas, unidades_count)
-            
-            # Generar preguntas automáticamente
-            self.generar_preguntas_automaticamente(unidades)
 
         total_preguntas = sum(unidad.num_preguntas for unidad in unidades)
         self.stdout.write(
             self.style.SUCCESS(
-                f'¡Datos creados exitosamente! Total de preguntas generadas: {total_preguntas}'
+                f'¡Datos creados exitosamente! Total de preguntas por completar: {total_preguntas}'
             )
         )
 
@@ -130,17 +127,3 @@ class Command(BaseCommand):
 
         self.stdout.write(f'Unidades creadas: {len(unidades)}')
         return unidades
-
-    def generar_preguntas_automaticamente(self, unidades):
-        """Generar preguntas automáticamente para todas las unidades"""
-        total_generadas = 0
-        for unidad in unidades:
-            if unidad.generar_preguntas_automaticamente():
-                total_generadas += unidad.num_preguntas
-                self.stdout.write(f'  OK {unidad.num_preguntas} preguntas generadas para {unidad}')
-            else:
-                self.stdout.write(
-                    self.style.WARNING(f'  ERROR: Error generando preguntas para {unidad}')
-                )
-
-        self.stdout.write(f'Total preguntas generadas: {total_generadas}')
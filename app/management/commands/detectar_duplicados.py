@@ -0,0 +1,57 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from app.duplicates import buscar_duplicados, indexar_partida
+from app.repositories import PartidaRepository
+
+
+class Command(BaseCommand):
+    help = 'Indexa las firmas MinHash de las preguntas y lista los grupos de casi duplicados'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--partida', type=int, help='ID de una partida (default: todas las asignaturas)')
+        parser.add_argument('--asignatura', type=int, help='ID de una asignatura')
+        parser.add_argument('--umbral', type=float, help='Similitud mínima entre 0 y 1 (default: DUPLICADOS_UMBRAL)')
+        parser.add_argument('--solo-indexar', action='store_true', help='Actualiza el índice sin listar duplicados')
+
+    def handle(self, *args, **options):
+        if options['partida']:
+            partidas = [PartidaRepository.get_by_id(options['partida'])]
+            if not partidas[0]:
+                raise CommandError(f"Partida {options['partida']} no encontrada")
+        else:
+            partidas = PartidaRepository.list_all(limit=10000, asignatura_id=options['asignatura'])
+
+        # Las partidas de una misma asignatura comparten preguntas: se indexa una por asignatura
+        por_asignatura = {}
+        for partida in partidas:
+            por_asignatura.setdefault(partida['asignatura_id'], partida['partida_id'])
+        if options['asignatura'] and not por_asignatura:
+            raise CommandError(f"La asignatura {options['asignatura']} no tiene partidas")
+
+        indexadas = 0
+        for partida_id in por_asignatura.values():
+            indexadas += len(indexar_partida(partida_id)[1])
+        self.stdout.write(f'Preguntas indexadas (nuevas o modificadas): {indexadas}')
+        if options['solo_indexar']:
+            return
+
+        # Un grupo con preguntas de varias asignaturas se lista una sola vez
+        vistos = set()
+        total = 0
+        for asignatura_id in sorted(por_asignatura):
+            for grupo in buscar_duplicados(asignatura_id=asignatura_id, umbral=options['umbral']):
+                miembros = frozenset(p['pregunta_id'] for p in grupo['preguntas'])
+                if miembros in vistos:
+                    continue
+                vistos.add(miembros)
+                total += 1
+                self.stdout.write(
+                    f"\nGrupo {total} ({len(grupo['preguntas'])} preguntas, similitud {grupo['similitud_maxima']:.2f})"
+                )
+                for pregunta in grupo['preguntas']:
+                    self.stdout.write(
+                        f"  [{pregunta['pregunta_id']}] asignatura {pregunta['asignatura_id']}, "
+                        f"unidad {pregunta['unidad_id']}, n.º {pregunta['numero']}: {pregunta['enunciado'][:80]}"
+                    )
+
+        self.stdout.write(self.style.SUCCESS(f'\nGrupos de casi duplicados: {total}'))
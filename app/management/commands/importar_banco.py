@@ -0,0 +1,61 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from app.importers import importar_banco, items_banco
+
+
+class Command(BaseCommand):
+    help = 'Importa un banco de preguntas existente (DOCX o CSV) en las unidades de una partida'
+
+    def add_arguments(self, parser):
+        parser.add_argument('archivo', help='Archivo .docx o .csv con las preguntas')
+        parser.add_argument('--partida', type=int, required=True, help='ID de la partida')
+        parser.add_argument(
+            '--programa',
+            type=int,
+            help='ID del programa analítico destino (default: el primero de la asignatura)'
+        )
+        parser.add_argument(
+            '--formato',
+            choices=['docx', 'csv'],
+            help='Formato del archivo (default: según la extensión)'
+        )
+        parser.add_argument(
+            '--lote',
+            type=int,
+            default=500,
+            help='Preguntas por lote de escritura (default: 500)'
+        )
+        parser.add_argument('--dry-run', action='store_true', help='Valida sin escribir en la base')
+
+    def handle(self, *args, **options):
+        formato = options['formato'] or os.path.splitext(options['archivo'])[1].lstrip('.').lower()
+
+        try:
+            with open(options['archivo'], 'rb') as archivo:
+                resumen = importar_banco(
+                    partida_id=options['partida'],
+                    items=items_banco(archivo, formato),
+                    programa_id=options['programa'],
+                    tamano_lote=options['lote'],
+                    dry_run=options['dry_run'],
+                )
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+
+        for error in resumen['errores']:
+            self.stdout.write(
+                self.style.WARNING(
+                    f"  ERROR (pregunta {error.get('numero') or '?'}, posición {error.get('posicion')}): {error['error']}"
+                )
+            )
+
+        prefijo = '[dry-run] ' if options['dry_run'] else ''
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{prefijo}Procesadas: {resumen['procesadas']}, actualizadas: {resumen['actualizadas']}, "
+                f"creadas: {resumen['creadas']}, unidades nuevas: {resumen['unidades_creadas']}, "
+                f"con errores: {len(resumen['errores'])}"
+            )
+        )
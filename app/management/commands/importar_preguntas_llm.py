@@ -0,0 +1,57 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from app.importers import importar_salida_llm, leer_texto
+
+
+class Command(BaseCommand):
+    help = 'Importa al banco las preguntas generadas por un modelo a partir del prompt (JSON o texto)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('archivo', help='Archivo con la salida del modelo')
+        parser.add_argument('--partida', type=int, required=True, help='ID de la partida')
+        parser.add_argument(
+            '--unidad',
+            type=int,
+            help='ID de la unidad; los números que no existan se crean en ella'
+        )
+        parser.add_argument(
+            '--programa',
+            type=int,
+            help='ID del programa analítico; requerido si la asignatura tiene varios y no se indica --unidad'
+        )
+        parser.add_argument(
+            '--lote',
+            type=int,
+            default=200,
+            help='Preguntas por lote de escritura (default: 200)'
+        )
+        parser.add_argument('--dry-run', action='store_true', help='Valida sin escribir en la base')
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['archivo'], 'rb') as archivo:
+                resumen = importar_salida_llm(
+                    partida_id=options['partida'],
+                    chunks=leer_texto(archivo),
+                    unidad_id=options['unidad'],
+                    programa_id=options['programa'],
+                    tamano_lote=options['lote'],
+                    dry_run=options['dry_run'],
+                )
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+
+        for error in resumen['errores']:
+            self.stdout.write(
+                self.style.WARNING(
+                    f"  ERROR (pregunta {error.get('numero') or '?'}, posición {error.get('posicion')}): {error['error']}"
+                )
+            )
+
+        prefijo = '[dry-run] ' if options['dry_run'] else ''
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{prefijo}Procesadas: {resumen['procesadas']}, actualizadas: {resumen['actualizadas']}, "
+                f"creadas: {resumen['creadas']}, con errores: {len(resumen['errores'])}"
+            )
+        )
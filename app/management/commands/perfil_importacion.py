@@ -0,0 +1,61 @@
+import os
+import subprocess
+import sys
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Lo que importa un worker antes de su primera petición: apps, URLs y vistas
+SCRIPT = 'import django; django.setup(); import project.urls'
+
+
+def _leer_importtime(salida):
+    """Filas (módulo, propio en µs, acumulado en µs, profundidad) de la salida de -X importtime."""
+    filas = []
+    for linea in salida.splitlines():
+        if not linea.startswith('import time:') or 'self [us]' in linea:
+            continue
+        propio, acumulado, nombre = linea[len('import time:'):].split('|')
+        profundidad = (len(nombre) - len(nombre.lstrip()) - 1) // 2
+        filas.append((nombre.strip(), int(propio), int(acumulado), profundidad))
+    return filas
+
+
+class Command(BaseCommand):
+    help = 'Perfila el tiempo de importación del arranque (python -X importtime)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=20, help='Cantidad de paquetes y módulos a listar')
+        parser.add_argument('--guardar', help='Guarda la salida completa de -X importtime en este archivo')
+
+    def handle(self, *args, **options):
+        entorno = {
+            **os.environ,
+            'DJANGO_SETTINGS_MODULE': os.environ.get('DJANGO_SETTINGS_MODULE', 'project.settings'),
+            # Solo se mide la importación, sin abrir conexiones
+            'SUPABASE_PRECALENTAR': '0',
+        }
+        proceso = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', SCRIPT],
+            cwd=settings.BASE_DIR, env=entorno, capture_output=True, text=True,
+        )
+        filas = _leer_importtime(proceso.stderr)
+        if proceso.returncode != 0 or not filas:
+            raise CommandError(proceso.stderr.strip().splitlines()[-1] if proceso.stderr else 'El proceso falló')
+        if options['guardar']:
+            with open(options['guardar'], 'w', encoding='utf-8') as archivo:
+                archivo.write(proceso.stderr)
+
+        total = sum(acumulado for _, _, acumulado, profundidad in filas if profundidad == 0) / 1000
+        por_paquete = defaultdict(int)
+        for nombre, propio, _, _ in filas:
+            por_paquete[nombre.split('.')[0]] += propio
+
+        self.stdout.write(f'Importación total: {total:.1f} ms en {len(filas)} módulos')
+        self.stdout.write(f"\nPaquetes por tiempo propio (top {options['top']}):")
+        for paquete, propio in sorted(por_paquete.items(), key=lambda p: -p[1])[:options['top']]:
+            self.stdout.write(f'  {propio / 1000:8.1f} ms  {paquete}')
+        self.stdout.write(f"\nMódulos por tiempo acumulado (top {options['top']}):")
+        for nombre, _, acumulado, _ in sorted(filas, key=lambda f: -f[2])[:options['top']]:
+            self.stdout.write(f'  {acumulado / 1000:8.1f} ms  {nombre}')
@@ -0,0 +1,75 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from app.jobs import ejecutar, latir, nombre_worker, purgar_antiguas, reclamar_siguiente, recuperar_abandonadas
+
+
+def _latir_mientras(worker, detener):
+    # Hilo aparte: una tarea lenta sigue latiendo aunque el bucle principal esté ocupado
+    while not detener.wait(settings.TAREAS_LATIDO):
+        try:
+            latir(worker)
+        finally:
+            close_old_connections()
+
+
+class Command(BaseCommand):
+    help = 'Ejecuta las tareas en segundo plano (creación de partidas, documentos) con un pool de hilos'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--hilos',
+            type=int,
+            default=settings.TAREAS_HILOS,
+            help=f'Tareas simultáneas (default: {settings.TAREAS_HILOS})'
+        )
+        parser.add_argument(
+            '--intervalo',
+            type=float,
+            default=1.0,
+            help='Segundos entre consultas a la cola cuando está vacía (default: 1)'
+        )
+        parser.add_argument(
+            '--una-vez',
+            action='store_true',
+            help='Procesa las tareas pendientes y termina'
+        )
+
+    def handle(self, *args, **options):
+        hilos = max(1, options['hilos'])
+        recuperadas = recuperar_abandonadas()
+        purgadas = purgar_antiguas()
+        worker = nombre_worker()
+        self.stdout.write(
+            f'Worker {worker} con {hilos} hilos ({recuperadas["reencoladas"]} tareas reencoladas, '
+            f'{recuperadas["fallidas"]} abandonadas marcadas fallidas, {purgadas} purgadas)'
+        )
+
+        detener = threading.Event()
+        threading.Thread(target=_latir_mientras, args=(worker, detener), name='latido', daemon=True).start()
+        en_curso = set()
+        with ThreadPoolExecutor(max_workers=hilos, thread_name_prefix='tarea') as pool:
+            try:
+                while True:
+                    en_curso = {f for f in en_curso if not f.done()}
+                    tomada = None
+                    if len(en_curso) < hilos:
+                        tomada = reclamar_siguiente(worker)
+                        if tomada:
+                            self.stdout.write(f'Tarea {tomada.pk} ({tomada.tipo}) iniciada')
+                            en_curso.add(pool.submit(ejecutar, tomada))
+                            continue
+
+                    if options['una_vez'] and not en_curso and tomada is None:
+                        break
+                    time.sleep(options['intervalo'])
+            except KeyboardInterrupt:
+                self.stdout.write(self.style.WARNING('Deteniendo: se esperan las tareas en curso...'))
+
+        detener.set()
+        self.stdout.write(self.style.SUCCESS('Worker detenido'))
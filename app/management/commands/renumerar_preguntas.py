@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from app.numbering import renumerar_programa, renumerar_programa_supabase
+from app.repositories import UnidadRepository
+from app.snapshots import despues_de_escribir, refrescar_unidades
+
+
+class Command(BaseCommand):
+    help = 'Compacta la numeración de las preguntas de un programa analítico dentro de cada unidad'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--programa', type=int, required=True, help='ID del programa analítico')
+        parser.add_argument(
+            '--local',
+            action='store_true',
+            help='Renumera en la base local de Django en lugar de Supabase'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            if options['local']:
+                resultado = renumerar_programa(options['programa'])
+            else:
+                resultado = renumerar_programa_supabase(options['programa'])
+                if resultado['cambiadas']:
+                    unidades = UnidadRepository.list_by_programas([options['programa']])
+                    despues_de_escribir(refrescar_unidades, [u['unidad_id'] for u in unidades])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Preguntas: {resultado['total']}, renumeradas: {resultado['cambiadas']}"
+            )
+        )
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from app.models import PartidaSnapshot
+from app.repositories import PartidaRepository
+from app.snapshots import reconstruir_asignatura, reconstruir_partida
+
+
+class Command(BaseCommand):
+    help = 'Reconstruye desde Supabase los snapshots de lectura de las partidas'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--partida', type=int, help='ID de una partida (default: todas)')
+
+    def handle(self, *args, **options):
+        if options['partida']:
+            if reconstruir_partida(options['partida']) is None:
+                raise CommandError(f"Partida {options['partida']} no encontrada")
+            self.stdout.write(self.style.SUCCESS(f"Snapshot de la partida {options['partida']} reconstruido"))
+            return
+
+        partidas = PartidaRepository.list_all(limit=10000)
+
+        # Snapshots de partidas que ya no existen en Supabase
+        eliminados, _ = PartidaSnapshot.objects.exclude(pk__in=[p['partida_id'] for p in partidas]).delete()
+        if eliminados:
+            self.stdout.write(f'Snapshots huérfanos eliminados: {eliminados}')
+
+        # Las partidas de una misma asignatura comparten árbol: se carga una vez por asignatura
+        total = 0
+        for asignatura_id in sorted({p['asignatura_id'] for p in partidas}):
+            total += reconstruir_asignatura(asignatura_id)
+
+        self.stdout.write(self.style.SUCCESS(f'Snapshots reconstruidos: {total}'))
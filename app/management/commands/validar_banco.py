@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from app.repositories import PartidaRepository
+from app.validation import validar_partida
+
+
+class Command(BaseCommand):
+    help = 'Valida las reglas de calidad de las preguntas (opciones, respuesta correcta, longitud, explicación, rachas)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--partida', type=int, help='ID de una partida (default: todas las asignaturas)')
+        parser.add_argument('--asignatura', type=int, help='ID de una asignatura')
+        parser.add_argument('--detalle', action='store_true', help='Lista cada pregunta con problemas')
+
+    def handle(self, *args, **options):
+        if options['partida']:
+            partida_ids = [options['partida']]
+        else:
+            # Las partidas de una misma asignatura comparten preguntas: se valida una por asignatura
+            por_asignatura = {}
+            for partida in PartidaRepository.list_all(limit=10000, asignatura_id=options['asignatura']):
+                por_asignatura.setdefault(partida['asignatura_id'], partida['partida_id'])
+            partida_ids = list(por_asignatura.values())
+            if options['asignatura'] and not partida_ids:
+                raise CommandError(f"La asignatura {options['asignatura']} no tiene partidas")
+
+        con_problemas = 0
+        for partida_id in partida_ids:
+            reporte = validar_partida(partida_id)
+            if reporte is None:
+                raise CommandError(f'Partida {partida_id} no encontrada')
+            con_problemas += reporte['con_problemas']
+            reglas = ', '.join(f'{regla}: {cantidad}' for regla, cantidad in sorted(reporte['por_regla'].items()))
+            self.stdout.write(
+                f"Asignatura {reporte['asignatura_id']}: {reporte['total']} preguntas, "
+                f"{reporte['evaluadas']} evaluadas, {reporte['con_problemas']} con problemas"
+                + (f' ({reglas})' if reglas else '')
+            )
+            if options['detalle']:
+                for pregunta in reporte['preguntas']:
+                    mensajes = '; '.join(p['mensaje'] for p in pregunta['problemas'])
+                    self.stdout.write(f"  Pregunta {pregunta['numero']} [{pregunta['pregunta_id']}]: {mensajes}")
+
+        estilo = self.style.WARNING if con_problemas else self.style.SUCCESS
+        self.stdout.write(estilo(f'Preguntas con problemas: {con_problemas}'))
@@ -0,0 +1,158 @@
+import re
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.text import compress_sequence, compress_string
+
+from .deadline import PlazoAgotado, iniciar_plazo, resultados_parciales, terminar_plazo
+from .responses import FastJsonResponse
+from .swr import hay_datos_obsoletos, iniciar_peticion, invalidar, terminar_peticion
+
+try:
+    import brotli
+except ImportError:  # opcional: sin brotli se comprime solo con gzip
+    brotli = None
+
+METODOS_DE_LECTURA = ('GET', 'HEAD', 'OPTIONS')
+
+# Tipos que vale la pena comprimir; docx, imágenes y eventos SSE quedan como están
+TIPOS_COMPRIMIBLES = ('text/html', 'text/plain', 'text/css', 'application/json', 'application/x-ndjson',
+                      'application/javascript', 'text/javascript', 'image/svg+xml')
+
+
+class DatosObsoletosMiddleware:
+    """Marca las respuestas servidas con copias obsoletas e invalida las copias tras una escritura.
+
+    Las respuestas obsoletas llevan ``Warning: 110`` y ``X-Datos-Obsoletos: 1``.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = iniciar_peticion()
+        try:
+            response = self.get_response(request)
+            if hay_datos_obsoletos():
+                response['Warning'] = '110 - "Response is Stale"'
+                response['X-Datos-Obsoletos'] = '1'
+            if request.method not in METODOS_DE_LECTURA and response.status_code < 400:
+                invalidar()
+            return response
+        finally:
+            terminar_peticion(token)
+
+
+class PlazoPeticionMiddleware:
+    """Fija un plazo para la petición que respetan todas las llamadas a Supabase.
+
+    El plazo sale de ``PETICION_PLAZO`` o de la cabecera ``X-Request-Timeout`` (segundos),
+    acotada a ``PETICION_PLAZO_MAXIMO``. Las respuestas recortadas por el plazo llevan
+    ``X-Resultados-Parciales: 1``.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def _plazo(self, request):
+        plazo = settings.PETICION_PLAZO
+        try:
+            pedido = float(request.headers['X-Request-Timeout'])
+            if pedido > 0:
+                plazo = min(pedido, settings.PETICION_PLAZO_MAXIMO)
+        except (KeyError, ValueError):
+            pass
+        return plazo or None
+
+    def __call__(self, request):
+        token = iniciar_plazo(self._plazo(request))
+        try:
+            response = self.get_response(request)
+            if resultados_parciales():
+                response['X-Resultados-Parciales'] = '1'
+            return response
+        finally:
+            terminar_plazo(token)
+
+    def process_exception(self, request, exception):
+        if isinstance(exception, PlazoAgotado):
+            return FastJsonResponse({'success': False, 'error': 'Se agotó el tiempo de la petición'}, status=504)
+        return None
+
+
+def _codificacion(request):
+    """'br' o 'gzip' según Accept-Encoding (respetando q=0), o None."""
+    aceptadas = {}
+    for parte in request.headers.get('Accept-Encoding', '').split(','):
+        nombre, _, parametros = parte.partition(';')
+        calidad = 1.0
+        parametros = parametros.strip()
+        if parametros.startswith('q='):
+            try:
+                calidad = float(parametros[2:])
+            except ValueError:
+                calidad = 0.0
+        if nombre.strip():
+            aceptadas[nombre.strip().lower()] = calidad
+    if brotli is not None and aceptadas.get('br', 0) > 0:
+        return 'br'
+    if aceptadas.get('gzip', 0) > 0:
+        return 'gzip'
+    return None
+
+
+def _brotli_por_trozos(trozos):
+    compresor = brotli.Compressor(quality=settings.COMPRESION_BROTLI_CALIDAD)
+    for trozo in trozos:
+        # flush por trozo: el cliente recibe cada parte sin esperar el final (NDJSON, listas)
+        salida = compresor.process(trozo) + compresor.flush()
+        if salida:
+            yield salida
+    yield compresor.finish()
+
+
+class CompresionMiddleware:
+    """Comprime con brotli (si está instalado) o gzip las respuestas de texto desde
+    ``COMPRESION_MINIMO`` bytes.
+
+    Las respuestas en streaming se comprimen trozo a trozo. Como ``GZipMiddleware``, el
+    ETag pasa a ser débil y gzip agrega bytes aleatorios al encabezado (mitiga BREACH).
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if response.has_header('Content-Encoding'):
+            return response
+        if response.get('Content-Type', '').split(';')[0].strip() not in TIPOS_COMPRIMIBLES:
+            return response
+        if not response.streaming and len(response.content) < settings.COMPRESION_MINIMO:
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        codificacion = _codificacion(request)
+        if codificacion is None:
+            return response
+
+        if response.streaming:
+            if codificacion == 'br':
+                response.streaming_content = _brotli_por_trozos(response.streaming_content)
+            else:
+                response.streaming_content = compress_sequence(response.streaming_content, max_random_bytes=100)
+            del response.headers['Content-Length']
+        else:
+            if codificacion == 'br':
+                comprimido = brotli.compress(response.content, quality=settings.COMPRESION_BROTLI_CALIDAD)
+            else:
+                comprimido = compress_string(response.content, max_random_bytes=100)
+            if len(comprimido) >= len(response.content):
+                return response
+            response.content = comprimido
+            response.headers['Content-Length'] = str(len(comprimido))
+
+        if response.has_header('ETag'):
+            response.headers['ETag'] = re.sub(r'^"', 'W/"', response.headers['ETag'])
+        response.headers['Content-Encoding'] = codificacion
+        return response
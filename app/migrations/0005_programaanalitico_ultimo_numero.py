@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-19 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0004_tarea'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='programaanalitico',
+            name='ultimo_numero',
+            field=models.IntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.7 on 2026-10-19 14:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0005_programaanalitico_ultimo_numero'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PartidaSnapshot',
+            fields=[
+                ('partida_id', models.IntegerField(primary_key=True, serialize=False)),
+                ('asignatura_id', models.IntegerField(db_index=True)),
+                ('documento', models.JSONField()),
+                ('version', models.PositiveIntegerField(default=1)),
+                ('actualizado', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,152 @@
+# Índice de búsqueda de texto completo para la base local (ver search.py).
+#
+# - SQLite: tabla virtual FTS5 app_pregunta_fts (rowid = pregunta_id) con enunciado,
+#   explicación y opciones, mantenida por triggers.
+# - PostgreSQL: columna tsvector "busqueda" con índice GIN, como en Supabase
+#   (supabase/migrations/20261019000004_busqueda_preguntas.sql).
+
+from django.db import migrations
+
+SQLITE = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS app_pregunta_fts USING fts5(
+        enunciado, explicacion, opciones, tokenize = 'unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS app_pregunta_fts_insert AFTER INSERT ON app_pregunta BEGIN
+        INSERT INTO app_pregunta_fts (rowid, enunciado, explicacion, opciones)
+        VALUES (new.pregunta_id, new.enunciado, coalesce(new.explicacion, ''), '');
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS app_pregunta_fts_update AFTER UPDATE OF enunciado, explicacion ON app_pregunta BEGIN
+        UPDATE app_pregunta_fts SET enunciado = new.enunciado, explicacion = coalesce(new.explicacion, '')
+        WHERE rowid = new.pregunta_id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS app_pregunta_fts_delete AFTER DELETE ON app_pregunta BEGIN
+        DELETE FROM app_pregunta_fts WHERE rowid = old.pregunta_id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS app_opcion_fts_insert AFTER INSERT ON app_opcion BEGIN
+        UPDATE app_pregunta_fts
+        SET opciones = (SELECT coalesce(group_concat(opcion, ' '), '') FROM app_opcion WHERE pregunta_id = new.pregunta_id)
+        WHERE rowid = new.pregunta_id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS app_opcion_fts_update AFTER UPDATE OF opcion, pregunta_id ON app_opcion BEGIN
+        UPDATE app_pregunta_fts
+        SET opciones = (SELECT coalesce(group_concat(opcion, ' '), '') FROM app_opcion WHERE pregunta_id = app_pregunta_fts.rowid)
+        WHERE rowid IN (old.pregunta_id, new.pregunta_id);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS app_opcion_fts_delete AFTER DELETE ON app_opcion BEGIN
+        UPDATE app_pregunta_fts
+        SET opciones = (SELECT coalesce(group_concat(opcion, ' '), '') FROM app_opcion WHERE pregunta_id = old.pregunta_id)
+        WHERE rowid = old.pregunta_id;
+    END
+    """,
+    """
+    INSERT INTO app_pregunta_fts (rowid, enunciado, explicacion, opciones)
+    SELECT p.pregunta_id, p.enunciado, coalesce(p.explicacion, ''),
+           (SELECT coalesce(group_concat(o.opcion, ' '), '') FROM app_opcion o WHERE o.pregunta_id = p.pregunta_id)
+    FROM app_pregunta p
+    WHERE p.pregunta_id NOT IN (SELECT rowid FROM app_pregunta_fts)
+    """,
+]
+
+SQLITE_REVERSA = [
+    "DROP TRIGGER IF EXISTS app_opcion_fts_delete",
+    "DROP TRIGGER IF EXISTS app_opcion_fts_update",
+    "DROP TRIGGER IF EXISTS app_opcion_fts_insert",
+    "DROP TRIGGER IF EXISTS app_pregunta_fts_delete",
+    "DROP TRIGGER IF EXISTS app_pregunta_fts_update",
+    "DROP TRIGGER IF EXISTS app_pregunta_fts_insert",
+    "DROP TABLE IF EXISTS app_pregunta_fts",
+]
+
+POSTGRES = [
+    "ALTER TABLE app_pregunta ADD COLUMN IF NOT EXISTS busqueda tsvector",
+    """
+    CREATE OR REPLACE FUNCTION app_vector_busqueda_pregunta(p_pregunta_id integer) RETURNS tsvector
+    LANGUAGE sql STABLE AS $$
+        SELECT setweight(to_tsvector('spanish', coalesce(p.enunciado, '')), 'A')
+            || setweight(to_tsvector('spanish', coalesce(p.explicacion, '')), 'B')
+            || setweight(to_tsvector('spanish', coalesce(
+                   (SELECT string_agg(o.opcion, ' ' ORDER BY o.opcion_id) FROM app_opcion o WHERE o.pregunta_id = p.pregunta_id),
+                   '')), 'C')
+        FROM app_pregunta p WHERE p.pregunta_id = p_pregunta_id
+    $$
+    """,
+    """
+    CREATE OR REPLACE FUNCTION app_pregunta_busqueda_trigger() RETURNS trigger
+    LANGUAGE plpgsql AS $$
+    BEGIN
+        UPDATE app_pregunta SET busqueda = app_vector_busqueda_pregunta(new.pregunta_id)
+        WHERE pregunta_id = new.pregunta_id;
+        RETURN NULL;
+    END;
+    $$
+    """,
+    """
+    CREATE OR REPLACE FUNCTION app_opcion_busqueda_trigger() RETURNS trigger
+    LANGUAGE plpgsql AS $$
+    DECLARE
+        v_pregunta_id integer := CASE WHEN tg_op = 'DELETE' THEN old.pregunta_id ELSE new.pregunta_id END;
+    BEGIN
+        UPDATE app_pregunta SET busqueda = app_vector_busqueda_pregunta(v_pregunta_id)
+        WHERE pregunta_id = v_pregunta_id;
+        RETURN NULL;
+    END;
+    $$
+    """,
+    "DROP TRIGGER IF EXISTS app_pregunta_busqueda ON app_pregunta",
+    """
+    CREATE TRIGGER app_pregunta_busqueda AFTER INSERT OR UPDATE OF enunciado, explicacion ON app_pregunta
+    FOR EACH ROW EXECUTE FUNCTION app_pregunta_busqueda_trigger()
+    """,
+    "DROP TRIGGER IF EXISTS app_opcion_busqueda ON app_opcion",
+    """
+    CREATE TRIGGER app_opcion_busqueda AFTER INSERT OR UPDATE OF opcion OR DELETE ON app_opcion
+    FOR EACH ROW EXECUTE FUNCTION app_opcion_busqueda_trigger()
+    """,
+    "UPDATE app_pregunta SET busqueda = app_vector_busqueda_pregunta(pregunta_id) WHERE busqueda IS NULL",
+    "CREATE INDEX IF NOT EXISTS app_pregunta_busqueda_idx ON app_pregunta USING gin (busqueda)",
+]
+
+POSTGRES_REVERSA = [
+    "DROP TRIGGER IF EXISTS app_opcion_busqueda ON app_opcion",
+    "DROP TRIGGER IF EXISTS app_pregunta_busqueda ON app_pregunta",
+    "DROP FUNCTION IF EXISTS app_opcion_busqueda_trigger()",
+    "DROP FUNCTION IF EXISTS app_pregunta_busqueda_trigger()",
+    "DROP FUNCTION IF EXISTS app_vector_busqueda_pregunta(integer)",
+    "DROP INDEX IF EXISTS app_pregunta_busqueda_idx",
+    "ALTER TABLE app_pregunta DROP COLUMN IF EXISTS busqueda",
+]
+
+
+def _ejecutar(sentencias):
+    def operacion(apps, schema_editor):
+        vendor = schema_editor.connection.vendor
+        for sql in sentencias.get(vendor, []):
+            schema_editor.execute(sql)
+    return operacion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0006_partidasnapshot'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            _ejecutar({'sqlite': SQLITE, 'postgresql': POSTGRES}),
+            _ejecutar({'sqlite': SQLITE_REVERSA, 'postgresql': POSTGRES_REVERSA}),
+        ),
+    ]
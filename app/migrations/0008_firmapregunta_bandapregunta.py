@@ -0,0 +1,39 @@
+# Generated by Django 5.2.7 on 2026-10-19 18:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0007_busqueda_preguntas'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FirmaPregunta',
+            fields=[
+                ('pregunta_id', models.IntegerField(primary_key=True, serialize=False)),
+                ('asignatura_id', models.IntegerField(db_index=True)),
+                ('unidad_id', models.IntegerField()),
+                ('numero', models.IntegerField()),
+                ('resumen', models.CharField(max_length=200)),
+                ('huella', models.CharField(max_length=32)),
+                ('firma', models.BinaryField()),
+                ('actualizada', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='BandaPregunta',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('banda', models.PositiveSmallIntegerField()),
+                ('clave', models.BigIntegerField()),
+                ('firma', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='bandas', to='app.firmapregunta')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['banda', 'clave'], name='app_bandapr_banda_81d213_idx')],
+            },
+        ),
+    ]
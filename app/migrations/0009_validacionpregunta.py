@@ -0,0 +1,24 @@
+# Generated by Django 5.2.7 on 2026-10-19 19:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0008_firmapregunta_bandapregunta'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ValidacionPregunta',
+            fields=[
+                ('pregunta_id', models.IntegerField(primary_key=True, serialize=False)),
+                ('asignatura_id', models.IntegerField(db_index=True)),
+                ('huella', models.CharField(max_length=32)),
+                ('letra', models.SmallIntegerField(null=True)),
+                ('problemas', models.JSONField(default=list)),
+                ('revisada', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
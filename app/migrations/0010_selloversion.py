@@ -0,0 +1,21 @@
+# Generated by Django 5.2.7 on 2026-10-19 20:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0009_validacionpregunta'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SelloVersion',
+            fields=[
+                ('clave', models.CharField(max_length=100, primary_key=True, serialize=False)),
+                ('version', models.PositiveIntegerField(default=1)),
+                ('actualizado', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -38,23 +38,22 @@ class ProgramaAnalitico(models.Model):
     asignatura = models.ForeignKey(
         "Asignatura", on_delete=models.CASCADE, related_name="programas_analiticos"
     )
+    # Último número entregado por reservar_numeros (ver numbering.py)
+    ultimo_numero = models.IntegerField(default=0)
 
     def __str__(self):
         return self.titulo
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        # Indexar el contexto al crear/actualizar para que extraer una unidad sea una búsqueda directa
+        from .context_index import obtener_indice_contexto
+        obtener_indice_contexto(self.contexto or "")
     
     def renumerar_preguntas_secuencialmente(self):
-        """Renumera todas las preguntas del programa analítico de manera secuencial"""
-        unidades = self.unidades.all().order_by('numero_unidad')
-        numero_actual = 1
-        
-        for unidad in unidades:
-            preguntas = unidad.preguntas.all().order_by('numero')
-            for pregunta in preguntas:
-                pregunta.numero = numero_actual
-                pregunta.save()
-                numero_actual += 1
-        
-        return numero_actual - 1  # Retorna el total de preguntas renumeradas
+        """Compacta la numeración de las preguntas del programa analítico dentro de cada unidad"""
+        from .numbering import renumerar_programa
+        return renumerar_programa(self.pk)['total']  # Retorna el total de preguntas renumeradas
 
 
 class Unidad(models.Model):
@@ -68,48 +67,6 @@ class Unidad(models.Model):
 
     def __str__(self):
         return f"Unidad {self.numero_unidad}: {self.descripcion}"
-    
-    def generar_preguntas_automaticamente(self):
-        """Genera las preguntas automáticamente con opciones básicas y numeración secuencial"""
-        
-        # Calcular el número de inicio basándose en las preguntas existentes en el programa analítico
-        preguntas_existentes = Pregunta.objects.filter(
-            unidad__programa_analitico=self.programa_analitico
-        ).exclude(unidad=self)  # Excluir las preguntas de la unidad actual
-        
-        numero_inicio = 1
-        if preguntas_existentes.exists():
-            numero_inicio = preguntas_existentes.aggregate(
-                max_numero=models.Max('numero')
-            )['max_numero'] + 1
-        
-        # Crear preguntas según num_preguntas con numeración secuencial
-        for i in range(self.num_preguntas):
-            numero_pregunta = numero_inicio + i
-            enunciado = f"Pregunta {numero_pregunta} sobre {self.descripcion}. Explique detalladamente."
-            
-            pregunta = Pregunta.objects.create(
-                enunciado=enunciado,
-                numero=numero_pregunta,
-                unidad=self
-            )
-            
-            # Crear opciones básicas automáticamente
-            opciones_basicas = [
-                f"Opción correcta para {self.descripcion}",
-                f"Opción parcial para {self.descripcion}",
-                f"Opción incorrecta relacionada con {self.descripcion}",
-                f"Opción no relacionada con {self.descripcion}"
-            ]
-            
-            for j, opcion_texto in enumerate(opciones_basicas):
-                Opcion.objects.create(
-                    opcion=opcion_texto,
-                    es_correcta=(j == 0),  # Primera opción es correcta por defecto
-                    pregunta=pregunta
-                )
-        
-        return True
 
 
 class Pregunta(models.Model):
@@ -138,3 +95,127 @@ class Opcion(models.Model):
         return f"Opción: {self.opcion[:30]}{' (Correcta)' if self.es_correcta else ''}"
 
 
+class Tarea(models.Model):
+    """Trabajo en segundo plano (creación de partidas, documentos) ejecutado por `procesar_tareas`."""
+
+    PENDIENTE = "pendiente"
+    EN_PROCESO = "en_proceso"
+    COMPLETADA = "completada"
+    FALLIDA = "fallida"
+    ESTADOS = [
+        (PENDIENTE, "Pendiente"),
+        (EN_PROCESO, "En proceso"),
+        (COMPLETADA, "Completada"),
+        (FALLIDA, "Fallida"),
+    ]
+
+    tipo = models.CharField(max_length=50)
+    parametros = models.JSONField(default=dict)
+    estado = models.CharField(max_length=20, choices=ESTADOS, default=PENDIENTE)
+    progreso = models.PositiveSmallIntegerField(default=0)
+    mensaje = models.CharField(max_length=255, blank=True, default="")
+    resultado = models.JSONField(null=True, blank=True)
+    archivo = models.CharField(max_length=500, blank=True, default="")
+    nombre_archivo = models.CharField(max_length=255, blank=True, default="")
+    content_type = models.CharField(max_length=150, blank=True, default="")
+    error = models.TextField(blank=True, default="")
+    intentos = models.PositiveSmallIntegerField(default=0)
+    worker = models.CharField(max_length=100, blank=True, default="")
+    creada = models.DateTimeField(auto_now_add=True)
+    iniciada = models.DateTimeField(null=True, blank=True)
+    # Lo renueva periódicamente el worker dueño mientras la tarea corre (ver jobs.latir)
+    latido = models.DateTimeField(null=True, blank=True)
+    terminada = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["estado", "creada"])]
+
+    def __str__(self):
+        return f"Tarea {self.pk} ({self.tipo}): {self.estado}"
+
+    @property
+    def terminal(self):
+        return self.estado in (self.COMPLETADA, self.FALLIDA)
+
+
+class PartidaSnapshot(models.Model):
+    """Árbol completo de una partida (unidades, preguntas, opciones y conteos) ya armado para lectura.
+
+    Se reconstruye desde Supabase con las APIs de escritura y con `reparar_snapshots`
+    (ver snapshots.py).
+    """
+
+    partida_id = models.IntegerField(primary_key=True)
+    asignatura_id = models.IntegerField(db_index=True)
+    documento = models.JSONField()
+    version = models.PositiveIntegerField(default=1)
+    actualizado = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Snapshot partida {self.partida_id} (v{self.version})"
+
+
+class FirmaPregunta(models.Model):
+    """Firma MinHash de una pregunta para detectar casi duplicados (ver duplicates.py).
+
+    ``huella`` cambia con el texto normalizado y con los parámetros de MinHash, así al
+    reindexar solo se recalculan las preguntas nuevas o modificadas.
+    """
+
+    pregunta_id = models.IntegerField(primary_key=True)
+    asignatura_id = models.IntegerField(db_index=True)
+    unidad_id = models.IntegerField()
+    numero = models.IntegerField()
+    resumen = models.CharField(max_length=200)
+    huella = models.CharField(max_length=32)
+    firma = models.BinaryField()
+    actualizada = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Firma pregunta {self.pregunta_id}"
+
+
+class BandaPregunta(models.Model):
+    """Clave LSH de una banda de la firma; preguntas con alguna banda igual son candidatas a duplicado."""
+
+    firma = models.ForeignKey(FirmaPregunta, on_delete=models.CASCADE, related_name="bandas")
+    banda = models.PositiveSmallIntegerField()
+    clave = models.BigIntegerField()
+
+    class Meta:
+        indexes = [models.Index(fields=["banda", "clave"])]
+
+
+class ValidacionPregunta(models.Model):
+    """Último resultado de las reglas de calidad de una pregunta (ver validation.py).
+
+    ``huella`` resume el contenido validado; en la siguiente corrida solo se vuelven a
+    evaluar las preguntas cuya huella cambió.
+    """
+
+    pregunta_id = models.IntegerField(primary_key=True)
+    asignatura_id = models.IntegerField(db_index=True)
+    huella = models.CharField(max_length=32)
+    # Posición de la opción correcta (0 = A) o None si no hay exactamente una
+    letra = models.SmallIntegerField(null=True)
+    problemas = models.JSONField(default=list)
+    revisada = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Validación pregunta {self.pregunta_id}: {len(self.problemas)} problemas"
+
+
+class SelloVersion(models.Model):
+    """Versión de una fila de Supabase (``partida:3``, ``unidad:12``) para el caché de fragmentos.
+
+    La suben las APIs de edición; las listas la usan en la clave de ``{% cache %}`` para
+    volver a dibujar solo las filas que cambiaron (ver fragments.py). La clave
+    ``swr:generacion`` es el contador de escrituras de swr.py.
+    """
+
+    clave = models.CharField(max_length=100, primary_key=True)
+    version = models.PositiveIntegerField(default=1)
+    actualizado = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.clave} (v{self.version})"
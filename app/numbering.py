@@ -0,0 +1,191 @@
+import logging
+from typing import Any, Dict, List
+
+from django.db import connection, transaction
+from django.db.models import Count, F, IntegerField, Max, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Greatest
+
+from . import supabase_client
+from .models import Pregunta, ProgramaAnalitico, Unidad
+from .placeholders import posiciones_unidad
+from .repositories import PreguntaRepository, ProgramaAnaliticoRepository, UnidadRepository
+
+logger = logging.getLogger(__name__)
+
+
+def _posiciones_sql(num_preguntas: str, reales: str) -> str:
+    """``posiciones_unidad`` como expresión SQL (CASE, porque SQLite no tiene greatest)."""
+    return (
+        f"CASE WHEN {reales} > COALESCE({num_preguntas}, 0) THEN {reales} "
+        f"WHEN {num_preguntas} > 0 THEN {num_preguntas} ELSE 0 END"
+    )
+
+
+# ============================================================================
+# ORM (base local)
+# ============================================================================
+
+def renumerar_programa(programa_id: int) -> Dict[str, int]:
+    """Compacta la numeración de las preguntas del programa dentro de cada unidad.
+
+    Los números son posiciones (ver ``rangos_numeracion``): cada unidad empieza después
+    de las posiciones de las anteriores y sus preguntas reales toman sus primeras
+    posiciones según (numero, pregunta_id); las que quedan libres siguen siendo
+    virtuales. Cada unidad ocupa ``posiciones_unidad`` posiciones: si tiene más preguntas
+    reales que ``num_preguntas``, tantas como preguntas, para no pisar la siguiente. Todo se aplica
+    en un solo UPDATE que solo toca las filas cuyo número cambia.
+    """
+    pregunta = Pregunta._meta.db_table
+    unidad = Unidad._meta.db_table
+    with transaction.atomic():
+        # Serializa con reservar_numeros sobre el mismo programa
+        list(ProgramaAnalitico.objects.select_for_update().filter(pk=programa_id).values_list('pk'))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                UPDATE {pregunta} SET numero = nuevos.numero
+                FROM (
+                    SELECT p.pregunta_id,
+                           inicios.desplazamiento
+                           + row_number() OVER (PARTITION BY p.unidad_id ORDER BY p.numero, p.pregunta_id) AS numero
+                    FROM {pregunta} p
+                    JOIN (
+                        SELECT unidad_id,
+                               SUM(posiciones) OVER (ORDER BY numero_unidad, unidad_id) - posiciones AS desplazamiento
+                        FROM (
+                            SELECT u.unidad_id, u.numero_unidad,
+                                   {_posiciones_sql('u.num_preguntas', 'COUNT(r.pregunta_id)')} AS posiciones
+                            FROM {unidad} u
+                            LEFT JOIN {pregunta} r ON r.unidad_id = u.unidad_id
+                            WHERE u.programa_analitico_id = %s
+                            GROUP BY u.unidad_id, u.numero_unidad, u.num_preguntas
+                        ) AS conteos
+                    ) AS inicios ON inicios.unidad_id = p.unidad_id
+                ) AS nuevos
+                WHERE {pregunta}.pregunta_id = nuevos.pregunta_id
+                  AND {pregunta}.numero <> nuevos.numero
+                """,
+                [programa_id],
+            )
+            cambiadas = cursor.rowcount
+        total = Pregunta.objects.filter(unidad__programa_analitico_id=programa_id).count()
+    return {'total': total, 'cambiadas': cambiadas}
+
+
+def numeracion_compacta(unidades: List[Dict[str, Any]], preguntas: List[Dict[str, Any]]) -> Dict[int, int]:
+    """Número nuevo de cada pregunta de un programa, con el mismo criterio que ``renumerar_programa``."""
+    por_unidad: Dict[int, List[Dict[str, Any]]] = {}
+    for pregunta in preguntas:
+        por_unidad.setdefault(pregunta['unidad_id'], []).append(pregunta)
+
+    numeros: Dict[int, int] = {}
+    desplazamiento = 0
+    for unidad in sorted(unidades, key=lambda u: (u['numero_unidad'], u['unidad_id'])):
+        reales = sorted(por_unidad.get(unidad['unidad_id'], []), key=lambda p: (p['numero'], p['pregunta_id']))
+        for posicion, pregunta in enumerate(reales, 1):
+            numeros[pregunta['pregunta_id']] = desplazamiento + posicion
+        desplazamiento += posiciones_unidad(unidad, len(reales))
+    return numeros
+
+
+def reservar_numeros(programa_id: int, cantidad: int) -> range:
+    """Reserva un bloque de ``cantidad`` números consecutivos en el programa.
+
+    El contador ``ultimo_numero`` avanza con un único UPDATE condicional, así dos
+    reservas concurrentes nunca comparten números. El bloque empieza después del mayor
+    número en uso: preguntas reales o posiciones virtuales (suma de ``posiciones_unidad``).
+    """
+    if cantidad < 1:
+        raise ValueError('La cantidad a reservar debe ser positiva')
+
+    max_numero = (
+        Pregunta.objects.filter(unidad__programa_analitico=OuterRef('pk'))
+        .values('unidad__programa_analitico')
+        .annotate(m=Max('numero'))
+        .values('m')
+    )
+    cero = Value(0, output_field=IntegerField())
+    reales = (
+        Pregunta.objects.filter(unidad=OuterRef('pk'))
+        .values('unidad')
+        .annotate(c=Count('pk'))
+        .values('c')
+    )
+    posiciones = (
+        Unidad.objects.filter(programa_analitico=OuterRef('pk'))
+        .values('programa_analitico')
+        .annotate(s=Sum(Greatest(
+            Coalesce('num_preguntas', cero),
+            Coalesce(Subquery(reales, output_field=IntegerField()), cero),
+            cero,
+        )))
+        .values('s')
+    )
+    with transaction.atomic():
+        actualizados = ProgramaAnalitico.objects.filter(pk=programa_id).update(
+            ultimo_numero=Greatest(
+                F('ultimo_numero'),
+                Coalesce(Subquery(max_numero, output_field=IntegerField()), cero),
+                Coalesce(Subquery(posiciones, output_field=IntegerField()), cero),
+            ) + cantidad
+        )
+        if not actualizados:
+            raise ValueError('Programa analítico no encontrado')
+        fin = ProgramaAnalitico.objects.filter(pk=programa_id).values_list('ultimo_numero', flat=True).get()
+    return range(fin - cantidad + 1, fin + 1)
+
+
+# ============================================================================
+# SUPABASE
+# ============================================================================
+
+def renumerar_programa_supabase(programa_id: int) -> Dict[str, int]:
+    """Como ``renumerar_programa`` pero en Supabase, con la función ``renumerar_preguntas``.
+
+    Si la función todavía no está instalada se calcula la numeración en Python y se
+    escriben por lotes solo las preguntas que cambian.
+    """
+    try:
+        resultado = ProgramaAnaliticoRepository.renumerar_preguntas(programa_id)
+        return {'total': int(resultado.get('total', 0)), 'cambiadas': int(resultado.get('cambiadas', 0))}
+    except supabase_client.APIError as e:
+        if e.code != 'PGRST202':
+            raise
+        logger.warning("La función renumerar_preguntas no existe; se renumera por lotes")
+
+    unidades = UnidadRepository.list_by_programas([programa_id])
+    preguntas = PreguntaRepository.list_by_unidades([u['unidad_id'] for u in unidades])
+    numeros = numeracion_compacta(unidades, preguntas)
+
+    cambiadas = [
+        {**pregunta, 'numero': numeros[pregunta['pregunta_id']]}
+        for pregunta in preguntas
+        if pregunta['numero'] != numeros[pregunta['pregunta_id']]
+    ]
+    PreguntaRepository.upsert_many(cambiadas)
+    return {'total': len(preguntas), 'cambiadas': len(cambiadas)}
+
+
+def reservar_numeros_supabase(programa_id: int, cantidad: int) -> range:
+    """Como ``reservar_numeros`` pero en Supabase, con la función ``reservar_numeros``."""
+    if cantidad < 1:
+        raise ValueError('La cantidad a reservar debe ser positiva')
+    try:
+        inicio = ProgramaAnaliticoRepository.reservar_numeros(programa_id, cantidad)
+        return range(inicio, inicio + cantidad)
+    except supabase_client.APIError as e:
+        if e.code != 'PGRST202':
+            raise
+
+    # Sin la función no hay reserva atómica: se continúa después del mayor número en uso
+    logger.warning("La función reservar_numeros no existe; la reserva no es atómica")
+    unidades = UnidadRepository.list_by_programas([programa_id])
+    preguntas = PreguntaRepository.list_by_unidades([u['unidad_id'] for u in unidades])
+    reales: Dict[int, int] = {}
+    for pregunta in preguntas:
+        reales[pregunta['unidad_id']] = reales.get(pregunta['unidad_id'], 0) + 1
+    ultimo = max(
+        max((p['numero'] for p in preguntas), default=0),
+        sum(posiciones_unidad(u, reales.get(u['unidad_id'], 0)) for u in unidades),
+    )
+    return range(ultimo + 1, ultimo + 1 + cantidad)
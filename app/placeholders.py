@@ -0,0 +1,108 @@
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+# Cantidad de opciones de una pregunta virtual (la primera es la correcta por defecto)
+OPCIONES_POR_PREGUNTA = 4
+
+
+def posiciones_unidad(unidad: Dict[str, Any], reales: int = 0) -> int:
+    """Cantidad de números que ocupa una unidad: ``num_preguntas`` o sus preguntas reales si son más.
+
+    Es la misma regla que aplican ``renumerar_programa`` y la función SQL
+    ``posiciones_unidad``; una unidad que creció sin actualizar ``num_preguntas`` no
+    pisa la numeración de la siguiente.
+    """
+    return max(0, int(unidad.get('num_preguntas') or 0), reales)
+
+
+def rangos_numeracion(unidades: Iterable[Dict[str, Any]], reales: Optional[Dict[int, int]] = None) -> Dict[int, range]:
+    """Números de pregunta que corresponden a cada unidad.
+
+    La numeración es secuencial dentro de cada programa analítico: las unidades se
+    ordenan por número y cada una ocupa ``posiciones_unidad`` posiciones a continuación
+    de la anterior, igual que la numeración con la que se crean las partidas.
+    ``reales`` es la cantidad de preguntas reales de cada unidad.
+    """
+    reales = reales or {}
+    rangos: Dict[int, range] = {}
+    por_programa: Dict[Any, List[Dict[str, Any]]] = {}
+    for unidad in unidades:
+        por_programa.setdefault(unidad.get('programa_analitico_id'), []).append(unidad)
+
+    for unidades_programa in por_programa.values():
+        inicio = 1
+        for unidad in sorted(unidades_programa, key=lambda u: (u['numero_unidad'], u['unidad_id'])):
+            cantidad = posiciones_unidad(unidad, reales.get(unidad['unidad_id'], 0))
+            rangos[unidad['unidad_id']] = range(inicio, inicio + cantidad)
+            inicio += cantidad
+    return rangos
+
+
+def pregunta_virtual(unidad_id: int, numero: int) -> Dict[str, Any]:
+    """Pregunta de relleno que se muestra mientras la posición no tiene una fila real."""
+    return {
+        'pregunta_id': None,
+        'numero': numero,
+        'enunciado': f"Pregunta {numero}",
+        'explicacion': '',
+        'unidad_id': unidad_id,
+        'virtual': True,
+        'opciones': [
+            {
+                'opcion_id': None,
+                'opcion': f"Opción {k} para pregunta {numero}",
+                'es_correcta': k == 1,
+                'media_url': None,
+                'pregunta_id': None,
+            }
+            for k in range(1, OPCIONES_POR_PREGUNTA + 1)
+        ],
+    }
+
+
+def completar_unidad(unidad: Dict[str, Any], preguntas: List[Dict[str, Any]], rango: range) -> List[Dict[str, Any]]:
+    """Preguntas reales de la unidad más las virtuales que faltan hasta ``num_preguntas``, por número."""
+    faltantes = int(unidad.get('num_preguntas') or 0) - len(preguntas)
+    if faltantes <= 0:
+        return sorted(preguntas, key=lambda p: int(p['numero']))
+
+    usados = {int(p['numero']) for p in preguntas}
+    virtuales = [pregunta_virtual(unidad['unidad_id'], n) for n in rango if n not in usados][:faltantes]
+    return sorted(preguntas + virtuales, key=lambda p: int(p['numero']))
+
+
+def completar_stream(
+    unidades: List[Dict[str, Any]],
+    preguntas: Iterable[Dict[str, Any]],
+    rangos: Optional[Dict[int, range]] = None,
+) -> Iterator[Dict[str, Any]]:
+    """Como ``completar_unidad`` pero sobre un flujo de preguntas ordenado por unidad.
+
+    Solo mantiene en memoria las preguntas de una unidad a la vez, para las
+    exportaciones en streaming. Sin ``rangos``, las unidades deben venir en el orden de
+    ``rangos_numeracion`` dentro de cada programa: el rango de cada una se calcula al
+    llegar a ella, cuando ya se conocen sus preguntas reales.
+    """
+    inicios: Dict[Any, int] = {}
+    pendientes = iter(preguntas)
+    siguiente = next(pendientes, None)
+
+    for unidad in unidades:
+        reales = []
+        while siguiente is not None and siguiente['unidad_id'] == unidad['unidad_id']:
+            reales.append(siguiente)
+            siguiente = next(pendientes, None)
+        if rangos is not None:
+            rango = rangos.get(unidad['unidad_id'], range(0))
+        else:
+            inicio = inicios.get(unidad.get('programa_analitico_id'), 1)
+            rango = range(inicio, inicio + posiciones_unidad(unidad, len(reales)))
+            inicios[unidad.get('programa_analitico_id')] = rango.stop
+        yield from completar_unidad(unidad, reales, rango)
+
+
+def unidad_de_numero(rangos: Dict[int, range], numero: int) -> Optional[int]:
+    """Unidad a la que corresponde un número de pregunta según la numeración secuencial."""
+    for unidad_id, rango in rangos.items():
+        if numero in rango:
+            return unidad_id
+    return None
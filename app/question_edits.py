@@ -0,0 +1,209 @@
+import logging
+from typing import Any, Dict, List
+
+from . import supabase_client
+from .deadline import PlazoAgotado
+from .repositories import OpcionRepository, PreguntaRepository
+
+logger = logging.getLogger(__name__)
+
+
+def calcular_cambios(actual: Dict[str, Any], data: Dict[str, Any]) -> Dict[str, Any]:
+    """Compara los datos enviados por el editor con la pregunta actual (con ``opciones``).
+
+    Devuelve solo lo que cambió: los campos de la pregunta, las opciones a actualizar
+    (filas completas, para un único upsert), las opciones nuevas y los ids de las
+    opciones que ya no vienen en los datos. Si los datos no traen ``opciones``, las
+    opciones no se tocan.
+    """
+    patch: Dict[str, Any] = {}
+    for campo in ('enunciado', 'explicacion'):
+        if campo in data:
+            valor = (data.get(campo) or '').strip()
+            if valor != (actual.get(campo) or ''):
+                patch[campo] = valor
+
+    actualizar: List[Dict[str, Any]] = []
+    crear: List[Dict[str, Any]] = []
+    eliminar: List[int] = []
+
+    if 'opciones' in data:
+        existentes = {o['opcion_id']: o for o in actual.get('opciones', [])}
+        enviadas = set()
+        for opcion_data in data.get('opciones') or []:
+            opcion_id = opcion_data.get('id')
+            texto = (opcion_data.get('texto') or '').strip()
+            es_correcta = bool(opcion_data.get('es_correcta', False))
+
+            if opcion_id == 'new':
+                if texto:
+                    crear.append({'opcion': texto, 'es_correcta': es_correcta, 'pregunta_id': actual['pregunta_id']})
+            elif opcion_id:
+                opcion = existentes.get(int(opcion_id))
+                if opcion is None:
+                    raise ValueError(f'La opción {opcion_id} no pertenece a la pregunta {actual["pregunta_id"]}')
+                enviadas.add(opcion['opcion_id'])
+                if opcion['opcion'] != texto or bool(opcion['es_correcta']) != es_correcta:
+                    actualizar.append({
+                        'opcion_id': opcion['opcion_id'],
+                        'opcion': texto,
+                        'es_correcta': es_correcta,
+                        'media_url': opcion.get('media_url'),
+                        'pregunta_id': actual['pregunta_id'],
+                    })
+
+        eliminar = [opcion_id for opcion_id in existentes if opcion_id not in enviadas]
+
+    return {
+        'pregunta': patch,
+        'actualizar_opciones': actualizar,
+        'crear_opciones': crear,
+        'eliminar_opciones': eliminar,
+    }
+
+
+def hay_cambios(cambios: Dict[str, Any]) -> bool:
+    return any(cambios.values())
+
+
+def aplicar_cambios(pregunta_id: int, cambios: Dict[str, Any]) -> None:
+    """Escribe los cambios con a lo sumo una consulta por tipo de operación."""
+    if cambios['pregunta']:
+        PreguntaRepository.update(pregunta_id, **cambios['pregunta'])
+    OpcionRepository.upsert_many(cambios['actualizar_opciones'])
+    OpcionRepository.create_many(cambios['crear_opciones'])
+    OpcionRepository.delete_many(cambios['eliminar_opciones'])
+
+
+def _cambios_lote(cambios_por_pregunta: Dict[int, Dict[str, Any]]) -> Dict[str, Any]:
+    """Une los cambios de varias preguntas en el formato de aplicar_edicion_masiva."""
+    lote: Dict[str, Any] = {'preguntas': [], 'actualizar_opciones': [], 'crear_opciones': [], 'eliminar_opciones': []}
+    for pregunta_id, cambios in cambios_por_pregunta.items():
+        if cambios['pregunta']:
+            lote['preguntas'].append({'pregunta_id': pregunta_id, **cambios['pregunta']})
+        lote['actualizar_opciones'].extend(cambios['actualizar_opciones'])
+        lote['crear_opciones'].extend(cambios['crear_opciones'])
+        lote['eliminar_opciones'].extend(cambios['eliminar_opciones'])
+    return lote
+
+
+def _aplicar_lote_rest(lote: Dict[str, Any], actuales: Dict[int, Dict[str, Any]], aplicados: List[str]) -> None:
+    """Mismos cambios con upserts por lote; no es transaccional entre tablas.
+
+    Cada paso confirmado se agrega a ``aplicados``, para informar qué quedó escrito si
+    un paso posterior falla.
+    """
+    pasos = [
+        ('preguntas', lambda: PreguntaRepository.upsert_many([
+            {
+                'pregunta_id': fila['pregunta_id'],
+                'numero': actuales[fila['pregunta_id']]['numero'],
+                'unidad_id': actuales[fila['pregunta_id']]['unidad_id'],
+                'enunciado': fila.get('enunciado', actuales[fila['pregunta_id']]['enunciado']),
+                'explicacion': fila.get('explicacion', actuales[fila['pregunta_id']].get('explicacion')),
+            }
+            for fila in lote['preguntas']
+        ])),
+        ('actualizar_opciones', lambda: OpcionRepository.upsert_many(lote['actualizar_opciones'])),
+        ('crear_opciones', lambda: OpcionRepository.create_many(lote['crear_opciones'])),
+        ('eliminar_opciones', lambda: OpcionRepository.delete_many(lote['eliminar_opciones'])),
+    ]
+    for nombre, paso in pasos:
+        if lote[nombre]:
+            paso()
+            aplicados.append(nombre)
+
+
+def aplicar_edicion_masiva(ediciones: List[Dict[str, Any]], tamano_lote: int = 200) -> List[Dict[str, Any]]:
+    """Aplica las ediciones de muchas preguntas y devuelve un resultado por ítem.
+
+    El estado actual se lee con dos consultas por lotes; cada lote de ``tamano_lote``
+    preguntas se escribe con una llamada a la función ``aplicar_edicion_masiva`` de la
+    base, que aplica todo el lote en una transacción. Si la función aún no existe se
+    usan upserts por lote sobre la API REST.
+
+    La petición no es atómica: cada lote se confirma por separado. Si un lote falla, sus
+    preguntas quedan con estado ``error`` (no se aplicó nada), ``parcial`` (con upserts
+    REST, ``aplicado`` lista los pasos ya escritos) o ``incierta`` (se perdió la respuesta
+    de la función y el lote pudo haberse aplicado; no se reintenta para no duplicar opciones).
+    """
+    resultados: List[Dict[str, Any]] = []
+    validas: List[Dict[str, Any]] = []
+    ids = []
+    for indice, edicion in enumerate(ediciones):
+        try:
+            pregunta_id = int(edicion.get('pregunta_id'))
+        except (TypeError, ValueError):
+            resultados.append({'indice': indice, 'pregunta_id': edicion.get('pregunta_id'), 'estado': 'error',
+                               'error': 'pregunta_id inválido'})
+            continue
+        if 'enunciado' in edicion and not (edicion.get('enunciado') or '').strip():
+            resultados.append({'indice': indice, 'pregunta_id': pregunta_id, 'estado': 'error',
+                               'error': 'Enunciado requerido'})
+            continue
+        ids.append(pregunta_id)
+        validas.append({'indice': indice, 'pregunta_id': pregunta_id, 'data': edicion})
+
+    actuales: Dict[int, Dict[str, Any]] = {}
+    for i in range(0, len(ids), tamano_lote):
+        for pregunta in PreguntaRepository.list_by_ids(ids[i:i + tamano_lote]):
+            pregunta['opciones'] = []
+            actuales[pregunta['pregunta_id']] = pregunta
+    for opcion in OpcionRepository.list_by_preguntas_chunked(list(actuales)):
+        actuales[opcion['pregunta_id']]['opciones'].append(opcion)
+
+    pendientes: List[tuple] = []
+    vistas = set()
+    for edicion in validas:
+        resultado = {'indice': edicion['indice'], 'pregunta_id': edicion['pregunta_id']}
+        resultados.append(resultado)
+        actual = actuales.get(edicion['pregunta_id'])
+        if actual is None:
+            resultado.update(estado='error', error='Pregunta no encontrada')
+            continue
+        if edicion['pregunta_id'] in vistas:
+            resultado.update(estado='error', error='Pregunta repetida en la edición')
+            continue
+        vistas.add(edicion['pregunta_id'])
+        try:
+            cambios = calcular_cambios(actual, edicion['data'])
+        except ValueError as e:
+            resultado.update(estado='error', error=str(e))
+            continue
+        if not hay_cambios(cambios):
+            resultado['estado'] = 'sin_cambios'
+            continue
+        pendientes.append((resultado, cambios))
+
+    usar_rpc = True
+    for i in range(0, len(pendientes), tamano_lote):
+        bloque = pendientes[i:i + tamano_lote]
+        lote = _cambios_lote({r['pregunta_id']: c for r, c in bloque})
+        aplicados: List[str] = []
+        try:
+            if usar_rpc:
+                try:
+                    PreguntaRepository.aplicar_edicion_masiva(lote)
+                except supabase_client.APIError as e:
+                    if e.code != 'PGRST202':
+                        raise
+                    logger.warning('La función aplicar_edicion_masiva no existe; se usan upserts por lote')
+                    usar_rpc = False
+            if not usar_rpc:
+                _aplicar_lote_rest(lote, actuales, aplicados)
+        except Exception as e:
+            logger.error(f"Error al aplicar lote de edición masiva: {e}")
+            if aplicados:
+                estado = {'estado': 'parcial', 'error': str(e), 'aplicado': aplicados}
+            elif usar_rpc and not isinstance(e, (supabase_client.APIError, PlazoAgotado)):
+                estado = {'estado': 'incierta', 'error': f'No se recibió la respuesta de la base: {e}'}
+            else:
+                estado = {'estado': 'error', 'error': str(e)}
+            for resultado, _ in bloque:
+                resultado.update(estado)
+            continue
+        for resultado, _ in bloque:
+            resultado['estado'] = 'actualizada'
+
+    resultados.sort(key=lambda r: r['indice'])
+    return resultados
@@ -0,0 +1,266 @@
+import json
+import re
+from typing import Any, Dict, Iterable, Iterator, Optional, Tuple
+
+# Inicio de un objeto pregunta en la salida JSON que pide el prompt
+_INICIO_OBJETO = re.compile(r'\{\s*"numero"\s*:')
+_MAX_OBJETO = 256 * 1024  # Un objeto más grande que esto se considera mal formado
+
+_UNIDAD = re.compile(r'^UNIDAD\s+(\d+)\s*[:.\-]\s*(.*)$', re.IGNORECASE)
+_PREGUNTA = re.compile(r'^(?:Pregunta|Caso)\s*(?:N[°º.]?\s*)?(\d+)\s*[:.\-)]?\s*(.*)$', re.IGNORECASE)
+_OPCION = re.compile(r'^([A-Ja-j])\s*[).:\-]\s+(.*)$')
+_RESPUESTA = re.compile(r'^Respuesta\s+correcta\s*:?\s*\(?([A-Ja-j])\)?', re.IGNORECASE)
+_EXPLICACION = re.compile(r'^Explicaci[oó]n\s*:?\s*(.*)$', re.IGNORECASE)
+_OPCIONES = re.compile(r'^Opciones\s*(?:\(A\s*[–-]\s*D\))?\s*:?\s*$', re.IGNORECASE)
+
+
+def _lineas(chunks: Iterable[str]) -> Iterator[str]:
+    pendiente = ''
+    for chunk in chunks:
+        pendiente += chunk
+        *completas, pendiente = pendiente.split('\n')
+        yield from completas
+    if pendiente:
+        yield pendiente
+
+
+def _limpiar(linea: str) -> str:
+    """Quita viñetas y negritas de markdown que los modelos suelen agregar."""
+    linea = linea.strip().replace('**', '').replace('__', '')
+    return re.sub(r'^[-*•]\s+', '', linea).strip()
+
+
+def _validar(item: Dict[str, Any]) -> Optional[str]:
+    if item.get('numero') is None:
+        return 'Falta el número de la pregunta'
+    if not item.get('enunciado'):
+        return 'Falta el enunciado'
+    opciones = item.get('opciones') or []
+    if len(opciones) < 2:
+        return f'Se esperaban al menos 2 opciones y hay {len(opciones)}'
+    correctas = sum(1 for o in opciones if o['es_correcta'])
+    if correctas != 1:
+        return f'Debe haber exactamente una opción correcta y hay {correctas}'
+    return None
+
+
+def _resultado(item: Dict[str, Any]) -> Dict[str, Any]:
+    error = _validar(item)
+    if error:
+        return {'error': error, 'numero': item.get('numero'), 'posicion': item.get('posicion')}
+    return item
+
+
+def _desde_json(objeto: Any, posicion: int) -> Dict[str, Any]:
+    if not isinstance(objeto, dict):
+        return {'error': 'Se esperaba un objeto JSON', 'numero': None, 'posicion': posicion}
+
+    opciones = []
+    for opcion in objeto.get('opciones') or []:
+        if isinstance(opcion, dict):
+            correcta = opcion.get('correcta', opcion.get('es_correcta', False))
+            opciones.append({'texto': str(opcion.get('texto', '')).strip(), 'es_correcta': correcta is True})
+        else:
+            opciones.append({'texto': str(opcion).strip(), 'es_correcta': False})
+
+    letra = str(objeto.get('respuesta_correcta') or '').strip().lower()[:1]
+    if letra and not any(o['es_correcta'] for o in opciones):
+        indice = ord(letra) - 97
+        if 0 <= indice < len(opciones):
+            opciones[indice]['es_correcta'] = True
+
+    try:
+        numero = int(objeto.get('numero'))
+    except (TypeError, ValueError):
+        numero = None
+
+    return _resultado({
+        'numero': numero,
+        'enunciado': str(objeto.get('enunciado') or '').strip(),
+        'explicacion': str(objeto.get('explicacion') or '').strip(),
+        'opciones': opciones,
+        'posicion': posicion,
+    })
+
+
+def _iter_json(chunks: Iterator[str], inicial: str) -> Iterator[Dict[str, Any]]:
+    """Decodifica los objetos pregunta uno a uno a medida que llega el texto."""
+    decoder = json.JSONDecoder()
+    buffer = inicial
+    desplazamiento = 0  # Posición absoluta del inicio del buffer, para los reportes
+    agotado = False
+
+    while True:
+        match = _INICIO_OBJETO.search(buffer)
+        if not match:
+            if agotado:
+                return
+            # Conservar una cola por si el inicio del objeto quedó partido entre chunks
+            corte = max(0, len(buffer) - 64)
+            desplazamiento += corte
+            buffer = buffer[corte:]
+            chunk = next(chunks, None)
+            if chunk is None:
+                agotado = True
+            else:
+                buffer += chunk
+            continue
+
+        inicio = match.start()
+        try:
+            objeto, fin = decoder.raw_decode(buffer, inicio)
+            yield _desde_json(objeto, desplazamiento + inicio)
+        except json.JSONDecodeError as e:
+            if not agotado and len(buffer) - inicio < _MAX_OBJETO:
+                # Probablemente el objeto aún no llegó completo
+                chunk = next(chunks, None)
+                if chunk is None:
+                    agotado = True
+                else:
+                    buffer += chunk
+                continue
+            yield {'error': f'JSON inválido: {e.msg}', 'numero': None, 'posicion': desplazamiento + inicio}
+            fin = inicio + 1
+
+        desplazamiento += fin
+        buffer = buffer[fin:]
+
+
+def _iter_texto(lineas: Iterator[str]) -> Iterator[Dict[str, Any]]:
+    """Interpreta el formato de texto: Pregunta N, opciones A–D, respuesta correcta y explicación."""
+    unidad = None
+    item: Optional[Dict[str, Any]] = None
+    seccion = None
+    letra_correcta = None
+
+    def cerrar():
+        if letra_correcta:
+            indice = ord(letra_correcta) - 97
+            if 0 <= indice < len(item['opciones']):
+                for i, opcion in enumerate(item['opciones']):
+                    opcion['es_correcta'] = i == indice
+        item['enunciado'] = '\n'.join(item['enunciado']).strip()
+        item['explicacion'] = '\n'.join(item['explicacion']).strip()
+        return _resultado(item)
+
+    for numero_linea, linea in enumerate(lineas, 1):
+        texto = _limpiar(linea)
+        if not texto:
+            continue
+
+        match = _UNIDAD.match(texto)
+        if match:
+            if item:
+                yield cerrar()
+                item = None
+            unidad = {'numero': int(match.group(1)), 'descripcion': match.group(2).strip()}
+            continue
+
+        match = _PREGUNTA.match(texto)
+        if match:
+            if item:
+                yield cerrar()
+            item = {
+                'numero': int(match.group(1)),
+                'enunciado': [match.group(2)] if match.group(2) else [],
+                'explicacion': [],
+                'opciones': [],
+                'unidad': unidad,
+                'posicion': numero_linea,
+            }
+            seccion = 'enunciado'
+            letra_correcta = None
+            continue
+
+        if item is None:
+            continue
+
+        match = _RESPUESTA.match(texto)
+        if match:
+            letra_correcta = match.group(1).lower()
+            seccion = None
+            continue
+
+        match = _EXPLICACION.match(texto)
+        if match:
+            seccion = 'explicacion'
+            if match.group(1):
+                item['explicacion'].append(match.group(1))
+            continue
+
+        if _OPCIONES.match(texto):
+            seccion = 'opciones'
+            continue
+
+        match = _OPCION.match(texto)
+        if match and seccion in ('enunciado', 'opciones'):
+            item['opciones'].append({'texto': match.group(2).strip(), 'es_correcta': False})
+            seccion = 'opciones'
+            continue
+
+        if seccion == 'enunciado':
+            item['enunciado'].append(texto)
+        elif seccion == 'opciones' and item['opciones']:
+            item['opciones'][-1]['texto'] += ' ' + texto
+        elif seccion == 'explicacion':
+            item['explicacion'].append(texto)
+
+    if item:
+        yield cerrar()
+
+
+def _detectar_formato(texto: str, desde: int, completo: bool) -> Tuple[Optional[str], int]:
+    """Formato de la salida según lo que aparece primero: un objeto pregunta JSON o un
+    encabezado ``Pregunta N``/``UNIDAD N`` del formato de texto.
+
+    Revisa las líneas completas a partir de ``desde`` y devuelve el formato (None si hace
+    falta más texto) y hasta dónde revisó. El texto previo (una introducción del modelo,
+    la apertura de un bloque ```json) se ignora.
+    """
+    objeto = _INICIO_OBJETO.search(texto, max(0, desde - 64))
+    fin = len(texto) if completo else texto.rfind('\n') + 1
+    while desde < fin and (objeto is None or desde <= objeto.start()):
+        salto = texto.find('\n', desde, fin)
+        siguiente = fin if salto < 0 else salto + 1
+        linea = _limpiar(texto[desde:siguiente])
+        if _PREGUNTA.match(linea) or _UNIDAD.match(linea):
+            return 'texto', desde
+        desde = siguiente
+    if objeto:
+        return 'json', desde
+    return None, desde
+
+
+def parsear_preguntas(chunks: Iterable[str]) -> Iterator[Dict[str, Any]]:
+    """Parsea en streaming la salida de un modelo (JSON o texto) y produce una pregunta por ítem.
+
+    Cada ítem es un dict con ``numero``, ``enunciado``, ``explicacion`` y ``opciones``
+    (``texto``/``es_correcta``), o un dict con ``error`` para los ítems que no se
+    pudieron interpretar, de modo que un ítem mal formado no detiene la importación.
+    Si la salida tiene texto pero ninguna pregunta reconocible se informa un error.
+    """
+    chunks = iter(chunks)
+    inicio = ''
+    formato, revisado = None, 0
+    for chunk in chunks:
+        inicio += chunk
+        formato, revisado = _detectar_formato(inicio, revisado, completo=False)
+        if formato:
+            break
+    else:
+        formato, revisado = _detectar_formato(inicio, revisado, completo=True)
+
+    if formato == 'json':
+        items = _iter_json(chunks, inicio)
+    else:
+        def todo():
+            yield inicio
+            yield from chunks
+        items = _iter_texto(_lineas(todo()))
+
+    reconocidos = 0
+    for item in items:
+        reconocidos += 1
+        yield item
+    if not reconocidos and inicio.strip().lstrip('\ufeff'):
+        yield {'error': 'No se reconoció ninguna pregunta en la salida del modelo', 'numero': None, 'posicion': 1}
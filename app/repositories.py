@@ -1,5 +1,7 @@
-from typing import Any, Dict, List, Optional, Tuple
+from functools import partial
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 
+from .concurrency import gather
 from .supabase_client import get_supabase_client, retry_on_network_error
 
 
@@ -169,6 +171,22 @@ class ProgramaAnaliticoRepository:
         res = client.table("programaanalitico").delete().eq("linea_educativa_id", linea_educativa_id).execute()
         return (1, res.data[0] if res.data else None)
 
+    @staticmethod
+    @retry_on_network_error()
+    def renumerar_preguntas(linea_educativa_id: int) -> Dict[str, Any]:
+        """Renumera las preguntas del programa en un solo UPDATE (ver supabase/migrations)."""
+        client = get_supabase_client()
+        res = client.rpc("renumerar_preguntas", {"p_programa_id": linea_educativa_id}).execute()
+        return res.data or {}
+
+    @staticmethod
+    @retry_on_network_error(idempotente=False)
+    def reservar_numeros(linea_educativa_id: int, cantidad: int) -> int:
+        """Reserva ``cantidad`` números consecutivos en el programa y devuelve el primero."""
+        client = get_supabase_client()
+        res = client.rpc("reservar_numeros", {"p_programa_id": linea_educativa_id, "p_cantidad": cantidad}).execute()
+        return int(res.data)
+
 
 class UnidadRepository:
     @staticmethod
@@ -188,6 +206,36 @@ class UnidadRepository:
         res = client.table("unidad").select("*").eq("unidad_id", unidad_id).single().execute()
         return res.data
 
+    @staticmethod
+    @retry_on_network_error()
+    def list_by_ids(unidad_ids: List[int]) -> List[Dict[str, Any]]:
+        if not unidad_ids:
+            return []
+        client = get_supabase_client()
+        res = (
+            client.table("unidad")
+            .select("unidad_id, numero_unidad, descripcion, num_preguntas, programa_analitico_id")
+            .in_("unidad_id", unidad_ids)
+            .execute()
+        )
+        return res.data or []
+
+    @staticmethod
+    @retry_on_network_error()
+    def list_by_programas(programa_ids: List[int], limit: int = 10000) -> List[Dict[str, Any]]:
+        if not programa_ids:
+            return []
+        client = get_supabase_client()
+        res = (
+            client.table("unidad")
+            .select("unidad_id, numero_unidad, descripcion, num_preguntas, programa_analitico_id")
+            .in_("programa_analitico_id", programa_ids)
+            .order("numero_unidad")
+            .limit(limit)
+            .execute()
+        )
+        return res.data or []
+
     @staticmethod
     @retry_on_network_error()
     def create(numero_unidad: int, descripcion: str, num_preguntas: int, programa_analitico_id: int) -> Dict[str, Any]:
@@ -201,6 +249,15 @@ class UnidadRepository:
         res = client.table("unidad").insert(payload).execute()
         return res.data[0] if res.data else None
 
+    @staticmethod
+    @retry_on_network_error(idempotente=False)
+    def create_many(rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        if not rows:
+            return []
+        client = get_supabase_client()
+        res = client.table("unidad").insert(rows).execute()
+        return res.data or []
+
     @staticmethod
     @retry_on_network_error()
     def update(unidad_id: int, descripcion: Optional[str] = None, numero_unidad: Optional[int] = None, num_preguntas: Optional[int] = None) -> Dict[str, Any]:
@@ -234,6 +291,126 @@ class PreguntaRepository:
         res = query.limit(limit).offset(offset).execute()
         return res.data or []
 
+    @staticmethod
+    @retry_on_network_error()
+    def list_page_by_unidad(unidad_id: int, limit: int = 500, offset: int = 0) -> List[Dict[str, Any]]:
+        client = get_supabase_client()
+        res = (
+            client.table("pregunta")
+            .select("pregunta_id, enunciado, explicacion, numero, unidad_id")
+            .eq("unidad_id", unidad_id)
+            .order("numero")
+            .order("pregunta_id")
+            .range(offset, offset + limit - 1)
+            .execute()
+        )
+        return res.data or []
+
+    @staticmethod
+    @retry_on_network_error()
+    def list_page_by_unidades(unidad_ids: List[int], limit: int = 1000, offset: int = 0) -> List[Dict[str, Any]]:
+        client = get_supabase_client()
+        res = (
+            client.table("pregunta")
+            .select("pregunta_id, enunciado, explicacion, numero, unidad_id")
+            .in_("unidad_id", unidad_ids)
+            .order("numero")
+            .order("pregunta_id")
+            .range(offset, offset + limit - 1)
+            .execute()
+        )
+        return res.data or []
+
+    @staticmethod
+    def list_by_unidades(unidad_ids: List[int], page_size: int = 1000) -> List[Dict[str, Any]]:
+        """Todas las preguntas de varias unidades, paginando por debajo del límite de PostgREST."""
+        if not unidad_ids:
+            return []
+        preguntas: List[Dict[str, Any]] = []
+        offset = 0
+        while True:
+            pagina = PreguntaRepository.list_page_by_unidades(unidad_ids, limit=page_size, offset=offset)
+            preguntas.extend(pagina)
+            if len(pagina) < page_size:
+                return preguntas
+            offset += page_size
+
+    @staticmethod
+    def iter_with_opciones(unidad_ids: List[int], page_size: int = 200) -> Iterator[Dict[str, Any]]:
+        """Recorre las preguntas de las unidades en orden, página a página, con sus opciones.
+
+        Solo mantiene una página en memoria, así que sirve para exportar bancos completos.
+        El tamaño de página por defecto deja las opciones de cada página (~4 por pregunta)
+        por debajo del límite de filas que PostgREST devuelve por consulta.
+        """
+        for unidad_id in unidad_ids:
+            offset = 0
+            while True:
+                preguntas = PreguntaRepository.list_page_by_unidad(unidad_id, limit=page_size, offset=offset)
+                if not preguntas:
+                    break
+                opciones = OpcionRepository.list_by_preguntas([p["pregunta_id"] for p in preguntas])
+                por_pregunta: Dict[int, List[Dict[str, Any]]] = {}
+                for opcion in opciones:
+                    por_pregunta.setdefault(opcion["pregunta_id"], []).append(opcion)
+                for pregunta in preguntas:
+                    pregunta["opciones"] = por_pregunta.get(pregunta["pregunta_id"], [])
+                    yield pregunta
+                if len(preguntas) < page_size:
+                    break
+                offset += page_size
+
+    @staticmethod
+    @retry_on_network_error()
+    def list_by_ids(pregunta_ids: List[int]) -> List[Dict[str, Any]]:
+        if not pregunta_ids:
+            return []
+        client = get_supabase_client()
+        res = (
+            client.table("pregunta")
+            .select("pregunta_id, enunciado, explicacion, numero, unidad_id")
+            .in_("pregunta_id", pregunta_ids)
+            .execute()
+        )
+        return res.data or []
+
+    @staticmethod
+    @retry_on_network_error()
+    def get_with_opciones(pregunta_id: int) -> Optional[Dict[str, Any]]:
+        """Pregunta con sus opciones embebidas, en una sola consulta."""
+        client = get_supabase_client()
+        res = (
+            client.table("pregunta")
+            .select("pregunta_id, enunciado, explicacion, numero, unidad_id, opcion(opcion_id, opcion, media_url, es_correcta, pregunta_id)")
+            .eq("pregunta_id", pregunta_id)
+            .execute()
+        )
+        if not res.data:
+            return None
+        pregunta = res.data[0]
+        pregunta["opciones"] = sorted(pregunta.pop("opcion", None) or [], key=lambda o: o["opcion_id"])
+        return pregunta
+
+    @staticmethod
+    @retry_on_network_error()
+    def get_by_unidad_numero(unidad_id: int, numero: int) -> Optional[Dict[str, Any]]:
+        """Pregunta real que ocupa la posición ``numero`` de la unidad, con sus opciones."""
+        client = get_supabase_client()
+        res = (
+            client.table("pregunta")
+            .select("pregunta_id, enunciado, explicacion, numero, unidad_id, opcion(opcion_id, opcion, media_url, es_correcta, pregunta_id)")
+            .eq("unidad_id", unidad_id)
+            .eq("numero", numero)
+            .order("pregunta_id")
+            .limit(1)
+            .execute()
+        )
+        if not res.data:
+            return None
+        pregunta = res.data[0]
+        pregunta["opciones"] = sorted(pregunta.pop("opcion", None) or [], key=lambda o: o["opcion_id"])
+        return pregunta
+
     @staticmethod
     @retry_on_network_error()
     def create(enunciado: str, numero: int, unidad_id: int, explicacion: Optional[str] = None) -> Dict[str, Any]:
@@ -244,6 +421,24 @@ class PreguntaRepository:
         res = client.table("pregunta").insert(payload).execute()
         return res.data[0] if res.data else None
 
+    @staticmethod
+    @retry_on_network_error(idempotente=False)
+    def create_many(rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        if not rows:
+            return []
+        client = get_supabase_client()
+        res = client.table("pregunta").insert(rows).execute()
+        return res.data or []
+
+    @staticmethod
+    @retry_on_network_error()
+    def upsert_many(rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        if not rows:
+            return []
+        client = get_supabase_client()
+        res = client.table("pregunta").upsert(rows, on_conflict="pregunta_id").execute()
+        return res.data or []
+
     @staticmethod
     @retry_on_network_error()
     def update(pregunta_id: int, enunciado: Optional[str] = None, numero: Optional[int] = None, explicacion: Optional[str] = None) -> Dict[str, Any]:
@@ -258,6 +453,53 @@ class PreguntaRepository:
         res = client.table("pregunta").update(patch).eq("pregunta_id", pregunta_id).execute()
         return res.data[0] if res.data else None
 
+    @staticmethod
+    @retry_on_network_error(idempotente=False)
+    def aplicar_edicion_masiva(cambios: Dict[str, Any]) -> Dict[str, Any]:
+        """Aplica cambios de preguntas y opciones en una transacción (ver supabase/migrations)."""
+        client = get_supabase_client()
+        res = client.rpc("aplicar_edicion_masiva", {"cambios": cambios}).execute()
+        return res.data or {}
+
+    @staticmethod
+    @retry_on_network_error()
+    def buscar(
+        consulta: str,
+        asignatura_id: Optional[int] = None,
+        partida_id: Optional[int] = None,
+        unidad_id: Optional[int] = None,
+        limite: int = 20,
+        offset: int = 0,
+    ) -> Dict[str, Any]:
+        """Búsqueda de texto completo ordenada por relevancia (ver supabase/migrations)."""
+        client = get_supabase_client()
+        res = client.rpc("buscar_preguntas", {
+            "p_consulta": consulta,
+            "p_asignatura_id": asignatura_id,
+            "p_partida_id": partida_id,
+            "p_unidad_id": unidad_id,
+            "p_limite": limite,
+            "p_offset": offset,
+        }).execute()
+        return res.data or {}
+
+    @staticmethod
+    @retry_on_network_error()
+    def buscar_texto(
+        consulta: str, unidad_ids: Optional[List[int]] = None, limite: int = 20, offset: int = 0
+    ) -> Tuple[List[Dict[str, Any]], int]:
+        """Filtro ``text_search`` sobre la columna ``busqueda``, sin ranking; devuelve (página, total)."""
+        client = get_supabase_client()
+        query = (
+            client.table("pregunta")
+            .select("pregunta_id, enunciado, numero, unidad_id", count="exact")
+            .text_search("busqueda", consulta, options={"config": "spanish", "type": "websearch"})
+        )
+        if unidad_ids is not None:
+            query = query.in_("unidad_id", unidad_ids)
+        res = query.order("numero").order("pregunta_id").range(offset, offset + limite - 1).execute()
+        return res.data or [], res.count or 0
+
     @staticmethod
     @retry_on_network_error()
     def delete(pregunta_id: int) -> Tuple[int, Optional[Dict[str, Any]]]:
@@ -277,6 +519,33 @@ class OpcionRepository:
         res = query.limit(limit).offset(offset).execute()
         return res.data or []
 
+    @staticmethod
+    @retry_on_network_error()
+    def list_by_preguntas(pregunta_ids: List[int]) -> List[Dict[str, Any]]:
+        if not pregunta_ids:
+            return []
+        client = get_supabase_client()
+        res = (
+            client.table("opcion")
+            .select("opcion_id, opcion, media_url, es_correcta, pregunta_id")
+            .in_("pregunta_id", pregunta_ids)
+            .order("opcion_id")
+            .execute()
+        )
+        return res.data or []
+
+    @staticmethod
+    def list_by_preguntas_chunked(pregunta_ids: List[int], chunk_size: int = 200) -> List[Dict[str, Any]]:
+        """Opciones de muchas preguntas en lotes, para no exceder el largo de URL ni el límite de filas.
+
+        Los lotes se piden en paralelo (ver ``concurrency.gather``) y se devuelven en orden.
+        """
+        lotes = gather(*(
+            partial(OpcionRepository.list_by_preguntas, pregunta_ids[i:i + chunk_size])
+            for i in range(0, len(pregunta_ids), chunk_size)
+        ))
+        return [opcion for lote in lotes for opcion in lote]
+
     @staticmethod
     @retry_on_network_error()
     def create(opcion: str, es_correcta: bool, pregunta_id: int, media_url: Optional[str] = None) -> Dict[str, Any]:
@@ -287,6 +556,15 @@ class OpcionRepository:
         res = client.table("opcion").insert(payload).execute()
         return res.data[0] if res.data else None
 
+    @staticmethod
+    @retry_on_network_error(idempotente=False)
+    def create_many(rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        if not rows:
+            return []
+        client = get_supabase_client()
+        res = client.table("opcion").insert(rows).execute()
+        return res.data or []
+
     @staticmethod
     @retry_on_network_error()
     def update(opcion_id: int, opcion: Optional[str] = None, es_correcta: Optional[bool] = None, media_url: Optional[str] = None) -> Dict[str, Any]:
@@ -308,6 +586,33 @@ class OpcionRepository:
         res = client.table("opcion").delete().eq("opcion_id", opcion_id).execute()
         return (1, res.data[0] if res.data else None)
 
+    @staticmethod
+    @retry_on_network_error()
+    def upsert_many(rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        if not rows:
+            return []
+        client = get_supabase_client()
+        res = client.table("opcion").upsert(rows, on_conflict="opcion_id").execute()
+        return res.data or []
+
+    @staticmethod
+    @retry_on_network_error()
+    def delete_many(opcion_ids: List[int]) -> int:
+        if not opcion_ids:
+            return 0
+        client = get_supabase_client()
+        res = client.table("opcion").delete().in_("opcion_id", opcion_ids).execute()
+        return len(res.data or [])
+
+    @staticmethod
+    @retry_on_network_error()
+    def delete_by_preguntas(pregunta_ids: List[int]) -> int:
+        if not pregunta_ids:
+            return 0
+        client = get_supabase_client()
+        res = client.table("opcion").delete().in_("pregunta_id", pregunta_ids).execute()
+        return len(res.data or [])
+
 
 class PartidaRepository:
     @staticmethod
@@ -328,6 +633,14 @@ class PartidaRepository:
         res = client.table("partida").insert(payload).execute()
         return res.data[0] if res.data else None
 
+    @staticmethod
+    @retry_on_network_error(idempotente=False)
+    def crear_completa(spec: Dict[str, Any]) -> Dict[str, Any]:
+        """Crea partida, programa, unidades, preguntas y opciones en una transacción (ver supabase/migrations)."""
+        client = get_supabase_client()
+        res = client.rpc("crear_partida_completa", {"spec": spec}).execute()
+        return res.data or {}
+
     @staticmethod
     @retry_on_network_error()
     def get_by_id(partida_id: int) -> Optional[Dict[str, Any]]:
@@ -0,0 +1,80 @@
+import json
+from typing import Any, Iterable, Iterator
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse, StreamingHttpResponse
+
+try:
+    import orjson
+except ImportError:  # opcional: sin orjson se usa el encoder de Django
+    orjson = None
+
+_encoder = DjangoJSONEncoder()
+
+
+def _por_defecto(valor: Any) -> Any:
+    # Lo que orjson no conoce (Decimal, Promise, ...) se resuelve como en JsonResponse
+    return _encoder.default(valor)
+
+
+# Las fechas también pasan por _por_defecto: orjson las escribiría con microsegundos
+# y "+00:00", y DjangoJSONEncoder con milisegundos y "Z"
+_OPCIONES_ORJSON = (orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME) if orjson is not None else 0
+
+
+def dumps(datos: Any) -> bytes:
+    """Serializa a JSON en bytes: con orjson si está instalado y JSON_RAPIDO no se desactivó."""
+    if orjson is not None and settings.JSON_RAPIDO:
+        return orjson.dumps(datos, default=_por_defecto, option=_OPCIONES_ORJSON)
+    return json.dumps(datos, cls=DjangoJSONEncoder, ensure_ascii=False, separators=(',', ':')).encode()
+
+
+class FastJsonResponse(HttpResponse):
+    """Igual que ``JsonResponse`` pero serializa con ``dumps``.
+
+    Acepta los mismos argumentos (``safe``, ``status``, ...); ``encoder`` y
+    ``json_dumps_params`` no se usan.
+    """
+
+    def __init__(self, data, encoder=None, safe=True, json_dumps_params=None, **kwargs):
+        if safe and not isinstance(data, dict):
+            raise TypeError(
+                'In order to allow non-dict objects to be serialized set the safe parameter to False.'
+            )
+        kwargs.setdefault('content_type', 'application/json')
+        super().__init__(content=dumps(data), **kwargs)
+
+
+def _arreglo(filas: Iterable[Any], por_trozo: int) -> Iterator[bytes]:
+    yield b'['
+    trozo = []
+    primero = True
+    for fila in filas:
+        trozo.append(dumps(fila))
+        if len(trozo) >= por_trozo:
+            yield (b'' if primero else b',') + b','.join(trozo)
+            primero = False
+            trozo = []
+    if trozo:
+        yield (b'' if primero else b',') + b','.join(trozo)
+    yield b']'
+
+
+class StreamingJsonResponse(StreamingHttpResponse):
+    """Arreglo JSON que se serializa y envía fila por fila.
+
+    El cuerpo completo nunca está en memoria; las filas se agrupan de a ``por_trozo``
+    para no escribir al socket una vez por fila.
+    """
+
+    def __init__(self, filas: Iterable[Any], por_trozo: int = 100, **kwargs):
+        kwargs.setdefault('content_type', 'application/json')
+        super().__init__(_arreglo(filas, por_trozo), **kwargs)
+
+
+def json_lista(filas: list, **kwargs) -> HttpResponse:
+    """Respuesta para una lista de filas: en streaming desde JSON_STREAMING_MINIMO filas."""
+    if len(filas) >= settings.JSON_STREAMING_MINIMO:
+        return StreamingJsonResponse(filas, **kwargs)
+    return FastJsonResponse(filas, safe=False, **kwargs)
@@ -0,0 +1,201 @@
+import html
+import logging
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+from django.db import connection
+
+from . import supabase_client
+from .models import Partida, Pregunta, ProgramaAnalitico, Unidad
+from .repositories import PartidaRepository, PreguntaRepository, ProgramaAnaliticoRepository, UnidadRepository
+
+logger = logging.getLogger(__name__)
+
+POR_PAGINA_MAXIMO = 100
+
+
+def _resaltar(fragmento: str) -> str:
+    """Escapa el fragmento dejando solo las marcas <b> que agrega el motor de búsqueda."""
+    return html.escape(fragmento or '').replace('&lt;b&gt;', '<b>').replace('&lt;/b&gt;', '</b>')
+
+
+def _pagina(total: int, resultados: List[Dict[str, Any]], consulta: str, pagina: int, por_pagina: int) -> Dict[str, Any]:
+    for resultado in resultados:
+        resultado['fragmento'] = _resaltar(resultado.get('fragmento'))
+    return {
+        'consulta': consulta,
+        'total': total,
+        'pagina': pagina,
+        'por_pagina': por_pagina,
+        'resultados': resultados,
+    }
+
+
+def _limites(pagina: int, por_pagina: int) -> Tuple[int, int]:
+    pagina = max(1, int(pagina))
+    por_pagina = min(max(1, int(por_pagina)), POR_PAGINA_MAXIMO)
+    return pagina, por_pagina
+
+
+# ============================================================================
+# SUPABASE
+# ============================================================================
+
+def buscar_preguntas(
+    consulta: str,
+    asignatura_id: Optional[int] = None,
+    partida_id: Optional[int] = None,
+    unidad_id: Optional[int] = None,
+    pagina: int = 1,
+    por_pagina: int = 20,
+) -> Dict[str, Any]:
+    """Busca en enunciado, explicación y opciones con la función ``buscar_preguntas``.
+
+    Los resultados vienen ordenados por relevancia (``ts_rank_cd``). Si la función todavía
+    no está instalada se usa el filtro ``text_search`` sobre la columna ``busqueda``,
+    ordenado por número.
+    """
+    pagina, por_pagina = _limites(pagina, por_pagina)
+    consulta = (consulta or '').strip()
+    if not consulta:
+        return _pagina(0, [], consulta, pagina, por_pagina)
+
+    try:
+        resultado = PreguntaRepository.buscar(
+            consulta,
+            asignatura_id=asignatura_id,
+            partida_id=partida_id,
+            unidad_id=unidad_id,
+            limite=por_pagina,
+            offset=(pagina - 1) * por_pagina,
+        )
+        return _pagina(int(resultado.get('total', 0)), resultado.get('resultados') or [], consulta, pagina, por_pagina)
+    except supabase_client.APIError as e:
+        if e.code != 'PGRST202':
+            raise
+        logger.warning("La función buscar_preguntas no existe; se usa el filtro text_search")
+
+    unidad_ids = None
+    if unidad_id:
+        unidad_ids = [unidad_id]
+    elif partida_id or asignatura_id:
+        if partida_id:
+            partida = PartidaRepository.get_by_id(partida_id)
+            if not partida:
+                return _pagina(0, [], consulta, pagina, por_pagina)
+            asignatura_id = partida['asignatura_id']
+        programas = ProgramaAnaliticoRepository.list_by_asignatura(asignatura_id=asignatura_id)
+        unidades = UnidadRepository.list_by_programas([p['linea_educativa_id'] for p in programas])
+        unidad_ids = [u['unidad_id'] for u in unidades]
+        if not unidad_ids:
+            return _pagina(0, [], consulta, pagina, por_pagina)
+
+    preguntas, total = PreguntaRepository.buscar_texto(
+        consulta, unidad_ids=unidad_ids, limite=por_pagina, offset=(pagina - 1) * por_pagina
+    )
+    resultados = [
+        {
+            'pregunta_id': p['pregunta_id'],
+            'numero': p['numero'],
+            'unidad_id': p['unidad_id'],
+            'enunciado': p['enunciado'],
+            'fragmento': p['enunciado'][:200],
+            'rango': None,
+        }
+        for p in preguntas
+    ]
+    return _pagina(total, resultados, consulta, pagina, por_pagina)
+
+
+# ============================================================================
+# ORM (base local)
+# ============================================================================
+
+def _consulta_fts5(consulta: str) -> str:
+    """Convierte el texto del usuario en una consulta FTS5 segura: todas las palabras, la última como prefijo."""
+    palabras = re.findall(r'\w+', consulta)
+    if not palabras:
+        return ''
+    return ' '.join(f'"{p}"' for p in palabras[:-1]) + f' "{palabras[-1]}"*'
+
+
+def buscar_preguntas_local(
+    consulta: str,
+    asignatura_id: Optional[int] = None,
+    partida_id: Optional[int] = None,
+    unidad_id: Optional[int] = None,
+    pagina: int = 1,
+    por_pagina: int = 20,
+) -> Dict[str, Any]:
+    """Como ``buscar_preguntas`` sobre la base local.
+
+    En SQLite usa la tabla FTS5 ``app_pregunta_fts`` (ranking bm25); en PostgreSQL la
+    columna ``busqueda`` con configuración 'spanish' (ver migración 0007).
+    """
+    pagina, por_pagina = _limites(pagina, por_pagina)
+    consulta = (consulta or '').strip()
+    if partida_id:
+        asignatura_id = Partida.objects.filter(pk=partida_id).values_list('asignatura_id', flat=True).first()
+        if asignatura_id is None:
+            return _pagina(0, [], consulta, pagina, por_pagina)
+
+    pregunta = Pregunta._meta.db_table
+    unidad = Unidad._meta.db_table
+    programa = ProgramaAnalitico._meta.db_table
+    filtros, parametros = [], []
+    if asignatura_id:
+        filtros.append('pa.asignatura_id = %s')
+        parametros.append(asignatura_id)
+    if unidad_id:
+        filtros.append('p.unidad_id = %s')
+        parametros.append(unidad_id)
+
+    if connection.vendor == 'sqlite':
+        expresion = _consulta_fts5(consulta)
+        if not expresion:
+            return _pagina(0, [], consulta, pagina, por_pagina)
+        desde = f"""
+            FROM app_pregunta_fts f
+            JOIN {pregunta} p ON p.pregunta_id = f.rowid
+            JOIN {unidad} u ON u.unidad_id = p.unidad_id
+            JOIN {programa} pa ON pa.linea_educativa_id = u.programa_analitico_id
+            WHERE app_pregunta_fts MATCH %s {''.join(' AND ' + f for f in filtros)}
+        """
+        columnas = """
+            p.pregunta_id, p.numero, p.unidad_id, p.enunciado,
+            snippet(app_pregunta_fts, -1, '<b>', '</b>', '…', 16) AS fragmento,
+            -bm25(app_pregunta_fts, 10.0, 5.0, 1.0) AS rango
+        """
+    elif connection.vendor == 'postgresql':
+        expresion = consulta
+        desde = f"""
+            FROM {pregunta} p
+            JOIN {unidad} u ON u.unidad_id = p.unidad_id
+            JOIN {programa} pa ON pa.linea_educativa_id = u.programa_analitico_id
+            WHERE p.busqueda @@ websearch_to_tsquery('spanish', %s) {''.join(' AND ' + f for f in filtros)}
+        """
+        columnas = """
+            p.pregunta_id, p.numero, p.unidad_id, p.enunciado,
+            ts_headline('spanish', p.enunciado || ' ' || coalesce(p.explicacion, ''),
+                        websearch_to_tsquery('spanish', %s), 'MaxWords=30, MinWords=10, MaxFragments=2') AS fragmento,
+            ts_rank_cd(p.busqueda, websearch_to_tsquery('spanish', %s)) AS rango
+        """
+    else:
+        raise NotImplementedError(f"Búsqueda no disponible para la base {connection.vendor}")
+
+    if not consulta:
+        return _pagina(0, [], consulta, pagina, por_pagina)
+
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT count(*) {desde}", [expresion, *parametros])
+        total = cursor.fetchone()[0]
+        if not total:
+            return _pagina(0, [], consulta, pagina, por_pagina)
+        extra = [expresion, expresion] if connection.vendor == 'postgresql' else []
+        cursor.execute(
+            f"SELECT {columnas} {desde} ORDER BY rango DESC, p.pregunta_id LIMIT %s OFFSET %s",
+            [*extra, expresion, *parametros, por_pagina, (pagina - 1) * por_pagina],
+        )
+        nombres = [c[0] for c in cursor.description]
+        resultados = [dict(zip(nombres, fila)) for fila in cursor.fetchall()]
+    return _pagina(total, resultados, consulta, pagina, por_pagina)
@@ -1,5 +1,11 @@
-from typing import Dict, Any, List
+import logging
+from functools import partial
+from typing import Dict, Any, List, Optional
 
+from . import supabase_client
+from .concurrency import gather
+from .context_index import obtener_indice_contexto
+from .placeholders import completar_unidad, rangos_numeracion
 from .repositories import (
     PartidaRepository,
     ProgramaAnaliticoRepository,
@@ -7,8 +13,11 @@ from .repositories import (
     PreguntaRepository,
     OpcionRepository,
     AsignaturaRepository,
+    CarreraRepository,
 )
 
+logger = logging.getLogger(__name__)
+
 
 class SupabaseBusinessService:
     @staticmethod
@@ -21,15 +30,8 @@ class SupabaseBusinessService:
         preguntas_por_unidad: int,
         unidades_personalizadas: List[Dict[str, Any]] | None = None,
     ) -> Dict[str, Any]:
-        partida = PartidaRepository.create(descripcion_partida, asignatura_id)
-
-        programa = ProgramaAnaliticoRepository.create(
-            titulo=titulo_programa,
-            contexto=contexto or "",
-            asignatura_id=asignatura_id,
-        )
-
-        unidades_creadas: List[Dict[str, Any]] = []
+        # Las preguntas de cada unidad quedan virtuales hasta su primera edición o importación
+        unidades: List[Dict[str, Any]] = []
         for i in range(1, int(num_unidades) + 1):
             if unidades_personalizadas and len(unidades_personalizadas) >= i:
                 u_cfg = unidades_personalizadas[i - 1]
@@ -41,55 +43,161 @@ class SupabaseBusinessService:
                 descripcion = f"Unidad {i}"
                 n_pregs = int(preguntas_por_unidad)
 
-            unidad = UnidadRepository.create(
-                numero_unidad=numero,
-                descripcion=descripcion,
-                num_preguntas=n_pregs,
-                programa_analitico_id=programa["linea_educativa_id"],
-            )
-            unidades_creadas.append(unidad)
-
-            SupabaseBusinessService.generar_preguntas_basicas_para_unidad(
-                unidad_id=unidad["unidad_id"],
-                numero_inicio=1,
-                cantidad=n_pregs,
-                descripcion_unidad=descripcion,
-            )
+            unidades.append({
+                "numero_unidad": numero,
+                "descripcion": descripcion,
+                "num_preguntas": n_pregs,
+            })
+
+        spec = {
+            "partida": {"descripcion": descripcion_partida, "asignatura_id": asignatura_id},
+            "programa": {"titulo": titulo_programa, "contexto": contexto or ""},
+            "unidades": unidades,
+        }
+        creada = SupabaseBusinessService.crear_partida_desde_spec(spec)
+        unidad_por_numero = {u["numero_unidad"]: u for u in unidades}
 
         return {
-            "partida": partida,
-            "programa": programa,
-            "unidades": unidades_creadas,
+            "partida": {"partida_id": creada["partida_id"], **spec["partida"]},
+            "programa": {"linea_educativa_id": creada["programa_id"], **spec["programa"], "asignatura_id": asignatura_id},
+            "unidades": [
+                {
+                    "unidad_id": u["unidad_id"],
+                    "numero_unidad": u["numero_unidad"],
+                    "descripcion": unidad_por_numero[u["numero_unidad"]]["descripcion"],
+                    "num_preguntas": unidad_por_numero[u["numero_unidad"]]["num_preguntas"],
+                    "programa_analitico_id": creada["programa_id"],
+                }
+                for u in creada["unidades"]
+            ],
         }
 
     @staticmethod
-    def generar_preguntas_basicas_para_unidad(
-        unidad_id: int,
-        numero_inicio: int,
-        cantidad: int,
-        descripcion_unidad: str,
-    ) -> int:
-        for i in range(cantidad):
-            numero_pregunta = numero_inicio + i
-            enunciado = f"Pregunta {numero_pregunta} sobre {descripcion_unidad}. Explique detalladamente."
-            pregunta = PreguntaRepository.create(
-                enunciado=enunciado,
-                numero=numero_pregunta,
-                unidad_id=unidad_id,
-            )
-
-            opciones_basicas = [
-                f"Opción correcta para {descripcion_unidad}",
-                f"Opción parcial para {descripcion_unidad}",
-                f"Opción incorrecta relacionada con {descripcion_unidad}",
-                f"Opción no relacionada con {descripcion_unidad}",
-            ]
-            for j, opcion_texto in enumerate(opciones_basicas):
-                OpcionRepository.create(
-                    opcion=opcion_texto,
-                    es_correcta=(j == 0),
-                    pregunta_id=pregunta["pregunta_id"],
-                )
-        return cantidad
+    def crear_partida_desde_spec(spec: Dict[str, Any]) -> Dict[str, Any]:
+        """Crea la partida completa descrita por ``spec`` con una sola llamada a la base.
 
+        La función ``crear_partida_completa`` (supabase/migrations) inserta todos los
+        niveles en una transacción. Si todavía no está instalada se usan inserciones
+        por lotes, una por nivel, sin garantía transaccional.
+        """
+        try:
+            creada = PartidaRepository.crear_completa(spec)
+        except supabase_client.APIError as e:
+            if e.code != "PGRST202":
+                raise
+            logger.warning("La función crear_partida_completa no existe; se crean los niveles por lotes")
+            creada = SupabaseBusinessService._crear_partida_por_lotes(spec)
 
+        obtener_indice_contexto(spec["programa"].get("contexto") or "")
+        return creada
+
+    @staticmethod
+    def _crear_partida_por_lotes(spec: Dict[str, Any]) -> Dict[str, Any]:
+        partida = PartidaRepository.create(spec["partida"]["descripcion"], spec["partida"]["asignatura_id"])
+        programa = ProgramaAnaliticoRepository.create(
+            titulo=spec["programa"]["titulo"],
+            contexto=spec["programa"].get("contexto") or "",
+            asignatura_id=spec["partida"]["asignatura_id"],
+        )
+
+        unidades = UnidadRepository.create_many([
+            {
+                "numero_unidad": u["numero_unidad"],
+                "descripcion": u["descripcion"],
+                "num_preguntas": u.get("num_preguntas", 0),
+                "programa_analitico_id": programa["linea_educativa_id"],
+            }
+            for u in spec["unidades"]
+        ])
+        unidad_por_numero = {u["numero_unidad"]: u["unidad_id"] for u in unidades}
+
+        preguntas = PreguntaRepository.create_many([
+            {
+                "numero": p["numero"],
+                "enunciado": p["enunciado"],
+                "explicacion": p.get("explicacion"),
+                "unidad_id": unidad_por_numero[u["numero_unidad"]],
+            }
+            for u in spec["unidades"]
+            for p in u.get("preguntas", [])
+        ])
+        pregunta_por_clave = {(p["unidad_id"], p["numero"]): p["pregunta_id"] for p in preguntas}
+
+        opciones = OpcionRepository.create_many([
+            {
+                "opcion": o["opcion"],
+                "es_correcta": o.get("es_correcta", False),
+                "pregunta_id": pregunta_por_clave[(unidad_por_numero[u["numero_unidad"]], p["numero"])],
+            }
+            for u in spec["unidades"]
+            for p in u.get("preguntas", [])
+            for o in p.get("opciones", [])
+        ])
+
+        return {
+            "partida_id": partida["partida_id"],
+            "programa_id": programa["linea_educativa_id"],
+            "unidades": sorted(
+                ({"unidad_id": u["unidad_id"], "numero_unidad": u["numero_unidad"]} for u in unidades),
+                key=lambda u: u["numero_unidad"],
+            ),
+            "preguntas": len(preguntas),
+            "opciones": len(opciones),
+        }
+
+    @staticmethod
+    def obtener_arbol_partida(partida_id: int, con_placeholders: bool = False) -> Optional[Dict[str, Any]]:
+        """Carga la partida con asignatura, carrera, programas, unidades, preguntas y opciones.
+
+        Cada nivel se obtiene con una sola consulta por lotes (``in``) en lugar de una
+        consulta por unidad y por pregunta. Las unidades quedan ordenadas por programa
+        y número, las preguntas por número y las opciones en orden de creación.
+        Con ``con_placeholders`` cada unidad se completa con sus preguntas virtuales.
+        """
+        partida = PartidaRepository.get_by_id(partida_id)
+        if not partida:
+            return None
+
+        asignatura = AsignaturaRepository.get_by_id(partida["asignatura_id"])
+        if not asignatura:
+            return None
+
+        # La carrera no depende del resto del árbol: se pide junto con los programas
+        carrera, programas = gather(
+            partial(CarreraRepository.get_by_id, asignatura["carrera_id"]) if asignatura.get("carrera_id") else lambda: None,
+            partial(ProgramaAnaliticoRepository.list_by_asignatura, asignatura_id=asignatura["asignatura_id"]),
+        )
+        orden_programa = {p["linea_educativa_id"]: i for i, p in enumerate(programas)}
+
+        unidades = UnidadRepository.list_by_programas(list(orden_programa))
+        unidades.sort(key=lambda u: (orden_programa[u["programa_analitico_id"]], u["numero_unidad"]))
+
+        preguntas = PreguntaRepository.list_by_unidades([u["unidad_id"] for u in unidades])
+        opciones = OpcionRepository.list_by_preguntas_chunked([p["pregunta_id"] for p in preguntas])
+
+        opciones_por_pregunta: Dict[int, List[Dict[str, Any]]] = {}
+        for opcion in opciones:
+            opciones_por_pregunta.setdefault(opcion["pregunta_id"], []).append(opcion)
+
+        preguntas_por_unidad: Dict[int, List[Dict[str, Any]]] = {}
+        for pregunta in preguntas:
+            pregunta["opciones"] = opciones_por_pregunta.get(pregunta["pregunta_id"], [])
+            preguntas_por_unidad.setdefault(pregunta["unidad_id"], []).append(pregunta)
+
+        rangos = rangos_numeracion(
+            unidades, {unidad_id: len(reales) for unidad_id, reales in preguntas_por_unidad.items()}
+        ) if con_placeholders else {}
+        for unidad in unidades:
+            unidad["preguntas"] = preguntas_por_unidad.get(unidad["unidad_id"], [])
+            if con_placeholders:
+                unidad["preguntas"] = completar_unidad(
+                    unidad, unidad["preguntas"], rangos.get(unidad["unidad_id"], range(0))
+                )
+
+        return {
+            "partida": partida,
+            "asignatura": asignatura,
+            "carrera": carrera,
+            "programas": programas,
+            "unidades": unidades,
+        }
@@ -0,0 +1,239 @@
+import logging
+from functools import partial
+from typing import Any, Dict, Iterable, List, Optional
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .concurrency import gather
+from .deadline import marcar_parcial, plazo_agotado
+from .models import PartidaSnapshot
+from .placeholders import completar_unidad, rangos_numeracion
+from .repositories import (
+    OpcionRepository,
+    PartidaRepository,
+    PreguntaRepository,
+    ProgramaAnaliticoRepository,
+    UnidadRepository,
+)
+from .services_supabase import SupabaseBusinessService
+from .swr import marcar_obsoleto, refrescar_en_segundo_plano
+
+logger = logging.getLogger(__name__)
+
+
+def despues_de_escribir(funcion, *args) -> None:
+    """Refresca snapshots tras una escritura sin propagar errores: la escritura ya se confirmó.
+
+    Un snapshot que no se pudo refrescar se corrige al vencer ``PARTIDA_SNAPSHOT_MAX_EDAD``
+    o con ``reparar_snapshots``.
+    """
+    try:
+        funcion(*args)
+    except Exception as e:
+        logger.warning(f"No se pudo actualizar el snapshot ({funcion.__name__}): {e}")
+
+
+def _conteos(unidades: List[Dict[str, Any]]) -> Dict[str, int]:
+    preguntas = [p for u in unidades for p in u['preguntas']]
+    return {
+        'programas': len({u['programa_analitico_id'] for u in unidades}),
+        'unidades': len(unidades),
+        'preguntas': len(preguntas),
+        'preguntas_reales': sum(1 for p in preguntas if not p.get('virtual')),
+        'opciones': sum(len(p.get('opciones') or []) for p in preguntas),
+    }
+
+
+def _guardar(partida_id: int, asignatura_id: int, documento: Dict[str, Any]) -> None:
+    documento['conteos'] = _conteos(documento['unidades'])
+
+    def actualizar() -> int:
+        return PartidaSnapshot.objects.filter(pk=partida_id).update(
+            asignatura_id=asignatura_id,
+            documento=documento,
+            version=F('version') + 1,
+            actualizado=timezone.now(),
+        )
+
+    if actualizar():
+        return
+    try:
+        with transaction.atomic():
+            PartidaSnapshot.objects.create(partida_id=partida_id, asignatura_id=asignatura_id, documento=documento)
+    except IntegrityError:
+        # Otro proceso armó el mismo snapshot entre el UPDATE y el INSERT
+        actualizar()
+
+
+def reconstruir_partida(partida_id: int) -> Optional[Dict[str, Any]]:
+    """Arma de nuevo el snapshot de la partida desde Supabase y lo devuelve.
+
+    Las partidas de la misma asignatura comparten programas y unidades, así que sus
+    snapshots existentes se actualizan con el mismo árbol.
+    """
+    arbol = SupabaseBusinessService.obtener_arbol_partida(partida_id, con_placeholders=True)
+    if not arbol:
+        PartidaSnapshot.objects.filter(pk=partida_id).delete()
+        return None
+
+    asignatura_id = arbol['asignatura']['asignatura_id']
+    _guardar(partida_id, asignatura_id, arbol)
+
+    hermanas = PartidaSnapshot.objects.filter(asignatura_id=asignatura_id).exclude(pk=partida_id)
+    for snapshot in hermanas:
+        _guardar(snapshot.partida_id, asignatura_id, {**arbol, 'partida': snapshot.documento['partida']})
+    return arbol
+
+
+def reconstruir_asignatura(asignatura_id: int) -> int:
+    """Arma los snapshots de todas las partidas de la asignatura cargando el árbol una sola vez."""
+    partidas = PartidaRepository.list_all(limit=1000, asignatura_id=asignatura_id)
+    if not partidas:
+        PartidaSnapshot.objects.filter(asignatura_id=asignatura_id).delete()
+        return 0
+
+    arbol = reconstruir_partida(partidas[0]['partida_id'])
+    if not arbol:
+        return 0
+    for partida in partidas[1:]:
+        _guardar(partida['partida_id'], asignatura_id, {**arbol, 'partida': partida})
+    return len(partidas)
+
+
+def obtener_snapshot(partida_id: int) -> Optional[Dict[str, Any]]:
+    """Snapshot de la partida; se arma si no existe (ver ``obtener_snapshots``)."""
+    return obtener_snapshots([partida_id]).get(partida_id)
+
+
+def obtener_snapshots(partida_ids: Iterable[int]) -> Dict[int, Dict[str, Any]]:
+    """Snapshots de varias partidas con una sola consulta.
+
+    Los que faltan se arman en el momento. Los que superaron la edad máxima se sirven
+    igual (marcando la respuesta como obsoleta) mientras se reconstruyen en segundo
+    plano, siempre que no superen ``SWR_MAX_OBSOLETO``.
+    """
+    partida_ids = list(partida_ids)
+    ahora = timezone.now()
+    filas = {
+        partida_id: (documento, (ahora - actualizado).total_seconds())
+        for partida_id, documento, actualizado in PartidaSnapshot.objects.filter(pk__in=partida_ids)
+        .values_list('partida_id', 'documento', 'actualizado')
+    }
+
+    documentos: Dict[int, Dict[str, Any]] = {}
+    for partida_id in partida_ids:
+        documento, edad = filas.get(partida_id, (None, None))
+        if documento is not None and edad < settings.PARTIDA_SNAPSHOT_MAX_EDAD:
+            documentos[partida_id] = documento
+        elif documento is not None and edad < settings.SWR_MAX_OBSOLETO:
+            marcar_obsoleto()
+            refrescar_en_segundo_plano(f"snapshot:{partida_id}", partial(reconstruir_partida, partida_id))
+            documentos[partida_id] = documento
+        elif plazo_agotado():
+            # Sin tiempo para armarlo: la respuesta sale sin esta partida
+            marcar_parcial()
+        else:
+            documento = reconstruir_partida(partida_id)
+            if documento:
+                documentos[partida_id] = documento
+    return documentos
+
+
+def refrescar_partida(partida: Dict[str, Any]) -> None:
+    """Reemplaza los datos propios de la partida (descripción) sin tocar el resto del árbol."""
+    with transaction.atomic():
+        snapshot = PartidaSnapshot.objects.select_for_update().filter(pk=partida['partida_id']).first()
+        if snapshot:
+            documento = snapshot.documento
+            documento['partida'] = {**documento['partida'], **partida}
+            _guardar(snapshot.partida_id, snapshot.asignatura_id, documento)
+
+
+def _reemplazar_unidades(
+    partida_id: int,
+    frescas: Dict[int, Dict[str, Any]],
+    preguntas_por_unidad: Dict[int, List[Dict[str, Any]]],
+    programa_ids: Iterable[int],
+) -> bool:
+    """Reemplaza las unidades en el snapshot; devuelve False si alguna no estaba (hay que armarlo).
+
+    El documento se lee con la fila bloqueada hasta guardarlo: dos ediciones de unidades
+    distintas de la misma asignatura no se pisan entre sí.
+    """
+    with transaction.atomic():
+        snapshot = PartidaSnapshot.objects.select_for_update().filter(pk=partida_id).first()
+        if not snapshot:
+            return True
+        documento = snapshot.documento
+        actuales = {u['unidad_id']: u for u in documento['unidades']}
+        if any(unidad_id not in actuales for unidad_id in frescas):
+            return False
+
+        for unidad_id, unidad in frescas.items():
+            actuales[unidad_id].update(unidad)
+            actuales[unidad_id]['preguntas'] = preguntas_por_unidad.get(unidad_id, [])
+
+        del_programa = [u for u in documento['unidades'] if u['programa_analitico_id'] in programa_ids]
+        reales = {
+            unidad['unidad_id']: [p for p in unidad['preguntas'] if not p.get('virtual')] for unidad in del_programa
+        }
+        rangos = rangos_numeracion(del_programa, {unidad_id: len(lista) for unidad_id, lista in reales.items()})
+        for unidad in del_programa:
+            unidad['preguntas'] = completar_unidad(
+                unidad, reales[unidad['unidad_id']], rangos.get(unidad['unidad_id'], range(0))
+            )
+
+        _guardar(snapshot.partida_id, snapshot.asignatura_id, documento)
+    return True
+
+
+def refrescar_unidades(unidad_ids: Iterable[int]) -> None:
+    """Vuelve a leer solo las unidades indicadas y las reemplaza en los snapshots que las contienen.
+
+    La numeración virtual de sus programas se recalcula, porque depende de
+    ``num_preguntas`` de todas las unidades del programa. Si una unidad todavía no
+    está en un snapshot (unidad nueva), ese snapshot se arma completo.
+    """
+    unidad_ids = sorted(set(unidad_ids))
+    if not unidad_ids:
+        return
+
+    frescas = {u['unidad_id']: u for u in UnidadRepository.list_by_ids(unidad_ids)}
+    preguntas = PreguntaRepository.list_by_unidades(list(frescas))
+    opciones = OpcionRepository.list_by_preguntas_chunked([p['pregunta_id'] for p in preguntas])
+
+    opciones_por_pregunta: Dict[int, List[Dict[str, Any]]] = {}
+    for opcion in opciones:
+        opciones_por_pregunta.setdefault(opcion['pregunta_id'], []).append(opcion)
+    preguntas_por_unidad: Dict[int, List[Dict[str, Any]]] = {}
+    for pregunta in preguntas:
+        pregunta['opciones'] = opciones_por_pregunta.get(pregunta['pregunta_id'], [])
+        preguntas_por_unidad.setdefault(pregunta['unidad_id'], []).append(pregunta)
+
+    programa_ids = {u['programa_analitico_id'] for u in frescas.values()}
+    asignatura_ids = {
+        programa['asignatura_id']
+        for programa in gather(*(partial(ProgramaAnaliticoRepository.get_by_id, p) for p in programa_ids))
+        if programa
+    }
+
+    reconstruidas = set()
+    snapshots = PartidaSnapshot.objects.filter(asignatura_id__in=asignatura_ids)
+    for partida_id, asignatura_id in list(snapshots.values_list('partida_id', 'asignatura_id')):
+        if asignatura_id in reconstruidas:
+            continue
+        if not _reemplazar_unidades(partida_id, frescas, preguntas_por_unidad, programa_ids):
+            # Unidad nueva: reconstruir_partida ya actualiza las demás partidas de la asignatura
+            reconstruir_partida(partida_id)
+            reconstruidas.add(asignatura_id)
+
+    logger.info(f"Snapshots actualizados para unidades {unidad_ids}")
+
+
+def refrescar_preguntas(pregunta_ids: Iterable[int]) -> None:
+    """Como ``refrescar_unidades``, a partir de las preguntas modificadas."""
+    preguntas = PreguntaRepository.list_by_ids(sorted(set(pregunta_ids)))
+    refrescar_unidades(p['unidad_id'] for p in preguntas)
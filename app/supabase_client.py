@@ -1,30 +1,80 @@
-from typing import Optional
+from typing import TYPE_CHECKING, Any, Dict, Optional
 import os
 import time
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from functools import wraps
 
-from supabase import Client, create_client
-from dotenv import load_dotenv
-import httpx
+from django.conf import settings
+
+from .deadline import (
+    PlazoAgotado, iniciar_plazo, limitar_timeout, plazo_restante, terminar_plazo, verificar_plazo,
+)
+
+# supabase (con sus clientes de auth, storage y realtime), postgrest y httpx se importan
+# recién con el primer uso: los comandos y workers que no llaman a Supabase no los cargan.
+# Las variables de .env ya las carga settings.py.
+if TYPE_CHECKING:
+    from supabase import Client
 
 logger = logging.getLogger(__name__)
 
-_supabase_client: Optional[Client] = None
+_supabase_client: Optional["Client"] = None
+# Proceso que creó el cliente: un hijo de fork nunca usa los sockets del padre
+_pid_cliente: Optional[int] = None
+# Clientes heredados del padre: se conservan sin cerrarlos (cerrarlos cortaría las conexiones del padre)
+_heredados = []
+
+# Estado del pool para /salud/listo/: frio, calentando, caliente o error
+_calentamiento: Dict[str, Any] = {'estado': 'frio', 'conexiones': 0, 'duracion': None, 'error': None}
+_lock_calentamiento = threading.Lock()
+
+
+def __getattr__(nombre: str) -> Any:
+    # ``supabase_client.APIError`` importa postgrest solo cuando se evalúa un ``except``,
+    # es decir, cuando postgrest ya lanzó la excepción y está cargado
+    if nombre == 'APIError':
+        from postgrest.exceptions import APIError
+        return APIError
+    raise AttributeError(f"module {__name__!r} has no attribute {nombre!r}")
+
+
+def _errores_de_red() -> tuple:
+    import httpx
+    return (httpx.ReadError, httpx.ConnectError, httpx.TimeoutException, OSError)
+
+
+def _errores_sin_envio() -> tuple:
+    # La petición no llegó a enviarse: reintentarla no puede duplicar una escritura
+    import httpx
+    return (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
 
+def retry_on_network_error(max_retries: int = 3, initial_delay: float = 1.0, idempotente: bool = True):
+    """Decorator para reintentar operaciones que fallan por errores de red.
 
-def retry_on_network_error(max_retries: int = 3, initial_delay: float = 1.0):
-    """Decorator para reintentar operaciones que fallan por errores de red."""
+    Con ``idempotente=False`` (escrituras que no se pueden repetir) solo se reintenta
+    cuando la conexión no llegó a establecerse; un error al leer la respuesta se propaga,
+    porque el servidor pudo haber confirmado la escritura.
+    """
     def decorator(func):
         @wraps(func)
         def wrapper(*args, **kwargs):
             last_exception = None
             current_delay = initial_delay
             for attempt in range(max_retries):
+                # Sin tiempo restante en la petición no se inicia otra llamada
+                verificar_plazo()
                 try:
                     return func(*args, **kwargs)
-                except (httpx.ReadError, httpx.ConnectError, httpx.TimeoutException, OSError) as e:
+                except PlazoAgotado:
+                    raise
+                except (_errores_de_red() if idempotente else _errores_sin_envio()) as e:
                     last_exception = e
+                    restante = plazo_restante()
+                    if restante is not None and restante <= current_delay:
+                        raise PlazoAgotado(f'Se agotó el tiempo de la petición: {e}') from e
                     if attempt < max_retries - 1:
                         logger.warning(f"Intento {attempt + 1} falló con error de red: {e}. Reintentando en {current_delay}s...")
                         time.sleep(current_delay)
@@ -40,19 +90,21 @@ def retry_on_network_error(max_retries: int = 3, initial_delay: float = 1.0):
     return decorator
 
 
-def get_supabase_client() -> Client:
+def get_supabase_client() -> "Client":
     """Return a singleton Supabase client configured from environment variables.
 
     Required env vars:
       - SUPABASE_URL
       - SUPABASE_ANON_KEY or SUPABASE_SERVICE_KEY (prefer service key on backend)
     """
-    global _supabase_client
-    if _supabase_client is not None:
+    global _supabase_client, _pid_cliente
+    if _supabase_client is not None and _pid_cliente == os.getpid():
         return _supabase_client
+    if _supabase_client is not None:
+        # Sin register_at_fork (o creado antes de registrarlo): se descarta el del padre
+        _reiniciar_en_hijo()
 
-    # Load .env from project root if available
-    load_dotenv()
+    from supabase import create_client
 
     supabase_url = os.getenv("SUPABASE_URL")
     supabase_key = os.getenv("SUPABASE_SERVICE_KEY") or os.getenv("SUPABASE_ANON_KEY")
@@ -63,7 +115,107 @@ def get_supabase_client() -> Client:
         )
 
     # Crear cliente Supabase con configuración básica
-    _supabase_client = create_client(supabase_url, supabase_key)
-    return _supabase_client
+    client = create_client(supabase_url, supabase_key)
+    _instalar_limite_de_tiempo(client)
+    _supabase_client, _pid_cliente = client, os.getpid()
+    return client
+
+
+def _instalar_limite_de_tiempo(client: "Client") -> None:
+    """Recorta el timeout de cada llamada HTTP al plazo restante de la petición (ver deadline.py)."""
+    try:
+        hooks = client.postgrest.session.event_hooks
+        hooks['request'] = [*hooks.get('request', []), limitar_timeout]
+    except AttributeError as e:
+        logger.warning(f"No se pudo limitar el timeout de las llamadas a Supabase: {e}")
+
+
+# ============================================================================
+# CICLO DE VIDA: calentamiento y fork
+# ============================================================================
+# El calentamiento corre en un hilo y nunca en un proceso que todavía puede hacer fork:
+# con ``gunicorn --preload`` el maestro carga la aplicación antes de crear los workers, y
+# un hilo suyo podría dejar tomado en el hijo un lock de importación, SSL o logging. Por
+# eso AppConfig.ready solo registra el reinicio tras fork; cada worker calienta su cliente
+# en el hijo (``_despues_de_fork``) o desde el hook post_worker_init de gunicorn.conf.py
+# (``iniciar_worker``). /salud/listo/ responde 503 hasta que termina y, con otros
+# servidores, la primera consulta lo inicia. Ver SUPABASE_PRECALENTAR en settings.py.
+
+def _ping() -> None:
+    # Plazo propio y corto: el event hook de deadline.py recorta los timeouts de httpx
+    token = iniciar_plazo(settings.SUPABASE_PING_TIMEOUT)
+    try:
+        get_supabase_client().table("carrera").select("carrera_id").limit(1).execute()
+    finally:
+        terminar_plazo(token)
+
+
+def calentar(conexiones: Optional[int] = None) -> bool:
+    """Crea el cliente y abre ``conexiones`` conexiones HTTP en paralelo (TLS incluido).
+
+    Las conexiones quedan en el pool de httpx para las primeras peticiones. Devuelve si
+    el pool quedó caliente; los errores se registran pero no se propagan.
+    """
+    conexiones = conexiones or settings.SUPABASE_CONEXIONES_PRECALENTADAS
+    with _lock_calentamiento:
+        if _calentamiento['estado'] == 'calentando':
+            return False
+        _calentamiento.update(estado='calentando', error=None)
+
+    inicio = time.perf_counter()
+    try:
+        get_supabase_client()
+        # Las llamadas simultáneas obligan a httpx a abrir una conexión por llamada
+        with ThreadPoolExecutor(max_workers=conexiones, thread_name_prefix='calentar') as pool:
+            for futuro in [pool.submit(_ping) for _ in range(conexiones)]:
+                futuro.result()
+    except Exception as e:
+        logger.warning(f"No se pudo calentar el cliente de Supabase: {e}")
+        _calentamiento.update(estado='error', conexiones=0, error=str(e))
+        return False
+
+    duracion = time.perf_counter() - inicio
+    _calentamiento.update(estado='caliente', conexiones=conexiones, duracion=duracion)
+    logger.info(f"Cliente de Supabase caliente en el proceso {os.getpid()}: {conexiones} conexiones en {duracion:.2f}s")
+    return True
+
+
+def calentar_en_segundo_plano() -> None:
+    threading.Thread(target=calentar, name='calentar-supabase', daemon=True).start()
+
+
+def estado_calentamiento() -> Dict[str, Any]:
+    return {**_calentamiento, 'pid': os.getpid()}
+
+
+def _reiniciar_en_hijo() -> None:
+    global _supabase_client, _pid_cliente, _lock_calentamiento
+    if _supabase_client is not None:
+        _heredados.append(_supabase_client)
+    _supabase_client, _pid_cliente = None, None
+    # El lock pudo quedar tomado por un hilo del padre que no existe en el hijo
+    _lock_calentamiento = threading.Lock()
+    _calentamiento.update(estado='frio', conexiones=0, duracion=None, error=None)
+
+
+def _despues_de_fork() -> None:
+    _reiniciar_en_hijo()
+    if settings.SUPABASE_PRECALENTAR:
+        calentar_en_segundo_plano()
+
+
+def iniciar_worker() -> None:
+    """Hook post_worker_init de gunicorn: el worker ya cargó la aplicación y no va a hacer fork."""
+    if settings.SUPABASE_PRECALENTAR and _calentamiento['estado'] == 'frio':
+        calentar_en_segundo_plano()
+
+
+_fork_registrado = False
 
 
+def preparar_ciclo_de_vida() -> None:
+    """Lo llama AppConfig.ready: registra el reinicio tras fork; no calienta (ver arriba)."""
+    global _fork_registrado
+    if not _fork_registrado and hasattr(os, 'register_at_fork'):
+        os.register_at_fork(after_in_child=_despues_de_fork)
+        _fork_registrado = True
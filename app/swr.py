@@ -0,0 +1,155 @@
+import logging
+import os
+import threading
+import time
+from contextvars import ContextVar
+from typing import Any, Callable, Optional
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import IntegrityError, close_old_connections, transaction
+from django.db.models import F
+
+from .deadline import resultados_parciales
+from .models import SelloVersion
+
+logger = logging.getLogger(__name__)
+
+CLAVE_GENERACION = "swr:generacion"
+
+# {'obsoleto': bool} de la petición en curso; compartido con los hilos de concurrency.gather
+_estado: ContextVar[Optional[dict]] = ContextVar('datos_obsoletos', default=None)
+
+_en_curso = set()
+_lock = threading.Lock()
+
+
+def _reiniciar_en_hijo() -> None:
+    # Las recargas en curso del padre no existen en el hijo: sus claves quedarían bloqueadas
+    global _lock
+    _en_curso.clear()
+    _lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reiniciar_en_hijo)
+
+
+def _cache():
+    return caches[settings.SWR_CACHE]
+
+
+def marcar_obsoleto() -> None:
+    estado = _estado.get()
+    if estado is not None:
+        estado['obsoleto'] = True
+
+
+def hay_datos_obsoletos() -> bool:
+    estado = _estado.get()
+    return estado is not None and estado['obsoleto']
+
+
+def iniciar_peticion():
+    """Limpia la marca de datos obsoletos; devuelve el token para restaurarla al terminar."""
+    return _estado.set({'obsoleto': False})
+
+
+def terminar_peticion(token) -> None:
+    _estado.reset(token)
+
+
+def generacion() -> int:
+    """Aumenta con cada escritura (ver ``invalidar``); también es parte de los ETag de conditional.py."""
+    try:
+        return SelloVersion.objects.filter(pk=CLAVE_GENERACION).values_list('version', flat=True).first() or 0
+    except Exception:
+        return 0
+
+
+def invalidar() -> None:
+    """Tras una escritura, las copias guardadas dejan de servirse sin antes intentar recargarlas.
+
+    No se borran: si la recarga falla se siguen usando como respaldo. El contador vive
+    en la base local y sube con un UPDATE atómico: dos escrituras simultáneas nunca se
+    pisan el incremento (un incremento perdido haría responder 304 con datos viejos).
+    """
+    try:
+        if SelloVersion.objects.filter(pk=CLAVE_GENERACION).update(version=F('version') + 1):
+            return
+        try:
+            with transaction.atomic():
+                SelloVersion.objects.create(clave=CLAVE_GENERACION)
+        except IntegrityError:
+            # Otra escritura creó la fila primero
+            SelloVersion.objects.filter(pk=CLAVE_GENERACION).update(version=F('version') + 1)
+    except Exception as e:
+        logger.warning(f"No se pudo invalidar la caché de respaldo: {e}")
+
+
+def _guardar(clave: str, valor: Any) -> None:
+    try:
+        _cache().set(clave, {'valor': valor, 'guardado': time.time(), 'generacion': generacion()}, None)
+    except Exception as e:
+        logger.warning(f"No se pudo guardar {clave} en la caché de respaldo: {e}")
+
+
+def refrescar_en_segundo_plano(clave: str, funcion: Callable[[], Any]) -> None:
+    """Ejecuta ``funcion`` en un hilo aparte, como mucho una vez a la vez por clave en este proceso."""
+    with _lock:
+        if clave in _en_curso:
+            return
+        _en_curso.add(clave)
+
+    def trabajo():
+        try:
+            funcion()
+        except Exception as e:
+            logger.warning(f"No se pudo refrescar {clave} en segundo plano: {e}")
+        finally:
+            with _lock:
+                _en_curso.discard(clave)
+            close_old_connections()
+
+    threading.Thread(target=trabajo, name=f"swr:{clave}", daemon=True).start()
+
+
+def leer_con_respaldo(clave: str, cargar: Callable[[], Any], fresco: Optional[int] = None) -> Any:
+    """Stale-while-revalidate: devuelve la última copia buena de ``cargar()``.
+
+    - Copia fresca (menos de ``fresco`` segundos): se devuelve tal cual.
+    - Copia vencida pero dentro de ``SWR_MAX_OBSOLETO``: se devuelve de inmediato,
+      se marca la respuesta como obsoleta y se recarga en segundo plano.
+    - Sin copia, invalidada por una escritura o demasiado vieja: se carga en el
+      momento; si Supabase falla se usa la copia que haya dentro del máximo.
+    """
+    fresco = settings.SWR_FRESCO if fresco is None else fresco
+    try:
+        entrada = _cache().get(clave)
+    except Exception:
+        entrada = None
+
+    edad = time.time() - entrada['guardado'] if entrada else None
+    vigente = entrada is not None and entrada.get('generacion') == generacion()
+    aceptable = edad is not None and edad < settings.SWR_MAX_OBSOLETO
+
+    if vigente and edad < fresco:
+        return entrada['valor']
+    if vigente and aceptable:
+        marcar_obsoleto()
+        refrescar_en_segundo_plano(clave, lambda: _guardar(clave, cargar()))
+        return entrada['valor']
+
+    parciales = resultados_parciales()
+    try:
+        valor = cargar()
+    except Exception as e:
+        if not aceptable:
+            raise
+        logger.warning(f"Supabase no respondió para {clave} ({e}); se usa la copia de hace {int(edad)}s")
+        marcar_obsoleto()
+        return entrada['valor']
+    # Un resultado recortado por el plazo de la petición no reemplaza la copia buena
+    if resultados_parciales() == parciales:
+        _guardar(clave, valor)
+    return valor
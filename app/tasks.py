@@ -0,0 +1,20 @@
+from .jobs import tarea
+
+
+@tarea('crear_partida_completa')
+def crear_partida_completa(progreso, datos):
+    from .views import crear_partida_completa as crear
+
+    return crear(datos, progreso=progreso)
+
+
+@tarea('documento_word', idempotente=True)
+def documento_word(progreso, partida_id):
+    from .views import construir_documento_partida
+
+    nombre_archivo, contenido = construir_documento_partida(partida_id, progreso=progreso)
+    return {
+        'contenido': contenido,
+        'nombre_archivo': nombre_archivo,
+        'content_type': 'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+    }
@@ -1,3 +1,1806 @@
-from django.test import TestCase
+import base64
+import csv
+import gzip
+import io
+import json
+import os
+import random
+import re
+import subprocess
+import sys
+import threading
+import time
+import uuid
+import zlib
+from datetime import date, datetime, time as dt_time, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from functools import partial
+from unittest import mock, skipIf
 
-# Create your tests here.
+import httpx
+import numpy as np
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
+from docx import Document
+
+from . import (
+    concurrency, conditional, deadline, docx_cache, duplicates, fragments, importers, jobs, middleware, numbering,
+    question_edits, repositories, responses, search, services_supabase, snapshots, supabase_client, swr,
+    validation, views,
+)
+from .models import (
+    Asignatura, FirmaPregunta, Opcion, Partida, PartidaSnapshot, Pregunta, ProgramaAnalitico, SelloVersion, Tarea,
+    Unidad,
+)
+from .numbering import numeracion_compacta, renumerar_programa
+from .placeholders import completar_stream, completar_unidad, rangos_numeracion, unidad_de_numero
+from .question_edits import calcular_cambios, hay_cambios
+from .question_parser import parsear_preguntas
+
+
+# ============================================================================
+# CACHÉ DE FRAGMENTOS WORD
+# ============================================================================
+
+class ClaveFragmentoUnidadTests(SimpleTestCase):
+    unidad = {
+        'numero': 1,
+        'descripcion': 'Fundamentos',
+        'preguntas': [{'numero': 1, 'enunciado': '¿Qué es?', 'opciones': [{'texto': 'a', 'es_correcta': True}]}],
+    }
+
+    def test_mismo_contenido_misma_clave(self):
+        self.assertEqual(
+            docx_cache.clave_fragmento_unidad(self.unidad, 1),
+            docx_cache.clave_fragmento_unidad(dict(self.unidad), 1),
+        )
+
+    def test_contador_solo_cuenta_sin_numero_propio(self):
+        self.assertEqual(
+            docx_cache.clave_fragmento_unidad(self.unidad, 1),
+            docx_cache.clave_fragmento_unidad(self.unidad, 50),
+        )
+        sin_numero = {**self.unidad, 'preguntas': [{'enunciado': '¿Qué es?', 'opciones': []}]}
+        self.assertNotEqual(
+            docx_cache.clave_fragmento_unidad(sin_numero, 1),
+            docx_cache.clave_fragmento_unidad(sin_numero, 50),
+        )
+
+    def test_version_de_render_cambia_la_clave(self):
+        anterior = docx_cache.clave_fragmento_unidad(self.unidad, 1)
+        with mock.patch.object(docx_cache, 'VERSION_RENDER', docx_cache.VERSION_RENDER + 1):
+            self.assertNotEqual(docx_cache.clave_fragmento_unidad(self.unidad, 1), anterior)
+
+
+class AgregarUnidadWordTests(SimpleTestCase):
+    def _documento(self):
+        from docx import Document
+        from docx.enum.style import WD_STYLE_TYPE
+
+        doc = Document()
+        for estilo in ('UnidadTitulo', 'PreguntaTitulo'):
+            doc.styles.add_style(estilo, WD_STYLE_TYPE.PARAGRAPH)
+        return doc
+
+    def test_unidad_sin_errores_es_completa(self):
+        unidad = {'numero': 1, 'descripcion': 'U1', 'preguntas': [
+            {'numero': 1, 'enunciado': 'E', 'explicacion': '', 'opciones': [{'texto': 'a', 'es_correcta': True}]},
+        ]}
+        contador, completa = views._agregar_unidad_word(self._documento(), unidad, 1, mock.Mock())
+        self.assertEqual(contador, 2)
+        self.assertTrue(completa)
+
+    def test_error_en_una_pregunta_no_es_completa(self):
+        # Una pregunta sin explicación de texto falla al dibujarse y se omite
+        unidad = {'numero': 1, 'descripcion': 'U1', 'preguntas': [
+            {'numero': 1, 'enunciado': 'E', 'explicacion': None, 'opciones': []},
+            {'numero': 2, 'enunciado': 'E', 'explicacion': '', 'opciones': []},
+        ]}
+        contador, completa = views._agregar_unidad_word(self._documento(), unidad, 1, mock.Mock())
+        self.assertEqual(contador, 3)
+        self.assertFalse(completa)
+
+
+# ============================================================================
+# IMPORTACIÓN DE LA SALIDA DEL MODELO
+# ============================================================================
+
+class ParsearPreguntasTests(SimpleTestCase):
+    def test_json_partido_en_chunks(self):
+        texto = (
+            '```json\n[{"numero": 1, "enunciado": "¿Uno?", "opciones": ['
+            '{"texto": "a", "correcta": true}, {"texto": "b", "correcta": false}]},'
+            ' {"numero": 2, "enunciado": "¿Dos?", "opciones": ["a", "b"], "respuesta_correcta": "B"}]\n```'
+        )
+        items = list(parsear_preguntas(texto[i:i + 7] for i in range(0, len(texto), 7)))
+        self.assertEqual([item['numero'] for item in items], [1, 2])
+        self.assertEqual([o['es_correcta'] for o in items[1]['opciones']], [False, True])
+
+    def test_item_invalido_no_detiene_el_resto(self):
+        texto = (
+            '[{"numero": 1, "enunciado": "¿Uno?", "opciones": ["a", "b"]},'
+            ' {"numero": 2, "enunciado": "¿Dos?", "opciones": ["a", "b"], "respuesta_correcta": "a"}]'
+        )
+        items = list(parsear_preguntas([texto]))
+        self.assertIn('error', items[0])
+        self.assertEqual(items[1]['numero'], 2)
+
+    def test_formato_de_texto(self):
+        texto = (
+            'Estas son las preguntas:\n'
+            'UNIDAD 2: Redes\n'
+            '**Pregunta 7:** ¿Qué capa enruta?\n'
+            'A) Física\nB) Red\nC) Enlace\nD) Sesión\n'
+            'Respuesta correcta: B\n'
+            'Explicación: La capa de red enruta paquetes.\n'
+        )
+        [item] = list(parsear_preguntas([texto]))
+        self.assertEqual(item['numero'], 7)
+        self.assertEqual(item['unidad']['numero'], 2)
+        self.assertEqual([o['texto'] for o in item['opciones'] if o['es_correcta']], ['Red'])
+        self.assertEqual(item['explicacion'], 'La capa de red enruta paquetes.')
+
+
+    def test_json_con_introduccion_del_modelo(self):
+        texto = (
+            'Claro, aquí tienes las preguntas solicitadas para la unidad:\n\n'
+            '```json\n[\n  {\n    "numero": 3,\n    "enunciado": "¿Tres?",\n'
+            '    "opciones": ["a", "b"],\n    "respuesta_correcta": "b"\n  }\n]\n```\n'
+            'Avísame si necesitas más.'
+        )
+        items = list(parsear_preguntas(texto[i:i + 5] for i in range(0, len(texto), 5)))
+        self.assertEqual([item['numero'] for item in items], [3])
+
+    def test_sin_preguntas_reconocibles_informa_error(self):
+        [item] = list(parsear_preguntas(['Lo siento, no puedo generar preguntas sobre ese tema.']))
+        self.assertIn('error', item)
+        self.assertEqual(list(parsear_preguntas(['  \n'])), [])
+
+
+def _arbol_dos_programas():
+    """Asignatura con dos programas; cada uno numera sus preguntas desde 1."""
+    def pregunta(pregunta_id, unidad_id, numero):
+        return {'pregunta_id': pregunta_id, 'unidad_id': unidad_id, 'numero': numero, 'opciones': []}
+
+    return {
+        'programas': [{'linea_educativa_id': 1}, {'linea_educativa_id': 2}],
+        'unidades': [
+            {'unidad_id': 10, 'programa_analitico_id': 1, 'numero_unidad': 1, 'num_preguntas': 3,
+             'preguntas': [pregunta(100, 10, 1)]},
+            {'unidad_id': 20, 'programa_analitico_id': 2, 'numero_unidad': 1, 'num_preguntas': 3,
+             'preguntas': [pregunta(200, 20, 1)]},
+        ],
+    }
+
+
+class ImportarSalidaLlmTests(SimpleTestCase):
+    salida = (
+        '[{"numero": 1, "enunciado": "¿Uno?", "opciones": ["a", "b"], "respuesta_correcta": "a"},'
+        ' {"numero": 2, "enunciado": "¿Dos?", "opciones": ["a", "b"], "respuesta_correcta": "a"}]'
+    )
+
+    def setUp(self):
+        patcher = mock.patch.object(
+            importers.SupabaseBusinessService, 'obtener_arbol_partida', return_value=_arbol_dos_programas()
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_varios_programas_requieren_programa(self):
+        with self.assertRaises(ValueError):
+            importers.importar_salida_llm(1, [self.salida], dry_run=True)
+
+    def test_empareja_por_programa_y_numero(self):
+        with mock.patch.object(importers, '_aplicar_lote') as aplicar:
+            importers.importar_salida_llm(1, [self.salida], programa_id=2, dry_run=True)
+        validos, existentes, clave, _, _ = aplicar.call_args.args
+        self.assertEqual(existentes[clave(validos[0])]['pregunta_id'], 200)
+        # El número 2 es una posición virtual del programa 2, no del 1
+        self.assertEqual(validos[1]['unidad_id'], 20)
+
+    def test_programa_se_deduce_de_la_unidad(self):
+        resumen = importers.importar_salida_llm(1, [self.salida], unidad_id=10, dry_run=True)
+        self.assertEqual((resumen['actualizadas'], resumen['creadas']), (1, 1))
+
+
+class ReemplazarOpcionesTests(SimpleTestCase):
+    def test_usa_una_sola_transaccion(self):
+        with mock.patch.object(importers, 'PreguntaRepository') as preguntas, \
+                mock.patch.object(importers, 'OpcionRepository') as opciones:
+            importers._reemplazar_opciones([{'opcion': 'a', 'es_correcta': True, 'pregunta_id': 1}], [5])
+        cambios = preguntas.aplicar_edicion_masiva.call_args.args[0]
+        self.assertEqual(cambios['eliminar_opciones'], [5])
+        opciones.delete_many.assert_not_called()
+
+    def test_sin_la_funcion_inserta_antes_de_borrar(self):
+        orden = mock.Mock()
+        orden.aplicar_edicion_masiva.side_effect = supabase_client.APIError({'code': 'PGRST202', 'message': ''})
+        with mock.patch.object(importers, 'PreguntaRepository', orden), \
+                mock.patch.object(importers, 'OpcionRepository', orden):
+            importers._reemplazar_opciones([{'opcion': 'a', 'es_correcta': True, 'pregunta_id': 1}], [5])
+        self.assertEqual([c[0] for c in orden.method_calls], ['aplicar_edicion_masiva', 'create_many', 'delete_many'])
+
+
+# ============================================================================
+# IMPORTACIÓN DE BANCOS (DOCX/CSV)
+# ============================================================================
+
+class ImportarBancoTests(SimpleTestCase):
+    def _item(self, numero, numero_unidad):
+        return {
+            'numero': numero, 'enunciado': f'¿{numero}?', 'explicacion': '', 'posicion': numero,
+            'opciones': [{'texto': 'a', 'es_correcta': True}, {'texto': 'b', 'es_correcta': False}],
+            'unidad': {'numero': numero_unidad, 'descripcion': ''},
+        }
+
+    def test_unidad_que_no_se_crea_se_reporta_sin_escribir_sus_preguntas(self):
+        arbol = {'programas': [{'linea_educativa_id': 1}], 'unidades': []}
+        creada = {'unidad_id': 20, 'numero_unidad': 2, 'num_preguntas': 0}
+        with mock.patch.object(importers.SupabaseBusinessService, 'obtener_arbol_partida', return_value=arbol), \
+                mock.patch.object(importers.UnidadRepository, 'create', side_effect=[None, creada]) as crear, \
+                mock.patch.object(importers.UnidadRepository, 'update'), \
+                mock.patch.object(importers, '_aplicar_lote') as aplicar, \
+                mock.patch.object(importers, 'renumerar_programa_supabase', return_value={'cambiadas': 0}), \
+                mock.patch.object(importers, 'despues_de_escribir'), \
+                mock.patch.object(importers, '_duplicados_importados', return_value=[]):
+            resumen = importers.importar_banco(1, [self._item(1, 1), self._item(2, 1), self._item(3, 2)])
+
+        self.assertEqual(crear.call_count, 2)
+        self.assertEqual([e['numero'] for e in resumen['errores']], [1, 2])
+        self.assertEqual([item['unidad_id'] for item in aplicar.call_args.args[0]], [20])
+        self.assertEqual(resumen['unidades_creadas'], 1)
+
+    def _importar_sin_numero(self, cantidad):
+        def existentes(unidad_id, numeros):
+            return [{'pregunta_id': unidad_id * 10 + n, 'unidad_id': unidad_id, 'numero': n} for n in numeros]
+
+        def aplicar_lote(validos, existentes, clave, resumen, dry_run):
+            existentes.update({clave(item): item for item in validos})
+
+        arbol = {'programas': [{'linea_educativa_id': 1}], 'unidades': [
+            {'unidad_id': 1, 'numero_unidad': 1, 'num_preguntas': 3, 'programa_analitico_id': 1,
+             'preguntas': existentes(1, (1, 3))},
+            {'unidad_id': 2, 'numero_unidad': 2, 'num_preguntas': 2, 'programa_analitico_id': 1,
+             'preguntas': existentes(2, (4,))},
+        ]}
+        items = [self._item(0, 1) for _ in range(cantidad)]
+        with mock.patch.object(importers.SupabaseBusinessService, 'obtener_arbol_partida', return_value=arbol), \
+                mock.patch.object(importers.UnidadRepository, 'update') as actualizar, \
+                mock.patch.object(importers, '_aplicar_lote', side_effect=aplicar_lote) as aplicar, \
+                mock.patch.object(importers, 'renumerar_programa_supabase', return_value={'cambiadas': 1}) as renumerar, \
+                mock.patch.object(importers, 'despues_de_escribir'), \
+                mock.patch.object(importers, '_duplicados_importados', return_value=[]):
+            importers.importar_banco(1, items)
+        numeros = [item['numero'] for llamada in aplicar.call_args_list for item in llamada.args[0]]
+        return numeros, actualizar, renumerar
+
+    def test_sin_numero_toma_posiciones_libres_de_su_unidad(self):
+        numeros, actualizar, renumerar = self._importar_sin_numero(1)
+        self.assertEqual(numeros, [2])
+        actualizar.assert_not_called()
+        renumerar.assert_not_called()
+
+    def test_unidad_llena_crece_y_se_renumera(self):
+        numeros, actualizar, renumerar = self._importar_sin_numero(2)
+        self.assertEqual(numeros, [2, 4])
+        actualizar.assert_called_once_with(1, num_preguntas=4)
+        renumerar.assert_called_once_with(1)
+
+    def test_csv_ancho_y_largo(self):
+        ancho = io.StringIO(
+            'numero_unidad,enunciado,opcion_a,opcion_b,correcta\n'
+            '1,¿Uno?,si,no,b\n'
+        )
+        [item] = list(importers.iter_csv(ancho))
+        self.assertEqual([o['es_correcta'] for o in item['opciones']], [False, True])
+
+        largo = io.StringIO(
+            'numero_unidad,unidad,numero,enunciado,explicacion,opcion,es_correcta\n'
+            '1,U1,1,¿Uno?,,si,true\n'
+            '1,U1,1,¿Uno?,,no,false\n'
+            '1,U1,2,¿Dos?,,si,false\n'
+        )
+        items = list(importers.iter_csv(largo))
+        self.assertEqual(items[0]['numero'], 1)
+        self.assertIn('error', items[1])
+
+
+# ============================================================================
+# EDICIÓN DE PREGUNTAS
+# ============================================================================
+
+class CalcularCambiosTests(SimpleTestCase):
+    actual = {
+        'pregunta_id': 1,
+        'enunciado': '¿Qué es?',
+        'explicacion': '',
+        'opciones': [
+            {'opcion_id': 10, 'opcion': 'a', 'es_correcta': True, 'media_url': None},
+            {'opcion_id': 11, 'opcion': 'b', 'es_correcta': False, 'media_url': None},
+        ],
+    }
+
+    def test_sin_cambios(self):
+        cambios = calcular_cambios(self.actual, {
+            'enunciado': ' ¿Qué es? ',
+            'opciones': [{'id': 10, 'texto': 'a', 'es_correcta': True}, {'id': 11, 'texto': 'b'}],
+        })
+        self.assertFalse(hay_cambios(cambios))
+
+    def test_solo_lo_que_cambia(self):
+        cambios = calcular_cambios(self.actual, {
+            'explicacion': 'Porque sí',
+            'opciones': [{'id': '10', 'texto': 'a', 'es_correcta': False}, {'id': 'new', 'texto': 'c', 'es_correcta': True}],
+        })
+        self.assertEqual(cambios['pregunta'], {'explicacion': 'Porque sí'})
+        self.assertEqual([o['opcion_id'] for o in cambios['actualizar_opciones']], [10])
+        self.assertEqual(cambios['crear_opciones'], [{'opcion': 'c', 'es_correcta': True, 'pregunta_id': 1}])
+        self.assertEqual(cambios['eliminar_opciones'], [11])
+
+    def test_sin_opciones_no_se_tocan(self):
+        cambios = calcular_cambios(self.actual, {'enunciado': 'Otro'})
+        self.assertEqual(cambios['eliminar_opciones'], [])
+
+    def test_opcion_ajena(self):
+        with self.assertRaises(ValueError):
+            calcular_cambios(self.actual, {'opciones': [{'id': 99, 'texto': 'x'}]})
+
+
+class EdicionMasivaTests(SimpleTestCase):
+    ediciones = [{'pregunta_id': 1, 'enunciado': 'Nuevo'}, {'pregunta_id': 2, 'opciones': []}]
+
+    def setUp(self):
+        actuales = [
+            {'pregunta_id': 1, 'numero': 1, 'unidad_id': 1, 'enunciado': 'Viejo', 'explicacion': ''},
+            {'pregunta_id': 2, 'numero': 2, 'unidad_id': 1, 'enunciado': 'Otro', 'explicacion': ''},
+        ]
+        for nombre, valor in (('list_by_ids', actuales), ('aplicar_edicion_masiva', {})):
+            patcher = mock.patch.object(question_edits.PreguntaRepository, nombre, return_value=valor)
+            setattr(self, nombre, patcher.start())
+            self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(question_edits, 'OpcionRepository')
+        self.opciones = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.opciones.list_by_preguntas_chunked.return_value = [
+            {'opcion_id': 20, 'pregunta_id': 2, 'opcion': 'a', 'es_correcta': True},
+        ]
+
+    def test_respuesta_perdida_no_se_reintenta(self):
+        self.aplicar_edicion_masiva.side_effect = httpx.ReadError('conexión cerrada')
+        resultados = question_edits.aplicar_edicion_masiva(self.ediciones)
+        self.assertEqual([r['estado'] for r in resultados], ['incierta', 'incierta'])
+        self.assertEqual(self.aplicar_edicion_masiva.call_count, 1)
+
+    def test_rest_informa_aplicacion_parcial(self):
+        self.aplicar_edicion_masiva.side_effect = supabase_client.APIError({'code': 'PGRST202', 'message': ''})
+        self.opciones.delete_many.side_effect = RuntimeError('falló el borrado')
+        with mock.patch.object(question_edits.PreguntaRepository, 'upsert_many'):
+            resultados = question_edits.aplicar_edicion_masiva(self.ediciones)
+        self.assertEqual([r['estado'] for r in resultados], ['parcial', 'parcial'])
+        self.assertEqual(resultados[0]['aplicado'], ['preguntas'])
+
+    def test_error_de_la_funcion_no_aplica_nada(self):
+        self.aplicar_edicion_masiva.side_effect = supabase_client.APIError({'code': '23503', 'message': 'fk'})
+        resultados = question_edits.aplicar_edicion_masiva(self.ediciones)
+        self.assertEqual([r['estado'] for r in resultados], ['error', 'error'])
+
+
+class RetryOnNetworkErrorTests(SimpleTestCase):
+    def _contar(self, error, **opciones):
+        llamadas = []
+
+        @supabase_client.retry_on_network_error(initial_delay=0, **opciones)
+        def escribir():
+            llamadas.append(1)
+            raise error
+
+        with self.assertRaises(type(error)):
+            escribir()
+        return len(llamadas)
+
+    def test_lecturas_se_reintentan(self):
+        self.assertEqual(self._contar(httpx.ReadError('x')), 3)
+
+    def test_escrituras_no_idempotentes_solo_sin_envio(self):
+        self.assertEqual(self._contar(httpx.ReadError('x'), idempotente=False), 1)
+        self.assertEqual(self._contar(httpx.ConnectError('x'), idempotente=False), 3)
+
+    @mock.patch.object(repositories, 'get_supabase_client')
+    def test_creaciones_no_se_repiten_si_se_pierde_la_respuesta(self, get_client):
+        cliente = get_client.return_value
+        cliente.rpc.return_value.execute.side_effect = httpx.ReadError('x')
+        cliente.table.return_value.insert.return_value.execute.side_effect = httpx.ReadError('x')
+        escrituras = [
+            lambda: repositories.PartidaRepository.crear_completa({}),
+            lambda: repositories.ProgramaAnaliticoRepository.reservar_numeros(1, 5),
+            lambda: repositories.UnidadRepository.create_many([{}]),
+            lambda: repositories.PreguntaRepository.create_many([{}]),
+            lambda: repositories.OpcionRepository.create_many([{}]),
+        ]
+        for escribir in escrituras:
+            with self.assertRaises(httpx.ReadError):
+                escribir()
+        self.assertEqual(cliente.rpc.return_value.execute.call_count, 2)
+        self.assertEqual(cliente.table.return_value.insert.return_value.execute.call_count, 3)
+
+
+# ============================================================================
+# TAREAS EN SEGUNDO PLANO
+# ============================================================================
+
+class DescargarDocumentoTests(TestCase):
+    @override_settings(TAREAS_EN_SEGUNDO_PLANO=False)
+    def test_async_sin_worker_genera_en_la_peticion(self):
+        with mock.patch.object(views, 'construir_documento_partida', return_value=('banco.docx', b'PK')):
+            response = self.client.get('/api/descargar-google-docs/', {'partida': 1, 'async': '1'})
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(Tarea.objects.exists())
+
+    @override_settings(TAREAS_EN_SEGUNDO_PLANO=True)
+    def test_con_worker_se_encola(self):
+        response = self.client.get('/api/descargar-google-docs/', {'partida': 1})
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(Tarea.objects.get().tipo, 'documento_word')
+
+
+@override_settings(TAREAS_LATIDO_VENCIDO=120, TAREAS_TIEMPO_MAXIMO=1800)
+class RecuperarAbandonadasTests(TestCase):
+    def _en_proceso(self, tipo, latido_hace, iniciada_hace=3600):
+        ahora = timezone.now()
+        return Tarea.objects.create(
+            tipo=tipo, estado=Tarea.EN_PROCESO, worker='w1',
+            iniciada=ahora - timedelta(seconds=iniciada_hace),
+            latido=None if latido_hace is None else ahora - timedelta(seconds=latido_hace),
+        )
+
+    def test_solo_las_de_workers_caidos(self):
+        lenta = self._en_proceso('crear_partida_completa', latido_hace=5)
+        documento = self._en_proceso('documento_word', latido_hace=600)
+        partida = self._en_proceso('crear_partida_completa', latido_hace=600)
+        antigua = self._en_proceso('documento_word', latido_hace=None)
+
+        self.assertEqual(jobs.recuperar_abandonadas(), {'reencoladas': 2, 'fallidas': 1})
+        estados = dict(Tarea.objects.values_list('pk', 'estado'))
+        self.assertEqual(estados[lenta.pk], Tarea.EN_PROCESO)
+        self.assertEqual(estados[documento.pk], Tarea.PENDIENTE)
+        self.assertEqual(estados[antigua.pk], Tarea.PENDIENTE)
+        self.assertEqual(estados[partida.pk], Tarea.FALLIDA)
+
+    def test_latir_renueva_solo_las_propias(self):
+        propia = self._en_proceso('documento_word', latido_hace=600)
+        ajena = self._en_proceso('documento_word', latido_hace=600)
+        Tarea.objects.filter(pk=ajena.pk).update(worker='w2')
+
+        self.assertEqual(jobs.latir('w1'), 1)
+        self.assertEqual(jobs.recuperar_abandonadas()['reencoladas'], 1)
+        self.assertEqual(Tarea.objects.get(pk=propia.pk).estado, Tarea.EN_PROCESO)
+
+
+class EventosTareaTests(TestCase):
+    def _eventos(self, tarea_obj):
+        response = self.client.get(f'/api/tareas/{tarea_obj.pk}/eventos/')
+        return b''.join(response.streaming_content).decode()
+
+    def test_tarea_terminada_envia_fin(self):
+        tarea_obj = Tarea.objects.create(tipo='documento_word', estado=Tarea.COMPLETADA, progreso=100)
+        cuerpo = self._eventos(tarea_obj)
+        self.assertTrue(cuerpo.startswith('retry: '))
+        self.assertIn('event: fin', cuerpo)
+
+    @override_settings(TAREAS_VENTANA_EVENTOS=0)
+    def test_tarea_pendiente_cierra_al_terminar_la_ventana(self):
+        tarea_obj = Tarea.objects.create(tipo='documento_word')
+        cuerpo = self._eventos(tarea_obj)
+        self.assertIn('event: progreso', cuerpo)
+        self.assertNotIn('event: fin', cuerpo)
+
+    def test_solo_get(self):
+        tarea_obj = Tarea.objects.create(tipo='documento_word')
+        self.assertEqual(self.client.post(f'/api/tareas/{tarea_obj.pk}/eventos/').status_code, 405)
+
+
+# ============================================================================
+# PREGUNTAS VIRTUALES
+# ============================================================================
+
+class PlaceholdersTests(SimpleTestCase):
+    unidades = [
+        {'unidad_id': 2, 'programa_analitico_id': 1, 'numero_unidad': 2, 'num_preguntas': 3},
+        {'unidad_id': 1, 'programa_analitico_id': 1, 'numero_unidad': 1, 'num_preguntas': 2},
+        {'unidad_id': 3, 'programa_analitico_id': 9, 'numero_unidad': 1, 'num_preguntas': 2},
+    ]
+
+    def test_rangos_por_programa(self):
+        rangos = rangos_numeracion(self.unidades)
+        self.assertEqual(rangos, {1: range(1, 3), 2: range(3, 6), 3: range(1, 3)})
+        self.assertEqual(unidad_de_numero({u: r for u, r in rangos.items() if u != 3}, 4), 2)
+
+    def test_completar_unidad_rellena_los_huecos(self):
+        real = {'pregunta_id': 7, 'numero': 4, 'unidad_id': 2, 'opciones': []}
+        preguntas = completar_unidad(self.unidades[0], [real], range(3, 6))
+        self.assertEqual([p['numero'] for p in preguntas], [3, 4, 5])
+        self.assertEqual([p.get('virtual', False) for p in preguntas], [True, False, True])
+        self.assertEqual(sum(o['es_correcta'] for o in preguntas[0]['opciones']), 1)
+
+    def test_unidad_completa_no_agrega_virtuales(self):
+        reales = [{'numero': n, 'unidad_id': 1} for n in (2, 1)]
+        self.assertEqual([p['numero'] for p in completar_unidad(self.unidades[1], reales, range(1, 3))], [1, 2])
+
+    def test_completar_stream(self):
+        unidades = sorted(self.unidades[:2], key=lambda u: u['numero_unidad'])
+        reales = iter([{'numero': 1, 'unidad_id': 1}, {'numero': 5, 'unidad_id': 2}])
+        numeros = [(p['unidad_id'], p['numero']) for p in completar_stream(unidades, reales)]
+        self.assertEqual(numeros, [(1, 1), (1, 2), (2, 3), (2, 4), (2, 5)])
+
+    def test_unidad_desbordada_corre_las_siguientes(self):
+        unidades = sorted(self.unidades[:2], key=lambda u: u['numero_unidad'])
+        self.assertEqual(rangos_numeracion(unidades, {1: 3}), {1: range(1, 4), 2: range(4, 7)})
+        reales = iter([{'numero': n, 'unidad_id': 1} for n in (1, 2, 3)])
+        numeros = [(p['unidad_id'], p['numero']) for p in completar_stream(unidades, reales)]
+        self.assertEqual(numeros, [(1, 1), (1, 2), (1, 3), (2, 4), (2, 5), (2, 6)])
+
+
+# ============================================================================
+# NUMERACIÓN
+# ============================================================================
+
+class RenumerarProgramaTests(TestCase):
+    def setUp(self):
+        asignatura = Asignatura.objects.create(descripcion='Redes')
+        self.programa = ProgramaAnalitico.objects.create(titulo='P1', contexto='', asignatura=asignatura)
+        self.u1 = Unidad.objects.create(numero_unidad=1, descripcion='U1', num_preguntas=10, programa_analitico=self.programa)
+        self.u2 = Unidad.objects.create(numero_unidad=2, descripcion='U2', num_preguntas=10, programa_analitico=self.programa)
+
+    def _pregunta(self, unidad, numero):
+        return Pregunta.objects.create(unidad=unidad, numero=numero, enunciado=f'Pregunta {numero}')
+
+    def _filas(self):
+        unidades = list(Unidad.objects.filter(programa_analitico=self.programa).values(
+            'unidad_id', 'numero_unidad', 'num_preguntas', 'programa_analitico_id'
+        ))
+        preguntas = list(Pregunta.objects.filter(unidad__programa_analitico=self.programa).values(
+            'pregunta_id', 'numero', 'unidad_id'
+        ))
+        return unidades, preguntas
+
+    def test_mezcla_de_virtuales_y_reales_sin_repetir_numeros(self):
+        p5, p15 = self._pregunta(self.u1, 5), self._pregunta(self.u2, 15)
+
+        self.assertEqual(renumerar_programa(self.programa.pk), {'total': 2, 'cambiadas': 2})
+        p5.refresh_from_db()
+        p15.refresh_from_db()
+        self.assertEqual((p5.numero, p15.numero), (1, 11))
+
+        # Con las virtuales, el programa muestra 1..20 una sola vez
+        unidades, preguntas = self._filas()
+        rangos = rangos_numeracion(unidades)
+        numeros = [
+            p['numero']
+            for u in unidades
+            for p in completar_unidad(u, [p for p in preguntas if p['unidad_id'] == u['unidad_id']], rangos[u['unidad_id']])
+        ]
+        self.assertEqual(sorted(numeros), list(range(1, 21)))
+
+    def test_unidad_desbordada_no_pisa_la_siguiente(self):
+        Unidad.objects.filter(pk=self.u1.pk).update(num_preguntas=2)
+        for numero in (7, 3, 9):
+            self._pregunta(self.u1, numero)
+        self._pregunta(self.u2, 40)
+
+        renumerar_programa(self.programa.pk)
+        self.assertEqual(list(Pregunta.objects.order_by('numero').values_list('numero', flat=True)), [1, 2, 3, 4])
+
+    def test_desborde_con_virtuales_no_repite_numeros(self):
+        # U1 recibió una pregunta más de las previstas (importar_salida_llm --unidad)
+        Unidad.objects.filter(pk=self.u1.pk).update(num_preguntas=2)
+        Unidad.objects.filter(pk=self.u2.pk).update(num_preguntas=2)
+        for numero in (1, 2, 9):
+            self._pregunta(self.u1, numero)
+
+        renumerar_programa(self.programa.pk)
+        unidades, preguntas = self._filas()
+        reales = {u['unidad_id']: [p for p in preguntas if p['unidad_id'] == u['unidad_id']] for u in unidades}
+        rangos = rangos_numeracion(unidades, {unidad_id: len(lista) for unidad_id, lista in reales.items()})
+        self.assertEqual(rangos, {self.u1.pk: range(1, 4), self.u2.pk: range(4, 6)})
+        numeros = [
+            p['numero'] for u in unidades for p in completar_unidad(u, reales[u['unidad_id']], rangos[u['unidad_id']])
+        ]
+        self.assertEqual(sorted(numeros), [1, 2, 3, 4, 5])
+        # La reserva sigue después de la última posición, virtual o no
+        self.assertEqual(numbering.reservar_numeros(self.programa.pk, 2), range(6, 8))
+
+    def test_supabase_calcula_lo_mismo(self):
+        for unidad, numero in ((self.u1, 5), (self.u1, 2), (self.u2, 15), (self.u2, 30)):
+            self._pregunta(unidad, numero)
+        unidades, preguntas = self._filas()
+        esperados = numeracion_compacta(unidades, preguntas)
+
+        renumerar_programa(self.programa.pk)
+        self.assertEqual(dict(Pregunta.objects.values_list('pregunta_id', 'numero')), esperados)
+
+    def test_sin_cambios_no_escribe(self):
+        self._pregunta(self.u1, 1)
+        self._pregunta(self.u2, 11)
+        self.assertEqual(renumerar_programa(self.programa.pk)['cambiadas'], 0)
+
+
+class RenumerarProgramaSupabaseTests(SimpleTestCase):
+    def test_sin_la_funcion_escribe_solo_las_cambiadas(self):
+        unidades = [
+            {'unidad_id': 1, 'numero_unidad': 1, 'num_preguntas': 10},
+            {'unidad_id': 2, 'numero_unidad': 2, 'num_preguntas': 10},
+        ]
+        preguntas = [{'pregunta_id': 5, 'unidad_id': 1, 'numero': 5}, {'pregunta_id': 15, 'unidad_id': 2, 'numero': 11}]
+        with mock.patch.object(numbering.ProgramaAnaliticoRepository, 'renumerar_preguntas',
+                               side_effect=supabase_client.APIError({'code': 'PGRST202', 'message': ''})), \
+                mock.patch.object(numbering.UnidadRepository, 'list_by_programas', return_value=unidades), \
+                mock.patch.object(numbering.PreguntaRepository, 'list_by_unidades', return_value=preguntas), \
+                mock.patch.object(numbering.PreguntaRepository, 'upsert_many') as upsert:
+            resultado = numbering.renumerar_programa_supabase(1)
+        self.assertEqual(resultado, {'total': 2, 'cambiadas': 1})
+        self.assertEqual(upsert.call_args.args[0], [{'pregunta_id': 5, 'unidad_id': 1, 'numero': 1}])
+
+
+# ============================================================================
+# SNAPSHOTS
+# ============================================================================
+
+class SnapshotsTests(TestCase):
+    documento = {'partida': {'partida_id': 1}, 'unidades': [
+        {'programa_analitico_id': 1, 'preguntas': [
+            {'virtual': True, 'opciones': [{}, {}]},
+            {'opciones': [{}]},
+        ]},
+    ]}
+
+    def _snapshot(self, edad):
+        PartidaSnapshot.objects.create(partida_id=1, asignatura_id=1, documento=self.documento)
+        PartidaSnapshot.objects.filter(pk=1).update(actualizado=timezone.now() - timedelta(seconds=edad))
+
+    def test_guardar_sube_la_version_y_cuenta(self):
+        snapshots._guardar(1, 1, dict(self.documento))
+        snapshots._guardar(1, 1, dict(self.documento))
+        snapshot = PartidaSnapshot.objects.get()
+        self.assertEqual(snapshot.version, 2)
+        self.assertEqual(snapshot.documento['conteos'], {
+            'programas': 1, 'unidades': 1, 'preguntas': 2, 'preguntas_reales': 1, 'opciones': 3,
+        })
+
+    def test_primer_guardado_concurrente_no_falla(self):
+        # El otro proceso inserta la fila entre nuestro UPDATE (sin filas) y el INSERT
+        PartidaSnapshot.objects.create(partida_id=1, asignatura_id=1, documento=self.documento)
+        antes_del_insert = mock.Mock(**{'update.return_value': 0})
+        filas = [antes_del_insert, PartidaSnapshot.objects.filter(pk=1)]
+        with mock.patch.object(PartidaSnapshot.objects, 'filter', side_effect=filas):
+            snapshots._guardar(1, 1, dict(self.documento))
+        self.assertEqual(PartidaSnapshot.objects.get().version, 2)
+
+    def test_refrescar_unidades_conserva_las_demas(self):
+        unidades = [
+            {'unidad_id': u, 'programa_analitico_id': 1, 'numero_unidad': u, 'num_preguntas': 1,
+             'descripcion': f'U{u}', 'preguntas': [{'pregunta_id': u, 'numero': u, 'unidad_id': u}]}
+            for u in (1, 2)
+        ]
+        PartidaSnapshot.objects.create(partida_id=1, asignatura_id=7, documento={'partida': {}, 'unidades': unidades})
+        # Otra edición ya guardó su cambio en la unidad 2
+        PartidaSnapshot.objects.filter(pk=1).update(documento={'partida': {}, 'unidades': [
+            unidades[0], {**unidades[1], 'descripcion': 'U2 editada'},
+        ]})
+        fresca = {**unidades[0], 'descripcion': 'U1 editada'}
+        del fresca['preguntas']
+        with mock.patch.object(snapshots.UnidadRepository, 'list_by_ids', return_value=[fresca]), \
+                mock.patch.object(snapshots.PreguntaRepository, 'list_by_unidades',
+                                  return_value=[{'pregunta_id': 1, 'numero': 1, 'unidad_id': 1}]), \
+                mock.patch.object(snapshots.OpcionRepository, 'list_by_preguntas_chunked', return_value=[]), \
+                mock.patch.object(snapshots.ProgramaAnaliticoRepository, 'get_by_id',
+                                  return_value={'asignatura_id': 7}):
+            snapshots.refrescar_unidades([1])
+        documento = PartidaSnapshot.objects.get().documento
+        self.assertEqual([u['descripcion'] for u in documento['unidades']], ['U1 editada', 'U2 editada'])
+
+    @mock.patch.object(snapshots, 'reconstruir_partida')
+    def test_vigente_no_consulta_supabase(self, reconstruir):
+        self._snapshot(0)
+        self.assertEqual(snapshots.obtener_snapshot(1)['partida'], {'partida_id': 1})
+        reconstruir.assert_not_called()
+
+    @override_settings(PARTIDA_SNAPSHOT_MAX_EDAD=60, SWR_MAX_OBSOLETO=3600)
+    @mock.patch.object(snapshots, 'refrescar_en_segundo_plano')
+    @mock.patch.object(snapshots, 'reconstruir_partida')
+    def test_vencido_se_sirve_y_se_refresca_aparte(self, reconstruir, refrescar):
+        self._snapshot(120)
+        self.assertIsNotNone(snapshots.obtener_snapshot(1))
+        reconstruir.assert_not_called()
+        self.assertEqual(refrescar.call_args.args[0], 'snapshot:1')
+
+    @override_settings(PARTIDA_SNAPSHOT_MAX_EDAD=60, SWR_MAX_OBSOLETO=3600)
+    @mock.patch.object(snapshots, 'reconstruir_partida', return_value={'partida': {'partida_id': 1}})
+    def test_muy_viejo_o_faltante_se_arma(self, reconstruir):
+        self._snapshot(7200)
+        self.assertEqual(sorted(snapshots.obtener_snapshots([1, 2])), [1, 2])
+        self.assertEqual([c.args for c in reconstruir.call_args_list], [(1,), (2,)])
+
+
+# ============================================================================
+# RESPALDO STALE-WHILE-REVALIDATE
+# ============================================================================
+
+class SubirVersionTests(TestCase):
+    def test_cada_edicion_suma_uno(self):
+        fragments.subir_version('unidad', 1)
+        fragments.subir_version('unidad', 1, 2)
+        self.assertEqual(fragments.versiones(['unidad:1', 'unidad:2', 'unidad:3']),
+                         {'unidad:1': 2, 'unidad:2': 1, 'unidad:3': 0})
+
+    def test_primeras_ediciones_simultaneas_no_pierden_incrementos(self):
+        crear = SelloVersion.objects.bulk_create
+
+        def otra_edicion_crea_primero(filas, **opciones):
+            # La otra edición ya insertó y subió la fila antes de nuestro INSERT
+            SelloVersion.objects.create(clave='partida:7', version=1)
+            return crear(filas, **opciones)
+
+        with mock.patch.object(SelloVersion.objects, 'bulk_create', side_effect=otra_edicion_crea_primero):
+            fragments.subir_version('partida', 7)
+        self.assertEqual(SelloVersion.objects.get(pk='partida:7').version, 2)
+
+
+class GeneracionRespaldoTests(TestCase):
+    def test_cada_escritura_suma_uno_en_la_base(self):
+        self.assertEqual(swr.generacion(), 0)
+        swr.invalidar()
+        swr.invalidar()
+        self.assertEqual(swr.generacion(), 2)
+        self.assertEqual(SelloVersion.objects.get(pk=swr.CLAVE_GENERACION).version, 2)
+
+    @override_settings(SWR_CACHE='default')
+    def test_escritura_obliga_a_recargar(self):
+        cargar = mock.Mock(side_effect=['viejo', 'nuevo'])
+        self.assertEqual(swr.leer_con_respaldo('prueba:generacion', cargar), 'viejo')
+        self.assertEqual(swr.leer_con_respaldo('prueba:generacion', cargar), 'viejo')
+        swr.invalidar()
+        self.assertEqual(swr.leer_con_respaldo('prueba:generacion', cargar), 'nuevo')
+
+
+# ============================================================================
+# CASI DUPLICADOS (MINHASH / LSH)
+# ============================================================================
+
+class MinHashTests(SimpleTestCase):
+    texto = 'cual es la capa del modelo osi encargada del enrutamiento de paquetes entre redes'
+
+    def test_normalizar_y_orden_de_opciones(self):
+        self.assertEqual(duplicates.normalizar('  ¿Qué  ES\tTCP? '), 'que es tcp')
+        a = {'enunciado': 'Elija', 'opciones': [{'opcion': 'Uno'}, {'opcion': 'Dos'}]}
+        b = {'enunciado': 'elija', 'opciones': [{'opcion': 'dos'}, {'opcion': 'uno'}]}
+        self.assertEqual(duplicates.texto_pregunta(a), duplicates.texto_pregunta(b))
+
+    def test_shingles_sin_repetir(self):
+        self.assertEqual(len(duplicates.shingles('abc')), 1)
+        self.assertEqual(len(duplicates.shingles('aaaaaaa')), 1)
+        self.assertEqual(len(duplicates.shingles('abcdefg')), 3)
+
+    def test_firmas_deterministas_y_por_lotes(self):
+        textos = [self.texto, self.texto + ' ip', 'otra pregunta distinta sobre bases de datos']
+        firmas = duplicates.calcular_firmas(textos)
+        self.assertEqual(firmas.shape, (3, settings.DUPLICADOS_PERMUTACIONES))
+        self.assertEqual(firmas.dtype, np.uint32)
+        # Partir en lotes de un texto no cambia el resultado
+        with mock.patch.object(duplicates, '_VALORES_POR_LOTE', 1):
+            np.testing.assert_array_equal(duplicates.calcular_firmas(textos), firmas)
+
+    def test_similitud_estimada_separa_casi_duplicados(self):
+        casi = self.texto.replace('paquetes', 'paquete')
+        firmas = duplicates.calcular_firmas([self.texto, casi, 'normalizacion de bases de datos relacionales'])
+        self.assertGreater((firmas[0] == firmas[1]).mean(), 0.7)
+        self.assertLess((firmas[0] == firmas[2]).mean(), 0.2)
+
+    def test_claves_bandas(self):
+        firmas = duplicates.calcular_firmas([self.texto, self.texto, 'otro texto cualquiera'])
+        claves = duplicates.claves_bandas(firmas)
+        self.assertEqual(claves.shape, (3, settings.DUPLICADOS_BANDAS))
+        self.assertEqual(claves.dtype, np.int64)
+        np.testing.assert_array_equal(claves[0], claves[1])
+        self.assertFalse((claves[0] == claves[2]).any())
+
+    @override_settings(DUPLICADOS_PERMUTACIONES=100, DUPLICADOS_BANDAS=16)
+    def test_permutaciones_deben_ser_multiplo_de_bandas(self):
+        with self.assertRaises(ValueError):
+            duplicates.calcular_firmas([self.texto])
+
+
+class BuscarDuplicadosTests(TestCase):
+    enunciado = 'Cual es la capa del modelo OSI encargada del enrutamiento de paquetes entre redes distintas'
+
+    def _pregunta(self, pregunta_id, enunciado, numero):
+        return {'pregunta_id': pregunta_id, 'unidad_id': 1, 'numero': numero, 'enunciado': enunciado,
+                'opciones': [{'opcion': 'Red'}, {'opcion': 'Enlace'}]}
+
+    def test_agrupa_casi_duplicados_y_reindexa_solo_cambios(self):
+        preguntas = [
+            self._pregunta(1, self.enunciado, 1),
+            self._pregunta(2, self.enunciado.replace('distintas', 'diferentes'), 2),
+            self._pregunta(3, 'Que forma normal elimina las dependencias transitivas en una tabla', 3),
+            {'pregunta_id': None, 'unidad_id': 1, 'numero': 4, 'virtual': True},
+        ]
+        self.assertEqual(sorted(duplicates.indexar(7, preguntas)), [1, 2, 3])
+        self.assertEqual(duplicates.indexar(7, preguntas), [])
+
+        grupos = duplicates.buscar_duplicados(asignatura_id=7, umbral=0.6)
+        self.assertEqual(len(grupos), 1)
+        self.assertEqual([p['pregunta_id'] for p in grupos[0]['preguntas']], [1, 2])
+        self.assertEqual(duplicates.buscar_duplicados(asignatura_id=7, umbral=1.0), [])
+
+    def test_completo_quita_las_que_ya_no_existen(self):
+        duplicates.indexar(7, [self._pregunta(1, self.enunciado, 1), self._pregunta(2, self.enunciado, 2)])
+        duplicates.indexar(7, [self._pregunta(1, self.enunciado, 1)], completo=True)
+        self.assertEqual(list(FirmaPregunta.objects.values_list('pk', flat=True)), [1])
+        self.assertEqual(duplicates.buscar_duplicados(asignatura_id=7), [])
+
+
+# ============================================================================
+# VALIDACIÓN DE PREGUNTAS
+# ============================================================================
+
+class EvaluarTests(SimpleTestCase):
+    parametros = {'opciones': 4, 'palabras_min': 3, 'palabras_max': 12, 'racha_maxima': 2}
+
+    def _pregunta(self, correctas, total=4, enunciado='Uno dos tres', explicacion='Porque sí'):
+        return {
+            'enunciado': enunciado,
+            'explicacion': explicacion,
+            'opciones': [{'opcion': f'op {i}', 'es_correcta': i in correctas} for i in range(total)],
+        }
+
+    def test_columnas_por_pregunta(self):
+        preguntas = [
+            self._pregunta({2}),
+            self._pregunta({0, 1}, total=3, explicacion='  '),
+            {'enunciado': 'Sin opciones'},
+            self._pregunta({0}, total=5),
+        ]
+        columnas = validation.evaluar(preguntas, self.parametros)
+        self.assertEqual(columnas['opciones'].tolist(), [4, 3, 0, 5])
+        self.assertEqual(columnas['correctas'].tolist(), [1, 2, 0, 1])
+        self.assertEqual(columnas['palabras'].tolist(), [11, 9, 2, 13])
+        self.assertEqual(columnas['explicacion'].tolist(), [True, False, False, True])
+        # La letra solo existe con exactamente una correcta
+        self.assertEqual(columnas['letra'].tolist(), [2, -1, -1, 0])
+
+    def test_problemas_por_regla(self):
+        columnas = validation.evaluar([self._pregunta({0, 1}, total=3, explicacion='')], self.parametros)
+        reglas = [p['regla'] for p in validation._problemas(columnas, 0, self.parametros)]
+        self.assertEqual(reglas, ['correctas', 'opciones', 'explicacion'])
+
+    def test_sin_preguntas(self):
+        columnas = validation.evaluar([], self.parametros)
+        self.assertEqual({len(c) for c in columnas.values()}, {0})
+
+    def test_rachas_por_programa_y_numero(self):
+        # Orden de entrada mezclado: las rachas se cuentan por (programa, número)
+        letras = np.array([0, 0, 0, 1, 0, -1, 0, 0])
+        programas = np.array([1, 1, 1, 1, 2, 2, 2, 1])
+        numeros = np.array([3, 1, 2, 5, 1, 2, 3, 4])
+        self.assertEqual(validation.rachas(letras, programas, numeros).tolist(), [3, 1, 2, 1, 1, 0, 1, 4])
+
+    def test_rachas_vacias(self):
+        vacio = np.array([], dtype=np.int64)
+        self.assertEqual(len(validation.rachas(vacio, vacio, vacio)), 0)
+
+
+class ValidarPartidaTests(TestCase):
+    def _documento(self, letras):
+        preguntas = [
+            {'pregunta_id': i + 1, 'unidad_id': 1, 'numero': i + 1, 'enunciado': 'Uno dos tres',
+             'explicacion': 'Porque sí',
+             'opciones': [{'opcion': 'op', 'es_correcta': j == letra} for j in range(4)]}
+            for i, letra in enumerate(letras)
+        ]
+        preguntas.append({'pregunta_id': None, 'unidad_id': 1, 'numero': len(letras) + 1, 'virtual': True})
+        return {'asignatura': {'asignatura_id': 7},
+                'unidades': [{'programa_analitico_id': 3, 'preguntas': preguntas}]}
+
+    @override_settings(VALIDACION_OPCIONES=4, VALIDACION_PALABRAS_MIN=3, VALIDACION_PALABRAS_MAX=20,
+                       VALIDACION_RACHA_MAXIMA=2)
+    def test_solo_reevalua_cambios_y_recalcula_rachas(self):
+        with mock.patch.object(validation, 'obtener_snapshot', return_value=self._documento([1, 1, 1, 2])):
+            reporte = validation.validar_partida(1)
+        self.assertEqual((reporte['total'], reporte['evaluadas']), (4, 4))
+        self.assertEqual(reporte['por_regla'], {'racha': 1})
+        self.assertEqual(reporte['preguntas'][0]['pregunta_id'], 3)
+
+        # Cambiar la pregunta 2 corta la racha sin reevaluar las demás
+        with mock.patch.object(validation, 'obtener_snapshot', return_value=self._documento([1, 0, 1, 2])):
+            reporte = validation.validar_partida(1)
+        self.assertEqual((reporte['evaluadas'], reporte['con_problemas']), (1, 0))
+
+
+# ============================================================================
+# PAGINACIÓN POR CURSOR
+# ============================================================================
+
+class CursorTests(SimpleTestCase):
+    def test_ida_y_vuelta(self):
+        clave = [12, 3, 40, 1500]
+        self.assertEqual(views._leer_cursor(views._escribir_cursor(clave)), clave)
+        self.assertIsNone(views._leer_cursor(''))
+        self.assertIsNone(views._leer_cursor(None))
+
+    def test_cursor_invalido(self):
+        invalidos = [
+            'no es base64!',
+            views._escribir_cursor([1, 2, 3]),
+            views._escribir_cursor([1, 2, 3, 'x']),
+            views._escribir_cursor({'numero': 1}),
+            base64.urlsafe_b64encode(b'{no json').decode(),
+        ]
+        for cursor in invalidos:
+            with self.subTest(cursor=cursor), self.assertRaises(ValueError):
+                views._leer_cursor(cursor)
+
+
+class PreguntasApiTests(TestCase):
+    def _snapshot(self, partida_id):
+        # Dos unidades con números intercalados y una posición virtual
+        return {
+            'asignatura': {'asignatura_id': 7, 'descripcion': 'Redes'},
+            'programas': [{'linea_educativa_id': 3}],
+            'unidades': [
+                {'unidad_id': u, 'programa_analitico_id': 3, 'numero_unidad': u, 'descripcion': f'U{u}',
+                 'preguntas': [{'pregunta_id': u * 10 + n, 'numero': n, 'enunciado': f'P{u}.{n}'} for n in (1, 2)]
+                 + [{'numero': 3, 'virtual': True}]}
+                for u in (1, 2)
+            ],
+        }
+
+    def _pagina(self, cursor=None):
+        parametros = {'partida': 1, 'limite': 2, 'campos': 'numero'}
+        if cursor:
+            parametros['cursor'] = cursor
+        return self.client.get('/api/preguntas/', parametros).json()
+
+    @mock.patch.object(views, 'obtener_snapshot')
+    def test_recorre_todas_las_paginas_sin_repetir(self, obtener):
+        obtener.side_effect = self._snapshot
+        vistas, cursor = [], None
+        while True:
+            pagina = self._pagina(cursor)
+            self.assertEqual(pagina['total'], 6)
+            vistas.extend(p['dom_id'] for p in pagina['preguntas'])
+            cursor = pagina['siguiente']
+            if not cursor:
+                break
+        self.assertEqual(vistas, [11, 21, 12, 22, 'v1_3', 'v2_3'])
+
+    def test_cursor_invalido_es_400(self):
+        response = self.client.get('/api/preguntas/', {'partida': 1, 'cursor': 'basura'})
+        self.assertEqual(response.status_code, 400)
+
+
+# ============================================================================
+# GET CONDICIONAL
+# ============================================================================
+
+@override_settings(PARTIDA_SNAPSHOT_MAX_EDAD=60)
+class GetCondicionalTests(TestCase):
+    def setUp(self):
+        PartidaSnapshot.objects.create(partida_id=1, asignatura_id=7, documento={})
+
+    def test_sello_partida_solo_con_snapshot_vigente(self):
+        self.assertEqual(conditional.sello_partida(1), 'p1.1')
+        self.assertIsNone(conditional.sello_partida(2))
+        PartidaSnapshot.objects.filter(pk=1).update(actualizado=timezone.now() - timedelta(seconds=120))
+        self.assertIsNone(conditional.sello_partida(1))
+
+    def test_etag_partida_combina_sellos(self):
+        sin_partida = RequestFactory().get('/')
+        con_partida = RequestFactory().get('/', {'partida': 1})
+        self.assertEqual(conditional.etag_partida(sin_partida), conditional.sello_global())
+        self.assertEqual(conditional.etag_partida(con_partida), f'{conditional.sello_global()}-p1.1')
+        swr.invalidar()
+        self.assertTrue(conditional.etag_partida(con_partida).startswith('g1.'))
+        self.assertIsNone(conditional.etag_partida(RequestFactory().get('/', {'partida': 2})))
+
+    @mock.patch.object(views, 'obtener_snapshot', return_value=None)
+    def test_304_sin_ejecutar_la_vista(self, obtener):
+        response = self.client.get('/api/preguntas/', {'partida': 1})
+        etag = response['ETag']
+        self.assertIn('no-cache', response['Cache-Control'])
+
+        response = self.client.get('/api/preguntas/', {'partida': 1}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(obtener.call_count, 1)
+
+        # Un snapshot nuevo cambia el sello y la vista vuelve a correr
+        PartidaSnapshot.objects.filter(pk=1).update(version=2)
+        response = self.client.get('/api/preguntas/', {'partida': 1}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(obtener.call_count, 2)
+
+
+# ============================================================================
+# CALENTAMIENTO Y READINESS
+# ============================================================================
+
+class CalentamientoTests(SimpleTestCase):
+    def setUp(self):
+        estado = mock.patch.dict(
+            supabase_client._calentamiento, estado='frio', conexiones=0, duracion=None, error=None
+        )
+        estado.start()
+        self.addCleanup(estado.stop)
+
+    @override_settings(SUPABASE_PRECALENTAR=True)
+    @mock.patch.object(supabase_client.threading, 'Thread')
+    @mock.patch.object(supabase_client, 'calentar')
+    def test_arranque_no_inicia_hilos_antes_del_fork(self, calentar, hilo):
+        # Con --preload AppConfig.ready corre en el maestro, que después hace fork
+        supabase_client.preparar_ciclo_de_vida()
+        hilo.assert_not_called()
+        calentar.assert_not_called()
+
+    @override_settings(SUPABASE_PRECALENTAR=True)
+    @mock.patch.object(supabase_client, 'calentar_en_segundo_plano')
+    def test_calienta_el_worker(self, en_segundo_plano):
+        supabase_client._despues_de_fork()
+        self.assertEqual(en_segundo_plano.call_count, 1)
+        supabase_client.iniciar_worker()
+        self.assertEqual(en_segundo_plano.call_count, 2)
+        # Ya caliente (o calentándose) no se repite
+        supabase_client._calentamiento.update(estado='caliente')
+        supabase_client.iniciar_worker()
+        self.assertEqual(en_segundo_plano.call_count, 2)
+
+    @override_settings(SUPABASE_PING_TIMEOUT=0.5)
+    @mock.patch.object(supabase_client, 'get_supabase_client')
+    def test_ping_con_plazo_corto(self, get_client):
+        plazos = []
+        get_client.return_value.table.return_value.select.return_value.limit.return_value.execute.side_effect = (
+            lambda: plazos.append(supabase_client.plazo_restante())
+        )
+        supabase_client._ping()
+        self.assertTrue(0 < plazos[0] <= 0.5)
+        # El plazo no queda fijado en el hilo después del ping
+        self.assertIsNone(supabase_client.plazo_restante())
+
+    @mock.patch.object(views, 'calentar_en_segundo_plano')
+    def test_listo_responde_503_hasta_calentar(self, en_segundo_plano):
+        response = self.client.get('/salud/listo/')
+        self.assertEqual(response.status_code, 503)
+        en_segundo_plano.assert_called_once_with()
+
+        supabase_client._calentamiento.update(estado='caliente', conexiones=4)
+        response = self.client.get('/salud/listo/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(en_segundo_plano.call_count, 1)
+
+
+# ============================================================================
+# LLAMADAS EN PARALELO
+# ============================================================================
+
+class GatherTests(SimpleTestCase):
+    def test_respeta_el_limite_y_el_orden(self):
+        candado = threading.Lock()
+        en_curso = []
+        maximo = []
+        # Las dos primeras sólo pasan la barrera si corren a la vez
+        barrera = threading.Barrier(2, timeout=5)
+
+        def llamada(i):
+            with candado:
+                en_curso.append(i)
+                maximo.append(len(en_curso))
+            if i < 2:
+                barrera.wait()
+            time.sleep(0.01)
+            with candado:
+                en_curso.remove(i)
+            return i * 10
+
+        resultados = concurrency.gather(*(partial(llamada, i) for i in range(6)), limite=2)
+        self.assertEqual(resultados, [0, 10, 20, 30, 40, 50])
+        self.assertEqual(max(maximo), 2)
+
+    def test_anidadas_corren_en_serie(self):
+        def interna():
+            return threading.current_thread().name
+
+        def externa():
+            return threading.current_thread().name, concurrency.gather(interna, interna)
+
+        for hilo, internos in concurrency.gather(externa, externa):
+            self.assertTrue(hilo.startswith('gather'))
+            self.assertEqual(internos, [hilo, hilo])
+
+    def test_propaga_errores(self):
+        def falla(mensaje):
+            raise ValueError(mensaje)
+
+        with self.assertRaisesMessage(ValueError, 'uno'):
+            concurrency.gather(lambda: 1, partial(falla, 'uno'))
+
+        with self.assertRaises(concurrency.ErroresConcurrentes) as ctx:
+            concurrency.gather(partial(falla, 'a'), lambda: 1, partial(falla, 'b'))
+        self.assertEqual([indice for indice, _ in ctx.exception.errores], [0, 2])
+
+        resultados = concurrency.gather(lambda: 1, partial(falla, 'c'), devolver_errores=True)
+        self.assertEqual(resultados[0], 1)
+        self.assertIsInstance(resultados[1], ValueError)
+
+    def test_plazo_de_la_peticion(self):
+        def marca():
+            deadline.marcar_parcial()
+            return deadline.plazo_restante()
+
+        def falla():
+            raise ValueError('otro error')
+
+        token = deadline.iniciar_plazo(30)
+        try:
+            # Los hilos ven el plazo de la petición y marcan parciales en ella
+            restantes = concurrency.gather(marca, marca)
+            self.assertTrue(all(0 < restante <= 30 for restante in restantes))
+            self.assertEqual(deadline.resultados_parciales(), 2)
+        finally:
+            deadline.terminar_plazo(token)
+
+        token = deadline.iniciar_plazo(0.001)
+        try:
+            time.sleep(0.01)
+            # PlazoAgotado tiene prioridad sobre los demás errores
+            with self.assertRaises(deadline.PlazoAgotado):
+                concurrency.gather(falla, deadline.verificar_plazo, falla)
+        finally:
+            deadline.terminar_plazo(token)
+
+
+# ============================================================================
+# EXPORTACIÓN DEL BANCO
+# ============================================================================
+
+class BancoFalso:
+    """Repositorios de Supabase sobre listas en memoria, con el orden y la paginación de PostgREST."""
+
+    def __init__(self, test, programas, unidades, preguntas):
+        self.programas = programas
+        self.unidades = unidades
+        self.preguntas = preguntas
+        self.opciones = [
+            {'opcion_id': pregunta['pregunta_id'] * 10 + k, 'opcion': f"Opción {k} de {pregunta['pregunta_id']}",
+             'es_correcta': k == 0, 'media_url': None, 'pregunta_id': pregunta['pregunta_id']}
+            for pregunta in preguntas for k in range(2)
+        ]
+        self.lotes_opciones = []
+        for clase, metodo, funcion in (
+            (repositories.PartidaRepository, 'get_by_id', self.partida),
+            (repositories.AsignaturaRepository, 'get_by_id', self.asignatura),
+            (repositories.ProgramaAnaliticoRepository, 'list_by_asignatura', self.programas_de),
+            (repositories.UnidadRepository, 'list_by_programas', self.unidades_de),
+            (repositories.PreguntaRepository, 'list_page_by_unidad', self.pagina_unidad),
+            (repositories.PreguntaRepository, 'list_page_by_unidades', self.pagina_unidades),
+            (repositories.OpcionRepository, 'list_by_preguntas', self.opciones_de),
+        ):
+            parche = mock.patch.object(clase, metodo, side_effect=funcion)
+            setattr(self, metodo, parche.start())
+            test.addCleanup(parche.stop)
+
+    @staticmethod
+    def partida(partida_id):
+        return {'partida_id': partida_id, 'descripcion': f'Partida {partida_id}', 'asignatura_id': partida_id * 10}
+
+    @staticmethod
+    def asignatura(asignatura_id):
+        return {'asignatura_id': asignatura_id, 'descripcion': f'Asignatura {asignatura_id}', 'carrera_id': None}
+
+    def programas_de(self, asignatura_id, limit=1000):
+        return [dict(p) for p in self.programas if p['asignatura_id'] == asignatura_id]
+
+    def unidades_de(self, programa_ids, limit=10000):
+        filas = [dict(u) for u in self.unidades if u['programa_analitico_id'] in programa_ids]
+        return sorted(filas, key=lambda u: u['numero_unidad'])
+
+    def _pagina(self, unidad_ids, limit, offset):
+        filas = sorted(
+            (dict(p) for p in self.preguntas if p['unidad_id'] in unidad_ids),
+            key=lambda p: (p['numero'], p['pregunta_id'])
+        )
+        return filas[offset:offset + limit]
+
+    def pagina_unidad(self, unidad_id, limit=500, offset=0):
+        return self._pagina([unidad_id], limit, offset)
+
+    def pagina_unidades(self, unidad_ids, limit=1000, offset=0):
+        return self._pagina(unidad_ids, limit, offset)
+
+    def opciones_de(self, pregunta_ids):
+        self.lotes_opciones.append(list(pregunta_ids))
+        return [dict(o) for o in self.opciones if o['pregunta_id'] in pregunta_ids]
+
+
+def _banco_dos_asignaturas(test):
+    # Partida 1 -> asignatura 10 (programa 100); la asignatura 20 no debe aparecer
+    return BancoFalso(
+        test,
+        programas=[{'linea_educativa_id': 100, 'asignatura_id': 10}, {'linea_educativa_id': 900, 'asignatura_id': 20}],
+        unidades=[
+            {'unidad_id': 1, 'numero_unidad': 2, 'descripcion': 'Segunda', 'num_preguntas': 2,
+             'programa_analitico_id': 100},
+            {'unidad_id': 2, 'numero_unidad': 1, 'descripcion': 'Primera', 'num_preguntas': 2,
+             'programa_analitico_id': 100},
+            {'unidad_id': 9, 'numero_unidad': 1, 'descripcion': 'Otra', 'num_preguntas': 1,
+             'programa_analitico_id': 900},
+        ],
+        preguntas=[
+            {'pregunta_id': 21, 'numero': 2, 'enunciado': 'B', 'explicacion': '', 'unidad_id': 2},
+            {'pregunta_id': 20, 'numero': 1, 'enunciado': 'A', 'explicacion': 'Porque', 'unidad_id': 2},
+            # La 4 falta: sale como pregunta virtual
+            {'pregunta_id': 11, 'numero': 3, 'enunciado': 'C', 'explicacion': '', 'unidad_id': 1},
+            {'pregunta_id': 90, 'numero': 1, 'enunciado': 'Z', 'explicacion': '', 'unidad_id': 9},
+        ],
+    )
+
+
+class ExportarBancoTests(TestCase):
+    def setUp(self):
+        self.banco = _banco_dos_asignaturas(self)
+
+    def _filas_csv(self, response):
+        contenido = b''.join(response.streaming_content).decode('utf-8-sig')
+        return list(csv.DictReader(io.StringIO(contenido)))
+
+    def test_csv_en_streaming_con_el_orden_del_word(self):
+        response = self.client.get('/api/exportar/', {'partida': 1, 'formato': 'csv'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        # Las preguntas se leen recién al enviar el cuerpo
+        self.banco.list_page_by_unidad.assert_not_called()
+
+        filas = self._filas_csv(response)
+        orden_csv = []
+        for fila in filas:
+            clave = (fila['numero_unidad'], fila['numero'])
+            if not orden_csv or orden_csv[-1] != clave:
+                orden_csv.append(clave)
+        self.assertEqual(orden_csv, [('1', '1'), ('1', '2'), ('2', '3'), ('2', '4')])
+        self.assertEqual([f['opcion_id'] for f in filas if f['pregunta_id'] == '20'], ['200', '201'])
+
+        _, contenido = views.construir_documento_partida(1)
+        orden_word = []
+        for parrafo in Document(io.BytesIO(contenido)).paragraphs:
+            if parrafo.style.name == 'UnidadTitulo' and parrafo.text.startswith('UNIDAD '):
+                unidad = parrafo.text.split()[1].rstrip(':')
+            elif parrafo.style.name == 'PreguntaTitulo':
+                orden_word.append((unidad, parrafo.text.split()[1]))
+        self.assertEqual(orden_csv, orden_word)
+
+    def test_partida_exporta_solo_su_asignatura(self):
+        response = self.client.get('/api/exportar/', {'partida': 1, 'formato': 'jsonl'})
+        filas = [json.loads(linea) for linea in b''.join(response.streaming_content).decode().splitlines()]
+        self.banco.list_by_asignatura.assert_called_once_with(asignatura_id=10)
+        self.banco.list_by_programas.assert_called_once_with([100])
+        self.assertNotIn(90, [f['pregunta_id'] for f in filas])
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="preguntas_Partida 1.jsonl"')
+
+    def test_opciones_por_pagina(self):
+        preguntas = list(repositories.PreguntaRepository.iter_with_opciones([2, 1], page_size=1))
+        self.assertEqual([p['pregunta_id'] for p in preguntas], [20, 21, 11])
+        # Una consulta de opciones por página, nunca por todo el banco
+        self.assertEqual(self.banco.lotes_opciones, [[20], [21], [11]])
+        self.assertEqual([o['opcion_id'] for o in preguntas[0]['opciones']], [200, 201])
+
+
+# ============================================================================
+# CONTEXTO POR UNIDAD
+# ============================================================================
+
+def _extraer_contexto_lineal(contexto_completo, numero_unidad):
+    """Búsqueda lineal que reemplazó context_index, tal como estaba en views.py."""
+    if not contexto_completo or not numero_unidad:
+        return contexto_completo
+    contexto = str(contexto_completo).strip()
+    numero_unidad = int(numero_unidad)
+
+    seccion_unidades = "Unidades, temas y subtemas"
+    pos_seccion = contexto.lower().find(seccion_unidades.lower())
+    if pos_seccion == -1:
+        return _buscar_unidad_directa_lineal(contexto, numero_unidad)
+
+    contexto_unidades = contexto[pos_seccion:].strip()
+    inicio_unidad = -1
+    for patron in [f"Unidad {numero_unidad}:", f"Unidad {numero_unidad} "]:
+        pos = contexto_unidades.lower().find(patron.lower())
+        if pos != -1:
+            inicio_unidad = pos
+            break
+    if inicio_unidad == -1:
+        return contexto
+
+    fin_unidad = len(contexto_unidades)
+    for patron in [f"Unidad {numero_unidad + 1}:", f"Unidad {numero_unidad + 1} "]:
+        pos = contexto_unidades.lower().find(patron.lower(), inicio_unidad + 1)
+        if pos != -1:
+            fin_unidad = pos
+            break
+
+    contexto_unidad = contexto_unidades[inicio_unidad:fin_unidad].strip()
+    if len(contexto_unidad) < 50:
+        return contexto
+    contexto_general = contexto[:pos_seccion].strip()
+    titulo_seccion = "Unidades, temas y subtemas (tal como en el programa)"
+    if titulo_seccion.lower() in contexto.lower():
+        return f"{contexto_general}\n\n{titulo_seccion}\n\n{contexto_unidad}"
+    return f"{contexto_general}\n\n{seccion_unidades}\n\n{contexto_unidad}"
+
+
+def _buscar_unidad_directa_lineal(contexto, numero_unidad):
+    def patrones(numero):
+        return [
+            f"{palabra} {numero}{separador}" for palabra in ('Unidad', 'Tema', 'Capítulo') for separador in (':', ' ')
+        ]
+
+    inicio_unidad = -1
+    for patron in patrones(numero_unidad):
+        pos = contexto.lower().find(patron.lower())
+        if pos != -1:
+            inicio_unidad = pos
+            break
+    if inicio_unidad == -1:
+        match = re.search(rf'\b{numero_unidad}\.?\s*[:\-]?\s*', contexto, re.IGNORECASE)
+        if match:
+            inicio_unidad = match.start()
+    if inicio_unidad == -1:
+        return contexto
+
+    fin_unidad = len(contexto)
+    for siguiente_num in range(numero_unidad + 1, numero_unidad + 4):
+        for patron in patrones(siguiente_num):
+            pos = contexto.lower().find(patron.lower(), inicio_unidad + 1)
+            if pos != -1:
+                fin_unidad = pos
+                break
+        if fin_unidad < len(contexto):
+            break
+
+    contexto_unidad = contexto[inicio_unidad:fin_unidad].strip()
+    if len(contexto_unidad) < 50:
+        return contexto
+    return contexto_unidad
+
+
+class ContextoPorUnidadTests(SimpleTestCase):
+    PIEZAS = [
+        'Unidad {n}: ', 'Unidad {n} ', 'UNIDAD {n}:', 'unidad {n}', 'Unidad{n}: ', 'Unidad 0{n}: ',
+        'Tema {n}: ', 'tema {n} ', 'Capítulo {n}: ', 'CAPÍTULO {n} ', '{n}. ', '{n}- ', 'x{n} ',
+        'Unidades, temas y subtemas', 'Unidades, temas y subtemas (tal como en el programa)\n',
+        'Objetivo general del curso. ', 'Fundamentos y aplicaciones prácticas de la materia. ',
+        'Subtema con definiciones, ejemplos y ejercicios resueltos. ', '\n', '  ', 'Año ', 'Ñandú ',
+    ]
+
+    def _comparar(self, contexto):
+        for numero in range(0, 8):
+            self.assertEqual(
+                views.extraer_contexto_por_unidad(contexto, numero),
+                _extraer_contexto_lineal(contexto, numero),
+                f"unidad {numero} de {contexto!r}",
+            )
+
+    def test_programa_con_seccion_de_unidades(self):
+        contexto = (
+            "  Asignatura de redes. Competencias: diseñar y administrar redes.\n"
+            "Unidades, temas y subtemas (tal como en el programa)\n"
+            "Unidad 1: Modelo OSI. Capas, encapsulamiento y protocolos de cada nivel.\n"
+            "Unidad 2 Direccionamiento IP, subredes y máscaras de longitud variable.\n"
+            "UNIDAD 3: Enrutamiento. Unidad 1: repaso. Protocolos estáticos y dinámicos.\n"
+            "Unidad 12: Seguridad perimetral y cortafuegos en redes empresariales.  "
+        )
+        self._comparar(contexto)
+        self.assertIn('Modelo OSI', views.extraer_contexto_por_unidad(contexto, 1))
+        self.assertNotIn('Direccionamiento', views.extraer_contexto_por_unidad(contexto, 1))
+
+    def test_programa_sin_seccion(self):
+        self._comparar(
+            "Tema 1: Conjuntos y funciones, relaciones de equivalencia y orden parcial.\n"
+            "Capítulo 2 Límites y continuidad de funciones reales de una variable.\n"
+            "4. Derivadas e integrales con aplicaciones a la física y la economía."
+        )
+        self._comparar("Texto breve 1: nada más")
+        self._comparar("")
+
+    def test_textos_aleatorios(self):
+        aleatorio = random.Random(20261019)
+        for _ in range(400):
+            piezas = aleatorio.choices(self.PIEZAS, k=aleatorio.randint(0, 30))
+            self._comparar(''.join(p.format(n=aleatorio.randint(0, 9)) for p in piezas))
+
+
+# ============================================================================
+# PROMPTS POR LOTE
+# ============================================================================
+
+class PromptsLoteTests(TestCase):
+    def setUp(self):
+        # Tres unidades, la segunda sin preguntas ni posiciones
+        self.banco = BancoFalso(
+            self,
+            programas=[{'linea_educativa_id': 100, 'asignatura_id': 10, 'titulo': 'Programa', 'contexto': ''}],
+            unidades=[
+                {'unidad_id': 3, 'numero_unidad': 3, 'descripcion': 'Tercera', 'num_preguntas': 3,
+                 'programa_analitico_id': 100},
+                {'unidad_id': 1, 'numero_unidad': 1, 'descripcion': 'Primera', 'num_preguntas': 2,
+                 'programa_analitico_id': 100},
+                {'unidad_id': 2, 'numero_unidad': 2, 'descripcion': 'Vacía', 'num_preguntas': 0,
+                 'programa_analitico_id': 100},
+            ],
+            preguntas=[
+                {'pregunta_id': 12, 'numero': 2, 'enunciado': 'B', 'explicacion': '', 'unidad_id': 1},
+                {'pregunta_id': 11, 'numero': 1, 'enunciado': 'A', 'explicacion': '', 'unidad_id': 1},
+                {'pregunta_id': 33, 'numero': 3, 'enunciado': 'C', 'explicacion': '', 'unidad_id': 3},
+            ],
+        )
+
+    def test_arbol_con_varias_unidades(self):
+        arbol = services_supabase.SupabaseBusinessService.obtener_arbol_partida(1, con_placeholders=True)
+        self.assertEqual([u['unidad_id'] for u in arbol['unidades']], [1, 2, 3])
+        self.assertEqual(
+            [[p['numero'] for p in u['preguntas']] for u in arbol['unidades']], [[1, 2], [], [3, 4, 5]]
+        )
+        self.assertEqual([o['opcion_id'] for o in arbol['unidades'][0]['preguntas'][0]['opciones']], [110, 111])
+        # Preguntas y opciones de todas las unidades en una consulta cada una
+        self.banco.list_page_by_unidades.assert_called_once()
+        self.assertEqual(self.banco.lotes_opciones, [[11, 12, 33]])
+
+    def test_un_prompt_por_unidad(self):
+        response = self.client.get('/api/obtener-prompts/', {'partida': 1})
+        self.assertEqual(response.status_code, 200)
+        prompts = response.json()['prompts']
+        self.assertEqual([p['unidad_id'] for p in prompts], [1, 2, 3])
+        self.assertEqual([p['preguntas'] for p in prompts], [[1, 2], [], [3, 4, 5]])
+        self.assertIn('numeradas de la 3 a la 5', prompts[2]['prompt'])
+
+        # Cada prompt parte del mismo texto que el de la unidad sola
+        for prompt in prompts:
+            sola = self.client.get('/api/obtener-prompt/', {'partida': 1, 'unidad': prompt['unidad_id']}).json()
+            self.assertTrue(prompt['prompt'].startswith(sola['prompt']))
+        self.assertEqual(prompts[1]['prompt'], self.client.get(
+            '/api/obtener-prompt/', {'partida': 1, 'unidad': 2}
+        ).json()['prompt'])
+
+    def test_filtro_y_division_por_presupuesto(self):
+        response = self.client.get('/api/obtener-prompts/', {
+            'partida': 1, 'unidades': '2,3', 'max_chars': 1, 'formato': 'ndjson',
+        })
+        prompts = [json.loads(linea) for linea in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([(p['unidad_id'], p['parte'], p['total_partes']) for p in prompts],
+                         [(2, 1, 1), (3, 1, 3), (3, 2, 3), (3, 3, 3)])
+        self.assertEqual([p['preguntas'] for p in prompts], [[], [3], [4], [5]])
+        self.assertTrue(all(p['excede_presupuesto'] for p in prompts))
+
+
+# ============================================================================
+# BÚSQUEDA DE PREGUNTAS
+# ============================================================================
+
+class BuscarPreguntasTests(SimpleTestCase):
+    def test_resaltar_escapa_todo_menos_las_marcas(self):
+        self.assertEqual(
+            search._resaltar('<b>red</b> <script>alert("x")</script> & <B>'),
+            '<b>red</b> &lt;script&gt;alert(&quot;x&quot;)&lt;/script&gt; &amp; &lt;B&gt;',
+        )
+        self.assertEqual(search._resaltar(None), '')
+
+    @mock.patch.object(repositories.PreguntaRepository, 'buscar')
+    def test_funcion_con_ranking(self, buscar):
+        buscar.return_value = {'total': 41, 'resultados': [
+            {'pregunta_id': 7, 'numero': 3, 'fragmento': 'capa de <b>red</b> <img src=x>', 'rango': 0.8},
+        ]}
+        resultado = search.buscar_preguntas(' red ', partida_id=1, pagina=3, por_pagina=500)
+        buscar.assert_called_once_with(
+            'red', asignatura_id=None, partida_id=1, unidad_id=None, limite=100, offset=200
+        )
+        self.assertEqual((resultado['total'], resultado['pagina'], resultado['por_pagina']), (41, 3, 100))
+        self.assertEqual(resultado['resultados'][0]['fragmento'], 'capa de <b>red</b> &lt;img src=x&gt;')
+
+        buscar.reset_mock()
+        self.assertEqual(search.buscar_preguntas('   ')['total'], 0)
+        buscar.assert_not_called()
+
+    @mock.patch.object(repositories.PreguntaRepository, 'buscar_texto')
+    @mock.patch.object(repositories.PreguntaRepository, 'buscar',
+                       side_effect=supabase_client.APIError({'code': 'PGRST202', 'message': ''}))
+    def test_sin_la_funcion_usa_text_search(self, buscar, buscar_texto):
+        _banco_dos_asignaturas(self)
+        buscar_texto.return_value = ([
+            {'pregunta_id': 20, 'numero': 1, 'unidad_id': 2, 'enunciado': 'Qué es <una> red ' + 'x' * 300},
+        ], 1)
+
+        with self.assertLogs('app.search', 'WARNING'):
+            resultado = search.buscar_preguntas('red', partida_id=1)
+        # La partida se resuelve a las unidades de su asignatura
+        self.assertEqual(sorted(buscar_texto.call_args.kwargs['unidad_ids']), [1, 2])
+        self.assertEqual(resultado['total'], 1)
+        fragmento = resultado['resultados'][0]['fragmento']
+        self.assertTrue(fragmento.startswith('Qué es &lt;una&gt; red'))
+        self.assertIsNone(resultado['resultados'][0]['rango'])
+
+        with self.assertLogs('app.search', 'WARNING'):
+            search.buscar_preguntas('red', unidad_id=9)
+            search.buscar_preguntas('red')
+        self.assertEqual(buscar_texto.call_args_list[-2].kwargs['unidad_ids'], [9])
+        self.assertIsNone(buscar_texto.call_args.kwargs['unidad_ids'])
+
+    @mock.patch.object(repositories.PreguntaRepository, 'buscar_texto')
+    @mock.patch.object(repositories.PreguntaRepository, 'buscar',
+                       side_effect=supabase_client.APIError({'code': '42501', 'message': 'permiso'}))
+    def test_otros_errores_se_propagan(self, buscar, buscar_texto):
+        with self.assertRaises(supabase_client.APIError):
+            search.buscar_preguntas('red')
+        buscar_texto.assert_not_called()
+
+
+class BuscarPreguntasLocalTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        redes = Asignatura.objects.create(descripcion='Redes')
+        otra = Asignatura.objects.create(descripcion='Álgebra')
+        cls.partida = Partida.objects.create(descripcion='Parcial', asignatura=redes)
+        unidad = Unidad.objects.create(
+            numero_unidad=1, descripcion='Capas', num_preguntas=4,
+            programa_analitico=ProgramaAnalitico.objects.create(titulo='P', contexto='', asignatura=redes),
+        )
+        cls.unidad = unidad
+        cls.en_enunciado = Pregunta.objects.create(numero=1, enunciado='¿Qué hace la capa de red?', unidad=unidad)
+        cls.en_explicacion = Pregunta.objects.create(
+            numero=2, enunciado='Elija el protocolo correcto', explicacion='IP trabaja en la capa de red', unidad=unidad
+        )
+        cls.en_opcion = Pregunta.objects.create(numero=3, enunciado='¿Cuál es la tercera capa?', unidad=unidad)
+        Opcion.objects.create(pregunta=cls.en_opcion, opcion='La de red', es_correcta=True)
+        cls.peligrosa = Pregunta.objects.create(numero=4, enunciado='<script>enrutar</script>', unidad=unidad)
+        Pregunta.objects.create(
+            numero=1, enunciado='La red de caminos del grafo',
+            unidad=Unidad.objects.create(
+                numero_unidad=1, descripcion='Grafos', num_preguntas=1,
+                programa_analitico=ProgramaAnalitico.objects.create(titulo='Q', contexto='', asignatura=otra),
+            ),
+        )
+
+    def _ids(self, resultado):
+        return [r['pregunta_id'] for r in resultado['resultados']]
+
+    def test_ranking_enunciado_explicacion_opciones(self):
+        resultado = search.buscar_preguntas_local('red', partida_id=self.partida.pk)
+        self.assertEqual(resultado['total'], 3)
+        # El peso de la columna manda: enunciado, luego explicación, luego opciones
+        self.assertEqual(
+            self._ids(resultado), [self.en_enunciado.pk, self.en_explicacion.pk, self.en_opcion.pk]
+        )
+
+    def test_la_ultima_palabra_es_prefijo(self):
+        resultado = search.buscar_preguntas_local('enru', unidad_id=self.unidad.pk)
+        self.assertEqual(self._ids(resultado), [self.peligrosa.pk])
+        self.assertEqual(resultado['resultados'][0]['fragmento'], '&lt;script&gt;<b>enrutar</b>&lt;/script&gt;')
+        # Las palabras anteriores a la última deben coincidir completas
+        self.assertEqual(search.buscar_preguntas_local('cap red', unidad_id=self.unidad.pk)['total'], 0)
+        self.assertEqual(search.buscar_preguntas_local('capa red', unidad_id=self.unidad.pk)['total'], 3)
+
+    def test_filtros_acentos_y_paginacion(self):
+        self.assertEqual(search.buscar_preguntas_local('red')['total'], 4)
+        self.assertEqual(search.buscar_preguntas_local('cual tercera')['total'], 1)
+        self.assertEqual(search.buscar_preguntas_local('red', partida_id=999)['total'], 0)
+        self.assertEqual(search.buscar_preguntas_local('"*( )')['total'], 0)
+
+        primera = search.buscar_preguntas_local('red', partida_id=self.partida.pk, por_pagina=2)
+        segunda = search.buscar_preguntas_local('red', partida_id=self.partida.pk, pagina=2, por_pagina=2)
+        self.assertEqual((primera['total'], len(self._ids(primera)), len(self._ids(segunda))), (3, 2, 1))
+        self.assertFalse(set(self._ids(primera)) & set(self._ids(segunda)))
+
+    @override_settings(BUSQUEDA_LOCAL=True)
+    def test_api(self):
+        response = self.client.get('/api/preguntas/buscar/', {'q': 'red', 'asignatura': self.partida.asignatura_id})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['total'], 3)
+        self.assertEqual(self.client.get('/api/preguntas/buscar/', {'q': 'red', 'pagina': 'x'}).status_code, 400)
+
+
+# ============================================================================
+# RESPUESTAS JSON
+# ============================================================================
+
+class FastJsonResponseTests(SimpleTestCase):
+    DATOS = {
+        'decimal': Decimal('1.10'),
+        'entero_grande': Decimal('12345678901234567890'),
+        'fecha_hora': datetime(2026, 10, 19, 12, 30, 5, 123456, tzinfo=dt_timezone.utc),
+        'sin_zona': datetime(2026, 1, 2, 3, 4, 5, 600000),
+        'fecha': date(2026, 1, 2),
+        'hora': dt_time(1, 2, 3, 456789),
+        'duracion': timedelta(minutes=3),
+        'uuid': uuid.UUID(int=5),
+        'perezoso': gettext_lazy('Partida'),
+        'texto': 'Ñandú «citado»  ',
+        'anidado': [{'precio': Decimal('0.5'), 'cuando': date(2026, 3, 4)}, (1, 2.5, None, True)],
+        1: 'clave entera',
+        2.5: 'clave real',
+        None: 'clave nula',
+    }
+
+    def _comparar(self):
+        esperado = JsonResponse(self.DATOS)
+        obtenido = responses.FastJsonResponse(self.DATOS, status=201)
+        self.assertEqual(obtenido.status_code, 201)
+        self.assertEqual(obtenido['Content-Type'], esperado['Content-Type'])
+        self.assertEqual(json.loads(obtenido.content), json.loads(esperado.content))
+        return obtenido
+
+    @skipIf(responses.orjson is None, 'orjson no está instalado')
+    def test_con_orjson_igual_que_jsonresponse(self):
+        with mock.patch.object(responses.orjson, 'dumps', wraps=responses.orjson.dumps) as dumps:
+            self._comparar()
+        dumps.assert_called_once()
+
+    def test_sin_orjson_igual_que_jsonresponse(self):
+        with mock.patch.object(responses, 'orjson', None):
+            self._comparar()
+        with override_settings(JSON_RAPIDO=False):
+            self._comparar()
+
+    def test_safe_y_listas(self):
+        with self.assertRaises(TypeError):
+            responses.FastJsonResponse([1, 2])
+        lista = [{'n': Decimal('3')}, {'n': date(2026, 1, 1)}]
+        self.assertEqual(
+            json.loads(responses.FastJsonResponse(lista, safe=False).content),
+            json.loads(JsonResponse(lista, safe=False).content),
+        )
+        streaming = responses.StreamingJsonResponse(iter(lista), por_trozo=1)
+        self.assertEqual(
+            json.loads(b''.join(streaming.streaming_content)), json.loads(JsonResponse(lista, safe=False).content)
+        )
+
+
+# ============================================================================
+# IMPORTS DIFERIDOS
+# ============================================================================
+
+class ImportsDiferidosTests(SimpleTestCase):
+    # Paquetes que solo se cargan con el primer uso (ver supabase_client.py); si aparecen al
+    # arrancar, algún import volvió a ser eager
+    PAQUETES = ('supabase', 'postgrest', 'gotrue', 'realtime', 'storage3', 'supafunc', 'httpx', 'numpy', 'docx')
+
+    SCRIPT = (
+        'import json, sys, django; django.setup(); import app.repositories, project.urls; '
+        'print(json.dumps(sorted({m.split(".")[0] for m in sys.modules})))'
+    )
+
+    def test_arrancar_no_importa_paquetes_pesados(self):
+        # En un proceso nuevo: en este ya los cargaron otros tests
+        proceso = subprocess.run(
+            [sys.executable, '-c', self.SCRIPT],
+            cwd=settings.BASE_DIR, capture_output=True, text=True,
+            env={**os.environ, 'DJANGO_SETTINGS_MODULE': 'project.settings', 'SUPABASE_PRECALENTAR': '0'},
+        )
+        self.assertEqual(proceso.returncode, 0, proceso.stderr)
+        cargados = set(json.loads(proceso.stdout.splitlines()[-1]))
+        self.assertIn('app', cargados)
+        self.assertEqual(sorted(cargados & set(self.PAQUETES)), [])
+
+
+# ============================================================================
+# COMPRESIÓN
+# ============================================================================
+
+class BrotliFalso:
+    """Sustituto de brotli para los tests: deflate con un prefijo reconocible."""
+
+    @staticmethod
+    def compress(datos, quality=None):
+        return b'BR' + zlib.compress(datos)
+
+    class Compressor:
+        def __init__(self, quality=None):
+            self._zlib = zlib.compressobj()
+            self._inicio = b'BR'
+
+        def process(self, datos):
+            salida, self._inicio = self._inicio + self._zlib.compress(datos), b''
+            return salida
+
+        def flush(self):
+            return self._zlib.flush(zlib.Z_SYNC_FLUSH)
+
+        def finish(self):
+            return self._zlib.flush()
+
+    @staticmethod
+    def decompress(datos):
+        assert datos.startswith(b'BR')
+        return zlib.decompress(datos[2:])
+
+
+@override_settings(COMPRESION_MINIMO=200)
+class CompresionMiddlewareTests(SimpleTestCase):
+    CUERPO = json.dumps([{'pregunta': f'Enunciado {i}', 'opciones': ['a', 'b', 'c']} for i in range(50)]).encode()
+
+    def setUp(self):
+        self.factory = RequestFactory()
+
+    def _procesar(self, response, accept_encoding=None):
+        cabeceras = {'HTTP_ACCEPT_ENCODING': accept_encoding} if accept_encoding is not None else {}
+        return middleware.CompresionMiddleware(lambda request: response)(self.factory.get('/', **cabeceras))
+
+    def _json(self, contenido=None):
+        response = HttpResponse(contenido or self.CUERPO, content_type='application/json')
+        response['ETag'] = '"v1"'
+        return response
+
+    def test_elige_la_codificacion(self):
+        casos = [
+            ('gzip, deflate, br', 'br'),
+            ('br;q=0, gzip', 'gzip'),
+            ('gzip;q=0.5', 'gzip'),
+            ('gzip;q=0, br;q=0', None),
+            ('identity', None),
+            ('GZIP', 'gzip'),
+        ]
+        with mock.patch.object(middleware, 'brotli', BrotliFalso):
+            for aceptadas, esperada in casos:
+                with self.subTest(aceptadas):
+                    response = self._procesar(self._json(), aceptadas)
+                    self.assertEqual(response.get('Content-Encoding'), esperada)
+                    self.assertEqual(response['Vary'], 'Accept-Encoding')
+        # Sin brotli instalado se usa gzip aunque el cliente prefiera br
+        with mock.patch.object(middleware, 'brotli', None):
+            self.assertEqual(self._procesar(self._json(), 'br, gzip')['Content-Encoding'], 'gzip')
+            self.assertNotIn('Content-Encoding', self._procesar(self._json(), 'br'))
+
+    def test_contenido_comprimido(self):
+        response = self._procesar(self._json(), 'gzip')
+        self.assertEqual(gzip.decompress(response.content), self.CUERPO)
+        self.assertEqual(response['Content-Length'], str(len(response.content)))
+        self.assertEqual(response['ETag'], 'W/"v1"')
+
+        with mock.patch.object(middleware, 'brotli', BrotliFalso):
+            response = self._procesar(self._json(), 'br')
+        self.assertEqual(BrotliFalso.decompress(response.content), self.CUERPO)
+
+    def test_no_comprime_pequenas_codificadas_ni_binarias(self):
+        pequena = self._procesar(self._json(b'{"ok":true}'), 'gzip')
+        self.assertEqual(pequena.content, b'{"ok":true}')
+        self.assertNotIn('Content-Encoding', pequena)
+        self.assertNotIn('Vary', pequena)
+
+        codificada = self._json()
+        codificada['Content-Encoding'] = 'identity'
+        self.assertEqual(self._procesar(codificada, 'gzip').content, self.CUERPO)
+
+        docx = HttpResponse(
+            self.CUERPO, content_type='application/vnd.openxmlformats-officedocument.wordprocessingml.document'
+        )
+        self.assertNotIn('Content-Encoding', self._procesar(docx, 'gzip'))
+
+    def test_streaming(self):
+        # Los eventos SSE se entregan tal cual, sin buffer de compresión
+        eventos = StreamingHttpResponse(iter([b'data: 1\n\n', b'data: 2\n\n']), content_type='text/event-stream')
+        response = self._procesar(eventos, 'gzip, br')
+        self.assertNotIn('Content-Encoding', response)
+        self.assertNotIn('Vary', response)
+        self.assertEqual(list(response.streaming_content), [b'data: 1\n\n', b'data: 2\n\n'])
+
+        # NDJSON sí, trozo a trozo: cada trozo comprimido se puede leer sin esperar el final
+        lineas = [b'{"n":%d}\n' % i for i in range(3)]
+        ndjson = StreamingHttpResponse(iter(lineas), content_type='application/x-ndjson')
+        with mock.patch.object(middleware, 'brotli', BrotliFalso):
+            response = self._procesar(ndjson, 'br')
+            trozos = list(response.streaming_content)
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        descompresor = zlib.decompressobj()
+        self.assertEqual(descompresor.decompress(trozos[0][2:]), lineas[0])
+        self.assertEqual(BrotliFalso.decompress(b''.join(trozos)), b''.join(lineas))
+
+        ndjson = StreamingHttpResponse(iter(lineas), content_type='application/x-ndjson')
+        response = self._procesar(ndjson, 'gzip')
+        self.assertEqual(gzip.decompress(b''.join(response.streaming_content)), b''.join(lineas))
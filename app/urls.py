@@ -16,6 +16,8 @@ urlpatterns = [
     path('api/partidas/<int:partida_id>/update/', views.update_partida_api, name='update_partida_api'),
     path('api/unidades/<int:unidad_id>/update/', views.update_unidad_api, name='update_unidad_api'),
     path('api/preguntas/<int:pregunta_id>/update/', views.update_pregunta_api, name='update_pregunta_api'),
+    path('api/unidades/<int:unidad_id>/preguntas/<int:numero>/update/', views.update_pregunta_virtual_api, name='update_pregunta_virtual_api'),
+    path('api/preguntas/bulk-update/', views.bulk_update_preguntas_api, name='bulk_update_preguntas_api'),
     path('api/opciones/<int:opcion_id>/delete/', views.delete_opcion_api, name='delete_opcion_api'),
     
     # ============================================================================
@@ -29,10 +31,38 @@ urlpatterns = [
     # ============================================================================
     path('api/programas-analiticos/', views.get_programas_analiticos, name='get_programas_analiticos'),
     path('api/unidades/', views.get_unidades, name='get_unidades'),
+    path('api/preguntas/', views.preguntas_api, name='preguntas_api'),
+    path('api/preguntas/buscar/', views.buscar_preguntas_api, name='buscar_preguntas_api'),
+    path('api/duplicados/', views.duplicados_api, name='duplicados_api'),
+    path('api/validacion/', views.validacion_api, name='validacion_api'),
     
     # ============================================================================
     # APIs DE GENERACIÓN DE CONTENIDO - SUPABASE
     # ============================================================================
     path('api/obtener-prompt/', views.obtener_prompt, name='obtener_prompt'),
+    path('api/obtener-prompts/', views.obtener_prompts_lote, name='obtener_prompts_lote'),
     path('api/descargar-google-docs/', views.descargar_google_docs, name='descargar_google_docs'),
+
+    # ============================================================================
+    # APIs DE EXPORTACIÓN MASIVA - SUPABASE
+    # ============================================================================
+    path('api/exportar/', views.exportar_banco, name='exportar_banco'),
+
+    # ============================================================================
+    # APIs DE IMPORTACIÓN MASIVA - SUPABASE
+    # ============================================================================
+    path('api/importar-preguntas/', views.importar_preguntas_llm, name='importar_preguntas_llm'),
+    path('api/importar-banco/', views.importar_banco_api, name='importar_banco'),
+
+    # ============================================================================
+    # APIs DE TAREAS EN SEGUNDO PLANO
+    # ============================================================================
+    path('api/tareas/<int:tarea_id>/', views.estado_tarea_api, name='estado_tarea'),
+    path('api/tareas/<int:tarea_id>/eventos/', views.eventos_tarea, name='eventos_tarea'),
+    path('api/tareas/<int:tarea_id>/resultado/', views.resultado_tarea, name='resultado_tarea'),
+
+    # ============================================================================
+    # SALUD DEL PROCESO
+    # ============================================================================
+    path('salud/listo/', views.salud_listo, name='salud_listo'),
 ]
\ No newline at end of file
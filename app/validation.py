@@ -0,0 +1,209 @@
+import hashlib
+import json
+import logging
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+
+from .models import ValidacionPregunta
+from .snapshots import obtener_snapshot
+
+logger = logging.getLogger(__name__)
+
+
+def _parametros() -> Dict[str, int]:
+    return {
+        'opciones': settings.VALIDACION_OPCIONES,
+        'palabras_min': settings.VALIDACION_PALABRAS_MIN,
+        'palabras_max': settings.VALIDACION_PALABRAS_MAX,
+        'racha_maxima': settings.VALIDACION_RACHA_MAXIMA,
+    }
+
+
+def _huella(pregunta: Dict[str, Any], parametros: Dict[str, int]) -> str:
+    contenido = [
+        pregunta.get('enunciado'),
+        pregunta.get('explicacion'),
+        [(o.get('opcion'), bool(o.get('es_correcta'))) for o in pregunta.get('opciones') or []],
+        parametros,
+    ]
+    return hashlib.blake2b(json.dumps(contenido, sort_keys=True).encode(), digest_size=16).hexdigest()
+
+
+def evaluar(preguntas: List[Dict[str, Any]], parametros: Optional[Dict[str, int]] = None) -> Dict[str, np.ndarray]:
+    """Evalúa las reglas de cada pregunta sobre columnas (una posición por pregunta).
+
+    Las preguntas y sus opciones se pasan a arreglos una sola vez; conteos y sumas
+    por pregunta salen de ``np.bincount`` sobre el índice de pregunta de cada opción.
+    Devuelve las columnas ``opciones``, ``correctas``, ``palabras``, ``explicacion``
+    y ``letra`` (posición de la correcta, -1 si no hay exactamente una).
+    """
+    parametros = parametros or _parametros()
+    n = len(preguntas)
+    por_pregunta = [p.get('opciones') or [] for p in preguntas]
+    opciones = [o for lista in por_pregunta for o in lista]
+    m = len(opciones)
+
+    indice = np.repeat(np.arange(n), [len(lista) for lista in por_pregunta])
+    correcta = np.fromiter((bool(o.get('es_correcta')) for o in opciones), dtype=bool, count=m)
+    palabras_opcion = np.fromiter((len((o.get('opcion') or '').split()) for o in opciones), dtype=np.int64, count=m)
+    palabras_enunciado = np.fromiter(
+        (len((p.get('enunciado') or '').split()) for p in preguntas), dtype=np.int64, count=n
+    )
+    con_explicacion = np.fromiter(
+        (bool((p.get('explicacion') or '').strip()) for p in preguntas), dtype=bool, count=n
+    )
+
+    num_opciones = np.bincount(indice, minlength=n)
+    num_correctas = np.bincount(indice, weights=correcta, minlength=n).astype(np.int64)
+    palabras = palabras_enunciado + np.bincount(indice, weights=palabras_opcion, minlength=n).astype(np.int64)
+
+    # Posición de cada opción dentro de su pregunta (0 = A)
+    posicion = np.arange(m) - (np.cumsum(num_opciones) - num_opciones)[indice]
+    letra = np.full(n, -1, dtype=np.int64)
+    letra[indice[correcta]] = posicion[correcta]
+    letra[num_correctas != 1] = -1
+
+    return {
+        'opciones': num_opciones,
+        'correctas': num_correctas,
+        'palabras': palabras,
+        'explicacion': con_explicacion,
+        'letra': letra,
+    }
+
+
+def rachas(letras: np.ndarray, programas: np.ndarray, numeros: np.ndarray) -> np.ndarray:
+    """Largo de la racha de la misma letra correcta que termina en cada pregunta.
+
+    Las preguntas se recorren por programa y número; una pregunta sin letra (-1)
+    corta la racha y tiene largo 0.
+    """
+    n = len(letras)
+    racha = np.zeros(n, dtype=np.int64)
+    if not n:
+        return racha
+    orden = np.lexsort((numeros, programas))
+    letra, programa = letras[orden], programas[orden]
+    corte = np.ones(n, dtype=bool)
+    corte[1:] = (letra[1:] != letra[:-1]) | (programa[1:] != programa[:-1])
+    corte |= letra < 0
+    inicio = np.flatnonzero(corte)
+    largo = np.arange(n) - inicio[np.cumsum(corte) - 1] + 1
+    racha[orden] = np.where(letra >= 0, largo, 0)
+    return racha
+
+
+def _problemas(columnas: Dict[str, np.ndarray], i: int, parametros: Dict[str, int]) -> List[Dict[str, str]]:
+    problemas = []
+    if columnas['correctas'][i] != 1:
+        problemas.append({
+            'regla': 'correctas',
+            'mensaje': f"{columnas['correctas'][i]} opciones correctas (debe haber una)",
+        })
+    if columnas['opciones'][i] != parametros['opciones']:
+        problemas.append({
+            'regla': 'opciones',
+            'mensaje': f"{columnas['opciones'][i]} opciones (deben ser {parametros['opciones']})",
+        })
+    if not parametros['palabras_min'] <= columnas['palabras'][i] <= parametros['palabras_max']:
+        problemas.append({
+            'regla': 'longitud',
+            'mensaje': f"{columnas['palabras'][i]} palabras "
+                       f"(rango {parametros['palabras_min']}–{parametros['palabras_max']})",
+        })
+    if not columnas['explicacion'][i]:
+        problemas.append({'regla': 'explicacion', 'mensaje': 'Sin explicación'})
+    return problemas
+
+
+def validar_partida(partida_id: int, solo_problemas: bool = True) -> Optional[Dict[str, Any]]:
+    """Valida todas las preguntas reales de la asignatura de la partida.
+
+    Las preguntas salen del snapshot de la partida (una sola lectura). Solo las que
+    cambiaron desde la corrida anterior se evalúan y se guardan de nuevo; la regla de
+    rachas depende de las vecinas y se recalcula siempre con las letras guardadas.
+    """
+    documento = obtener_snapshot(partida_id)
+    if not documento:
+        return None
+    asignatura_id = documento['asignatura']['asignatura_id']
+    parametros = _parametros()
+
+    preguntas = [
+        {**p, 'programa_analitico_id': u['programa_analitico_id']}
+        for u in documento['unidades']
+        for p in u['preguntas']
+        if not p.get('virtual')
+    ]
+    ids = [p['pregunta_id'] for p in preguntas]
+    huellas = [_huella(p, parametros) for p in preguntas]
+    guardadas = {
+        v.pregunta_id: v for v in ValidacionPregunta.objects.filter(asignatura_id=asignatura_id)
+    }
+
+    cambiadas = [
+        i for i, (pregunta_id, huella) in enumerate(zip(ids, huellas))
+        if pregunta_id not in guardadas or guardadas[pregunta_id].huella != huella
+    ]
+    columnas = evaluar([preguntas[i] for i in cambiadas], parametros)
+    nuevas = [
+        ValidacionPregunta(
+            pregunta_id=ids[i],
+            asignatura_id=asignatura_id,
+            huella=huellas[i],
+            letra=int(columnas['letra'][k]) if columnas['letra'][k] >= 0 else None,
+            problemas=_problemas(columnas, k, parametros),
+        )
+        for k, i in enumerate(cambiadas)
+    ]
+    # Preguntas eliminadas y resultados que se reemplazan, por lotes de ids
+    borrar = sorted((set(guardadas) - set(ids)) | {v.pregunta_id for v in nuevas if v.pregunta_id in guardadas})
+    with transaction.atomic():
+        for inicio in range(0, len(borrar), 500):
+            ValidacionPregunta.objects.filter(pk__in=borrar[inicio:inicio + 500]).delete()
+        ValidacionPregunta.objects.bulk_create(nuevas, batch_size=1000)
+    guardadas.update({v.pregunta_id: v for v in nuevas})
+
+    letras = np.fromiter(
+        (-1 if guardadas[i].letra is None else guardadas[i].letra for i in ids), dtype=np.int64, count=len(ids)
+    )
+    racha = rachas(
+        letras,
+        np.fromiter((p['programa_analitico_id'] for p in preguntas), dtype=np.int64, count=len(ids)),
+        np.fromiter((p['numero'] for p in preguntas), dtype=np.int64, count=len(ids)),
+    )
+
+    reporte = []
+    por_regla: Dict[str, int] = {}
+    for i, pregunta in enumerate(preguntas):
+        problemas = list(guardadas[pregunta['pregunta_id']].problemas)
+        if racha[i] > parametros['racha_maxima']:
+            problemas.append({
+                'regla': 'racha',
+                'mensaje': f"La respuesta correcta es {chr(ord('A') + letras[i])} por {racha[i]}.ª vez seguida",
+            })
+        for problema in problemas:
+            por_regla[problema['regla']] = por_regla.get(problema['regla'], 0) + 1
+        if problemas or not solo_problemas:
+            reporte.append({
+                'pregunta_id': pregunta['pregunta_id'],
+                'numero': pregunta['numero'],
+                'unidad_id': pregunta['unidad_id'],
+                'problemas': problemas,
+            })
+
+    con_problemas = len({r['pregunta_id'] for r in reporte if r['problemas']})
+    logger.info(
+        f"Validación de la asignatura {asignatura_id}: {len(cambiadas)} evaluadas, {con_problemas} con problemas"
+    )
+    return {
+        'asignatura_id': asignatura_id,
+        'total': len(preguntas),
+        'evaluadas': len(cambiadas),
+        'con_problemas': con_problemas,
+        'por_regla': por_regla,
+        'preguntas': reporte,
+    }
@@ -1,24 +1,59 @@
 from django.shortcuts import render, redirect
-from django.http import JsonResponse
-from django.views.generic import ListView
+from django.views.generic import ListView, TemplateView
 from django.views.decorators.csrf import csrf_protect
 from django.views.decorators.http import require_http_methods
 from django.utils.decorators import method_decorator
 from django.contrib import messages
+from django.conf import settings
 from django.views import View
+import base64
 import json
+from bisect import bisect_right
+from functools import partial
 
 from .repositories import (
     CarreraRepository, AsignaturaRepository, ProgramaAnaliticoRepository,
     UnidadRepository, PreguntaRepository, OpcionRepository, PartidaRepository
 )
-from .supabase_client import get_supabase_client
+from .services_supabase import SupabaseBusinessService
+from .supabase_client import calentar_en_segundo_plano, estado_calentamiento, get_supabase_client
+from .question_edits import aplicar_cambios, aplicar_edicion_masiva, calcular_cambios, hay_cambios
+from .importers import importar_banco, importar_salida_llm, items_banco, leer_texto
+from .exporters import FORMATOS as FORMATOS_EXPORTACION
+from .context_index import obtener_indice_contexto
+from .docx_cache import clave_fragmento_unidad, obtener_fragmento, guardar_fragmento, insertar_fragmento
+from .jobs import encolar, tareas_en_segundo_plano
+from .models import Tarea
+from .placeholders import completar_stream
+from .swr import generacion as generacion_respaldo, invalidar as invalidar_respaldo, leer_con_respaldo
+from .concurrency import gather
+from .conditional import (
+    condicional, etag_global, etag_lista_partidas, etag_partida, etag_snapshot, modificado_snapshot
+)
+from .responses import FastJsonResponse, json_lista
+from .fragments import sellar, subir_version
+from .search import buscar_preguntas, buscar_preguntas_local
+from .deadline import PlazoAgotado, marcar_parcial, plazo_agotado
+from .snapshots import (
+    despues_de_escribir, obtener_snapshot, obtener_snapshots,
+    reconstruir_partida, refrescar_partida, refrescar_preguntas, refrescar_unidades
+)
 
 
 # ============================================================================
 # VISTAS PRINCIPALES - SUPABASE
 # ============================================================================
 
+def _contexto_fragmentos():
+    """Duración y sello de las listas para los {% cache %} de las plantillas de listas."""
+    return {
+        'fragmentos_ttl': settings.FRAGMENTOS_TTL,
+        'listas_ttl': settings.SWR_FRESCO,
+        'sello_listas': generacion_respaldo(),
+    }
+
+
+@method_decorator(condicional(etag_lista_partidas), name='dispatch')
 class PartidaListView(ListView):
     """Lista de partidas con contador de unidades - Supabase"""
     template_name = 'partidas/lista.html'
@@ -26,31 +61,16 @@ class PartidaListView(ListView):
     paginate_by = 50
 
     def get_queryset(self):
-        partidas = PartidaRepository.list_all(limit=1000)
+        partidas = leer_con_respaldo('partidas', lambda: PartidaRepository.list_all(limit=1000))
+        # Asignatura, carrera y conteos salen del snapshot de cada partida (una sola consulta)
+        snapshots = obtener_snapshots([p['partida_id'] for p in partidas])
         for partida in partidas:
-            # Obtener asignatura
-            asignatura = AsignaturaRepository.get_by_id(partida['asignatura_id'])
-            if asignatura:
-                partida['asignatura'] = asignatura
-
-                # Obtener carrera si existe
-                if asignatura.get('carrera_id'):
-                    carrera = CarreraRepository.get_by_id(asignatura['carrera_id'])
-                    if carrera:
-                        partida['asignatura']['carrera'] = carrera
-
-                # Calcular unidades
-                programas = ProgramaAnaliticoRepository.list_by_asignatura(
-                    asignatura_id=asignatura['asignatura_id']
-                )
-                total_unidades = 0
-                for programa in programas:
-                    unidades = UnidadRepository.list_all(
-                        limit=1000,
-                        programa_analitico_id=programa['linea_educativa_id']
-                    )
-                    total_unidades += len(unidades)
-                partida['unidades_count'] = total_unidades
+            snapshot = snapshots.get(partida['partida_id'])
+            if snapshot:
+                partida['asignatura'] = snapshot['asignatura']
+                if snapshot['carrera']:
+                    partida['asignatura']['carrera'] = snapshot['carrera']
+                partida['unidades_count'] = snapshot['conteos']['unidades']
             else:
                 partida['unidades_count'] = 0
                 partida['asignatura'] = None
@@ -60,8 +80,13 @@ class PartidaListView(ListView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         # Datos para el modal de crear partida
-        context['asignaturas'] = AsignaturaRepository.list_all(limit=1000)
-        context['carreras'] = CarreraRepository.list_all(limit=1000)
+        context['asignaturas'], context['carreras'] = gather(
+            lambda: leer_con_respaldo('asignaturas', lambda: AsignaturaRepository.list_all(limit=1000)),
+            lambda: leer_con_respaldo('carreras', lambda: CarreraRepository.list_all(limit=1000)),
+        )
+        # Claves del caché de fragmentos: solo las filas de esta página
+        sellar(context['partidas'], 'partida', 'partida_id')
+        context.update(_contexto_fragmentos())
         return context
 
 
@@ -72,196 +97,212 @@ class UnidadListView(ListView):
     paginate_by = 50
 
     def get_queryset(self):
+        # Obtener filtro de la URL
+        programa_analitico_id = self.request.GET.get('programa_analitico')
         try:
-            # Obtener filtro de la URL
-            programa_analitico_id = self.request.GET.get('programa_analitico')
-
-            # Obtener unidades según el filtro
-            if programa_analitico_id:
-                unidades = UnidadRepository.list_all(
-                    limit=1000,
-                    programa_analitico_id=int(programa_analitico_id)
-                )
-            else:
-                unidades = UnidadRepository.list_all(limit=1000)
-
-            # Enriquecer datos de cada unidad
-            for unidad in unidades:
-                try:
-                    # Obtener programa analítico
-                    programa = ProgramaAnaliticoRepository.get_by_id(unidad['programa_analitico_id'])
-                    if programa:
-                        unidad['programa_analitico'] = programa
-
-                        # Obtener asignatura
-                        asignatura = AsignaturaRepository.get_by_id(programa['asignatura_id'])
-                        if asignatura:
-                            unidad['programa_analitico']['asignatura'] = asignatura
-
-                            # Obtener carrera si existe
-                            if asignatura.get('carrera_id'):
-                                carrera = CarreraRepository.get_by_id(asignatura['carrera_id'])
-                                if carrera:
-                                    unidad['programa_analitico']['asignatura']['carrera'] = carrera
-
-                            # Obtener partida asociada a la asignatura
-                            partidas = PartidaRepository.list_all(limit=1000, asignatura_id=asignatura['asignatura_id'])
-                            if partidas:
-                                # Tomar la primera partida encontrada (asumiendo que hay una por asignatura)
-                                unidad['partida'] = partidas[0]
-                            else:
-                                unidad['partida'] = None
-                except Exception as e:
-                    # Si falla el enriquecimiento de una unidad, continuar con las demás
-                    import logging
-                    logger = logging.getLogger(__name__)
-                    logger.warning(f"Error al enriquecer unidad {unidad.get('unidad_id', 'unknown')}: {e}")
-                    continue
-
-            return unidades
+            # Con Supabase lento o caído se sirve la última lista buena
+            return leer_con_respaldo(
+                f"unidades:{programa_analitico_id or 'todas'}",
+                lambda: self._cargar_unidades(programa_analitico_id)
+            )
         except Exception as e:
             import logging
             logger = logging.getLogger(__name__)
             logger.error(f"Error al obtener unidades: {e}")
-            # Retornar lista vacía en caso de error
+            messages.error(self.request, 'No se pudieron cargar las unidades: Supabase no responde')
             return []
 
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-        try:
-            # Datos para el filtro de programas analíticos
-            context['programas_analiticos'] = ProgramaAnaliticoRepository.list_all(limit=1000)
+    def _cargar_unidades(self, programa_analitico_id):
+        # Obtener unidades según el filtro
+        if programa_analitico_id:
+            unidades = UnidadRepository.list_all(
+                limit=1000,
+                programa_analitico_id=int(programa_analitico_id)
+            )
+        else:
+            unidades = UnidadRepository.list_all(limit=1000)
+
+        # Enriquecer datos de cada unidad mientras quede tiempo; el resto se lista sin detalle.
+        # Las unidades se enriquecen en paralelo (ver concurrency.gather).
+        def enriquecer(unidad):
+            if plazo_agotado():
+                marcar_parcial()
+                return
+            try:
+                # Obtener programa analítico
+                programa = ProgramaAnaliticoRepository.get_by_id(unidad['programa_analitico_id'])
+                if programa:
+                    unidad['programa_analitico'] = programa
 
-            # Enriquecer programas con asignatura y carrera
-            for programa in context['programas_analiticos']:
-                try:
+                    # Obtener asignatura
                     asignatura = AsignaturaRepository.get_by_id(programa['asignatura_id'])
                     if asignatura:
-                        programa['asignatura'] = asignatura
+                        unidad['programa_analitico']['asignatura'] = asignatura
+
+                        # Obtener carrera si existe
                         if asignatura.get('carrera_id'):
                             carrera = CarreraRepository.get_by_id(asignatura['carrera_id'])
                             if carrera:
-                                programa['asignatura']['carrera'] = carrera
-                except Exception as e:
-                    import logging
-                    logger = logging.getLogger(__name__)
-                    logger.warning(f"Error al enriquecer programa {programa.get('linea_educativa_id', 'unknown')}: {e}")
-                    continue
+                                unidad['programa_analitico']['asignatura']['carrera'] = carrera
+
+                        # Obtener partida asociada a la asignatura
+                        partidas = PartidaRepository.list_all(limit=1000, asignatura_id=asignatura['asignatura_id'])
+                        if partidas:
+                            # Tomar la primera partida encontrada (asumiendo que hay una por asignatura)
+                            unidad['partida'] = partidas[0]
+                        else:
+                            unidad['partida'] = None
+            except PlazoAgotado:
+                marcar_parcial()
+            except Exception as e:
+                # Si falla el enriquecimiento de una unidad, continuar con las demás
+                import logging
+                logger = logging.getLogger(__name__)
+                logger.warning(f"Error al enriquecer unidad {unidad.get('unidad_id', 'unknown')}: {e}")
+
+        gather(*(partial(enriquecer, unidad) for unidad in unidades))
+        return unidades
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        try:
+            # Datos para el filtro de programas analíticos
+            context['programas_analiticos'] = leer_con_respaldo('programas:enriquecidos', self._cargar_programas)
         except Exception as e:
             import logging
             logger = logging.getLogger(__name__)
             logger.error(f"Error al obtener programas analíticos: {e}")
             context['programas_analiticos'] = []
 
+        # La fila de una unidad también muestra el nombre de su partida
+        sellar(
+            context['unidades'], 'unidad', 'unidad_id',
+            relacionadas=[('partida', lambda u: (u.get('partida') or {}).get('partida_id'))],
+        )
+        context.update(_contexto_fragmentos())
         return context
 
+    def _cargar_programas(self):
+        programas = ProgramaAnaliticoRepository.list_all(limit=1000)
 
-class PreguntaListView(ListView):
-    """Lista de preguntas con filtros - Supabase"""
-    template_name = 'preguntas/lista.html'
-    context_object_name = 'preguntas'
-    paginate_by = 50
-
-    def get_queryset(self):
-        try:
-            partida_id = self.request.GET.get('partida')
-            if not partida_id:
-                return []
-
-            partida = PartidaRepository.get_by_id(int(partida_id))
-            if not partida:
-                return []
+        # Enriquecer programas con asignatura y carrera mientras quede tiempo, en paralelo
+        def enriquecer(programa):
+            if plazo_agotado():
+                marcar_parcial()
+                return
+            try:
+                asignatura = AsignaturaRepository.get_by_id(programa['asignatura_id'])
+                if asignatura:
+                    programa['asignatura'] = asignatura
+                    if asignatura.get('carrera_id'):
+                        carrera = CarreraRepository.get_by_id(asignatura['carrera_id'])
+                        if carrera:
+                            programa['asignatura']['carrera'] = carrera
+            except PlazoAgotado:
+                marcar_parcial()
+            except Exception as e:
+                import logging
+                logger = logging.getLogger(__name__)
+                logger.warning(f"Error al enriquecer programa {programa.get('linea_educativa_id', 'unknown')}: {e}")
 
-            asignatura = AsignaturaRepository.get_by_id(partida['asignatura_id'])
-            if not asignatura:
-                return []
+        gather(*(partial(enriquecer, programa) for programa in programas))
+        return programas
 
-            programas = ProgramaAnaliticoRepository.list_by_asignatura(
-                asignatura_id=asignatura['asignatura_id']
-            )
 
-            programa_analitico_id = self.request.GET.get('programa_analitico')
-            if programa_analitico_id:
-                programas = [p for p in programas if p['linea_educativa_id'] == int(programa_analitico_id)]
+def _preguntas_de_snapshot(snapshot, programa_analitico_id=None, unidad_id=None):
+    """Preguntas del snapshot (reales y virtuales) con su unidad, programa y asignatura.
 
-            todas_unidades = []
-            for programa in programas:
-                try:
-                    unidades = UnidadRepository.list_all(
-                        limit=1000,
-                        programa_analitico_id=programa['linea_educativa_id']
-                    )
-                    todas_unidades.extend(unidades)
-                except Exception as e:
-                    import logging
-                    logger = logging.getLogger(__name__)
-                    logger.warning(f"Error al obtener unidades para programa {programa.get('linea_educativa_id', 'unknown')}: {e}")
-                    continue
+    Quedan ordenadas por número; a igual número, por programa, unidad y pregunta. Esa
+    misma clave es la que usa la paginación por cursor de ``preguntas_api``.
+    """
+    asignatura = snapshot['asignatura']
+    programas = snapshot['programas']
+    if programa_analitico_id:
+        programas = [p for p in programas if p['linea_educativa_id'] == int(programa_analitico_id)]
+    programa_por_id = {p['linea_educativa_id']: p for p in programas}
+
+    # Las posiciones sin fila real ya vienen como preguntas virtuales
+    todas_unidades = [u for u in snapshot['unidades'] if u['programa_analitico_id'] in programa_por_id]
+    if unidad_id:
+        todas_unidades = [u for u in todas_unidades if u['unidad_id'] == int(unidad_id)]
+
+    todas_preguntas = []
+    for unidad in todas_unidades:
+        preguntas = unidad.pop('preguntas')
+        for pregunta in preguntas:
+            # Identificador para el DOM: las virtuales aún no tienen pregunta_id
+            if pregunta.get('virtual'):
+                pregunta['dom_id'] = f"v{unidad['unidad_id']}_{pregunta['numero']}"
+            else:
+                pregunta['dom_id'] = pregunta['pregunta_id']
+            pregunta['unidad'] = unidad
+            pregunta['programa_analitico'] = programa_por_id[unidad['programa_analitico_id']]
+            pregunta['asignatura'] = asignatura
+        todas_preguntas.extend(preguntas)
+
+    todas_preguntas.sort(key=_clave_cursor)
+    return todas_preguntas
+
+
+def _clave_cursor(pregunta):
+    return [
+        int(pregunta.get('numero', 0)),
+        pregunta['unidad']['programa_analitico_id'],
+        pregunta['unidad']['unidad_id'],
+        pregunta.get('pregunta_id') or 0,
+    ]
 
-            unidad_id = self.request.GET.get('unidad')
-            if unidad_id:
-                todas_unidades = [u for u in todas_unidades if u['unidad_id'] == int(unidad_id)]
 
-            todas_preguntas = []
-            for unidad in todas_unidades:
-                try:
-                    preguntas = PreguntaRepository.list_all(limit=1000, unidad_id=unidad['unidad_id'])
-                    for pregunta in preguntas:
-                        pregunta['unidad'] = unidad
-                        programa_correspondiente = next(
-                            (p for p in programas if p['linea_educativa_id'] == unidad['programa_analitico_id']),
-                            None
-                        )
-                        if programa_correspondiente:
-                            pregunta['programa_analitico'] = programa_correspondiente
-                            pregunta['asignatura'] = asignatura
-                        try:
-                            pregunta['opciones'] = OpcionRepository.list_all(limit=1000, pregunta_id=pregunta['pregunta_id'])
-                        except Exception as e:
-                            import logging
-                            logger = logging.getLogger(__name__)
-                            logger.warning(f"Error al obtener opciones para pregunta {pregunta.get('pregunta_id', 'unknown')}: {e}")
-                            pregunta['opciones'] = []
-                    todas_preguntas.extend(preguntas)
-                except Exception as e:
-                    import logging
-                    logger = logging.getLogger(__name__)
-                    logger.warning(f"Error al obtener preguntas para unidad {unidad.get('unidad_id', 'unknown')}: {e}")
-                    continue
+@method_decorator(condicional(etag_partida), name='dispatch')
+class PreguntaListView(TemplateView):
+    """Lista de preguntas con filtros - Supabase
 
-            todas_preguntas.sort(key=lambda x: int(x.get('numero', 0)))
-            return todas_preguntas
-        except Exception as e:
-            import logging
-            logger = logging.getLogger(__name__)
-            logger.error(f"Error al obtener preguntas: {e}")
-            return []
+    La página solo trae los filtros y el total; las tarjetas se cargan por páginas
+    desde ``preguntas_api`` a medida que se hace scroll.
+    """
+    template_name = 'preguntas/lista.html'
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
+        context['total_preguntas'] = 0
+        context['unidad_seleccionada'] = None
         try:
-            context['partidas'] = PartidaRepository.list_all(limit=1000)
-        except Exception as e:
-            import logging
-            logger = logging.getLogger(__name__)
-            logger.error(f"Error al obtener partidas: {e}")
-            context['partidas'] = []
-        
-        try:
-            context['unidades'] = UnidadRepository.list_all(limit=1000)
-        except Exception as e:
-            import logging
-            logger = logging.getLogger(__name__)
-            logger.error(f"Error al obtener unidades: {e}")
-            context['unidades'] = []
-        
-        try:
-            context['programas_analiticos'] = ProgramaAnaliticoRepository.list_all(limit=1000)
+            partida_id = self.request.GET.get('partida')
+            snapshot = obtener_snapshot(int(partida_id)) if partida_id else None
+            if snapshot:
+                programa_analitico_id = self.request.GET.get('programa_analitico')
+                unidad_id = self.request.GET.get('unidad')
+                unidades = [
+                    u for u in snapshot['unidades']
+                    if (not programa_analitico_id or u['programa_analitico_id'] == int(programa_analitico_id))
+                    and (not unidad_id or u['unidad_id'] == int(unidad_id))
+                ]
+                context['total_preguntas'] = sum(len(u['preguntas']) for u in unidades)
+                if unidad_id and unidades:
+                    context['unidad_seleccionada'] = unidades[0]
+        except PlazoAgotado:
+            marcar_parcial()
         except Exception as e:
             import logging
             logger = logging.getLogger(__name__)
-            logger.error(f"Error al obtener programas analíticos: {e}")
-            context['programas_analiticos'] = []
+            logger.error(f"Error al obtener preguntas: {e}")
+
+        # Las tres listas son independientes: se cargan en paralelo
+        listas = {
+            'partidas': lambda: leer_con_respaldo('partidas', lambda: PartidaRepository.list_all(limit=1000)),
+            'unidades': lambda: leer_con_respaldo('unidades:lista', lambda: UnidadRepository.list_all(limit=1000)),
+            'programas_analiticos': lambda: leer_con_respaldo(
+                'programas', lambda: ProgramaAnaliticoRepository.list_all(limit=1000)
+            ),
+        }
+        resultados = gather(*listas.values(), devolver_errores=True)
+        for nombre, resultado in zip(listas, resultados):
+            if isinstance(resultado, Exception):
+                import logging
+                logger = logging.getLogger(__name__)
+                logger.error(f"Error al obtener {nombre}: {resultado}")
+                resultado = []
+            context[nombre] = resultado
         
         return context
 
@@ -270,6 +311,7 @@ class PreguntaListView(ListView):
 # APIs DE EDICIÓN INLINE - SUPABASE
 # ============================================================================
 
+
 @csrf_protect
 @require_http_methods(["POST"])
 def update_partida_api(request, partida_id):
@@ -278,7 +320,9 @@ def update_partida_api(request, partida_id):
         data = json.loads(request.body)
         if 'descripcion' in data:
             partida = PartidaRepository.update(int(partida_id), descripcion=data['descripcion'])
-            return JsonResponse({
+            despues_de_escribir(refrescar_partida, partida)
+            subir_version('partida', partida['partida_id'])
+            return FastJsonResponse({
                 'success': True,
                 'message': 'Partida actualizada exitosamente',
                 'partida': {
@@ -287,9 +331,9 @@ def update_partida_api(request, partida_id):
                 }
             })
         else:
-            return JsonResponse({'success': False, 'error': 'Descripción requerida'}, status=400)
+            return FastJsonResponse({'success': False, 'error': 'Descripción requerida'}, status=400)
     except Exception as e:
-        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+        return FastJsonResponse({'success': False, 'error': str(e)}, status=400)
 
 
 @csrf_protect
@@ -300,7 +344,9 @@ def update_unidad_api(request, unidad_id):
         data = json.loads(request.body)
         if 'descripcion' in data:
             unidad = UnidadRepository.update(int(unidad_id), descripcion=data['descripcion'])
-            return JsonResponse({
+            despues_de_escribir(refrescar_unidades, [unidad['unidad_id']])
+            subir_version('unidad', unidad['unidad_id'])
+            return FastJsonResponse({
                 'success': True,
                 'message': 'Unidad actualizada exitosamente',
                 'unidad': {
@@ -310,9 +356,9 @@ def update_unidad_api(request, unidad_id):
                 }
             })
         else:
-            return JsonResponse({'success': False, 'error': 'Descripción requerida'}, status=400)
+            return FastJsonResponse({'success': False, 'error': 'Descripción requerida'}, status=400)
     except Exception as e:
-        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+        return FastJsonResponse({'success': False, 'error': str(e)}, status=400)
 
 
 # ============================================================================
@@ -328,10 +374,10 @@ def crear_carrera_ajax(request):
         descripcion = data.get('descripcion', '').strip()
 
         if not descripcion:
-            return JsonResponse({'success': False, 'error': 'La descripción es requerida'}, status=400)
+            return FastJsonResponse({'success': False, 'error': 'La descripción es requerida'}, status=400)
 
         carrera = CarreraRepository.create(descripcion=descripcion)
-        return JsonResponse({
+        return FastJsonResponse({
             'success': True,
             'message': 'Carrera creada exitosamente',
             'carrera': {
@@ -340,7 +386,7 @@ def crear_carrera_ajax(request):
             }
         })
     except Exception as e:
-        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+        return FastJsonResponse({'success': False, 'error': str(e)}, status=400)
 
 
 @csrf_protect
@@ -353,16 +399,16 @@ def crear_asignatura_ajax(request):
         carrera_id = data.get('carrera_id')
 
         if not descripcion:
-            return JsonResponse({'success': False, 'error': 'La descripción es requerida'}, status=400)
+            return FastJsonResponse({'success': False, 'error': 'La descripción es requerida'}, status=400)
 
         if not carrera_id:
-            return JsonResponse({'success': False, 'error': 'La carrera es requerida'}, status=400)
+            return FastJsonResponse({'success': False, 'error': 'La carrera es requerida'}, status=400)
 
         asignatura = AsignaturaRepository.create(
             descripcion=descripcion,
             carrera_id=int(carrera_id)
         )
-        return JsonResponse({
+        return FastJsonResponse({
             'success': True,
             'message': 'Asignatura creada exitosamente',
             'asignatura': {
@@ -372,13 +418,14 @@ def crear_asignatura_ajax(request):
             }
         })
     except Exception as e:
-        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+        return FastJsonResponse({'success': False, 'error': str(e)}, status=400)
 
 
 # ============================================================================
 # APIs DE FILTROS DINÁMICOS - SUPABASE
 # ============================================================================
 
+@condicional(etag_global)
 def get_programas_analiticos(request):
     """API para obtener programas analíticos por partida o por asignatura (Supabase)."""
     try:
@@ -390,18 +437,18 @@ def get_programas_analiticos(request):
             try:
                 pid = int(partida_id)
             except ValueError:
-                return JsonResponse({'error': 'partida_id inválido'}, status=400)
+                return FastJsonResponse({'error': 'partida_id inválido'}, status=400)
 
             try:
                 partida = PartidaRepository.get_by_id(pid)
                 print(f"DEBUG: partida encontrada={partida}")
             except Exception as e:
                 print(f"DEBUG: Error al obtener partida: {e}")
-                return JsonResponse({'error': f'Error al obtener partida: {e}'}, status=400)
+                return FastJsonResponse({'error': f'Error al obtener partida: {e}'}, status=400)
 
             if not partida:
                 print("DEBUG: Partida no encontrada, devolviendo array vacío")
-                return JsonResponse([], safe=False)
+                return FastJsonResponse([], safe=False)
 
             # Si la partida existe, usamos su asignatura_id (a menos que ya venga uno explícito)
             asignatura_id = asignatura_id or partida.get('asignatura_id')
@@ -410,41 +457,226 @@ def get_programas_analiticos(request):
         # 2) Validación: necesitamos asignatura_id para listar programas
         if not asignatura_id:
             print("DEBUG: No hay asignatura_id, devolviendo array vacío")
-            return JsonResponse([], safe=False)
+            return FastJsonResponse([], safe=False)
 
         try:
             aid = int(asignatura_id)
         except ValueError:
-            return JsonResponse({'error': 'asignatura_id inválido'}, status=400)
+            return FastJsonResponse({'error': 'asignatura_id inválido'}, status=400)
 
         # 3) Obtener programas por asignatura
         try:
-            programas = ProgramaAnaliticoRepository.list_by_asignatura(asignatura_id=aid)
+            programas = leer_con_respaldo(
+                f"programas:asignatura:{aid}",
+                lambda: ProgramaAnaliticoRepository.list_by_asignatura(asignatura_id=aid)
+            )
             print(f"DEBUG: programas encontrados={len(programas) if programas else 0}")
-            return JsonResponse(programas or [], safe=False)
+            return json_lista(programas or [])
         except Exception as e:
             print(f"DEBUG: Error al obtener programas: {e}")
-            return JsonResponse({'error': f'Error al obtener programas: {e}'}, status=400)
+            return FastJsonResponse({'error': f'Error al obtener programas: {e}'}, status=400)
 
     except Exception as e:
         print(f"DEBUG: Error general en get_programas_analiticos: {e}")
-        return JsonResponse({'error': str(e)}, status=500)
+        return FastJsonResponse({'error': str(e)}, status=500)
 
 
+@condicional(etag_global)
 def get_unidades(request):
     """API para obtener unidades por programa analítico - Supabase"""
     try:
         programa_id = request.GET.get('programa_id')
         if not programa_id:
-            return JsonResponse([], safe=False)
+            return FastJsonResponse([], safe=False)
+
+        unidades = leer_con_respaldo(
+            f"unidades:programa:{int(programa_id)}",
+            lambda: UnidadRepository.list_all(limit=1000, programa_analitico_id=int(programa_id))
+        )
+        return json_lista(unidades)
+    except Exception as e:
+        return FastJsonResponse({'error': str(e)}, status=400)
+
+
+# Campos que se pueden pedir a preguntas_api con ``campos=``
+CAMPOS_PREGUNTA = {
+    'dom_id': lambda p: p['dom_id'],
+    'pregunta_id': lambda p: p.get('pregunta_id'),
+    'numero': lambda p: p['numero'],
+    'enunciado': lambda p: p.get('enunciado', ''),
+    'explicacion': lambda p: p.get('explicacion') or '',
+    'virtual': lambda p: bool(p.get('virtual')),
+    'unidad_id': lambda p: p['unidad']['unidad_id'],
+    'unidad': lambda p: {k: p['unidad'][k] for k in ('unidad_id', 'numero_unidad', 'descripcion')},
+    'programa_analitico_id': lambda p: p['unidad']['programa_analitico_id'],
+    'asignatura': lambda p: {k: p['asignatura'][k] for k in ('asignatura_id', 'descripcion')},
+    'opciones': lambda p: p.get('opciones') or [],
+}
+PREGUNTAS_API_LIMITE_MAXIMO = 200
+
+
+def _escribir_cursor(clave):
+    return base64.urlsafe_b64encode(json.dumps(clave).encode()).decode()
+
+
+def _leer_cursor(cursor):
+    if not cursor:
+        return None
+    clave = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    if not isinstance(clave, list) or len(clave) != 4 or not all(isinstance(v, int) for v in clave):
+        raise ValueError('Cursor inválido')
+    return clave
+
+
+@require_http_methods(["GET"])
+@condicional(etag_snapshot, modificado_snapshot)
+def preguntas_api(request):
+    """API paginada de preguntas (con opciones) de una partida, para la lista con scroll virtual.
+
+    Parámetros: partida, programa_analitico, unidad, numero, limite (hasta 200), cursor
+    y campos (separados por coma; por defecto todos, ``dom_id`` siempre). ``siguiente``
+    es el cursor de la página siguiente, o null en la última.
+    """
+    try:
+        partida_id = int(request.GET['partida'])
+        limite = min(max(1, int(request.GET.get('limite', 50))), PREGUNTAS_API_LIMITE_MAXIMO)
+        campos = [c for c in request.GET.get('campos', '').split(',') if c] or list(CAMPOS_PREGUNTA)
+        if any(c not in CAMPOS_PREGUNTA for c in campos):
+            return FastJsonResponse({'success': False, 'error': f"Campos disponibles: {', '.join(CAMPOS_PREGUNTA)}"}, status=400)
+        if 'dom_id' not in campos:
+            campos.insert(0, 'dom_id')
+        despues = _leer_cursor(request.GET.get('cursor'))
+        numero = int(request.GET['numero']) if request.GET.get('numero') else None
+    except (KeyError, ValueError):
+        return FastJsonResponse({'success': False, 'error': 'Parámetros inválidos'}, status=400)
 
-        unidades = UnidadRepository.list_all(
-            limit=1000,
-            programa_analitico_id=int(programa_id)
+    try:
+        snapshot = obtener_snapshot(partida_id)
+        if not snapshot:
+            return FastJsonResponse({'success': False, 'error': 'Partida no encontrada'}, status=404)
+        preguntas = _preguntas_de_snapshot(
+            snapshot, request.GET.get('programa_analitico'), request.GET.get('unidad')
         )
-        return JsonResponse(unidades, safe=False)
+        if numero is not None:
+            preguntas = [p for p in preguntas if int(p['numero']) == numero]
+
+        claves = [_clave_cursor(p) for p in preguntas]
+        inicio = bisect_right(claves, despues) if despues else 0
+        fin = inicio + limite
+        return FastJsonResponse({
+            'success': True,
+            'total': len(preguntas),
+            'preguntas': [{c: CAMPOS_PREGUNTA[c](p) for c in campos} for p in preguntas[inicio:fin]],
+            'siguiente': _escribir_cursor(claves[fin - 1]) if fin < len(preguntas) else None,
+        })
+    except PlazoAgotado:
+        raise
+    except Exception as e:
+        import logging
+        logger = logging.getLogger(__name__)
+        logger.error(f"Error al obtener preguntas: {e}")
+        return FastJsonResponse({'success': False, 'error': str(e)}, status=500)
+
+
+@require_http_methods(["GET"])
+def buscar_preguntas_api(request):
+    """API de búsqueda de texto completo en enunciado, explicación y opciones.
+
+    Parámetros: q, partida, asignatura, unidad, pagina, por_pagina. Los resultados
+    vienen ordenados por relevancia, con un fragmento resaltado.
+    """
+    try:
+        filtros = {}
+        for parametro, nombre in (('partida', 'partida_id'), ('asignatura', 'asignatura_id'), ('unidad', 'unidad_id')):
+            if request.GET.get(parametro):
+                filtros[nombre] = int(request.GET[parametro])
+        pagina = int(request.GET.get('pagina', 1))
+        por_pagina = int(request.GET.get('por_pagina', 20))
+    except ValueError:
+        return FastJsonResponse({'success': False, 'error': 'Parámetros inválidos'}, status=400)
+
+    buscar = buscar_preguntas_local if settings.BUSQUEDA_LOCAL else buscar_preguntas
+    try:
+        resultado = buscar(request.GET.get('q', ''), pagina=pagina, por_pagina=por_pagina, **filtros)
+        return FastJsonResponse({'success': True, **resultado})
+    except Exception as e:
+        import logging
+        logger = logging.getLogger(__name__)
+        logger.error(f"Error en la búsqueda de preguntas: {e}")
+        return FastJsonResponse({'success': False, 'error': str(e)}, status=500)
+
+
+@require_http_methods(["GET"])
+def duplicados_api(request):
+    """API con los grupos de preguntas casi duplicadas de una partida o asignatura.
+
+    Parámetros: partida o asignatura, umbral opcional (similitud de 0 a 1). Antes de
+    buscar se indexan las preguntas nuevas o modificadas de la asignatura.
+    """
+    # numpy se carga solo cuando se usa
+    from .duplicates import buscar_duplicados, indexar_partida
+
+    try:
+        partida_id = request.GET.get('partida')
+        asignatura_id = request.GET.get('asignatura')
+        umbral = float(request.GET['umbral']) if request.GET.get('umbral') else None
+        if partida_id:
+            asignatura_id, _ = indexar_partida(int(partida_id))
+            if asignatura_id is None:
+                return FastJsonResponse({'success': False, 'error': 'Partida no encontrada'}, status=404)
+        elif asignatura_id:
+            asignatura_id = int(asignatura_id)
+            partidas = PartidaRepository.list_all(limit=1, asignatura_id=asignatura_id)
+            if partidas:
+                indexar_partida(partidas[0]['partida_id'])
+        else:
+            return FastJsonResponse({'success': False, 'error': 'Partida o asignatura requerida'}, status=400)
+    except ValueError:
+        return FastJsonResponse({'success': False, 'error': 'Parámetros inválidos'}, status=400)
+
+    try:
+        grupos = buscar_duplicados(asignatura_id=asignatura_id, umbral=umbral)
+        return FastJsonResponse({'success': True, 'asignatura_id': asignatura_id, 'grupos': grupos})
+    except Exception as e:
+        import logging
+        logger = logging.getLogger(__name__)
+        logger.error(f"Error al buscar duplicados: {e}")
+        return FastJsonResponse({'success': False, 'error': str(e)}, status=500)
+
+
+@require_http_methods(["GET"])
+def validacion_api(request):
+    """API con el reporte de calidad de las preguntas de una partida o asignatura.
+
+    Parámetros: partida o asignatura; todas=1 incluye también las preguntas sin problemas.
+    """
+    from .validation import validar_partida
+
+    try:
+        partida_id = request.GET.get('partida')
+        asignatura_id = request.GET.get('asignatura')
+        if not partida_id and asignatura_id:
+            # Todas las partidas de la asignatura comparten preguntas
+            partidas = PartidaRepository.list_all(limit=1, asignatura_id=int(asignatura_id))
+            partida_id = partidas[0]['partida_id'] if partidas else None
+            if not partida_id:
+                return FastJsonResponse({'success': False, 'error': 'La asignatura no tiene partidas'}, status=404)
+        if not partida_id:
+            return FastJsonResponse({'success': False, 'error': 'Partida o asignatura requerida'}, status=400)
+        partida_id = int(partida_id)
+    except ValueError:
+        return FastJsonResponse({'success': False, 'error': 'Parámetros inválidos'}, status=400)
+
+    try:
+        reporte = validar_partida(partida_id, solo_problemas=request.GET.get('todas') != '1')
+        if reporte is None:
+            return FastJsonResponse({'success': False, 'error': 'Partida no encontrada'}, status=404)
+        return FastJsonResponse({'success': True, **reporte})
     except Exception as e:
-        return JsonResponse({'error': str(e)}, status=400)
+        import logging
+        logger = logging.getLogger(__name__)
+        logger.error(f"Error al validar preguntas: {e}")
+        return FastJsonResponse({'success': False, 'error': str(e)}, status=500)
 
 
 @csrf_protect
@@ -454,44 +686,115 @@ def update_pregunta_api(request, pregunta_id):
     try:
         data = json.loads(request.body)
         enunciado = data.get('enunciado', '').strip()
-        explicacion = data.get('explicacion', '').strip()
-        opciones = data.get('opciones', [])
 
         if not enunciado:
-            return JsonResponse({'success': False, 'error': 'Enunciado requerido'}, status=400)
+            return FastJsonResponse({'success': False, 'error': 'Enunciado requerido'}, status=400)
 
-        # Actualizar enunciado y explicación de la pregunta
-        pregunta = PreguntaRepository.update(int(pregunta_id), enunciado=enunciado, explicacion=explicacion)
+        # Estado actual en una sola consulta; solo se envía lo que cambió
+        pregunta = PreguntaRepository.get_with_opciones(int(pregunta_id))
         if not pregunta:
-            return JsonResponse({'success': False, 'error': 'Error al actualizar pregunta'}, status=400)
-
-        # Actualizar opciones
-        for opcion_data in opciones:
-            opcion_id = opcion_data.get('id')
-            texto = opcion_data.get('texto', '').strip()
-            es_correcta = opcion_data.get('es_correcta', False)
-
-            if opcion_id and opcion_id != 'new':
-                # Actualizar opción existente
-                OpcionRepository.update(
-                    int(opcion_id),
-                    opcion=texto,
-                    es_correcta=es_correcta
-                )
-            elif opcion_id == 'new' and texto:
-                # Crear nueva opción
-                OpcionRepository.create(
-                    opcion=texto,
-                    es_correcta=es_correcta,
-                    pregunta_id=int(pregunta_id)
-                )
+            return FastJsonResponse({'success': False, 'error': 'Pregunta no encontrada'}, status=404)
+
+        cambios = calcular_cambios(pregunta, data)
+        if not hay_cambios(cambios):
+            return FastJsonResponse({
+                'success': True,
+                'sin_cambios': True,
+                'message': 'No hay cambios que guardar'
+            })
+
+        aplicar_cambios(int(pregunta_id), cambios)
+        despues_de_escribir(refrescar_unidades, [pregunta['unidad_id']])
 
-        return JsonResponse({
+        return FastJsonResponse({
             'success': True,
             'message': 'Pregunta actualizada exitosamente'
         })
     except Exception as e:
-        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+        return FastJsonResponse({'success': False, 'error': str(e)}, status=400)
+
+
+@csrf_protect
+@require_http_methods(["POST"])
+def update_pregunta_virtual_api(request, unidad_id, numero):
+    """API para guardar una pregunta virtual: la crea en su primera edición - Supabase"""
+    try:
+        data = json.loads(request.body)
+        enunciado = data.get('enunciado', '').strip()
+
+        if not enunciado:
+            return FastJsonResponse({'success': False, 'error': 'Enunciado requerido'}, status=400)
+
+        # Si otra edición ya la guardó, se actualiza esa fila en lugar de duplicarla
+        pregunta = PreguntaRepository.get_by_unidad_numero(int(unidad_id), int(numero))
+        if not pregunta:
+            unidad = UnidadRepository.get_by_id(int(unidad_id))
+            if not unidad:
+                return FastJsonResponse({'success': False, 'error': 'Unidad no encontrada'}, status=404)
+            pregunta = PreguntaRepository.create(
+                enunciado=enunciado,
+                numero=int(numero),
+                unidad_id=int(unidad_id),
+                explicacion=data.get('explicacion', '').strip() or None
+            )
+            if not pregunta:
+                return FastJsonResponse({'success': False, 'error': 'Error al crear la pregunta'}, status=400)
+            pregunta['opciones'] = []
+
+        cambios = calcular_cambios(pregunta, data)
+        if hay_cambios(cambios):
+            aplicar_cambios(pregunta['pregunta_id'], cambios)
+        despues_de_escribir(refrescar_unidades, [int(unidad_id)])
+
+        return FastJsonResponse({
+            'success': True,
+            'pregunta_id': pregunta['pregunta_id'],
+            'message': 'Pregunta guardada exitosamente'
+        })
+    except Exception as e:
+        return FastJsonResponse({'success': False, 'error': str(e)}, status=400)
+
+
+@csrf_protect
+@require_http_methods(["POST"])
+def bulk_update_preguntas_api(request):
+    """API para editar muchas preguntas y sus opciones en una sola petición - Supabase"""
+    try:
+        data = json.loads(request.body)
+        ediciones = data.get('preguntas')
+        if not isinstance(ediciones, list) or not ediciones:
+            return FastJsonResponse({'success': False, 'error': 'Lista de preguntas requerida'}, status=400)
+        if len(ediciones) > settings.EDICION_MASIVA_MAX_PREGUNTAS:
+            return FastJsonResponse({
+                'success': False,
+                'error': f'Máximo {settings.EDICION_MASIVA_MAX_PREGUNTAS} preguntas por petición'
+            }, status=400)
+
+        resultados = aplicar_edicion_masiva(ediciones)
+        # Las parciales y las inciertas también pudieron cambiar en la base
+        despues_de_escribir(refrescar_preguntas, [
+            r['pregunta_id'] for r in resultados if r['estado'] in ('actualizada', 'parcial', 'incierta')
+        ])
+        totales = {'actualizadas': 0, 'sin_cambios': 0, 'parciales': 0, 'inciertas': 0, 'errores': 0}
+        por_estado = {'actualizada': 'actualizadas', 'sin_cambios': 'sin_cambios', 'parcial': 'parciales', 'incierta': 'inciertas'}
+        for resultado in resultados:
+            totales[por_estado.get(resultado['estado'], 'errores')] += 1
+
+        mensaje = f"{totales['actualizadas']} preguntas actualizadas, {totales['errores']} con errores"
+        if totales['parciales'] or totales['inciertas']:
+            mensaje += (
+                f", {totales['parciales']} aplicadas parcialmente y {totales['inciertas']} sin confirmar"
+                " (revisa su estado antes de reintentar)"
+            )
+        return FastJsonResponse({
+            # Cada lote se confirma por separado: con errores, parte de la petición pudo quedar escrita
+            'success': totales['actualizadas'] + totales['sin_cambios'] == len(resultados),
+            'message': mensaje,
+            'resultados': resultados,
+            **totales
+        })
+    except Exception as e:
+        return FastJsonResponse({'success': False, 'error': str(e)}, status=400)
 
 
 @csrf_protect
@@ -499,381 +802,430 @@ def update_pregunta_api(request, pregunta_id):
 def delete_opcion_api(request, opcion_id):
     """API para eliminar opción - Supabase"""
     try:
-        success = OpcionRepository.delete(int(opcion_id))
+        success, opcion = OpcionRepository.delete(int(opcion_id))
         if success:
-            return JsonResponse({'success': True, 'message': 'Opción eliminada exitosamente'})
+            if opcion:
+                despues_de_escribir(refrescar_preguntas, [opcion['pregunta_id']])
+            return FastJsonResponse({'success': True, 'message': 'Opción eliminada exitosamente'})
         else:
-            return JsonResponse({'success': False, 'error': 'Error al eliminar opción'}, status=400)
+            return FastJsonResponse({'success': False, 'error': 'Error al eliminar opción'}, status=400)
     except Exception as e:
-        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+        return FastJsonResponse({'success': False, 'error': str(e)}, status=400)
 
 
 def obtener_prompt(request):
     """API para obtener prompt de generación de preguntas - Supabase"""
     try:
         partida_id = request.GET.get('partida')
-        programa_id = request.GET.get('programa_analitico')
         unidad_id = request.GET.get('unidad')
 
         if not partida_id:
-            return JsonResponse({'success': False, 'error': 'Partida requerida'}, status=400)
-
-        # Obtener datos de la partida
-        partida = PartidaRepository.get_by_id(int(partida_id))
-        if not partida:
-            return JsonResponse({'success': False, 'error': 'Partida no encontrada'}, status=404)
-
-        # Obtener asignatura
-        asignatura = AsignaturaRepository.get_by_id(partida['asignatura_id'])
-        if not asignatura:
-            return JsonResponse({'success': False, 'error': 'Asignatura no encontrada'}, status=404)
-
-        # Obtener carrera
-        carrera = None
-        if asignatura.get('carrera_id'):
-            carrera = CarreraRepository.get_by_id(asignatura['carrera_id'])
-
-        # Obtener programas analíticos
-        programas = ProgramaAnaliticoRepository.list_by_asignatura(
-            asignatura_id=asignatura['asignatura_id']
-        )
+            return FastJsonResponse({'success': False, 'error': 'Partida requerida'}, status=400)
+
+        # Árbol de la partida ya armado (asignatura, carrera, programas, unidades y preguntas)
+        snapshot = obtener_snapshot(int(partida_id))
+        if not snapshot:
+            return FastJsonResponse({'success': False, 'error': 'Partida no encontrada'}, status=404)
 
         # Obtener unidades y preguntas
         unidades_data = []
         unidad_actual = None  # Para almacenar la unidad actual si se filtra
 
-        for programa in programas:
-            unidades = UnidadRepository.list_all(
-                limit=1000,
-                programa_analitico_id=programa['linea_educativa_id']
-            )
+        for unidad in snapshot['unidades']:
+            # Filtrar por unidad específica si se proporciona
+            if unidad_id and unidad['unidad_id'] != int(unidad_id):
+                continue
 
-            for unidad in unidades:
-                # Filtrar por unidad específica si se proporciona
-                if unidad_id and unidad['unidad_id'] != int(unidad_id):
-                    continue
+            # Guardar la unidad actual si se está filtrando por unidad específica
+            if unidad_id:
+                unidad_actual = {
+                    'numero': unidad['numero_unidad'],
+                    'descripcion': unidad['descripcion']
+                }
 
-                # Guardar la unidad actual si se está filtrando por unidad específica
-                if unidad_id and unidad['unidad_id'] == int(unidad_id):
-                    unidad_actual = {
-                        'numero': unidad['numero_unidad'],
-                        'descripcion': unidad['descripcion']
-                    }
+            if unidad['preguntas']:  # Solo agregar si tiene preguntas
+                unidades_data.append(_unidad_para_prompt(unidad))
 
-                # Obtener preguntas de la unidad
-                preguntas = PreguntaRepository.list_all(limit=1000, unidad_id=unidad['unidad_id'])
+        # Generar prompt con información de unidad actual
+        prompt = generar_prompt_texto(
+            snapshot['partida'], snapshot['asignatura'], snapshot['carrera'],
+            snapshot['programas'], unidades_data, unidad_actual
+        )
 
-                unidad_info = {
-                    'numero': unidad['numero_unidad'],
-                    'descripcion': unidad['descripcion'],
-                    'preguntas': []
-                }
+        return FastJsonResponse({
+            'success': True,
+            'prompt': prompt
+        })
 
-                for pregunta in preguntas:
-                    # Obtener opciones de la pregunta
-                    opciones = OpcionRepository.list_all(limit=1000, pregunta_id=pregunta['pregunta_id'])
+    except Exception as e:
+        return FastJsonResponse({'success': False, 'error': str(e)}, status=400)
+
+
+def _unidad_para_prompt(unidad):
+    """Convierte una unidad del árbol de la partida al formato de generar_prompt_texto."""
+    return {
+        'numero': unidad['numero_unidad'],
+        'descripcion': unidad['descripcion'],
+        'preguntas': [
+            {
+                'numero': pregunta['numero'],
+                'enunciado': pregunta['enunciado'],
+                'opciones': [
+                    {'texto': opcion['opcion'], 'es_correcta': opcion['es_correcta']}
+                    for opcion in pregunta.get('opciones', [])
+                ],
+            }
+            for pregunta in unidad.get('preguntas', [])
+        ],
+    }
 
-                    pregunta_info = {
-                        'numero': pregunta['numero'],
-                        'enunciado': pregunta['enunciado'],
-                        'opciones': []
-                    }
 
-                    for opcion in opciones:
-                        pregunta_info['opciones'].append({
-                            'texto': opcion['opcion'],
-                            'es_correcta': opcion['es_correcta']
-                        })
+def _texto_asignacion_lote(unidad, numeros):
+    """Indica al modelo qué números de pregunta debe generar en este prompt."""
+    es_contiguo = numeros == list(range(numeros[0], numeros[0] + len(numeros)))
+    if es_contiguo:
+        numeracion = f"numeradas de la {numeros[0]} a la {numeros[-1]}"
+    else:
+        numeracion = "numeradas: " + ", ".join(str(n) for n in numeros)
+    return (
+        "ASIGNACIÓN DE ESTE LOTE\n"
+        f"- Unidad {unidad['numero_unidad']}: {unidad['descripcion']}\n"
+        f"- Genera EXACTAMENTE {len(numeros)} preguntas, {numeracion}.\n"
+    )
 
-                    unidad_info['preguntas'].append(pregunta_info)
 
-                if unidad_info['preguntas']:  # Solo agregar si tiene preguntas
-                    unidades_data.append(unidad_info)
+def generar_prompts_lote(arbol, unidad_ids=None, max_chars=None):
+    """Genera los prompts de cada unidad del árbol ya cargado.
 
-        # Generar prompt con información de unidad actual
-        prompt = generar_prompt_texto(
-            partida, asignatura, carrera, programas, unidades_data, unidad_actual
+    Si se indica ``max_chars``, las preguntas de una unidad se reparten en varios
+    prompts para que el prompt más la salida esperada (PROMPT_CHARS_POR_PREGUNTA
+    por pregunta) no superen el presupuesto.
+    """
+    chars_por_pregunta = settings.PROMPT_CHARS_POR_PREGUNTA
+
+    for unidad in arbol['unidades']:
+        if unidad_ids and unidad['unidad_id'] not in unidad_ids:
+            continue
+
+        unidad_prompt = _unidad_para_prompt(unidad)
+        unidades_data = [unidad_prompt] if unidad_prompt['preguntas'] else []
+        unidad_actual = {'numero': unidad['numero_unidad'], 'descripcion': unidad['descripcion']}
+        prompt_base = generar_prompt_texto(
+            arbol['partida'], arbol['asignatura'], arbol['carrera'],
+            arbol['programas'], unidades_data, unidad_actual
         )
 
-        return JsonResponse({
+        numeros = sorted(int(p['numero']) for p in unidad_prompt['preguntas'])
+        if not numeros:
+            lotes = [[]]
+        elif max_chars:
+            disponible = max_chars - len(prompt_base) - len(_texto_asignacion_lote(unidad, numeros))
+            por_lote = max(1, disponible // chars_por_pregunta)
+            lotes = [numeros[i:i + por_lote] for i in range(0, len(numeros), por_lote)]
+        else:
+            lotes = [numeros]
+
+        for parte, lote in enumerate(lotes, 1):
+            prompt = prompt_base + _texto_asignacion_lote(unidad, lote) if lote else prompt_base
+            caracteres = len(prompt) + len(lote) * chars_por_pregunta
+            yield {
+                'unidad_id': unidad['unidad_id'],
+                'numero_unidad': unidad['numero_unidad'],
+                'descripcion': unidad['descripcion'],
+                'parte': parte,
+                'total_partes': len(lotes),
+                'preguntas': lote,
+                'caracteres_estimados': caracteres,
+                'tokens_estimados': caracteres // settings.PROMPT_CHARS_POR_TOKEN,
+                'excede_presupuesto': bool(max_chars) and caracteres > max_chars,
+                'prompt': prompt,
+            }
+
+
+def obtener_prompts_lote(request):
+    """API para obtener los prompts de todas (o varias) unidades de una partida en una llamada - Supabase"""
+    try:
+        partida_id = request.GET.get('partida')
+        if not partida_id:
+            return FastJsonResponse({'success': False, 'error': 'Partida requerida'}, status=400)
+
+        unidad_ids = None
+        if request.GET.get('unidades'):
+            unidad_ids = {int(u) for u in request.GET['unidades'].split(',') if u.strip()}
+
+        max_chars = settings.PROMPT_MAX_CHARS
+        if request.GET.get('max_chars'):
+            max_chars = int(request.GET['max_chars'])
+        elif request.GET.get('max_tokens'):
+            max_chars = int(request.GET['max_tokens']) * settings.PROMPT_CHARS_POR_TOKEN
+
+        # El árbol se lee una sola vez (snapshot) para todas las unidades
+        arbol = obtener_snapshot(int(partida_id))
+        if not arbol:
+            return FastJsonResponse({'success': False, 'error': 'Partida no encontrada'}, status=404)
+
+        prompts = generar_prompts_lote(arbol, unidad_ids, max_chars)
+
+        if request.GET.get('formato') == 'ndjson':
+            from django.http import StreamingHttpResponse
+            lineas = (json.dumps(item, ensure_ascii=False) + '\n' for item in prompts)
+            return StreamingHttpResponse(lineas, content_type='application/x-ndjson; charset=utf-8')
+
+        return FastJsonResponse({
             'success': True,
-            'prompt': prompt
+            'prompts': list(prompts)
         })
 
     except Exception as e:
-        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+        return FastJsonResponse({'success': False, 'error': str(e)}, status=400)
+
+
+def construir_documento_partida(partida_id, progreso=None):
+    """Arma el documento Word del banco de la partida y devuelve (nombre_archivo, contenido).
+
+    Lanza ValueError si la partida, la asignatura o las preguntas no existen.
+    """
+    from docx import Document
+    import io
+    import logging
+
+    logger = logging.getLogger(__name__)
+
+    # Árbol de la partida ya armado (similar a obtener_prompt)
+    snapshot = obtener_snapshot(int(partida_id))
+    if not snapshot:
+        logger.error(f"Partida {partida_id} no encontrada")
+        raise ValueError('Partida no encontrada')
+
+    partida = snapshot['partida']
+    asignatura = snapshot['asignatura']
+    carrera = snapshot['carrera']
+
+    # Preguntas con límites para evitar documentos muy grandes
+    unidades_data = []
+    total_preguntas = 0
+    max_preguntas = 500  # Límite para evitar documentos muy grandes
+
+    for unidad in snapshot['unidades']:
+        if total_preguntas >= max_preguntas:
+            logger.warning(f"Límite de {max_preguntas} preguntas alcanzado")
+            break
+
+        unidad_info = {
+            'numero': unidad['numero_unidad'],
+            'descripcion': unidad['descripcion'],
+            'preguntas': []
+        }
+
+        # Limitar preguntas por unidad (ya ordenadas por número, con las virtuales)
+        for pregunta in unidad['preguntas'][:50]:
+            if total_preguntas >= max_preguntas:
+                break
+
+            unidad_info['preguntas'].append({
+                'numero': pregunta['numero'],
+                'enunciado': pregunta['enunciado'],
+                'explicacion': pregunta.get('explicacion', ''),
+                'opciones': [
+                    {'texto': opcion['opcion'], 'es_correcta': opcion['es_correcta']}
+                    for opcion in pregunta.get('opciones', [])[:10]
+                ]
+            })
+            total_preguntas += 1
+
+        if unidad_info['preguntas']:
+            unidades_data.append(unidad_info)
+
+    if progreso:
+        # El render del documento es la parte lenta
+        progreso(20, f'{total_preguntas} preguntas cargadas')
+
+    logger.info(f"Generando documento con {total_preguntas} preguntas en {len(unidades_data)} unidades")
+
+    # Verificar que hay datos para generar
+    if not unidades_data:
+        logger.warning("No se encontraron preguntas para generar el documento")
+        raise ValueError('No se encontraron preguntas para generar el documento')
+
+    # Generar documento Word
+    doc = generar_documento_word(partida, asignatura, carrera, unidades_data)
+
+    # Sanitizar nombre de archivo
+    safe_filename = "".join(c for c in partida["descripcion"] if c.isalnum() or c in (' ', '-', '_')).rstrip()
+
+    # Guardar documento en memoria
+    doc_buffer = io.BytesIO()
+    doc.save(doc_buffer)
+    return f'preguntas_{safe_filename}.docx', doc_buffer.getvalue()
 
 
 def descargar_google_docs(request):
     """API para descargar documento de Google Docs - Supabase"""
     try:
         from django.http import HttpResponse
-        from docx import Document
-        from docx.shared import Inches
-        import io
         import logging
 
         logger = logging.getLogger(__name__)
         logger.info(f"Iniciando descarga de documento para partida: {request.GET.get('partida')}")
 
         partida_id = request.GET.get('partida')
-        programa_id = request.GET.get('programa_analitico')
-        unidad_id = request.GET.get('unidad')
 
         if not partida_id:
             logger.error("Partida no proporcionada")
-            return JsonResponse({'success': False, 'error': 'Partida requerida'}, status=400)
+            return FastJsonResponse({'success': False, 'error': 'Partida requerida'}, status=400)
 
-        # Obtener datos (similar a obtener_prompt)
-        partida = PartidaRepository.get_by_id(int(partida_id))
-        if not partida:
-            logger.error(f"Partida {partida_id} no encontrada")
-            return JsonResponse({'success': False, 'error': 'Partida no encontrada'}, status=404)
+        # Solo con el worker activo el documento se genera como tarea; sin él nadie la procesaría
+        if tareas_en_segundo_plano():
+            tarea_obj = encolar('documento_word', partida_id=int(partida_id))
+            return FastJsonResponse({'success': True, **_urls_tarea(tarea_obj)}, status=202)
 
-        asignatura = AsignaturaRepository.get_by_id(partida['asignatura_id'])
-        if not asignatura:
-            logger.error(f"Asignatura {partida['asignatura_id']} no encontrada")
-            return JsonResponse({'success': False, 'error': 'Asignatura no encontrada'}, status=404)
-
-        carrera = None
-        if asignatura.get('carrera_id'):
-            carrera = CarreraRepository.get_by_id(asignatura['carrera_id'])
+        try:
+            nombre_archivo, contenido = construir_documento_partida(partida_id)
+        except ValueError as e:
+            return FastJsonResponse({'success': False, 'error': str(e)}, status=404)
 
-        # Obtener datos de preguntas con límites para evitar documentos muy grandes
-        unidades_data = []
-        programas = ProgramaAnaliticoRepository.list_by_asignatura(
-            asignatura_id=asignatura['asignatura_id']
+        # Crear respuesta HTTP
+        response = HttpResponse(
+            content_type='application/vnd.openxmlformats-officedocument.wordprocessingml.document'
         )
+        response['Content-Disposition'] = f'attachment; filename="{nombre_archivo}"'
+        response.write(contenido)
+        logger.info("Documento generado exitosamente")
+        return response
 
-        total_preguntas = 0
-        max_preguntas = 500  # Límite para evitar documentos muy grandes
-
-        for programa in programas:
-            if total_preguntas >= max_preguntas:
-                logger.warning(f"Límite de {max_preguntas} preguntas alcanzado")
-                break
-                
-            unidades = UnidadRepository.list_all(
-                limit=100,
-                programa_analitico_id=programa['linea_educativa_id']
-            )
+    except Exception as e:
+        logger.error(f"Error al generar documento: {str(e)}", exc_info=True)
+        return FastJsonResponse({'success': False, 'error': f'Error interno: {str(e)}'}, status=500)
 
-            for unidad in unidades:
-                if total_preguntas >= max_preguntas:
-                    break
-                    
-                # Limitar preguntas por unidad
-                preguntas = PreguntaRepository.list_all(limit=50, unidad_id=unidad['unidad_id'])
 
-                unidad_info = {
-                    'numero': unidad['numero_unidad'],
-                    'descripcion': unidad['descripcion'],
-                    'preguntas': []
-                }
+def exportar_banco(request):
+    """API para exportar el banco completo en streaming (JSONL, CSV, GIFT, Moodle XML) - Supabase"""
+    from django.http import StreamingHttpResponse
 
-                # Ordenar preguntas por número
-                preguntas_ordenadas = sorted(preguntas, key=lambda x: int(x.get('numero', 0)))
-                
-                for pregunta in preguntas_ordenadas:
-                    if total_preguntas >= max_preguntas:
-                        break
-                        
-                    opciones = OpcionRepository.list_all(limit=10, pregunta_id=pregunta['pregunta_id'])
+    formato = request.GET.get('formato', 'jsonl')
+    if formato not in FORMATOS_EXPORTACION:
+        return FastJsonResponse({
+            'success': False,
+            'error': f"Formato no soportado. Use uno de: {', '.join(FORMATOS_EXPORTACION)}"
+        }, status=400)
 
-                    pregunta_info = {
-                        'numero': pregunta['numero'],
-                        'enunciado': pregunta['enunciado'],
-                        'explicacion': pregunta.get('explicacion', ''),
-                        'opciones': []
-                    }
+    try:
+        partida_id = request.GET.get('partida')
+        asignatura_id = request.GET.get('asignatura')
+        nombre = 'banco'
 
-                    for opcion in opciones:
-                        pregunta_info['opciones'].append({
-                            'texto': opcion['opcion'],
-                            'es_correcta': opcion['es_correcta']
-                        })
+        if partida_id:
+            partida = PartidaRepository.get_by_id(int(partida_id))
+            if not partida:
+                return FastJsonResponse({'success': False, 'error': 'Partida no encontrada'}, status=404)
+            asignatura_id = partida['asignatura_id']
+            nombre = partida['descripcion']
+        elif asignatura_id:
+            asignatura = AsignaturaRepository.get_by_id(int(asignatura_id))
+            if not asignatura:
+                return FastJsonResponse({'success': False, 'error': 'Asignatura no encontrada'}, status=404)
+            nombre = asignatura['descripcion']
+        else:
+            return FastJsonResponse({'success': False, 'error': 'Partida o asignatura requerida'}, status=400)
 
-                    unidad_info['preguntas'].append(pregunta_info)
-                    total_preguntas += 1
+        programas = ProgramaAnaliticoRepository.list_by_asignatura(asignatura_id=int(asignatura_id))
+        orden_programa = {p['linea_educativa_id']: i for i, p in enumerate(programas)}
+        unidades = UnidadRepository.list_by_programas(list(orden_programa))
+        unidades.sort(key=lambda u: (orden_programa[u['programa_analitico_id']], u['numero_unidad']))
+    except Exception as e:
+        return FastJsonResponse({'success': False, 'error': str(e)}, status=400)
 
-                if unidad_info['preguntas']:
-                    unidades_data.append(unidad_info)
+    # Las preguntas se leen página a página mientras se envía la respuesta
+    generador, content_type, extension = FORMATOS_EXPORTACION[formato]
+    preguntas = completar_stream(unidades, PreguntaRepository.iter_with_opciones([u['unidad_id'] for u in unidades]))
+    response = StreamingHttpResponse(generador(unidades, preguntas), content_type=content_type)
 
-        logger.info(f"Generando documento con {total_preguntas} preguntas en {len(unidades_data)} unidades")
+    safe_filename = "".join(c for c in nombre if c.isalnum() or c in (' ', '-', '_')).rstrip()
+    response['Content-Disposition'] = f'attachment; filename="preguntas_{safe_filename}.{extension}"'
+    return response
 
-        # Verificar que hay datos para generar
-        if not unidades_data:
-            logger.warning("No se encontraron preguntas para generar el documento")
-            return JsonResponse({'success': False, 'error': 'No se encontraron preguntas para generar el documento'}, status=404)
 
-        # Generar documento Word
-        doc = generar_documento_word(partida, asignatura, carrera, unidades_data)
+@csrf_protect
+@require_http_methods(["POST"])
+def importar_preguntas_llm(request):
+    """API para cargar en el banco la salida del modelo (JSON o texto) por número de pregunta - Supabase"""
+    try:
+        partida_id = request.GET.get('partida')
+        if not partida_id:
+            return FastJsonResponse({'success': False, 'error': 'Partida requerida'}, status=400)
+        unidad_id = request.GET.get('unidad')
+        programa_id = request.GET.get('programa')
 
-        # Crear respuesta HTTP
-        response = HttpResponse(
-            content_type='application/vnd.openxmlformats-officedocument.wordprocessingml.document'
+        # Archivo subido o texto plano en el cuerpo; en ambos casos se lee por bloques
+        if request.content_type == 'multipart/form-data':
+            archivo = request.FILES.get('archivo')
+            if not archivo:
+                return FastJsonResponse({'success': False, 'error': 'Archivo requerido'}, status=400)
+        else:
+            archivo = request
+
+        resumen = importar_salida_llm(
+            partida_id=int(partida_id),
+            chunks=leer_texto(archivo),
+            unidad_id=int(unidad_id) if unidad_id else None,
+            programa_id=int(programa_id) if programa_id else None,
+            dry_run=request.GET.get('dry_run') == '1',
         )
-        
-        # Sanitizar nombre de archivo
-        safe_filename = "".join(c for c in partida["descripcion"] if c.isalnum() or c in (' ', '-', '_')).rstrip()
-        response['Content-Disposition'] = f'attachment; filename="preguntas_{safe_filename}.docx"'
-
-        # Guardar documento en memoria
-        doc_buffer = io.BytesIO()
-        doc.save(doc_buffer)
-        doc_buffer.seek(0)
+        return FastJsonResponse({
+            'success': True,
+            'message': f"{resumen['actualizadas']} preguntas actualizadas y {resumen['creadas']} creadas",
+            **resumen
+        })
+    except Exception as e:
+        return FastJsonResponse({'success': False, 'error': str(e)}, status=400)
 
-        response.write(doc_buffer.getvalue())
-        logger.info("Documento generado exitosamente")
-        return response
 
+@csrf_protect
+@require_http_methods(["POST"])
+def importar_banco_api(request):
+    """API para cargar un banco existente (DOCX o CSV) en las unidades de una partida - Supabase"""
+    try:
+        partida_id = request.GET.get('partida')
+        if not partida_id:
+            return FastJsonResponse({'success': False, 'error': 'Partida requerida'}, status=400)
+        archivo = request.FILES.get('archivo')
+        if not archivo:
+            return FastJsonResponse({'success': False, 'error': 'Archivo requerido'}, status=400)
+
+        formato = request.GET.get('formato') or archivo.name.rsplit('.', 1)[-1].lower()
+        programa_id = request.GET.get('programa')
+        resumen = importar_banco(
+            partida_id=int(partida_id),
+            items=items_banco(archivo, formato),
+            programa_id=int(programa_id) if programa_id else None,
+            dry_run=request.GET.get('dry_run') == '1',
+        )
+        return FastJsonResponse({
+            'success': True,
+            'message': f"{resumen['creadas']} preguntas creadas y {resumen['actualizadas']} actualizadas",
+            **resumen
+        })
     except Exception as e:
-        logger.error(f"Error al generar documento: {str(e)}", exc_info=True)
-        return JsonResponse({'success': False, 'error': f'Error interno: {str(e)}'}, status=500)
+        return FastJsonResponse({'success': False, 'error': str(e)}, status=400)
 
 
 def extraer_contexto_por_unidad(contexto_completo, numero_unidad):
     """
     Extrae el contexto específico de una unidad del contexto completo del programa analítico.
     Maneja el formato real: Contexto general + Unidades con temas y subtemas.
+    El contexto se analiza una sola vez (ver context_index) y cada unidad es una búsqueda directa.
     """
     if not contexto_completo or not numero_unidad:
         return contexto_completo
-    
-    # Convertir a string y limpiar
-    contexto = str(contexto_completo).strip()
-    numero_unidad = int(numero_unidad)
-    
-    # Buscar la sección "Unidades, temas y subtemas"
-    seccion_unidades = "Unidades, temas y subtemas"
-    pos_seccion = contexto.lower().find(seccion_unidades.lower())
-    
-    if pos_seccion == -1:
-        # Si no encuentra la sección, buscar directamente la unidad
-        return _buscar_unidad_directa(contexto, numero_unidad)
-    
-    # Extraer desde la sección de unidades hasta el final
-    contexto_unidades = contexto[pos_seccion:].strip()
-    
-    # Buscar la unidad específica
-    patrones_unidad = [
-        f"Unidad {numero_unidad}:",
-        f"Unidad {numero_unidad} ",
-    ]
-    
-    inicio_unidad = -1
-    for patron in patrones_unidad:
-        pos = contexto_unidades.lower().find(patron.lower())
-        if pos != -1:
-            inicio_unidad = pos
-            break
-    
-    if inicio_unidad == -1:
-        # Si no encuentra la unidad específica, devolver todo el contexto
-        return contexto
-    
-    # Buscar el final de la unidad (siguiente unidad o final del texto)
-    siguiente_unidad = numero_unidad + 1
-    fin_unidad = len(contexto_unidades)
-    
-    # Buscar la siguiente unidad
-    patrones_siguiente = [
-        f"Unidad {siguiente_unidad}:",
-        f"Unidad {siguiente_unidad} ",
-    ]
-    
-    for patron in patrones_siguiente:
-        pos = contexto_unidades.lower().find(patron.lower(), inicio_unidad + 1)
-        if pos != -1:
-            fin_unidad = pos
-            break
-    
-    # Extraer el contexto de la unidad
-    contexto_unidad = contexto_unidades[inicio_unidad:fin_unidad].strip()
-    
-    # Si el contexto extraído es muy corto, devolver el contexto completo
-    if len(contexto_unidad) < 50:
-        return contexto
-    
-    # Construir el contexto completo: contexto general + unidad específica
-    contexto_general = contexto[:pos_seccion].strip()
-    
-    # Buscar el título de la sección de unidades
-    titulo_seccion = "Unidades, temas y subtemas (tal como en el programa)"
-    if titulo_seccion.lower() in contexto.lower():
-        # Incluir el título de la sección
-        resultado = f"{contexto_general}\n\n{titulo_seccion}\n\n{contexto_unidad}"
-    else:
-        resultado = f"{contexto_general}\n\n{seccion_unidades}\n\n{contexto_unidad}"
-    
-    return resultado
+
+    return obtener_indice_contexto(contexto_completo).extraer(int(numero_unidad))
 
 
 def _buscar_unidad_directa(contexto, numero_unidad):
     """
     Busca la unidad directamente en el contexto sin sección específica.
     """
-    patrones_unidad = [
-        f"Unidad {numero_unidad}:",
-        f"Unidad {numero_unidad} ",
-        f"Tema {numero_unidad}:",
-        f"Tema {numero_unidad} ",
-        f"Capítulo {numero_unidad}:",
-        f"Capítulo {numero_unidad} ",
-    ]
-    
-    # Buscar el inicio de la unidad
-    inicio_unidad = -1
-    for patron in patrones_unidad:
-        pos = contexto.lower().find(patron.lower())
-        if pos != -1:
-            inicio_unidad = pos
-            break
-    
-    if inicio_unidad == -1:
-        # Si no encuentra patrones específicos, buscar por número
-        import re
-        patron_numero = rf'\b{numero_unidad}\.?\s*[:\-]?\s*'
-        match = re.search(patron_numero, contexto, re.IGNORECASE)
-        if match:
-            inicio_unidad = match.start()
-    
-    if inicio_unidad == -1:
-        # Si no encuentra la unidad específica, devolver todo el contexto
-        return contexto
-    
-    # Buscar el final de la unidad (siguiente unidad o final del texto)
-    siguiente_unidad = numero_unidad + 1
-    fin_unidad = len(contexto)
-    
-    # Buscar la siguiente unidad
-    for siguiente_num in range(siguiente_unidad, siguiente_unidad + 3):  # Buscar hasta 3 unidades adelante
-        patrones_siguiente = [
-            f"Unidad {siguiente_num}:",
-            f"Unidad {siguiente_num} ",
-            f"Tema {siguiente_num}:",
-            f"Tema {siguiente_num} ",
-            f"Capítulo {siguiente_num}:",
-            f"Capítulo {siguiente_num} ",
-        ]
-        
-        for patron in patrones_siguiente:
-            pos = contexto.lower().find(patron.lower(), inicio_unidad + 1)
-            if pos != -1:
-                fin_unidad = pos
-                break
-        
-        if fin_unidad < len(contexto):
-            break
-    
-    # Extraer el contexto de la unidad
-    contexto_unidad = contexto[inicio_unidad:fin_unidad].strip()
-    
-    # Si el contexto extraído es muy corto, devolver el contexto completo
-    if len(contexto_unidad) < 50:
-        return contexto
-    
-    return contexto_unidad
+    return obtener_indice_contexto(contexto, directo=True).extraer(int(numero_unidad))
 
 
 def generar_prompt_texto(partida, asignatura, carrera, programas, unidades_data, unidad_actual=None):
@@ -1178,119 +1530,194 @@ def generar_documento_word(partida, asignatura, carrera, unidades_data):
         # Contador global de preguntas para numeración continua
         contador_pregunta_global = 1
 
-        # Preguntas por unidad
+        # Preguntas por unidad: los fragmentos ya renderizados se reutilizan desde la caché
+        body = doc.element.body
+        fragmentos_reutilizados = 0
         for unidad in unidades_data:
+            clave = clave_fragmento_unidad(unidad, contador_pregunta_global)
+            fragmento = obtener_fragmento(clave)
+            if fragmento is not None:
+                insertar_fragmento(doc, fragmento)
+                fragmentos_reutilizados += 1
+                contador_pregunta_global += len(unidad.get('preguntas', []))
+                continue
+
+            elementos_antes = len(body)
+            contador_pregunta_global, completa = _agregar_unidad_word(
+                doc, unidad, contador_pregunta_global, logger
+            )
+            if completa:
+                # Los elementos nuevos quedan antes de sectPr, que siempre es el último hijo
+                guardar_fragmento(clave, list(body)[elementos_antes - 1:-1])
+
+        logger.info(f"Fragmentos de unidad reutilizados desde caché: {fragmentos_reutilizados}/{len(unidades_data)}")
+        logger.info(f"Documento generado con {contador_pregunta_global - 1} preguntas")
+        return doc
+
+    except Exception as e:
+        logger.error(f"Error crítico al generar documento: {e}", exc_info=True)
+        raise e
+
+
+def _agregar_unidad_word(doc, unidad, contador_pregunta_global, logger):
+    """Agrega al documento el título y las preguntas de una unidad.
+
+    Retorna el contador global actualizado y si la unidad se renderizó sin errores.
+    """
+    from docx.shared import Inches, Pt, RGBColor
+    from docx.enum.text import WD_ALIGN_PARAGRAPH
+
+    # Una opción o pregunta omitida deja el fragmento incompleto: no se guarda en caché
+    completa = True
+    try:
+        # Título de la unidad (sin color de tema)
+        unidad_desc = str(unidad.get('descripcion', ''))[:200]  # Limitar longitud
+        unidad_heading = doc.add_paragraph(
+            f'UNIDAD {unidad.get("numero", "?")}: {unidad_desc}',
+            style='UnidadTitulo'
+        )
+        unidad_heading.alignment = WD_ALIGN_PARAGRAPH.LEFT
+
+        # Preguntas de la unidad
+        for pregunta in unidad.get('preguntas', []):
             try:
-                # Título de la unidad (sin color de tema)
-                unidad_desc = str(unidad.get('descripcion', ''))[:200]  # Limitar longitud
-                unidad_heading = doc.add_paragraph(
-                    f'UNIDAD {unidad.get("numero", "?")}: {unidad_desc}',
-                    style='UnidadTitulo'
+                # Título de la pregunta con estilo propio
+                numero_pregunta = pregunta.get('numero', contador_pregunta_global)
+                pregunta_paragraph = doc.add_paragraph(
+                    f'Pregunta {numero_pregunta}',
+                    style='PreguntaTitulo'
                 )
-                unidad_heading.alignment = WD_ALIGN_PARAGRAPH.LEFT
-
-                # Preguntas de la unidad
-                for pregunta in unidad.get('preguntas', []):
+                pregunta_paragraph.alignment = WD_ALIGN_PARAGRAPH.LEFT
+
+                # Enunciado de la pregunta
+                enunciado_paragraph = doc.add_paragraph()
+                enunciado_paragraph.alignment = WD_ALIGN_PARAGRAPH.JUSTIFY
+                enunciado_text = str(pregunta.get('enunciado', ''))[:500]  # Limitar longitud
+                enunciado_run = enunciado_paragraph.add_run(enunciado_text)
+                enunciado_run.font.size = Pt(11)
+                enunciado_run.font.color.rgb = RGBColor(0, 0, 0)
+
+                # Opciones
+                opciones_heading = doc.add_paragraph()
+                opciones_heading_run = opciones_heading.add_run('Opciones:')
+                opciones_heading.alignment = WD_ALIGN_PARAGRAPH.LEFT
+                opciones_heading_run.font.color.rgb = RGBColor(0, 0, 0)
+
+                opciones = pregunta.get('opciones', [])
+                for i, opcion in enumerate(opciones[:10], 1):  # Limitar a 10 opciones
                     try:
-                        # Título de la pregunta con estilo propio
-                        numero_pregunta = pregunta.get('numero', contador_pregunta_global)
-                        pregunta_paragraph = doc.add_paragraph(
-                            f'Pregunta {numero_pregunta}',
-                            style='PreguntaTitulo'
-                        )
-                        pregunta_paragraph.alignment = WD_ALIGN_PARAGRAPH.LEFT
-
-                        # Enunciado de la pregunta
-                        enunciado_paragraph = doc.add_paragraph()
-                        enunciado_paragraph.alignment = WD_ALIGN_PARAGRAPH.JUSTIFY
-                        enunciado_text = str(pregunta.get('enunciado', ''))[:500]  # Limitar longitud
-                        enunciado_run = enunciado_paragraph.add_run(enunciado_text)
-                        enunciado_run.font.size = Pt(11)
-                        enunciado_run.font.color.rgb = RGBColor(0, 0, 0)
-
-                        # Opciones
-                        opciones_heading = doc.add_paragraph()
-                        opciones_heading_run = opciones_heading.add_run('Opciones:')
-                        opciones_heading.alignment = WD_ALIGN_PARAGRAPH.LEFT
-                        opciones_heading_run.font.color.rgb = RGBColor(0, 0, 0)
-
-                        opciones = pregunta.get('opciones', [])
-                        for i, opcion in enumerate(opciones[:10], 1):  # Limitar a 10 opciones
-                            try:
-                                opcion_paragraph = doc.add_paragraph()
-                                opcion_paragraph.alignment = WD_ALIGN_PARAGRAPH.JUSTIFY
-                                opcion_paragraph.paragraph_format.left_indent = Inches(0.3)
-
-                                letra = chr(96 + i)  # a, b, c, d...
-                                opcion_text = str(opcion.get('texto', ''))[:300]  # Limitar longitud
-                                opcion_text = f'{letra}) {opcion_text}'
-                                opcion_run = opcion_paragraph.add_run(opcion_text)
-                                opcion_run.font.size = Pt(11)
-                                opcion_run.font.color.rgb = RGBColor(0, 0, 0)
-                                # Importante: NO poner en negrita la opción correcta
-                            except Exception as e:
-                                logger.warning(f"Error al procesar opción {i}: {e}")
-                                continue
-
-                        # Respuesta correcta (solo aquí se resalta si quieres mantenerlo)
-                        respuesta_paragraph = doc.add_paragraph()
-                        respuesta_paragraph.alignment = WD_ALIGN_PARAGRAPH.LEFT
-                        respuesta_paragraph.paragraph_format.left_indent = Inches(0.3)
-
-                        # Encontrar la respuesta correcta
-                        for i, opcion in enumerate(opciones[:10], 1):
-                            if opcion.get('es_correcta', False):
-                                letra_correcta = chr(96 + i)
-                                respuesta_run = respuesta_paragraph.add_run(f'Respuesta correcta: {letra_correcta}')
-                                respuesta_run.bold = True
-                                respuesta_run.font.size = Pt(11)
-                                respuesta_run.font.color.rgb = RGBColor(0, 0, 0)
-                                break
-
-                        # Explicación de la respuesta
-                        explicacion = pregunta.get('explicacion', '').strip()
-                        if explicacion:
-                            explicacion_paragraph = doc.add_paragraph()
-                            explicacion_paragraph.alignment = WD_ALIGN_PARAGRAPH.JUSTIFY
-                            explicacion_paragraph.paragraph_format.left_indent = Inches(0.3)
-                            
-                            explicacion_heading = explicacion_paragraph.add_run('Explicación: ')
-                            explicacion_heading.bold = True
-                            explicacion_heading.font.size = Pt(11)
-                            explicacion_heading.font.color.rgb = RGBColor(0, 0, 0)
-                            
-                            explicacion_text = str(explicacion)[:800]  # Limitar longitud
-                            explicacion_run = explicacion_paragraph.add_run(explicacion_text)
-                            explicacion_run.font.size = Pt(11)
-                            explicacion_run.font.color.rgb = RGBColor(0, 0, 0)
-
-                        # Incrementar contador global
-                        contador_pregunta_global += 1
-
-                        # Espacio entre preguntas
-                        doc.add_paragraph()
-
+                        opcion_paragraph = doc.add_paragraph()
+                        opcion_paragraph.alignment = WD_ALIGN_PARAGRAPH.JUSTIFY
+                        opcion_paragraph.paragraph_format.left_indent = Inches(0.3)
+
+                        letra = chr(96 + i)  # a, b, c, d...
+                        opcion_text = str(opcion.get('texto', ''))[:300]  # Limitar longitud
+                        opcion_text = f'{letra}) {opcion_text}'
+                        opcion_run = opcion_paragraph.add_run(opcion_text)
+                        opcion_run.font.size = Pt(11)
+                        opcion_run.font.color.rgb = RGBColor(0, 0, 0)
+                        # Importante: NO poner en negrita la opción correcta
                     except Exception as e:
-                        logger.warning(f"Error al procesar pregunta {contador_pregunta_global}: {e}")
-                        contador_pregunta_global += 1
+                        logger.warning(f"Error al procesar opción {i}: {e}")
+                        completa = False
                         continue
 
+                # Respuesta correcta (solo aquí se resalta si quieres mantenerlo)
+                respuesta_paragraph = doc.add_paragraph()
+                respuesta_paragraph.alignment = WD_ALIGN_PARAGRAPH.LEFT
+                respuesta_paragraph.paragraph_format.left_indent = Inches(0.3)
+
+                # Encontrar la respuesta correcta
+                for i, opcion in enumerate(opciones[:10], 1):
+                    if opcion.get('es_correcta', False):
+                        letra_correcta = chr(96 + i)
+                        respuesta_run = respuesta_paragraph.add_run(f'Respuesta correcta: {letra_correcta}')
+                        respuesta_run.bold = True
+                        respuesta_run.font.size = Pt(11)
+                        respuesta_run.font.color.rgb = RGBColor(0, 0, 0)
+                        break
+
+                # Explicación de la respuesta
+                explicacion = pregunta.get('explicacion', '').strip()
+                if explicacion:
+                    explicacion_paragraph = doc.add_paragraph()
+                    explicacion_paragraph.alignment = WD_ALIGN_PARAGRAPH.JUSTIFY
+                    explicacion_paragraph.paragraph_format.left_indent = Inches(0.3)
+
+                    explicacion_heading = explicacion_paragraph.add_run('Explicación: ')
+                    explicacion_heading.bold = True
+                    explicacion_heading.font.size = Pt(11)
+                    explicacion_heading.font.color.rgb = RGBColor(0, 0, 0)
+
+                    explicacion_text = str(explicacion)[:800]  # Limitar longitud
+                    explicacion_run = explicacion_paragraph.add_run(explicacion_text)
+                    explicacion_run.font.size = Pt(11)
+                    explicacion_run.font.color.rgb = RGBColor(0, 0, 0)
+
+                # Incrementar contador global
+                contador_pregunta_global += 1
+
+                # Espacio entre preguntas
+                doc.add_paragraph()
+
             except Exception as e:
-                logger.warning(f"Error al procesar unidad {unidad.get('numero', '?')}: {e}")
+                logger.warning(f"Error al procesar pregunta {contador_pregunta_global}: {e}")
+                contador_pregunta_global += 1
+                completa = False
                 continue
 
-        logger.info(f"Documento generado con {contador_pregunta_global - 1} preguntas")
-        return doc
-
     except Exception as e:
-        logger.error(f"Error crítico al generar documento: {e}", exc_info=True)
-        raise e
+        logger.warning(f"Error al procesar unidad {unidad.get('numero', '?')}: {e}")
+        return contador_pregunta_global, False
+
+    return contador_pregunta_global, completa
 
 
 # ============================================================================
 # VISTA PARA CREAR PARTIDAS COMPLETAS - SUPABASE
 # ============================================================================
 
+def crear_partida_completa(datos, progreso=None):
+    """Crea partida, programa analítico y unidades a partir de los datos del formulario.
+
+    ``datos`` trae descripcion, asignatura_id, titulo_programa, contexto,
+    preguntas_por_unidad y unidades (lista de {numero, descripcion}). ``progreso`` es
+    opcional y recibe el porcentaje de avance cuando se ejecuta como tarea.
+    """
+    preguntas_por_unidad = int(datos['preguntas_por_unidad'])
+
+    # Las preguntas no se crean: son virtuales (numeración secuencial global entre
+    # unidades) hasta que se editan o se importan, ver placeholders.py
+    unidades = [
+        {
+            'numero_unidad': unidad_datos['numero'],
+            'descripcion': unidad_datos['descripcion'],
+            'num_preguntas': preguntas_por_unidad,
+        }
+        for unidad_datos in datos['unidades']
+    ]
+
+    if progreso:
+        progreso(5, 'Creando partida')
+
+    # Partida, programa y unidades en una sola transacción
+    creada = SupabaseBusinessService.crear_partida_desde_spec({
+        'partida': {'descripcion': datos['descripcion'], 'asignatura_id': int(datos['asignatura_id'])},
+        'programa': {'titulo': datos['titulo_programa'], 'contexto': datos['contexto']},
+        'unidades': unidades,
+    })
+    despues_de_escribir(reconstruir_partida, creada['partida_id'])
+    # Desde el worker no pasa por DatosObsoletosMiddleware
+    invalidar_respaldo()
+
+    return {
+        'partida_id': creada['partida_id'],
+        'programa_id': creada['programa_id'],
+        'unidades': len(creada['unidades']),
+        'preguntas': len(creada['unidades']) * preguntas_por_unidad,
+    }
+
+
 class CrearPartidaCompletaView(View):
     """Vista para crear partida completa con programa analítico y unidades - Supabase"""
 
@@ -1309,69 +1736,38 @@ class CrearPartidaCompletaView(View):
                 messages.error(request, 'Todos los campos son obligatorios')
                 return redirect('partida_lista')
 
-            # 1. Crear la partida
-            partida = PartidaRepository.create(
-                descripcion=descripcion,
-                asignatura_id=int(asignatura_id)
-            )
-
-            if not partida:
-                messages.error(request, 'Error al crear la partida')
-                return redirect('partida_lista')
-
-            # 2. Crear el programa analítico
-            programa = ProgramaAnaliticoRepository.create(
-                titulo=titulo_programa,
-                contexto=contexto,
-                asignatura_id=int(asignatura_id)
-            )
+            datos = {
+                'descripcion': descripcion,
+                'asignatura_id': int(asignatura_id),
+                'titulo_programa': titulo_programa,
+                'contexto': contexto,
+                'preguntas_por_unidad': preguntas_por_unidad,
+                'unidades': [
+                    {'numero': i, 'descripcion': request.POST.get(f'unidad_{i}_descripcion', '').strip()}
+                    for i in range(1, num_unidades + 1)
+                    if request.POST.get(f'unidad_{i}_descripcion', '').strip()
+                ],
+            }
 
-            if not programa:
-                messages.error(request, 'Error al crear el programa analítico')
+            # Con el worker activo la creación se encola y la petición responde de inmediato
+            if tareas_en_segundo_plano():
+                tarea_obj = encolar('crear_partida_completa', datos=datos)
+                if request.headers.get('x-requested-with') == 'XMLHttpRequest':
+                    return FastJsonResponse({'success': True, **_urls_tarea(tarea_obj)}, status=202)
+                messages.info(
+                    request,
+                    f'La partida se está creando en segundo plano (tarea #{tarea_obj.pk}). '
+                    f'Aparecerá en la lista en unos momentos.'
+                )
                 return redirect('partida_lista')
 
-            # 3. Crear las unidades
-            unidades_creadas = []
-            for i in range(1, num_unidades + 1):
-                descripcion_unidad = request.POST.get(f'unidad_{i}_descripcion', '').strip()
-                if descripcion_unidad:
-                    unidad = UnidadRepository.create(
-                        numero_unidad=i,
-                        descripcion=descripcion_unidad,
-                        num_preguntas=preguntas_por_unidad,
-                        programa_analitico_id=programa['linea_educativa_id']
-                    )
-                    if unidad:
-                        unidades_creadas.append(unidad)
-
-            # 4. Crear preguntas automáticas para cada unidad con numeración secuencial
-            preguntas_creadas = 0
-            contador_pregunta_global = 1  # Contador global para numeración secuencial
-
-            for unidad in unidades_creadas:
-                for _ in range(preguntas_por_unidad):
-                    pregunta = PreguntaRepository.create(
-                        numero=contador_pregunta_global,  # Usar contador global
-                        enunciado=f"Pregunta {contador_pregunta_global}",
-                        unidad_id=unidad['unidad_id']
-                    )
-                    if pregunta:
-                        # Crear opciones para la pregunta
-                        for k in range(1, 5):  # 4 opciones por pregunta
-                            es_correcta = (k == 1)  # La primera opción es correcta por defecto
-                            OpcionRepository.create(
-                                opcion=f"Opción {k} para pregunta {contador_pregunta_global}",
-                                es_correcta=es_correcta,
-                                pregunta_id=pregunta['pregunta_id']
-                            )
-                        preguntas_creadas += 1
-                        contador_pregunta_global += 1  # Incrementar contador global
+            creada = crear_partida_completa(datos)
 
             # Mensaje de éxito
             messages.success(
                 request,
                 f'¡Partida creada exitosamente! '
-                f'Se crearon {len(unidades_creadas)} unidades y {preguntas_creadas} preguntas automáticamente.'
+                f'Se crearon {creada["unidades"]} unidades con {creada["preguntas"]} preguntas por completar.'
             )
 
             return redirect('partida_lista')
@@ -1379,3 +1775,119 @@ class CrearPartidaCompletaView(View):
         except Exception as e:
             messages.error(request, f'Error al crear la partida: {str(e)}')
             return redirect('partida_lista')
+
+
+def _urls_tarea(tarea_obj):
+    from django.urls import reverse
+
+    return {
+        'tarea_id': tarea_obj.pk,
+        'estado_url': reverse('estado_tarea', args=[tarea_obj.pk]),
+        'eventos_url': reverse('eventos_tarea', args=[tarea_obj.pk]),
+        'resultado_url': reverse('resultado_tarea', args=[tarea_obj.pk]),
+    }
+
+
+def _estado_tarea(tarea_obj):
+    return {
+        'tarea_id': tarea_obj.pk,
+        'tipo': tarea_obj.tipo,
+        'estado': tarea_obj.estado,
+        'progreso': tarea_obj.progreso,
+        'mensaje': tarea_obj.mensaje,
+        'error': tarea_obj.error,
+        'tiene_archivo': bool(tarea_obj.archivo),
+    }
+
+
+@require_http_methods(["GET"])
+def estado_tarea_api(request, tarea_id):
+    """API para consultar el estado de una tarea en segundo plano"""
+    tarea_obj = Tarea.objects.filter(pk=tarea_id).first()
+    if not tarea_obj:
+        return FastJsonResponse({'success': False, 'error': 'Tarea no encontrada'}, status=404)
+    return FastJsonResponse({'success': True, **_estado_tarea(tarea_obj)})
+
+
+@require_http_methods(["GET"])
+def eventos_tarea(request, tarea_id):
+    """Server-Sent Events con el progreso de una tarea durante una ventana corta.
+
+    Con WSGI cada flujo abierto ocupa un worker, así que la conexión se cierra tras
+    ``TAREAS_VENTANA_EVENTOS`` segundos; EventSource se reconecta solo (campo ``retry``)
+    y recibe el estado actual. El evento ``fin`` llega cuando la tarea termina.
+    """
+    from django.http import StreamingHttpResponse
+    import time
+
+    if not Tarea.objects.filter(pk=tarea_id).exists():
+        return FastJsonResponse({'success': False, 'error': 'Tarea no encontrada'}, status=404)
+
+    def eventos():
+        yield f"retry: {settings.TAREAS_REINTENTO_EVENTOS_MS}\n\n"
+        ultimo = None
+        limite = time.monotonic() + settings.TAREAS_VENTANA_EVENTOS
+        while True:
+            tarea_obj = Tarea.objects.filter(pk=tarea_id).first()
+            if tarea_obj is None:
+                return
+            estado = _estado_tarea(tarea_obj)
+            if estado != ultimo:
+                ultimo = estado
+                yield f"event: progreso\ndata: {json.dumps(estado, ensure_ascii=False)}\n\n"
+            if tarea_obj.terminal:
+                yield f"event: fin\ndata: {json.dumps(estado, ensure_ascii=False)}\n\n"
+                return
+            if time.monotonic() + settings.TAREAS_INTERVALO_EVENTOS >= limite:
+                return
+            yield ": ping\n\n"  # Mantiene viva la conexión detrás del proxy
+            time.sleep(settings.TAREAS_INTERVALO_EVENTOS)
+
+    response = StreamingHttpResponse(eventos(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@require_http_methods(["GET"])
+def resultado_tarea(request, tarea_id):
+    """API para obtener el resultado de una tarea terminada (archivo o JSON)"""
+    from django.http import FileResponse
+
+    tarea_obj = Tarea.objects.filter(pk=tarea_id).first()
+    if not tarea_obj:
+        return FastJsonResponse({'success': False, 'error': 'Tarea no encontrada'}, status=404)
+    if tarea_obj.estado == Tarea.FALLIDA:
+        return FastJsonResponse({'success': False, 'error': tarea_obj.error}, status=500)
+    if tarea_obj.estado != Tarea.COMPLETADA:
+        return FastJsonResponse({'success': False, **_estado_tarea(tarea_obj)}, status=409)
+
+    if tarea_obj.archivo:
+        try:
+            archivo = open(tarea_obj.archivo, 'rb')
+        except OSError:
+            return FastJsonResponse({'success': False, 'error': 'El archivo del resultado ya no existe'}, status=410)
+        return FileResponse(
+            archivo,
+            as_attachment=True,
+            filename=tarea_obj.nombre_archivo,
+            content_type=tarea_obj.content_type,
+        )
+    return FastJsonResponse({'success': True, 'resultado': tarea_obj.resultado})
+
+
+# ============================================================================
+# SALUD DEL PROCESO
+# ============================================================================
+
+@require_http_methods(["GET"])
+def salud_listo(request):
+    """Readiness: 200 cuando el cliente de Supabase de este worker tiene conexiones abiertas, 503 si no.
+
+    Un worker frío o con error empieza a calentarse en segundo plano con la primera consulta.
+    """
+    estado = estado_calentamiento()
+    if estado['estado'] in ('frio', 'error'):
+        calentar_en_segundo_plano()
+    listo = estado['estado'] == 'caliente'
+    return FastJsonResponse({'listo': listo, **estado}, status=200 if listo else 503)
@@ -0,0 +1,9 @@
+# Configuración de gunicorn; se carga sola al arrancar desde la raíz del proyecto.
+# Uso: gunicorn project.wsgi --preload --workers 4
+
+
+def post_worker_init(worker):
+    # El cliente de Supabase se calienta en cada worker, nunca en el maestro que hace
+    # fork (ver supabase_client.py)
+    from app.supabase_client import iniciar_worker
+    iniciar_worker()
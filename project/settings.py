@@ -46,12 +46,15 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'app.middleware.CompresionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'app.middleware.DatosObsoletosMiddleware',
+    'app.middleware.PlazoPeticionMiddleware',
 ]
 
 ROOT_URLCONF = 'project.urls'
@@ -66,6 +69,8 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'app.context_processors.datos_obsoletos',
+                'app.context_processors.plazo_peticion',
             ],
         },
     },
@@ -135,3 +140,148 @@ STATIC_URL = 'static/'
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Caché de fragmentos de documentos Word
+# Cada unidad renderizada se guarda por hash de contenido, así una descarga solo
+# vuelve a renderizar las unidades que cambiaron desde la anterior.
+
+DOCX_FRAGMENT_CACHE_TIMEOUT = int(os.getenv("DOCX_FRAGMENT_CACHE_TIMEOUT", 60 * 60 * 24))
+
+# Generación de prompts por lotes
+# PROMPT_MAX_CHARS limita cada prompt (entrada + salida estimada); vacío = sin dividir.
+
+PROMPT_MAX_CHARS = int(os.getenv("PROMPT_MAX_CHARS", 0)) or None
+PROMPT_CHARS_POR_PREGUNTA = 900
+PROMPT_CHARS_POR_TOKEN = 4
+
+# Edición masiva de preguntas
+# Cada lote se aplica en una transacción con la función aplicar_edicion_masiva
+# (supabase/migrations); este límite acota el tamaño de una petición.
+
+EDICION_MASIVA_MAX_PREGUNTAS = int(os.getenv("EDICION_MASIVA_MAX_PREGUNTAS", 1000))
+
+# Tareas en segundo plano
+# Con TAREAS_EN_SEGUNDO_PLANO=1 la creación de partidas y los documentos Word se
+# encolan en la base local y los ejecuta `python manage.py procesar_tareas`.
+
+TAREAS_EN_SEGUNDO_PLANO = os.getenv("TAREAS_EN_SEGUNDO_PLANO", "0") == "1"
+TAREAS_HILOS = int(os.getenv("TAREAS_HILOS", 2))
+TAREAS_TIEMPO_MAXIMO = int(os.getenv("TAREAS_TIEMPO_MAXIMO", 60 * 30))
+# El worker renueva el latido de sus tareas cada TAREAS_LATIDO segundos; sin latido por
+# TAREAS_LATIDO_VENCIDO segundos la tarea se considera abandonada (ver jobs.py)
+TAREAS_LATIDO = int(os.getenv("TAREAS_LATIDO", 15))
+TAREAS_LATIDO_VENCIDO = int(os.getenv("TAREAS_LATIDO_VENCIDO", 120))
+TAREAS_RETENCION_DIAS = int(os.getenv("TAREAS_RETENCION_DIAS", 7))
+TAREAS_INTERVALO_EVENTOS = 1.0
+# Cada conexión de /eventos/ dura a lo sumo esta ventana; el navegador se reconecta tras el retry
+TAREAS_VENTANA_EVENTOS = int(os.getenv("TAREAS_VENTANA_EVENTOS", 25))
+TAREAS_REINTENTO_EVENTOS_MS = 2000
+TAREAS_RESULTADOS_DIR = BASE_DIR / "tareas_resultados"
+
+# Snapshots de partidas
+# Las vistas de lectura sirven el árbol ya armado de cada partida (PartidaSnapshot).
+# Las escrituras hechas fuera de la aplicación se recogen al vencer la edad máxima
+# o con `python manage.py reparar_snapshots`.
+
+PARTIDA_SNAPSHOT_MAX_EDAD = int(os.getenv("PARTIDA_SNAPSHOT_MAX_EDAD", 60 * 60 * 6))
+
+# Respaldo stale-while-revalidate
+# Las vistas de lectura responden con la última copia buena de los datos de Supabase
+# y la recargan en segundo plano. La copia se guarda en disco para sobrevivir a
+# reinicios; más allá de SWR_MAX_OBSOLETO ya no se sirve.
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    "respaldo": {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": BASE_DIR / "cache_respaldo",
+        "OPTIONS": {"MAX_ENTRIES": 5000},
+    },
+    # {% cache %} de las plantillas de listas (ver fragments.py)
+    "template_fragments": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "fragmentos",
+        "OPTIONS": {"MAX_ENTRIES": 10000},
+    },
+}
+SWR_CACHE = "respaldo"
+SWR_FRESCO = int(os.getenv("SWR_FRESCO", 30))
+SWR_MAX_OBSOLETO = int(os.getenv("SWR_MAX_OBSOLETO", 60 * 60 * 24))
+
+# Plazo de las peticiones
+# Ninguna vista sigue llamando a Supabase pasado el plazo: las listas devuelven lo
+# que alcanzaron a cargar. El cliente puede pedir menos (o más, hasta el máximo)
+# con la cabecera X-Request-Timeout en segundos. PETICION_PLAZO=0 desactiva el plazo.
+
+PETICION_PLAZO = float(os.getenv("PETICION_PLAZO", 25))
+PETICION_PLAZO_MAXIMO = float(os.getenv("PETICION_PLAZO_MAXIMO", 120))
+
+# Llamadas concurrentes a Supabase
+# Las vistas piden en paralelo los datos que no dependen entre sí (concurrency.gather)
+# usando un pool compartido de CONCURRENCIA_HILOS hilos; cada llamada a gather ocupa como
+# mucho CONCURRENCIA_POR_PETICION a la vez (las anidadas corren en serie, así que una
+# petición tampoco lo supera). CONCURRENCIA_POR_PETICION=1 vuelve a serie.
+
+CONCURRENCIA_HILOS = int(os.getenv("CONCURRENCIA_HILOS", 8))
+CONCURRENCIA_POR_PETICION = int(os.getenv("CONCURRENCIA_POR_PETICION", 4))
+
+# Búsqueda de preguntas
+# Por defecto busca en Supabase (columna tsvector + función buscar_preguntas).
+# Con BUSQUEDA_LOCAL=1 busca en la base local: FTS5 en SQLite, tsvector en PostgreSQL.
+
+BUSQUEDA_LOCAL = os.getenv("BUSQUEDA_LOCAL", "0") == "1"
+
+# Detección de casi duplicados
+# Firmas MinHash de enunciado + opciones con LSH por bandas (ver duplicates.py).
+# Con 128 permutaciones en 16 bandas los pares con similitud >= 0.8 salen como
+# candidatos ~95% de las veces. Cambiar los parámetros recalcula todas las firmas.
+
+DUPLICADOS_PERMUTACIONES = 128
+DUPLICADOS_BANDAS = 16
+DUPLICADOS_UMBRAL = float(os.getenv("DUPLICADOS_UMBRAL", 0.8))
+
+# Validación de calidad de las preguntas
+# Las mismas reglas que pide el prompt de generación (ver validation.py).
+
+VALIDACION_OPCIONES = 4
+VALIDACION_PALABRAS_MIN = 60
+VALIDACION_PALABRAS_MAX = 120
+VALIDACION_RACHA_MAXIMA = 3
+
+# Serialización JSON de las APIs
+# FastJsonResponse usa orjson si está instalado (pip install orjson); JSON_RAPIDO=0
+# vuelve al encoder de Django. Las listas desde JSON_STREAMING_MINIMO filas se envían
+# en streaming, sin armar el cuerpo completo en memoria.
+
+JSON_RAPIDO = os.getenv("JSON_RAPIDO", "1") == "1"
+JSON_STREAMING_MINIMO = int(os.getenv("JSON_STREAMING_MINIMO", 1000))
+
+# Compresión de respuestas
+# CompresionMiddleware comprime HTML y JSON desde COMPRESION_MINIMO bytes: con brotli
+# si está instalado (pip install brotli) y el navegador lo acepta, si no con gzip.
+# Las páginas de listas y las APIs de filtros responden 304 mientras no cambie su sello
+# de versión (ver conditional.py), sin consultar Supabase.
+
+COMPRESION_MINIMO = int(os.getenv("COMPRESION_MINIMO", 1024))
+COMPRESION_BROTLI_CALIDAD = int(os.getenv("COMPRESION_BROTLI_CALIDAD", 5))
+
+# Caché de fragmentos de las listas
+# Cada fila de partidas y unidades se guarda renderizada bajo su id y su versión
+# (SelloVersion, que suben las APIs de edición); solo las filas editadas se vuelven a
+# dibujar. FRAGMENTOS_TTL acota cuánto puede tardar en verse un cambio hecho fuera de
+# la aplicación. Los selects de filtros se guardan SWR_FRESCO segundos.
+
+FRAGMENTOS_TTL = int(os.getenv("FRAGMENTOS_TTL", 60 * 60 * 6))
+
+# Ciclo de vida del cliente de Supabase
+# Con SUPABASE_PRECALENTAR=1 (lo fija project/wsgi.py) cada worker crea el cliente y
+# abre SUPABASE_CONEXIONES_PRECALENTADAS conexiones en segundo plano: tras el fork o desde
+# el hook post_worker_init de gunicorn.conf.py, nunca en el maestro de gunicorn --preload.
+# /salud/listo/ responde 200 cuando el pool del worker está caliente. Cada consulta del
+# calentamiento se corta a los SUPABASE_PING_TIMEOUT segundos.
+
+SUPABASE_PRECALENTAR = os.getenv("SUPABASE_PRECALENTAR", "0") == "1"
+SUPABASE_CONEXIONES_PRECALENTADAS = int(os.getenv("SUPABASE_CONEXIONES_PRECALENTADAS", CONCURRENCIA_POR_PETICION))
+SUPABASE_PING_TIMEOUT = float(os.getenv("SUPABASE_PING_TIMEOUT", 5))
@@ -12,5 +12,7 @@ import os
 from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'project.settings')
+# Los workers WSGI calientan el cliente de Supabase tras arrancar (ver supabase_client.py); manage.py no
+os.environ.setdefault('SUPABASE_PRECALENTAR', '1')
 
 application = get_wsgi_application()
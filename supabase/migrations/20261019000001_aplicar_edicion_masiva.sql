@@ -0,0 +1,59 @@
+-- Edición masiva de preguntas y opciones en una sola transacción.
+--
+-- Recibe los cambios ya calculados por la aplicación (solo lo que cambió):
+--   {
+--     "preguntas":            [{"pregunta_id": 1, "enunciado": "...", "explicacion": "..."}],
+--     "actualizar_opciones":  [{"opcion_id": 10, "opcion": "...", "es_correcta": true}],
+--     "crear_opciones":       [{"pregunta_id": 1, "opcion": "...", "es_correcta": false}],
+--     "eliminar_opciones":    [11, 12]
+--   }
+-- En "preguntas" los campos ausentes (null) no se modifican. Cada sentencia opera
+-- sobre el conjunto completo; si alguna falla, no se aplica ningún cambio.
+
+create or replace function public.aplicar_edicion_masiva(cambios jsonb)
+returns jsonb
+language plpgsql
+as $$
+declare
+    n_preguntas integer;
+    n_actualizadas integer;
+    n_creadas integer;
+    n_eliminadas integer;
+begin
+    update public.pregunta p
+       set enunciado = coalesce(c.enunciado, p.enunciado),
+           explicacion = coalesce(c.explicacion, p.explicacion)
+      from jsonb_to_recordset(coalesce(cambios->'preguntas', '[]'::jsonb))
+           as c(pregunta_id integer, enunciado text, explicacion text)
+     where p.pregunta_id = c.pregunta_id;
+    get diagnostics n_preguntas = row_count;
+
+    update public.opcion o
+       set opcion = c.opcion,
+           es_correcta = c.es_correcta
+      from jsonb_to_recordset(coalesce(cambios->'actualizar_opciones', '[]'::jsonb))
+           as c(opcion_id integer, opcion text, es_correcta boolean)
+     where o.opcion_id = c.opcion_id;
+    get diagnostics n_actualizadas = row_count;
+
+    insert into public.opcion (opcion, es_correcta, pregunta_id)
+    select c.opcion, c.es_correcta, c.pregunta_id
+      from jsonb_to_recordset(coalesce(cambios->'crear_opciones', '[]'::jsonb))
+           as c(pregunta_id integer, opcion text, es_correcta boolean);
+    get diagnostics n_creadas = row_count;
+
+    delete from public.opcion
+     where opcion_id in (
+         select value::integer
+           from jsonb_array_elements_text(coalesce(cambios->'eliminar_opciones', '[]'::jsonb))
+     );
+    get diagnostics n_eliminadas = row_count;
+
+    return jsonb_build_object(
+        'preguntas', n_preguntas,
+        'opciones_actualizadas', n_actualizadas,
+        'opciones_creadas', n_creadas,
+        'opciones_eliminadas', n_eliminadas
+    );
+end;
+$$;
@@ -0,0 +1,101 @@
+-- Creación de una partida completa en una sola transacción.
+--
+-- Recibe la especificación anidada:
+--   {
+--     "partida":  {"descripcion": "...", "asignatura_id": 1},
+--     "programa": {"titulo": "...", "contexto": "..."},
+--     "unidades": [
+--       {"numero_unidad": 1, "descripcion": "...", "num_preguntas": 10,
+--        "preguntas": [{"numero": 1, "enunciado": "...", "explicacion": null,
+--                       "opciones": [{"opcion": "...", "es_correcta": true}]}]}
+--     ]
+--   }
+-- y devuelve los ids creados:
+--   {"partida_id": 1, "programa_id": 2, "preguntas": 40, "opciones": 160,
+--    "unidades": [{"unidad_id": 3, "numero_unidad": 1}]}
+--
+-- Los ids de unidades y preguntas se reservan con nextval antes de insertar, así
+-- cada hijo se enlaza con su padre sin depender del orden de RETURNING. Todo corre
+-- en una sola sentencia por nivel: si algo falla no queda ninguna fila huérfana.
+
+create or replace function public.crear_partida_completa(spec jsonb)
+returns jsonb
+language plpgsql
+as $$
+declare
+    v_partida_id integer;
+    v_programa_id integer;
+    v_unidades jsonb;
+    v_preguntas integer;
+    v_opciones integer;
+begin
+    insert into public.partida (descripcion, asignatura_id)
+    values (spec->'partida'->>'descripcion', (spec->'partida'->>'asignatura_id')::integer)
+    returning partida_id into v_partida_id;
+
+    insert into public.programaanalitico (titulo, contexto, asignatura_id)
+    values (
+        spec->'programa'->>'titulo',
+        coalesce(spec->'programa'->>'contexto', ''),
+        (spec->'partida'->>'asignatura_id')::integer
+    )
+    returning linea_educativa_id into v_programa_id;
+
+    with u as materialized (
+        select nextval(pg_get_serial_sequence('public.unidad', 'unidad_id'))::integer as unidad_id,
+               t.valor
+          from jsonb_array_elements(coalesce(spec->'unidades', '[]'::jsonb)) as t(valor)
+    ),
+    ins_u as (
+        insert into public.unidad (unidad_id, numero_unidad, descripcion, num_preguntas, programa_analitico_id)
+        overriding system value
+        select u.unidad_id,
+               (u.valor->>'numero_unidad')::integer,
+               u.valor->>'descripcion',
+               coalesce((u.valor->>'num_preguntas')::integer, 0),
+               v_programa_id
+          from u
+        returning unidad_id, numero_unidad
+    ),
+    p as materialized (
+        select nextval(pg_get_serial_sequence('public.pregunta', 'pregunta_id'))::integer as pregunta_id,
+               u.unidad_id,
+               t.valor
+          from u
+         cross join lateral jsonb_array_elements(coalesce(u.valor->'preguntas', '[]'::jsonb)) as t(valor)
+    ),
+    ins_p as (
+        insert into public.pregunta (pregunta_id, numero, enunciado, explicacion, unidad_id)
+        overriding system value
+        select p.pregunta_id,
+               (p.valor->>'numero')::integer,
+               p.valor->>'enunciado',
+               p.valor->>'explicacion',
+               p.unidad_id
+          from p
+        returning pregunta_id
+    ),
+    ins_o as (
+        insert into public.opcion (opcion, es_correcta, pregunta_id)
+        select t.valor->>'opcion',
+               coalesce((t.valor->>'es_correcta')::boolean, false),
+               p.pregunta_id
+          from p
+         cross join lateral jsonb_array_elements(coalesce(p.valor->'opciones', '[]'::jsonb)) as t(valor)
+        returning opcion_id
+    )
+    select coalesce((select jsonb_agg(jsonb_build_object('unidad_id', unidad_id, 'numero_unidad', numero_unidad)
+                                      order by numero_unidad) from ins_u), '[]'::jsonb),
+           (select count(*) from ins_p),
+           (select count(*) from ins_o)
+      into v_unidades, v_preguntas, v_opciones;
+
+    return jsonb_build_object(
+        'partida_id', v_partida_id,
+        'programa_id', v_programa_id,
+        'unidades', v_unidades,
+        'preguntas', v_preguntas,
+        'opciones', v_opciones
+    );
+end;
+$$;
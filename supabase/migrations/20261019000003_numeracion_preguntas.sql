@@ -0,0 +1,84 @@
+-- Numeración secuencial de preguntas por programa analítico.
+--
+-- renumerar_preguntas(p_programa_id)
+--   Calcula los números nuevos con row_number() sobre (numero_unidad, numero) y los
+--   aplica en un solo UPDATE, escribiendo solo las filas cuyo número cambia.
+--   Devuelve {"total": 120, "cambiadas": 7}.
+--
+-- reservar_numeros(p_programa_id, p_cantidad)
+--   Reserva un bloque de números consecutivos para inserciones por lotes y devuelve
+--   el primero. El contador ultimo_numero se avanza con un UPDATE sobre la fila del
+--   programa, que queda bloqueada hasta el commit: dos reservas concurrentes nunca
+--   reciben el mismo bloque. El bloque empieza después del mayor número en uso, sea
+--   de una pregunta real o de una posición virtual (suma de num_preguntas).
+
+alter table public.programaanalitico
+    add column if not exists ultimo_numero integer not null default 0;
+
+create or replace function public.renumerar_preguntas(p_programa_id integer)
+returns jsonb
+language plpgsql
+as $$
+declare
+    v_total integer;
+    v_cambiadas integer;
+begin
+    -- Serializa con las reservas de números del mismo programa
+    perform 1 from public.programaanalitico
+     where linea_educativa_id = p_programa_id
+       for update;
+
+    with nuevos as (
+        select p.pregunta_id,
+               row_number() over (order by u.numero_unidad, p.numero, p.pregunta_id)::integer as numero
+          from public.pregunta p
+          join public.unidad u on u.unidad_id = p.unidad_id
+         where u.programa_analitico_id = p_programa_id
+    ),
+    cambiadas as (
+        update public.pregunta p
+           set numero = n.numero
+          from nuevos n
+         where p.pregunta_id = n.pregunta_id
+           and p.numero is distinct from n.numero
+        returning 1
+    )
+    select (select count(*) from nuevos), (select count(*) from cambiadas)
+      into v_total, v_cambiadas;
+
+    return jsonb_build_object('total', v_total, 'cambiadas', v_cambiadas);
+end;
+$$;
+
+create or replace function public.reservar_numeros(p_programa_id integer, p_cantidad integer)
+returns integer
+language plpgsql
+as $$
+declare
+    v_fin integer;
+begin
+    if p_cantidad is null or p_cantidad < 1 then
+        raise exception 'La cantidad a reservar debe ser positiva';
+    end if;
+
+    update public.programaanalitico pa
+       set ultimo_numero = greatest(
+               pa.ultimo_numero,
+               coalesce((select max(p.numero)
+                           from public.pregunta p
+                           join public.unidad u on u.unidad_id = p.unidad_id
+                          where u.programa_analitico_id = pa.linea_educativa_id), 0),
+               coalesce((select sum(u.num_preguntas)
+                           from public.unidad u
+                          where u.programa_analitico_id = pa.linea_educativa_id), 0)
+           ) + p_cantidad
+     where pa.linea_educativa_id = p_programa_id
+    returning pa.ultimo_numero into v_fin;
+
+    if v_fin is null then
+        raise exception 'El programa analítico % no existe', p_programa_id;
+    end if;
+
+    return v_fin - p_cantidad + 1;
+end;
+$$;
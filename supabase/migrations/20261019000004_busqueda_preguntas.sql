@@ -0,0 +1,177 @@
+-- Búsqueda de texto completo en el banco de preguntas.
+--
+-- pregunta.busqueda
+--   tsvector en configuración 'spanish' con el enunciado (peso A), la explicación (B)
+--   y el texto de las opciones (C), con índice GIN. Lo mantienen los triggers de
+--   pregunta (al cambiar enunciado o explicación) y de opcion (por sentencia, así un
+--   insert masivo de opciones actualiza cada pregunta una sola vez).
+--
+-- buscar_preguntas(p_consulta, p_asignatura_id, p_partida_id, p_unidad_id, p_limite, p_offset)
+--   Interpreta la consulta con websearch_to_tsquery ("frase exacta", -excluir, or),
+--   ordena por ts_rank_cd y devuelve una página:
+--   {"total": 37, "resultados": [{"pregunta_id": 1, "numero": 4, "unidad_id": 2,
+--     "enunciado": "...", "fragmento": "... <b>palabra</b> ...", "rango": 0.3}]}
+--   p_partida_id filtra por la asignatura de la partida.
+
+alter table public.pregunta
+    add column if not exists busqueda tsvector;
+
+create or replace function public.vector_busqueda_pregunta(p_enunciado text, p_explicacion text, p_opciones text)
+returns tsvector
+language sql
+immutable
+as $$
+    select setweight(to_tsvector('spanish', coalesce(p_enunciado, '')), 'A')
+        || setweight(to_tsvector('spanish', coalesce(p_explicacion, '')), 'B')
+        || setweight(to_tsvector('spanish', coalesce(p_opciones, '')), 'C');
+$$;
+
+create or replace function public.refrescar_busqueda_preguntas(p_pregunta_ids integer[])
+returns void
+language sql
+as $$
+    update public.pregunta p
+       set busqueda = public.vector_busqueda_pregunta(
+               p.enunciado,
+               p.explicacion,
+               (select string_agg(o.opcion, ' ' order by o.opcion_id)
+                  from public.opcion o
+                 where o.pregunta_id = p.pregunta_id))
+     where p.pregunta_id = any(p_pregunta_ids);
+$$;
+
+create or replace function public.pregunta_busqueda_trigger()
+returns trigger
+language plpgsql
+as $$
+begin
+    new.busqueda := public.vector_busqueda_pregunta(
+        new.enunciado,
+        new.explicacion,
+        (select string_agg(o.opcion, ' ' order by o.opcion_id)
+           from public.opcion o
+          where o.pregunta_id = new.pregunta_id));
+    return new;
+end;
+$$;
+
+drop trigger if exists pregunta_busqueda on public.pregunta;
+create trigger pregunta_busqueda
+    before insert or update of enunciado, explicacion on public.pregunta
+    for each row execute function public.pregunta_busqueda_trigger();
+
+create or replace function public.opcion_busqueda_trigger()
+returns trigger
+language plpgsql
+as $$
+begin
+    if tg_op = 'INSERT' then
+        perform public.refrescar_busqueda_preguntas(array(select distinct pregunta_id from nuevas));
+    elsif tg_op = 'DELETE' then
+        perform public.refrescar_busqueda_preguntas(array(select distinct pregunta_id from viejas));
+    else
+        perform public.refrescar_busqueda_preguntas(array(
+            select pregunta_id from nuevas
+            union
+            select pregunta_id from viejas));
+    end if;
+    return null;
+end;
+$$;
+
+drop trigger if exists opcion_busqueda_insert on public.opcion;
+create trigger opcion_busqueda_insert
+    after insert on public.opcion
+    referencing new table as nuevas
+    for each statement execute function public.opcion_busqueda_trigger();
+
+drop trigger if exists opcion_busqueda_update on public.opcion;
+create trigger opcion_busqueda_update
+    after update on public.opcion
+    referencing new table as nuevas old table as viejas
+    for each statement execute function public.opcion_busqueda_trigger();
+
+drop trigger if exists opcion_busqueda_delete on public.opcion;
+create trigger opcion_busqueda_delete
+    after delete on public.opcion
+    referencing old table as viejas
+    for each statement execute function public.opcion_busqueda_trigger();
+
+-- Preguntas existentes
+update public.pregunta p
+   set busqueda = public.vector_busqueda_pregunta(
+           p.enunciado,
+           p.explicacion,
+           (select string_agg(o.opcion, ' ' order by o.opcion_id)
+              from public.opcion o
+             where o.pregunta_id = p.pregunta_id))
+ where p.busqueda is null;
+
+create index if not exists pregunta_busqueda_idx on public.pregunta using gin (busqueda);
+
+create or replace function public.buscar_preguntas(
+    p_consulta text,
+    p_asignatura_id integer default null,
+    p_partida_id integer default null,
+    p_unidad_id integer default null,
+    p_limite integer default 20,
+    p_offset integer default 0
+)
+returns jsonb
+language plpgsql
+stable
+as $$
+declare
+    v_consulta tsquery := websearch_to_tsquery('spanish', coalesce(p_consulta, ''));
+    v_asignatura_id integer := p_asignatura_id;
+    v_resultado jsonb;
+begin
+    if p_partida_id is not null then
+        select asignatura_id into v_asignatura_id from public.partida where partida_id = p_partida_id;
+        if v_asignatura_id is null then
+            return jsonb_build_object('total', 0, 'resultados', '[]'::jsonb);
+        end if;
+    end if;
+
+    -- Una consulta vacía o solo de palabras vacías no coincide con nada
+    if numnode(v_consulta) = 0 then
+        return jsonb_build_object('total', 0, 'resultados', '[]'::jsonb);
+    end if;
+
+    with coincidencias as (
+        select p.pregunta_id, p.numero, p.unidad_id, p.enunciado, p.explicacion,
+               ts_rank_cd(p.busqueda, v_consulta) as rango
+          from public.pregunta p
+          join public.unidad u on u.unidad_id = p.unidad_id
+          join public.programaanalitico pa on pa.linea_educativa_id = u.programa_analitico_id
+         where p.busqueda @@ v_consulta
+           and (v_asignatura_id is null or pa.asignatura_id = v_asignatura_id)
+           and (p_unidad_id is null or p.unidad_id = p_unidad_id)
+    ),
+    pagina as (
+        select *
+          from coincidencias
+         order by rango desc, pregunta_id
+         limit greatest(p_limite, 0)
+        offset greatest(p_offset, 0)
+    )
+    select jsonb_build_object(
+               'total', (select count(*) from coincidencias),
+               'resultados', coalesce((
+                   select jsonb_agg(jsonb_build_object(
+                              'pregunta_id', pregunta_id,
+                              'numero', numero,
+                              'unidad_id', unidad_id,
+                              'enunciado', enunciado,
+                              -- ts_headline es caro: solo se calcula para la página pedida
+                              'fragmento', ts_headline(
+                                  'spanish', enunciado || ' ' || coalesce(explicacion, ''), v_consulta,
+                                  'StartSel=<b>, StopSel=</b>, MaxWords=30, MinWords=10, MaxFragments=2'),
+                              'rango', rango
+                          ) order by rango desc, pregunta_id)
+                     from pagina), '[]'::jsonb))
+      into v_resultado;
+
+    return v_resultado;
+end;
+$$;
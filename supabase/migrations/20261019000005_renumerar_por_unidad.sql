@@ -0,0 +1,59 @@
+-- renumerar_preguntas(p_programa_id) compacta la numeración dentro de cada unidad.
+--
+-- Los números de pregunta son posiciones: cada unidad ocupa num_preguntas posiciones a
+-- continuación de las anteriores (por numero_unidad) y las que no tienen fila real son
+-- preguntas virtuales. La versión anterior numeraba 1..N solo las filas reales, así una
+-- pregunta de la unidad 2 podía tomar un número de la unidad 1 y repetirse en ambas.
+-- Ahora cada pregunta real toma la siguiente posición libre de su propia unidad, según
+-- (numero, pregunta_id). Una unidad con más filas reales que num_preguntas ocupa tantas
+-- posiciones como filas tiene, para no pisar la unidad siguiente.
+-- Devuelve {"total": 120, "cambiadas": 7}.
+
+create or replace function public.renumerar_preguntas(p_programa_id integer)
+returns jsonb
+language plpgsql
+as $$
+declare
+    v_total integer;
+    v_cambiadas integer;
+begin
+    -- Serializa con las reservas de números del mismo programa
+    perform 1 from public.programaanalitico
+     where linea_educativa_id = p_programa_id
+       for update;
+
+    with posiciones as (
+        select u.unidad_id,
+               u.numero_unidad,
+               greatest(coalesce(u.num_preguntas, 0), count(p.pregunta_id))::integer as posiciones
+          from public.unidad u
+          left join public.pregunta p on p.unidad_id = u.unidad_id
+         where u.programa_analitico_id = p_programa_id
+         group by u.unidad_id, u.numero_unidad, u.num_preguntas
+    ),
+    inicios as (
+        select unidad_id,
+               (sum(posiciones) over (order by numero_unidad, unidad_id) - posiciones)::integer as desplazamiento
+          from posiciones
+    ),
+    nuevos as (
+        select p.pregunta_id,
+               (i.desplazamiento
+                + row_number() over (partition by p.unidad_id order by p.numero, p.pregunta_id))::integer as numero
+          from public.pregunta p
+          join inicios i on i.unidad_id = p.unidad_id
+    ),
+    cambiadas as (
+        update public.pregunta p
+           set numero = n.numero
+          from nuevos n
+         where p.pregunta_id = n.pregunta_id
+           and p.numero is distinct from n.numero
+        returning 1
+    )
+    select (select count(*) from nuevos), (select count(*) from cambiadas)
+      into v_total, v_cambiadas;
+
+    return jsonb_build_object('total', v_total, 'cambiadas', v_cambiadas);
+end;
+$$;
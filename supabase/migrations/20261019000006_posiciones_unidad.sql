@@ -0,0 +1,100 @@
+-- posiciones_unidad(p_num_preguntas, p_reales) es la cantidad de números que ocupa una
+-- unidad: num_preguntas, o sus preguntas reales si son más (una unidad que creció sin
+-- actualizar num_preguntas no pisa la numeración de la siguiente). Es la misma regla que
+-- posiciones_unidad en app/placeholders.py, que arma los rangos de las preguntas virtuales.
+--
+-- renumerar_preguntas y reservar_numeros pasan a usarla: la reserva empieza después de la
+-- última posición del programa contando las unidades desbordadas.
+
+create or replace function public.posiciones_unidad(p_num_preguntas integer, p_reales bigint)
+returns integer
+language sql
+immutable
+as $$
+    select greatest(coalesce(p_num_preguntas, 0), coalesce(p_reales, 0), 0)::integer;
+$$;
+
+create or replace function public.renumerar_preguntas(p_programa_id integer)
+returns jsonb
+language plpgsql
+as $$
+declare
+    v_total integer;
+    v_cambiadas integer;
+begin
+    -- Serializa con las reservas de números del mismo programa
+    perform 1 from public.programaanalitico
+     where linea_educativa_id = p_programa_id
+       for update;
+
+    with posiciones as (
+        select u.unidad_id,
+               u.numero_unidad,
+               public.posiciones_unidad(u.num_preguntas, count(p.pregunta_id)) as posiciones
+          from public.unidad u
+          left join public.pregunta p on p.unidad_id = u.unidad_id
+         where u.programa_analitico_id = p_programa_id
+         group by u.unidad_id, u.numero_unidad, u.num_preguntas
+    ),
+    inicios as (
+        select unidad_id,
+               (sum(posiciones) over (order by numero_unidad, unidad_id) - posiciones)::integer as desplazamiento
+          from posiciones
+    ),
+    nuevos as (
+        select p.pregunta_id,
+               (i.desplazamiento
+                + row_number() over (partition by p.unidad_id order by p.numero, p.pregunta_id))::integer as numero
+          from public.pregunta p
+          join inicios i on i.unidad_id = p.unidad_id
+    ),
+    cambiadas as (
+        update public.pregunta p
+           set numero = n.numero
+          from nuevos n
+         where p.pregunta_id = n.pregunta_id
+           and p.numero is distinct from n.numero
+        returning 1
+    )
+    select (select count(*) from nuevos), (select count(*) from cambiadas)
+      into v_total, v_cambiadas;
+
+    return jsonb_build_object('total', v_total, 'cambiadas', v_cambiadas);
+end;
+$$;
+
+create or replace function public.reservar_numeros(p_programa_id integer, p_cantidad integer)
+returns integer
+language plpgsql
+as $$
+declare
+    v_fin integer;
+begin
+    if p_cantidad is null or p_cantidad < 1 then
+        raise exception 'La cantidad a reservar debe ser positiva';
+    end if;
+
+    update public.programaanalitico pa
+       set ultimo_numero = greatest(
+               pa.ultimo_numero,
+               coalesce((select max(p.numero)
+                           from public.pregunta p
+                           join public.unidad u on u.unidad_id = p.unidad_id
+                          where u.programa_analitico_id = pa.linea_educativa_id), 0),
+               coalesce((select sum(public.posiciones_unidad(
+                                    u.num_preguntas,
+                                    (select count(*) from public.pregunta p where p.unidad_id = u.unidad_id)
+                                ))
+                           from public.unidad u
+                          where u.programa_analitico_id = pa.linea_educativa_id), 0)
+           ) + p_cantidad
+     where pa.linea_educativa_id = p_programa_id
+    returning pa.ultimo_numero into v_fin;
+
+    if v_fin is null then
+        raise exception 'El programa analítico % no existe', p_programa_id;
+    end if;
+
+    return v_fin - p_cantidad + 1;
+end;
+$$;